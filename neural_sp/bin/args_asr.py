@@ -145,6 +145,14 @@ def build_parser():
                         help='wordpiece model path for the 1st auxiliary task')
     parser.add_argument('--wp_model_sub2', type=str, default=False, nargs='?',
                         help='wordpiece model path for the 2nd auxiliary task')
+    parser.add_argument('--n_workers', type=int, default=0,
+                        help='number of background workers to prefetch mini-batches (0 disables prefetching)')
+    parser.add_argument('--n_prefetch', type=int, default=4,
+                        help='number of mini-batches to prefetch')
+    parser.add_argument('--token_store', type=strtobool, default=False,
+                        help='load pre-tokenized labels from a memory-mapped store next to the tsv file')
+    parser.add_argument('--index_cache', type=strtobool, default=False,
+                        help='cache the filtered and sorted dataset index next to the tsv file')
     # features
     parser.add_argument('--input_type', type=str, default='speech',
                         choices=['speech', 'text'],
@@ -161,6 +169,11 @@ def build_parser():
                         help='minimum number of input frames')
     parser.add_argument('--dynamic_batching', type=strtobool, default=True,
                         help='')
+    parser.add_argument('--max_n_frames_batch', type=int, default=0,
+                        help='maximum total number of input frames in mini-batch (0 disables). \
+                              batch_size works as the upper bound of the number of utterances.')
+    parser.add_argument('--max_n_padded_frames_batch', type=int, default=0,
+                        help='maximum number of input frames in mini-batch including padding (0 disables)')
     parser.add_argument('--gaussian_noise', type=strtobool, default=False,
                         help='add Gaussian noise to input features')
     parser.add_argument('--weight_noise', type=strtobool, default=False,
@@ -376,6 +389,9 @@ def build_parser():
                         help='recognize by teacher-forcing')
     parser.add_argument('--recog_batch_size', type=int, default=1,
                         help='size of mini-batch in evaluation')
+    parser.add_argument('--recog_max_n_frames_batch', type=int, default=0,
+                        help='maximum number of padded input frames in a mini-batch in evaluation. \
+                              Utterances are sorted by length and split into mini-batches under this budget.')
     parser.add_argument('--recog_beam_width', type=int, default=1,
                         help='size of beam')
     parser.add_argument('--recog_max_len_ratio', type=float, default=1.0,
@@ -403,6 +419,12 @@ def build_parser():
                                   First-pass backward LM in case of synchronous bidirectional decoding.')
     parser.add_argument('--recog_ctc_weight', type=float, default=0.0,
                         help='weight of CTC score')
+    parser.add_argument('--recog_ctc_prefix_margin', type=int, default=0,
+                        help='number of frames around the previous CTC spike to compute CTC prefix scores \
+                              in joint CTC-attention decoding (0: all frames)')
+    parser.add_argument('--recog_ctc_prefix_horizon', type=int, default=0,
+                        help='number of the latest frames to keep for CTC prefix scores \
+                              in chunk-synchronous decoding (0: all frames)')
     parser.add_argument('--recog_lm', type=str, default=False, nargs='?',
                         help='path to first path LM for shallow fusion')
     parser.add_argument('--recog_lm_second', type=str, default=False, nargs='?',
@@ -423,6 +445,9 @@ def build_parser():
                         help='carry over LM state')
     parser.add_argument('--recog_softmax_smoothing', type=float, default=1.0,
                         help='softmax smoothing (beta) for diverse hypothesis generation')
+    parser.add_argument('--recog_rnnt_state_cache_size', type=int, default=1000,
+                        help='maximum number of label prefixes whose prediction network states \
+                              are cached in RNN-T beam search')
     parser.add_argument('--recog_wordlm', type=strtobool, default=False,
                         help='')
     parser.add_argument('--recog_n_average', type=int, default=1,
@@ -441,8 +466,26 @@ def build_parser():
                         help='')
     parser.add_argument('--recog_ctc_vad_n_accum_frames', type=float, default=4000,
                         help='')
+    parser.add_argument('--recog_cache_left_context', type=strtobool, default=False,
+                        help='cache the left context per layer in streaming Transformer/Conformer encoders \
+                              instead of re-encoding it. This is an approximation of chunkwise training \
+                              with multiple layers.')
+    parser.add_argument('--recog_max_segment_len', type=int, default=6000,
+                        help='maximum number of input frames in a segment for global decoding. \
+                              The segment is committed at the current chunk if no boundary is detected.')
     parser.add_argument('--recog_mma_delay_threshold', type=int, default=-1,
                         help='delay threshold for MMA decoder')
     parser.add_argument('--recog_mem_len', type=int, default=0,
                         help='number of tokens for memory in TransformerXL decoder during evaluation')
+    # inference server
+    parser.add_argument('--server_host', type=str, default='localhost',
+                        help='host name of the inference server')
+    parser.add_argument('--server_port', type=int, default=8000,
+                        help='port number of the inference server')
+    parser.add_argument('--server_unix_socket', type=str, default=False, nargs='?',
+                        help='path to a Unix domain socket to serve on instead of TCP')
+    parser.add_argument('--server_max_batch_size', type=int, default=8,
+                        help='maximum number of requests decoded together in the inference server')
+    parser.add_argument('--server_max_wait', type=float, default=0.01,
+                        help='maximum time [sec] to wait for following requests to make a mini-batch')
     return parser
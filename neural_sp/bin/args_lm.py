@@ -100,6 +100,8 @@ def build_parser():
                         help='output unit')
     parser.add_argument('--wp_model', type=str, default=False, nargs='?',
                         help='wordpiece model path')
+    parser.add_argument('--token_store', type=strtobool, default=False,
+                        help='load pre-tokenized labels from a memory-mapped store next to the tsv file')
     # features
     parser.add_argument('--min_n_tokens', type=int, default=1,
                         help='minimum number of input tokens')
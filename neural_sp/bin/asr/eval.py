@@ -6,7 +6,6 @@
 
 """Evaluate the ASR model."""
 
-import argparse
 import copy
 import logging
 import os
@@ -15,6 +14,7 @@ import time
 
 from neural_sp.bin.args_asr import parse_args_eval
 from neural_sp.bin.eval_utils import average_checkpoints
+from neural_sp.bin.eval_utils import load_lms
 from neural_sp.bin.train_utils import load_checkpoint
 from neural_sp.bin.train_utils import load_config
 from neural_sp.bin.train_utils import set_logger
@@ -26,7 +26,6 @@ from neural_sp.evaluators.ppl import eval_ppl
 from neural_sp.evaluators.word import eval_word
 from neural_sp.evaluators.wordpiece import eval_wordpiece
 from neural_sp.evaluators.wordpiece_bleu import eval_wordpiece_bleu
-from neural_sp.models.lm.build import build_lm
 from neural_sp.models.seq2seq.speech2text import Speech2Text
 
 logger = logging.getLogger(__name__)
@@ -64,7 +63,9 @@ def main():
                           unit_sub2=args.unit_sub2,
                           batch_size=args.recog_batch_size,
                           first_n_utterances=args.recog_first_n_utt,
-                          is_test=True)
+                          is_test=True,
+                          sort_by='input',
+                          index_cache=args.index_cache)
 
         if i == 0:
             # Load the ASR model
@@ -95,44 +96,7 @@ def main():
                     ensemble_models += [model_e]
 
             # Load the LM for shallow fusion
-            if not args.lm_fusion:
-                # first path
-                if args.recog_lm is not None and args.recog_lm_weight > 0:
-                    conf_lm = load_config(os.path.join(os.path.dirname(args.recog_lm), 'conf.yml'))
-                    args_lm = argparse.Namespace()
-                    for k, v in conf_lm.items():
-                        setattr(args_lm, k, v)
-                    args_lm.recog_mem_len = args.recog_mem_len
-                    lm = build_lm(args_lm, wordlm=args.recog_wordlm,
-                                  lm_dict_path=os.path.join(os.path.dirname(args.recog_lm), 'dict.txt'),
-                                  asr_dict_path=os.path.join(dir_name, 'dict.txt'))
-                    load_checkpoint(args.recog_lm, lm)
-                    if args_lm.backward:
-                        model.lm_bwd = lm
-                    else:
-                        model.lm_fwd = lm
-
-                # second path (forward)
-                if args.recog_lm_second is not None and args.recog_lm_second_weight > 0:
-                    conf_lm_second = load_config(os.path.join(os.path.dirname(args.recog_lm_second), 'conf.yml'))
-                    args_lm_second = argparse.Namespace()
-                    for k, v in conf_lm_second.items():
-                        setattr(args_lm_second, k, v)
-                    args_lm_second.recog_mem_len = args.recog_mem_len
-                    lm_second = build_lm(args_lm_second)
-                    load_checkpoint(args.recog_lm_second, lm_second)
-                    model.lm_second = lm_second
-
-                # second path (bakward)
-                if args.recog_lm_bwd is not None and args.recog_lm_bwd_weight > 0:
-                    conf_lm = load_config(os.path.join(os.path.dirname(args.recog_lm_bwd), 'conf.yml'))
-                    args_lm_bwd = argparse.Namespace()
-                    for k, v in conf_lm.items():
-                        setattr(args_lm_bwd, k, v)
-                    args_lm_bwd.recog_mem_len = args.recog_mem_len
-                    lm_bwd = build_lm(args_lm_bwd)
-                    load_checkpoint(args.recog_lm_bwd, lm_bwd)
-                    model.lm_bwd = lm_bwd
+            load_lms(model, args, dir_name)
 
             if not args.recog_unit:
                 args.recog_unit = args.unit
@@ -142,6 +106,7 @@ def main():
             logger.info('recog oracle: %s' % args.recog_oracle)
             logger.info('epoch: %d' % epoch)
             logger.info('batch size: %d' % args.recog_batch_size)
+            logger.info('max frames in mini-batch: %d' % args.recog_max_n_frames_batch)
             logger.info('beam width: %d' % args.recog_beam_width)
             logger.info('min length ratio: %.3f' % args.recog_min_len_ratio)
             logger.info('max length ratio: %.3f' % args.recog_max_len_ratio)
@@ -24,6 +24,7 @@ from neural_sp.bin.train_utils import (
 from neural_sp.datasets.asr import Dataset
 from neural_sp.models.lm.build import build_lm
 from neural_sp.models.seq2seq.speech2text import Speech2Text
+from neural_sp.models.torch_utils import set_attention_capture
 from neural_sp.utils import mkdir_join
 
 logger = logging.getLogger(__name__)
@@ -39,6 +40,9 @@ def main():
         os.remove(os.path.join(args.recog_dir, 'plot.log'))
     set_logger(os.path.join(args.recog_dir, 'plot.log'), stdout=args.recog_stdout)
 
+    # Keep attention weights in evaluation mode for plots
+    set_attention_capture(True)
+
     for i, s in enumerate(args.recog_sets):
         # Load dataset
         dataset = Dataset(corpus=args.corpus,
@@ -0,0 +1,363 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Serve the ASR model with dynamic batching."""
+
+from concurrent.futures import Future
+import http.client
+import http.server
+import json
+import kaldiio
+import logging
+import numpy as np
+import os
+import queue
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+from neural_sp.bin.args_asr import parse_args_eval
+from neural_sp.bin.eval_utils import average_checkpoints
+from neural_sp.bin.eval_utils import load_lms
+from neural_sp.bin.train_utils import load_checkpoint
+from neural_sp.bin.train_utils import set_logger
+from neural_sp.datasets.token_converter.character import Idx2char
+from neural_sp.datasets.token_converter.phone import Idx2phone
+from neural_sp.datasets.token_converter.word import Idx2word
+from neural_sp.datasets.token_converter.wordpiece import Idx2wp
+from neural_sp.evaluators.decode_scheduler import decode_length_sorted
+from neural_sp.models.seq2seq.speech2text import Speech2Text
+
+logger = logging.getLogger(__name__)
+
+
+class DynamicBatcher(object):
+    """Combine concurrent requests into mini-batches.
+
+    Requests are queued by handler threads and decoded by a single worker thread.
+    A mini-batch is closed when it reaches `max_batch_size` or `max_wait` seconds
+    have passed since its first request arrived.
+
+    Args:
+        decode_fn (callable): function mapping a list of inputs to a list of outputs
+        max_batch_size (int): maximum number of requests in a mini-batch
+        max_wait (float): maximum time to wait for following requests [sec]
+
+    """
+
+    def __init__(self, decode_fn, max_batch_size=8, max_wait=0.01):
+
+        self.decode_fn = decode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self.queue = queue.Queue()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def submit(self, x):
+        """Add a request to the queue.
+
+        Args:
+            x: input of `decode_fn`
+        Returns:
+            future (Future): holds the output of `decode_fn` for `x`
+
+        """
+        future = Future()
+        self.queue.put((x, future))
+        return future
+
+    def close(self):
+        """Stop the worker after decoding the queued requests."""
+        self.queue.put(None)
+        self.worker.join()
+
+    def _run(self):
+        is_closed = False
+        while not is_closed:
+            request = self.queue.get()
+            if request is None:
+                break
+            batch = [request]
+            deadline = time.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is None:
+                    is_closed = True
+                    break
+                batch.append(request)
+            self._decode(batch)
+
+    def _decode(self, batch):
+        try:
+            ys = self.decode_fn([x for x, _ in batch])
+        except Exception as e:
+            logger.exception('Failed to decode a mini-batch of %d requests' % len(batch))
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        logger.debug('Decoded a mini-batch of %d requests' % len(batch))
+        for (_, future), y in zip(batch, ys):
+            future.set_result(y)
+
+
+def load_feat(request):
+    """Load an input feature matrix from a request.
+
+    Args:
+        request (dict): contains either `feat` (list of size `[T, input_dim]`)
+            or `ark` (kaldi ark path such as `feats.ark:123`)
+    Returns:
+        x (np.ndarray): `[T, input_dim]`
+
+    """
+    if 'feat' in request:
+        x = np.array(request['feat'], dtype=np.float32)
+    elif 'ark' in request:
+        x = kaldiio.load_mat(request['ark'])
+    else:
+        raise ValueError('Either feat or ark is required.')
+    if x.ndim != 2 or x.shape[0] == 0:
+        raise ValueError('Input features must be a matrix of size [T, input_dim].')
+    return x
+
+
+class DecodeRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Handle `POST /decode` requests.
+
+    The request body is a JSON object accepted by `load_feat`, optionally with `utt_id`.
+    The response body is a JSON object returned by the decode function.
+
+    """
+
+    def do_POST(self):
+        if self.path != '/decode':
+            self._send(404, {'error': 'Unknown path: %s' % self.path})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+            x = load_feat(request)
+        except (ValueError, KeyError, OSError) as e:
+            self._send(400, {'error': str(e)})
+            return
+
+        try:
+            result = self.server.batcher.submit(x).result()
+        except Exception as e:
+            self._send(500, {'error': str(e)})
+            return
+        if 'utt_id' in request:
+            result = dict(result, utt_id=request['utt_id'])
+        self._send(200, result)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send(200, {'status': 'ok'})
+        else:
+            self._send(404, {'error': 'Unknown path: %s' % self.path})
+
+    def _send(self, code, obj):
+        body = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # NOTE: client addresses are empty for Unix domain sockets
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        logger.debug('%s - %s' % (self.address_string(), format % args))
+
+
+class ASRServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """HTTP server over TCP.
+
+    Args:
+        address (tuple): (host, port)
+        batcher (DynamicBatcher):
+
+    """
+
+    daemon_threads = True
+    request_queue_size = 128  # accept bursts of concurrent requests
+
+    def __init__(self, address, batcher):
+        super(ASRServer, self).__init__(address, DecodeRequestHandler)
+        self.batcher = batcher
+
+
+class UnixASRServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """HTTP server over a Unix domain socket.
+
+    Args:
+        path (str): path to the socket file
+        batcher (DynamicBatcher):
+
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, path, batcher):
+        if os.path.exists(path):
+            os.remove(path)
+        super(UnixASRServer, self).__init__(path, DecodeRequestHandler)
+        self.batcher = batcher
+
+    def server_close(self):
+        super(UnixASRServer, self).server_close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a Unix domain socket."""
+
+    def __init__(self, path, timeout=60):
+        super(UnixHTTPConnection, self).__init__('localhost', timeout=timeout)
+        self.unix_socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_socket_path)
+
+
+def request_decode(address, feat=None, ark=None, utt_id=None, timeout=60):
+    """Send a decoding request to the server.
+
+    Args:
+        address (tuple or str): (host, port) or path to the Unix domain socket
+        feat (np.ndarray): `[T, input_dim]`
+        ark (str): kaldi ark path
+        utt_id (str): utterance ID
+        timeout (float): timeout [sec]
+    Returns:
+        result (dict): decoding result
+
+    """
+    request = {}
+    if feat is not None:
+        request['feat'] = np.asarray(feat).tolist()
+    if ark is not None:
+        request['ark'] = ark
+    if utt_id is not None:
+        request['utt_id'] = utt_id
+
+    if isinstance(address, str):
+        conn = UnixHTTPConnection(address, timeout=timeout)
+    else:
+        conn = http.client.HTTPConnection(*address, timeout=timeout)
+    try:
+        conn.request('POST', '/decode', body=json.dumps(request),
+                     headers={'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        result = json.loads(response.read().decode('utf-8'))
+    finally:
+        conn.close()
+    if response.status != 200:
+        raise RuntimeError('%d: %s' % (response.status, result['error']))
+    return result
+
+
+def build_decode_fn(model, recog_params, idx2token):
+    """Wrap `Speech2Text.decode` for mini-batches of feature matrices.
+
+    Requests in a mini-batch are further grouped by length under `recog_max_n_frames_batch`.
+
+    Args:
+        model (Speech2Text): ASR model
+        recog_params (dict): hyper-parameters for decoding
+        idx2token (): converter from index to token
+    Returns:
+        decode_fn (callable): function mapping a list of `[T, input_dim]` arrays to results
+
+    """
+    def decode_fn(xs):
+        params = dict(recog_params, recog_batch_size=len(xs))
+        best_hyps_id, _ = decode_length_sorted(model, xs, params, idx2token, exclude_eos=True)
+        return [{'text': idx2token(hyp_id), 'token_ids': [int(i) for i in hyp_id]}
+                for hyp_id in best_hyps_id]
+    return decode_fn
+
+
+def build_idx2token(unit, dir_name):
+    """Build the index converter of the main task.
+
+    Args:
+        unit (str): word/wp/char/phone/word_char
+        dir_name (str): directory of the ASR model
+    Returns:
+        idx2token (): converter from index to token
+
+    """
+    dict_path = os.path.join(dir_name, 'dict.txt')
+    if unit in ['word', 'word_char']:
+        return Idx2word(dict_path)
+    elif unit == 'wp':
+        return Idx2wp(dict_path, os.path.join(dir_name, 'wp.model'))
+    elif unit in ['char']:
+        return Idx2char(dict_path)
+    elif 'phone' in unit:
+        return Idx2phone(dict_path)
+    else:
+        raise ValueError(unit)
+
+
+def main():
+
+    # Load configuration
+    args, recog_params, dir_name = parse_args_eval(sys.argv[1:])
+
+    # Setting for logging
+    set_logger(os.path.join(args.recog_dir, 'server.log') if args.recog_dir else None,
+               stdout=args.recog_stdout)
+
+    # Load the ASR model and LMs only once
+    model = Speech2Text(args, dir_name)
+    if args.recog_n_average > 1:
+        model = average_checkpoints(model, args.recog_model[0], n_average=args.recog_n_average)
+    else:
+        load_checkpoint(args.recog_model[0], model)
+    load_lms(model, args, dir_name)
+    if args.recog_n_gpus >= 1:
+        model.cudnn_setting(deterministic=True, benchmark=False)
+        model.cuda()
+    idx2token = build_idx2token(args.unit, dir_name)
+
+    batcher = DynamicBatcher(build_decode_fn(model, recog_params, idx2token),
+                             max_batch_size=args.server_max_batch_size,
+                             max_wait=args.server_max_wait)
+    if args.server_unix_socket:
+        server = UnixASRServer(args.server_unix_socket, batcher)
+        logger.info('Serving on %s' % args.server_unix_socket)
+    else:
+        server = ASRServer((args.server_host, args.server_port), batcher)
+        logger.info('Serving on %s:%d' % server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
+
+
+if __name__ == '__main__':
+    main()
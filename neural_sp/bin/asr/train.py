@@ -33,6 +33,7 @@ from neural_sp.models.data_parallel import CustomDataParallel
 from neural_sp.models.data_parallel import CPUWrapperASR
 from neural_sp.models.lm.build import build_lm
 from neural_sp.models.seq2seq.speech2text import Speech2Text
+from neural_sp.models.torch_utils import set_attention_capture
 from neural_sp.trainers.lr_scheduler import LRScheduler
 from neural_sp.trainers.optimizer import set_optimizer
 from neural_sp.trainers.reporter import Reporter
@@ -62,6 +63,7 @@ def main():
 
     # Load dataset
     batch_size = args.batch_size * args.n_gpus if args.n_gpus >= 1 else args.batch_size
+    n_gpus = max(1, args.n_gpus)
     train_set = Dataset(corpus=args.corpus,
                         tsv_path=args.train_set,
                         tsv_path_sub1=args.train_set_sub1,
@@ -85,13 +87,19 @@ def main():
                         short2long=args.sort_short2long,
                         sort_stop_epoch=args.sort_stop_epoch,
                         dynamic_batching=args.dynamic_batching,
+                        max_n_frames_batch=args.max_n_frames_batch * n_gpus,
+                        max_n_padded_frames_batch=args.max_n_padded_frames_batch * n_gpus,
                         ctc=args.ctc_weight > 0,
                         ctc_sub1=args.ctc_weight_sub1 > 0,
                         ctc_sub2=args.ctc_weight_sub2 > 0,
                         subsample_factor=args.subsample_factor,
                         subsample_factor_sub1=args.subsample_factor_sub1,
                         subsample_factor_sub2=args.subsample_factor_sub2,
-                        discourse_aware=args.discourse_aware)
+                        discourse_aware=args.discourse_aware,
+                        n_workers=args.n_workers,
+                        n_prefetch=args.n_prefetch,
+                        token_store=args.token_store,
+                        index_cache=args.index_cache)
     dev_set = Dataset(corpus=args.corpus,
                       tsv_path=args.dev_set,
                       tsv_path_sub1=args.dev_set_sub1,
@@ -114,7 +122,11 @@ def main():
                       ctc_sub2=args.ctc_weight_sub2 > 0,
                       subsample_factor=args.subsample_factor,
                       subsample_factor_sub1=args.subsample_factor_sub1,
-                      subsample_factor_sub2=args.subsample_factor_sub2)
+                      subsample_factor_sub2=args.subsample_factor_sub2,
+                      n_workers=args.n_workers,
+                      n_prefetch=args.n_prefetch,
+                      token_store=args.token_store,
+                      index_cache=args.index_cache)
     eval_sets = [Dataset(corpus=args.corpus,
                          tsv_path=s,
                          dict_path=args.dict,
@@ -122,7 +134,8 @@ def main():
                          unit=args.unit,
                          wp_model=args.wp_model,
                          batch_size=1,
-                         is_test=True) for s in args.eval_sets]
+                         is_test=True,
+                         index_cache=args.index_cache) for s in args.eval_sets]
 
     args.vocab = train_set.vocab
     args.vocab_sub1 = train_set.vocab_sub1
@@ -146,6 +159,9 @@ def main():
     # Set logger
     set_logger(os.path.join(save_path, 'train.log'), stdout=args.stdout)
 
+    # Keep attention weights in evaluation mode for plots
+    set_attention_capture(True)
+
     # Load a LM conf file for LM fusion & LM initialization
     if not args.resume and args.external_lm:
         lm_conf = load_config(os.path.join(os.path.dirname(args.external_lm), 'conf.yml'))
@@ -465,6 +481,8 @@ def main():
 
     reporter.tf_writer.close()
     pbar_epoch.close()
+    for dataset in [train_set, dev_set] + eval_sets:
+        dataset.close()
 
     return save_path
 
@@ -6,10 +6,15 @@
 
 """Utility functions for evaluation."""
 
+import argparse
 import logging
 import os
 import torch
 
+from neural_sp.bin.train_utils import load_checkpoint
+from neural_sp.bin.train_utils import load_config
+from neural_sp.models.lm.build import build_lm
+
 logger = logging.getLogger(__name__)
 
 
@@ -51,3 +56,54 @@ def average_checkpoints(model, best_model_path, n_average, topk_list=[]):
     torch.save(checkpoint_avg, checkpoint_avg_path)
 
     return model
+
+
+def load_lms(model, args, dir_name):
+    """Load external LMs for shallow fusion and rescoring and attach them to the ASR model.
+
+    Args:
+        model (Speech2Text): ASR model
+        args (Namespace): arguments for evaluation
+        dir_name (str): directory of the ASR model
+
+    """
+    if args.lm_fusion:
+        return
+
+    # first path
+    if args.recog_lm is not None and args.recog_lm_weight > 0:
+        conf_lm = load_config(os.path.join(os.path.dirname(args.recog_lm), 'conf.yml'))
+        args_lm = argparse.Namespace()
+        for k, v in conf_lm.items():
+            setattr(args_lm, k, v)
+        args_lm.recog_mem_len = args.recog_mem_len
+        lm = build_lm(args_lm, wordlm=args.recog_wordlm,
+                      lm_dict_path=os.path.join(os.path.dirname(args.recog_lm), 'dict.txt'),
+                      asr_dict_path=os.path.join(dir_name, 'dict.txt'))
+        load_checkpoint(args.recog_lm, lm)
+        if args_lm.backward:
+            model.lm_bwd = lm
+        else:
+            model.lm_fwd = lm
+
+    # second path (forward)
+    if args.recog_lm_second is not None and args.recog_lm_second_weight > 0:
+        conf_lm_second = load_config(os.path.join(os.path.dirname(args.recog_lm_second), 'conf.yml'))
+        args_lm_second = argparse.Namespace()
+        for k, v in conf_lm_second.items():
+            setattr(args_lm_second, k, v)
+        args_lm_second.recog_mem_len = args.recog_mem_len
+        lm_second = build_lm(args_lm_second)
+        load_checkpoint(args.recog_lm_second, lm_second)
+        model.lm_second = lm_second
+
+    # second path (bakward)
+    if args.recog_lm_bwd is not None and args.recog_lm_bwd_weight > 0:
+        conf_lm = load_config(os.path.join(os.path.dirname(args.recog_lm_bwd), 'conf.yml'))
+        args_lm_bwd = argparse.Namespace()
+        for k, v in conf_lm.items():
+            setattr(args_lm_bwd, k, v)
+        args_lm_bwd.recog_mem_len = args.recog_mem_len
+        lm_bwd = build_lm(args_lm_bwd)
+        load_checkpoint(args.recog_lm_bwd, lm_bwd)
+        model.lm_bwd = lm_bwd
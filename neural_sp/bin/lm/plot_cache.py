@@ -21,6 +21,7 @@ from neural_sp.bin.train_utils import (
 )
 from neural_sp.datasets.lm import Dataset
 from neural_sp.models.lm.build import build_lm
+from neural_sp.models.torch_utils import set_attention_capture
 from neural_sp.utils import mkdir_join
 
 logger = logging.getLogger(__name__)
@@ -36,6 +37,9 @@ def main():
         os.remove(os.path.join(args.recog_dir, 'plot.log'))
     set_logger(os.path.join(args.recog_dir, 'plot.log'), stdout=args.recog_stdout)
 
+    # Keep cache attention weights for plots
+    set_attention_capture(True)
+
     for i, s in enumerate(args.recog_sets):
         # Load dataset
         dataset = Dataset(corpus=args.corpus,
@@ -30,6 +30,7 @@ from neural_sp.evaluators.ppl import eval_ppl
 from neural_sp.models.data_parallel import CustomDataParallel
 from neural_sp.models.data_parallel import CPUWrapperLM
 from neural_sp.models.lm.build import build_lm
+from neural_sp.models.torch_utils import set_attention_capture
 from neural_sp.trainers.lr_scheduler import LRScheduler
 from neural_sp.trainers.optimizer import set_optimizer
 from neural_sp.trainers.reporter import Reporter
@@ -66,7 +67,8 @@ def main():
                         bptt=args.bptt,
                         shuffle=args.shuffle,
                         backward=args.backward,
-                        serialize=args.serialize)
+                        serialize=args.serialize,
+                        token_store=args.token_store)
     dev_set = Dataset(corpus=args.corpus,
                       tsv_path=args.dev_set,
                       dict_path=args.dict,
@@ -76,7 +78,8 @@ def main():
                       batch_size=batch_size,
                       bptt=args.bptt,
                       backward=args.backward,
-                      serialize=args.serialize)
+                      serialize=args.serialize,
+                      token_store=args.token_store)
     eval_sets = [Dataset(corpus=args.corpus,
                          tsv_path=s,
                          dict_path=args.dict,
@@ -103,6 +106,9 @@ def main():
     # Set logger
     set_logger(os.path.join(save_path, 'train.log'), stdout=args.stdout)
 
+    # Keep attention weights in evaluation mode for plots
+    set_attention_capture(True)
+
     # Model setting
     model = build_lm(args, save_path)
 
@@ -10,11 +10,16 @@
 """
 
 import codecs
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import kaldiio
 import numpy as np
 import os
 import pandas as pd
+import pickle
 import random
+import time
 
 from neural_sp.datasets.token_converter.character import Char2idx
 from neural_sp.datasets.token_converter.character import Idx2char
@@ -24,10 +29,13 @@ from neural_sp.datasets.token_converter.word import Idx2word
 from neural_sp.datasets.token_converter.word import Word2idx
 from neural_sp.datasets.token_converter.wordpiece import Idx2wp
 from neural_sp.datasets.token_converter.wordpiece import Wp2idx
+from neural_sp.datasets.token_store import TokenStore
 
 random.seed(1)
 np.random.seed(1)
 
+INDEX_CACHE_VERSION = 1
+
 
 def count_vocab_size(dict_path):
     vocab_count = 1  # for <blank>
@@ -38,6 +46,33 @@ def count_vocab_size(dict_path):
     return vocab_count
 
 
+def index_cache_path(tsv_paths, filter_args):
+    """Path to the dataset index cache keyed by tsv files and filtering options.
+
+    Args:
+        tsv_paths (list): paths to the dataset tsv files
+        filter_args (dict): options to filter and sort utterances
+    Returns:
+        cache_path (str): path to the cache file
+
+    """
+    key = [INDEX_CACHE_VERSION]
+    for tsv_path in tsv_paths:
+        if tsv_path:
+            key += [os.path.abspath(tsv_path), os.path.getmtime(tsv_path), os.path.getsize(tsv_path)]
+    key += sorted(filter_args.items())
+    key = hashlib.md5(repr(key).encode('utf-8')).hexdigest()
+    return os.path.join(tsv_paths[0] + '.index_cache', key + '.pkl')
+
+
+def save_index_cache(cache_path, cache):
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = cache_path + '.tmp%d' % os.getpid()
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, cache_path)
+
+
 class Dataset(object):
 
     def __init__(self, tsv_path, dict_path,
@@ -50,7 +85,9 @@ class Dataset(object):
                  wp_model_sub1=False, ctc_sub1=False, subsample_factor_sub1=1,
                  tsv_path_sub2=False, dict_path_sub2=False, unit_sub2=False,
                  wp_model_sub2=False, ctc_sub2=False, subsample_factor_sub2=1,
-                 discourse_aware=False, first_n_utterances=-1):
+                 discourse_aware=False, first_n_utterances=-1,
+                 n_workers=0, n_prefetch=4, token_store=False, index_cache=False,
+                 max_n_frames_batch=0, max_n_padded_frames_batch=0):
         """A class for loading dataset.
 
         Args:
@@ -65,7 +102,7 @@ class Dataset(object):
             max_n_frames (int): exclude utterances longer than this value
             shuffle_bucket (bool): gather the similar length of utterances and shuffle them
             sort_by (str): sort all utterances in the ascending order
-                input: sort by input length
+                input: sort by input length (also for test sets)
                 output: sort by output length
                 shuffle: shuffle all utterances
             short2long (bool): sort utterances in the descending order
@@ -78,6 +115,19 @@ class Dataset(object):
             corpus (str): name of corpus
             discourse_aware (bool):
             first_n_utterances (int): evaluate the first N utterances
+            n_workers (int): number of background workers to build mini-batches
+                (0 disables prefetching)
+            n_prefetch (int): number of mini-batches to prefetch
+            token_store (bool): load pre-tokenized labels from a memory-mapped store
+                instead of parsing token_id in the tsv file
+            index_cache (bool): save the filtered and sorted dataset index next to the tsv file
+                and load it in the next run instead of parsing the tsv file again
+            max_n_frames_batch (int): maximum total number of input frames in mini-batch.
+                Utterances are packed into mini-batches under this budget, and
+                batch_size works as the upper bound of the number of utterances.
+                Labels in the auxiliary tasks share the same indices. (0 disables)
+            max_n_padded_frames_batch (int): maximum number of input frames in mini-batch
+                including padding, i.e., batch size x the longest length (0 disables)
 
         """
         super(Dataset, self).__init__()
@@ -99,6 +149,10 @@ class Dataset(object):
         self.sort_by = sort_by
         assert sort_by in ['input', 'output', 'shuffle', 'utt_id']
         self.dynamic_batching = dynamic_batching
+        self.max_n_frames_batch = max_n_frames_batch
+        self.max_n_padded_frames_batch = max_n_padded_frames_batch
+        if max_n_frames_batch > 0 or max_n_padded_frames_batch > 0:
+            assert not discourse_aware
         self.corpus = corpus
         self.discourse_aware = discourse_aware
         if discourse_aware:
@@ -152,14 +206,83 @@ class Dataset(object):
                 setattr(self, 'vocab_sub' + str(i), -1)
 
         # Load dataset tsv file
-        df = pd.read_csv(tsv_path, encoding='utf-8', delimiter='\t')
+        start_time = time.time()
+        tsv_paths = [tsv_path, tsv_path_sub1, tsv_path_sub2]
+        self.token_store = None
+        self.token_store_sub1 = None
+        self.token_store_sub2 = None
+        if token_store:
+            for i, sub in enumerate(['', '_sub1', '_sub2']):
+                if tsv_paths[i]:
+                    setattr(self, 'token_store' + sub, TokenStore(tsv_paths[i]))
+
+        filter_args = dict(is_test=is_test, min_n_frames=min_n_frames, max_n_frames=max_n_frames,
+                           sort_by=sort_by, short2long=short2long,
+                           ctc=[ctc, ctc_sub1, ctc_sub2],
+                           subsample_factor=[subsample_factor, subsample_factor_sub1, subsample_factor_sub2],
+                           corpus=corpus, discourse_aware=discourse_aware,
+                           first_n_utterances=first_n_utterances, token_store=token_store)
+        cache_path = None
+        if index_cache and sort_by != 'shuffle':
+            # NOTE: a random permutation is not cached
+            cache_path = index_cache_path(tsv_paths, filter_args)
+        if cache_path is not None and os.path.isfile(cache_path):
+            with open(cache_path, 'rb') as f:
+                cache = pickle.load(f)
+            self.df = cache['df']
+            self.df_sub1 = cache['df_sub1']
+            self.df_sub2 = cache['df_sub2']
+            self.input_dim = cache['input_dim']
+            print('Loaded the dataset index cache: %s' % cache_path)
+        else:
+            self.load_tsv(tsv_paths, **filter_args)
+            if cache_path is not None:
+                save_index_cache(cache_path, {'df': self.df,
+                                              'df_sub1': self.df_sub1,
+                                              'df_sub2': self.df_sub2,
+                                              'input_dim': self.input_dim})
+
+        if discourse_aware:
+            self.df_indices_buckets = self.discourse_bucketing(batch_size)
+        elif shuffle_bucket:
+            self.df_indices_buckets = self.shuffle_bucketing(batch_size)
+        else:
+            self.df_indices = list(self.df.index)
+        print('Loaded %d utterances (%.2f sec)' % (len(self.df), time.time() - start_time))
+
+        # Prefetch mini-batches in background workers
+        self.n_workers = n_workers
+        self.n_prefetch = max(1, n_prefetch)
+        self.executor = ThreadPoolExecutor(max_workers=n_workers) if n_workers > 0 else None
+        self.queue = deque()  # list of (future, is_new_epoch, df_indices_mb, offset)
+        self.n_prefetched_utts = 0
+        self.prefetch_batch_size = None
+
+    def load_tsv(self, tsv_paths, is_test, min_n_frames, max_n_frames,
+                 sort_by, short2long, ctc, subsample_factor, corpus,
+                 discourse_aware, first_n_utterances, token_store):
+        """Load dataset tsv files, remove inappropriate utterances, and sort them.
+
+        Args:
+            tsv_paths (list): paths to the dataset tsv files for the main and auxiliary tasks
+            ctc (list): CTC is used in the main and auxiliary tasks
+            subsample_factor (list): subsampling factors for the main and auxiliary tasks
+            token_store (bool): the token_id column is replaced with line indices
+            (see __init__ for the other arguments)
+
+        """
+        df = pd.read_csv(tsv_paths[0], encoding='utf-8', delimiter='\t')
         df = df.loc[:, ['utt_id', 'speaker', 'feat_path',
                         'xlen', 'xdim', 'text', 'token_id', 'ylen', 'ydim']]
+        if token_store:
+            df = df.drop(columns='token_id').assign(row=np.arange(len(df)))
         for i in range(1, 3):
-            if locals()['tsv_path_sub' + str(i)]:
-                df_sub = pd.read_csv(locals()['tsv_path_sub' + str(i)], encoding='utf-8', delimiter='\t')
+            if tsv_paths[i]:
+                df_sub = pd.read_csv(tsv_paths[i], encoding='utf-8', delimiter='\t')
                 df_sub = df_sub.loc[:, ['utt_id', 'speaker', 'feat_path',
                                         'xlen', 'xdim', 'text', 'token_id', 'ylen', 'ydim']]
+                if token_store:
+                    df_sub = df_sub.drop(columns='token_id').assign(row=np.arange(len(df_sub)))
                 setattr(self, 'df_sub' + str(i), df_sub)
             else:
                 setattr(self, 'df_sub' + str(i), None)
@@ -169,34 +292,29 @@ class Dataset(object):
         if is_test or discourse_aware:
             print('Original utterance num: %d' % len(df))
             n_utts = len(df)
-            df = df[df.apply(lambda x: x['ylen'] > 0, axis=1)]
+            df = df[df['ylen'] > 0]
             print('Removed %d empty utterances' % (n_utts - len(df)))
             if first_n_utterances > 0:
-                n_utts = len(df)
-                df = df[df.apply(lambda x: x['ylen'] > 0, axis=1)]
                 df = df.truncate(before=0, after=first_n_utterances - 1)
                 print('Select first %d utterances' % len(df))
         else:
             print('Original utterance num: %d' % len(df))
             n_utts = len(df)
-            df = df[df.apply(lambda x: min_n_frames <= x[
-                'xlen'] <= max_n_frames, axis=1)]
-            df = df[df.apply(lambda x: x['ylen'] > 0, axis=1)]
+            df = df[(df['xlen'] >= min_n_frames) & (df['xlen'] <= max_n_frames) & (df['ylen'] > 0)]
             print('Removed %d utterances (threshold)' % (n_utts - len(df)))
 
-            if ctc and subsample_factor > 1:
+            if ctc[0] and subsample_factor[0] > 1:
                 n_utts = len(df)
-                df = df[df.apply(lambda x: x['ylen'] <= (x['xlen'] // subsample_factor), axis=1)]
+                df = df[df['ylen'] <= (df['xlen'] // subsample_factor[0])]
                 print('Removed %d utterances (for CTC)' % (n_utts - len(df)))
 
             for i in range(1, 3):
                 df_sub = getattr(self, 'df_sub' + str(i))
-                ctc_sub = locals()['ctc_sub' + str(i)]
-                subsample_factor_sub = locals()['subsample_factor_sub' + str(i)]
+                ctc_sub = ctc[i]
+                subsample_factor_sub = subsample_factor[i]
                 if df_sub is not None:
                     if ctc_sub and subsample_factor_sub > 1:
-                        df_sub = df_sub[df_sub.apply(
-                            lambda x: x['ylen'] <= (x['xlen'] // subsample_factor_sub), axis=1)]
+                        df_sub = df_sub[df_sub['ylen'] <= (df_sub['xlen'] // subsample_factor_sub)]
 
                     if len(df) != len(df_sub):
                         n_utts = len(df)
@@ -208,35 +326,28 @@ class Dataset(object):
 
         if corpus == 'swbd':
             # 1. serialize
-            # df['session'] = df['speaker'].apply(lambda x: str(x).split('-')[0])
+            # df['session'] = df['speaker'].astype(str).str.split('-').str[0]
             # 2. not serialize
-            df['session'] = df['speaker'].apply(lambda x: str(x))
+            df['session'] = df['speaker'].astype(str)
         else:
-            df['session'] = df['speaker'].apply(lambda x: str(x))
+            df['session'] = df['speaker'].astype(str)
 
         # Sort tsv records
         if discourse_aware:
             # Sort by onset (start time)
-            df = df.assign(prev_utt='')
-            df = df.assign(line_no=list(range(len(df))))
+            df = df.assign(line_no=np.arange(len(df)))
             if corpus == 'swbd':
-                df['onset'] = df['utt_id'].apply(lambda x: int(x.split('_')[-1].split('-')[0]))
+                df['onset'] = df['utt_id'].str.split('_').str[-1].str.split('-').str[0].astype(int)
             elif corpus == 'csj':
-                df['onset'] = df['utt_id'].apply(lambda x: int(x.split('_')[1]))
+                df['onset'] = df['utt_id'].str.split('_').str[1].astype(int)
             elif corpus == 'tedlium2':
-                df['onset'] = df['utt_id'].apply(lambda x: int(x.split('-')[-2]))
+                df['onset'] = df['utt_id'].str.split('-').str[-2].astype(int)
             else:
                 raise NotImplementedError(corpus)
             df = df.sort_values(by=['session', 'onset'], ascending=True)
 
             # Extract previous utterances
-            groups = df.groupby('session').groups
-            df['prev_utt'] = df.apply(
-                lambda x: [df.loc[i, 'line_no']
-                           for i in groups[x['session']] if df.loc[i, 'onset'] < x['onset']], axis=1)
-            df['n_prev_utt'] = df.apply(lambda x: len(x['prev_utt']), axis=1)
-            df['n_utt_in_session'] = df.apply(
-                lambda x: len([i for i in groups[x['session']]]), axis=1)
+            df = self.add_prev_utt(df)
             df = df.sort_values(by=['n_utt_in_session'], ascending=short2long)
 
             # NOTE: this is used only when LM is trained with seliarize: true
@@ -245,13 +356,14 @@ class Dataset(object):
             #     df['onset'] = df['utt_id'].apply(lambda x: int(x.split('_')[-1].split('-')[0]))
             #     df = df.sort_values(by=['session', 'onset'], ascending=True)
 
+        elif sort_by == 'input':
+            # NOTE: test sets are also sorted to decode similar lengths of utterances together
+            df = df.sort_values(by=['xlen'], ascending=short2long)
         elif not is_test:
-            if sort_by == 'input':
-                df = df.sort_values(by=['xlen'], ascending=short2long)
-            elif sort_by == 'output':
+            if sort_by == 'output':
                 df = df.sort_values(by=['ylen'], ascending=short2long)
             elif sort_by == 'shuffle':
-                df = df.reindex(np.random.permutation(self.df.index))
+                df = df.reindex(np.random.permutation(df.index))
 
         # Re-indexing
         if discourse_aware:
@@ -267,20 +379,13 @@ class Dataset(object):
                     setattr(self, 'df_sub' + str(i),
                             getattr(self, 'df_sub' + str(i)).reindex(df.index).reset_index())
 
-        if discourse_aware:
-            self.df_indices_buckets = self.discourse_bucketing(batch_size)
-        elif shuffle_bucket:
-            self.df_indices_buckets = self.shuffle_bucketing(batch_size)
-        else:
-            self.df_indices = list(self.df.index)
-
     def __len__(self):
         return len(self.df)
 
     @property
     def epoch_detail(self):
         """Percentage of the current epoch."""
-        return self.offset / len(self)
+        return (self.offset - self.n_prefetched_utts) / len(self)
 
     @property
     def n_frames(self):
@@ -304,6 +409,40 @@ class Dataset(object):
             self.df_indices = list(self.df.index)
         self.offset = 0
 
+        # Discard prefetched mini-batches
+        self.discard_prefetched()
+
+    def close(self):
+        """Shut down background workers."""
+        if self.executor is not None:
+            self.discard_prefetched()
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+    def __del__(self):
+        if getattr(self, 'executor', None) is not None:
+            self.close()
+
+    def discard_prefetched(self):
+        """Cancel prefetched mini-batches."""
+        for future, _, _, _ in self.queue:
+            future.cancel()
+        self.queue.clear()
+        self.n_prefetched_utts = 0
+
+    def rewind_prefetched(self):
+        """Discard prefetched mini-batches and return their indices to the sampler."""
+        if len(self.queue) == 0:
+            return
+        offset = self.queue[0][3]
+        df_indices_mbs = [df_indices_mb for _, _, df_indices_mb, _ in self.queue]
+        self.discard_prefetched()
+        if self.discourse_aware or self.shuffle_bucket:
+            self.df_indices_buckets = df_indices_mbs + self.df_indices_buckets
+        else:
+            self.df_indices = list(self.df[offset:].index)
+        self.offset = offset
+
     def next(self, batch_size=None):
         """Generate each mini-batch.
 
@@ -320,8 +459,17 @@ class Dataset(object):
         if self.epoch >= self.max_epoch:
             raise StopIteration
 
-        df_indices_mb, is_new_epoch = self.sample_index(batch_size)
-        mini_batch = self.make_mini_batch(df_indices_mb)
+        if self.executor is None:
+            df_indices_mb, is_new_epoch = self.sample_index(batch_size)
+            mini_batch = self.make_mini_batch(df_indices_mb)
+        else:
+            if batch_size != self.prefetch_batch_size:
+                # mini-batches in the queue were sampled with a different batch size
+                self.rewind_prefetched()
+            self.prefetch(batch_size)
+            future, is_new_epoch, df_indices_mb, _ = self.queue.popleft()
+            self.n_prefetched_utts -= len(df_indices_mb)
+            mini_batch = future.result()
 
         if is_new_epoch:
             # shuffle the whole data
@@ -341,6 +489,26 @@ class Dataset(object):
 
         return mini_batch, is_new_epoch
 
+    def prefetch(self, batch_size):
+        """Sample indices of the following mini-batches and build them in background workers.
+           Mini-batches are returned in the sampled order. Sampling never goes beyond
+           the end of the current epoch so that the epoch-level update (re-sorting and
+           re-bucketing) happens after all mini-batches in the epoch are consumed.
+
+        Args:
+            batch_size (int): size of mini-batch
+
+        """
+        self.prefetch_batch_size = batch_size
+        while len(self.queue) < self.n_prefetch:
+            if len(self.queue) > 0 and self.queue[-1][1]:
+                break
+            offset = self.offset
+            df_indices_mb, is_new_epoch = self.sample_index(batch_size)
+            future = self.executor.submit(self.make_mini_batch, df_indices_mb)
+            self.queue.append((future, is_new_epoch, df_indices_mb, offset))
+            self.n_prefetched_utts += len(df_indices_mb)
+
     def sample_index(self, batch_size):
         """Sample data indices of mini-batch.
 
@@ -366,6 +534,9 @@ class Dataset(object):
             # Shuffle uttrances in mini-batch
             df_indices_mb = random.sample(df_indices_mb, len(df_indices_mb))
         else:
+            # Pack utterances under the frame budget
+            batch_size = self.pack_frames(batch_size, self.offset)
+
             if len(self.df_indices) > batch_size:
                 # Change batch size dynamically
                 min_xlen = self.df[self.offset:self.offset + 1]['xlen'].values[0]
@@ -391,8 +562,8 @@ class Dataset(object):
             # Shuffle uttrances in mini-batch
             df_indices_mb = random.sample(df_indices_mb, len(df_indices_mb))
 
-            for i in df_indices_mb:
-                self.df_indices.remove(i)
+            # NOTE: mini-batches are always taken from the head of df_indices
+            del self.df_indices[:len(df_indices_mb)]
 
         return df_indices_mb, is_new_epoch
 
@@ -409,6 +580,7 @@ class Dataset(object):
                 ys_sub1 (list): reference labels in the 1st auxiliary task of size `[L_sub1]`
                 ys_sub2 (list): reference labels in the 2nd auxiliary task of size `[L_sub2]`
                 utt_ids (list): name of each utterance
+                utt_indices (list): position of each utterance in the tsv file
                 speakers (list): name of each speaker
                 sessions (list): name of each session
 
@@ -420,17 +592,17 @@ class Dataset(object):
         if self.is_test:
             ys = [self.token2idx[0](self.df['text'][i]) for i in df_indices_mb]
         else:
-            ys = [list(map(int, str(self.df['token_id'][i]).split())) for i in df_indices_mb]
+            ys = self.load_token_id(self.df, self.token_store, df_indices_mb)
 
         ys_sub1 = []
         if self.df_sub1 is not None:
-            ys_sub1 = [list(map(int, str(self.df_sub1['token_id'][i]).split())) for i in df_indices_mb]
+            ys_sub1 = self.load_token_id(self.df_sub1, self.token_store_sub1, df_indices_mb)
         elif self.vocab_sub1 > 0 and not self.is_test:
             ys_sub1 = [self.token2idx[1](self.df['text'][i]) for i in df_indices_mb]
 
         ys_sub2 = []
         if self.df_sub2 is not None:
-            ys_sub2 = [list(map(int, str(self.df_sub2['token_id'][i]).split())) for i in df_indices_mb]
+            ys_sub2 = self.load_token_id(self.df_sub2, self.token_store_sub2, df_indices_mb)
         elif self.vocab_sub2 > 0 and not self.is_test:
             ys_sub2 = [self.token2idx[2](self.df['text'][i]) for i in df_indices_mb]
 
@@ -441,6 +613,8 @@ class Dataset(object):
             'ys_sub1': ys_sub1,
             'ys_sub2': ys_sub2,
             'utt_ids': [self.df['utt_id'][i] for i in df_indices_mb],
+            # NOTE: the original index is kept as a column after re-indexing
+            'utt_indices': [self.df['index'][i] if 'index' in self.df else i for i in df_indices_mb],
             'speakers': [self.df['speaker'][i] for i in df_indices_mb],
             'sessions': [self.df['session'][i] for i in df_indices_mb],
             'text': [self.df['text'][i] for i in df_indices_mb],
@@ -448,6 +622,13 @@ class Dataset(object):
         }
         return mini_batch_dict
 
+    @staticmethod
+    def load_token_id(df, token_store, df_indices_mb):
+        """Load reference labels from the token store or by parsing the token_id column."""
+        if token_store is None:
+            return [list(map(int, str(df['token_id'][i]).split())) for i in df_indices_mb]
+        return [token_store[df['row'][i]].tolist() for i in df_indices_mb]
+
     def set_batch_size(self, batch_size, min_xlen, min_ylen):
         if not self.dynamic_batching:
             return batch_size
@@ -461,14 +642,43 @@ class Dataset(object):
 
         return max(1, batch_size)
 
+    def pack_frames(self, batch_size, offset):
+        """Limit the number of utterances so that the mini-batch starting from
+           the offset-th utterance fits in the frame budgets.
+
+        Args:
+            batch_size (int): maximum number of utterances in mini-batch
+            offset (int): position of the first utterance in self.df
+        Returns:
+            batch_size (int): number of utterances in mini-batch
+
+        """
+        if self.max_n_frames_batch <= 0 and self.max_n_padded_frames_batch <= 0:
+            return batch_size
+
+        xlens = self.df['xlen'].values[offset:offset + batch_size]
+        n_utts = len(xlens)
+        if self.max_n_frames_batch > 0:
+            n_utts = min(n_utts, np.searchsorted(
+                np.cumsum(xlens), self.max_n_frames_batch, side='right'))
+        if self.max_n_padded_frames_batch > 0:
+            # NOTE: the padded size is non-decreasing with the number of utterances
+            n_padded_frames = np.maximum.accumulate(xlens) * np.arange(1, len(xlens) + 1)
+            n_utts = min(n_utts, np.searchsorted(
+                n_padded_frames, self.max_n_padded_frames_batch, side='right'))
+        # NOTE: an utterance longer than the budget forms a mini-batch by itself
+        return max(1, int(n_utts))
+
     def shuffle_bucketing(self, batch_size):
         df_indices_buckets = []  # list of list
+        df_indices = self.df.index.values
+        xlens = self.df['xlen'].values
+        ylens = self.df['ylen'].values
         offset = 0
         while True:
-            min_xlen = self.df[offset:offset + 1]['xlen'].values[0]
-            min_ylen = self.df[offset:offset + 1]['ylen'].values[0]
-            _batch_size = self.set_batch_size(batch_size, min_xlen, min_ylen)
-            df_indices_mb = list(self.df[offset:offset + _batch_size].index)
+            _batch_size = self.set_batch_size(batch_size, xlens[offset], ylens[offset])
+            _batch_size = self.pack_frames(_batch_size, offset)
+            df_indices_mb = df_indices[offset:offset + _batch_size].tolist()
             df_indices_buckets.append(df_indices_mb)
             offset += len(df_indices_mb)
             if offset + _batch_size >= len(self):
@@ -480,15 +690,46 @@ class Dataset(object):
 
     def discourse_bucketing(self, batch_size):
         df_indices_buckets = []  # list of list
-        session_groups = [(k, v) for k, v in self.df.groupby('n_utt_in_session').groups.items()]
+        df_indices = self.df.index.values
+        n_utt_in_session = self.df['n_utt_in_session'].values
+        is_first_utt = self.df['n_prev_utt'].values == 0
+        session_groups = [(n_utt, df_indices[(n_utt_in_session == n_utt) & is_first_utt])
+                          for n_utt in np.unique(n_utt_in_session)]
         if self.shuffle_bucket:
             random.shuffle(session_groups)
-        for n_utt, ids in session_groups:
-            first_utt_ids = [i for i in ids if self.df['n_prev_utt'][i] == 0]
+        for n_utt, first_utt_ids in session_groups:
             for i in range(0, len(first_utt_ids), batch_size):
                 first_utt_ids_mb = first_utt_ids[i:i + batch_size]
                 for j in range(n_utt):
-                    df_indices_mb = [k + j for k in first_utt_ids_mb]
-                    df_indices_buckets.append(df_indices_mb)
+                    df_indices_buckets.append((first_utt_ids_mb + j).tolist())
 
         return df_indices_buckets
+
+    @staticmethod
+    def add_prev_utt(df):
+        """Add indices of previous utterances in the same session.
+
+        Args:
+            df (pd.DataFrame): sorted by session and onset
+        Returns:
+            df (pd.DataFrame): with `prev_utt`, `n_prev_utt`, and `n_utt_in_session` columns
+
+        """
+        sessions = df['session'].values
+        onsets = df['onset'].values
+        line_nos = df['line_no'].values
+
+        # Boundaries of each session
+        is_head = np.ones(len(df), dtype=bool)
+        is_head[1:] = sessions[1:] != sessions[:-1]
+        head = np.maximum.accumulate(np.where(is_head, np.arange(len(df)), 0))
+        n_utt_in_session = np.bincount(np.cumsum(is_head) - 1)[np.cumsum(is_head) - 1]
+
+        # Number of utterances with an earlier onset in the same session
+        n_prev_utt = np.zeros(len(df), dtype=np.int64)
+        for h in np.flatnonzero(is_head):
+            onsets_session = onsets[h:h + n_utt_in_session[h]]
+            n_prev_utt[h:h + n_utt_in_session[h]] = np.searchsorted(onsets_session, onsets_session, side='left')
+
+        prev_utt = [line_nos[h:h + n].tolist() for h, n in zip(head, n_prev_utt)]
+        return df.assign(prev_utt=prev_utt, n_prev_utt=n_prev_utt, n_utt_in_session=n_utt_in_session)
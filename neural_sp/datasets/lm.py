@@ -24,6 +24,7 @@ from neural_sp.datasets.token_converter.word import Idx2word
 from neural_sp.datasets.token_converter.word import Word2idx
 from neural_sp.datasets.token_converter.wordpiece import Idx2wp
 from neural_sp.datasets.token_converter.wordpiece import Wp2idx
+from neural_sp.datasets.token_store import TokenStore
 
 random.seed(1)
 np.random.seed(1)
@@ -37,7 +38,7 @@ class Dataset(object):
                  unit, batch_size, nlsyms=False, n_epochs=1e10,
                  is_test=False, min_n_tokens=1,
                  bptt=2, shuffle=False, backward=False, serialize=False,
-                 wp_model=None, corpus=''):
+                 wp_model=None, corpus='', token_store=False):
         """A class for loading dataset.
 
         Args:
@@ -55,6 +56,8 @@ class Dataset(object):
             serialize (bool): serialize text according to contexts in dialogue
             wp_model (): path to the word-piece model for sentencepiece
             corpus (str): name of corpus
+            token_store (bool): load pre-tokenized labels from a memory-mapped store
+                instead of parsing token_id in the tsv file
 
         """
         super(Dataset, self).__init__()
@@ -99,6 +102,10 @@ class Dataset(object):
         self.df = pd.read_csv(tsv_path, encoding='utf-8', delimiter='\t')
         self.df = self.df.loc[:, ['utt_id', 'speaker', 'feat_path',
                                   'xlen', 'xdim', 'text', 'token_id', 'ylen', 'ydim']]
+        self.token_store = None
+        if token_store:
+            self.token_store = TokenStore(tsv_path)
+            self.df = self.df.drop(columns='token_id').assign(row=np.arange(len(self.df)))
 
         # Remove inappropriate utterances
         if is_test:
@@ -129,14 +136,21 @@ class Dataset(object):
         self.concat_ids = self.concat_utterances(self.df)
 
     def concat_utterances(self, df):
-        indices = list(df.index)
-        if self.backward:
-            indices = indices[::-1]
-        concat_ids = []
-        for i in indices:
-            assert df['token_id'][i] != ''
-            concat_ids += [self.eos] + list(map(int, df['token_id'][i].split()))
-        concat_ids += [self.eos]  # for the last sentence
+        if self.token_store is not None:
+            rows = df['row'].values
+            if self.backward:
+                rows = rows[::-1]
+            assert (self.token_store.ylen[rows] > 0).all()
+            concat_ids = self.token_store.concat(rows, self.eos)
+        else:
+            indices = list(df.index)
+            if self.backward:
+                indices = indices[::-1]
+            concat_ids = []
+            for i in indices:
+                assert df['token_id'][i] != ''
+                concat_ids += [self.eos] + list(map(int, df['token_id'][i].split()))
+            concat_ids += [self.eos]  # for the last sentence
         # NOTE: <sos> and <eos> have the same index
 
         # Reshape
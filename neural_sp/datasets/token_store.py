@@ -0,0 +1,132 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Memory-mapped store of pre-tokenized labels.
+   Space-separated token indices in a dataset tsv file are converted into
+   a flat int32 array and an offset array only once, and then loaded with mmap.
+"""
+
+import logging
+import numpy as np
+import os
+import pandas as pd
+import shutil
+
+logger = logging.getLogger(__name__)
+
+ARRAY_NAMES = ['token_id', 'offset', 'xlen', 'ylen']
+
+
+def token_store_dir(tsv_path):
+    return tsv_path + '.token_store'
+
+
+def is_up_to_date(tsv_path, store_dir):
+    for name in ARRAY_NAMES:
+        path = os.path.join(store_dir, name + '.npy')
+        if not os.path.isfile(path) or os.path.getmtime(path) < os.path.getmtime(tsv_path):
+            return False
+    return True
+
+
+def build_token_store(tsv_path, store_dir=None):
+    """Convert token indices in a tsv file into numpy arrays.
+
+    Args:
+        tsv_path (str): path to the dataset tsv file
+        store_dir (str): directory to save arrays
+    Returns:
+        store_dir (str): directory to save arrays
+
+    """
+    if store_dir is None:
+        store_dir = token_store_dir(tsv_path)
+
+    df = pd.read_csv(tsv_path, encoding='utf-8', delimiter='\t',
+                     usecols=['token_id', 'xlen'], dtype={'token_id': str})
+    token_ids = df['token_id'].fillna('')
+    ylens = token_ids.str.split().str.len().values.astype(np.int64)
+    offset = np.zeros(len(df) + 1, dtype=np.int64)
+    np.cumsum(ylens, out=offset[1:])
+    token_id = np.array(' '.join(token_ids).split(), dtype=np.int32)
+    assert len(token_id) == offset[-1]
+
+    # Write to a temporary directory first not to expose a half-written store
+    tmp_dir = store_dir + '.tmp%d' % os.getpid()
+    os.makedirs(tmp_dir, exist_ok=True)
+    np.save(os.path.join(tmp_dir, 'token_id.npy'), token_id)
+    np.save(os.path.join(tmp_dir, 'offset.npy'), offset)
+    np.save(os.path.join(tmp_dir, 'xlen.npy'), df['xlen'].values.astype(np.int32))
+    np.save(os.path.join(tmp_dir, 'ylen.npy'), ylens.astype(np.int32))
+    if os.path.isdir(store_dir):
+        shutil.rmtree(store_dir, ignore_errors=True)
+    try:
+        os.rename(tmp_dir, store_dir)
+    except OSError:
+        # another process has created the store concurrently
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    logger.info('Saved %d tokens of %d utterances to %s' % (len(token_id), len(df), store_dir))
+    return store_dir
+
+
+class TokenStore(object):
+    """Memory-mapped token indices of each line in a dataset tsv file.
+
+    Args:
+        tsv_path (str): path to the dataset tsv file
+        store_dir (str): directory to save arrays. The store is (re-)built
+            if it does not exist or is older than the tsv file.
+
+    """
+
+    def __init__(self, tsv_path, store_dir=None):
+        if store_dir is None:
+            store_dir = token_store_dir(tsv_path)
+        if not is_up_to_date(tsv_path, store_dir):
+            build_token_store(tsv_path, store_dir)
+
+        self.token_id = np.load(os.path.join(store_dir, 'token_id.npy'), mmap_mode='r')
+        self.offset = np.load(os.path.join(store_dir, 'offset.npy'), mmap_mode='r')
+        self.xlen = np.load(os.path.join(store_dir, 'xlen.npy'), mmap_mode='r')
+        self.ylen = np.load(os.path.join(store_dir, 'ylen.npy'), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.ylen)
+
+    def __getitem__(self, row):
+        """Token indices of the `row`-th line in the tsv file.
+
+        Args:
+            row (int): line index (header excluded)
+        Returns:
+            token_id (np.ndarray): token indices of size `[L]`
+
+        """
+        return self.token_id[self.offset[row]:self.offset[row + 1]]
+
+    def concat(self, rows, eos):
+        """Concatenate token indices of multiple lines with a delimiter.
+
+        Args:
+            rows (np.ndarray): line indices
+            eos (int): index of the delimiter inserted before each line and at the end
+        Returns:
+            concat_ids (np.ndarray): concatenated token indices of size `[sum(L) + len(rows) + 1]`
+
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        starts = np.asarray(self.offset[rows])
+        ylens = np.asarray(self.offset[rows + 1]) - starts
+        n_tokens = int(ylens.sum())
+
+        # source position of each token
+        src = np.arange(n_tokens, dtype=np.int64) + np.repeat(starts - (np.cumsum(ylens) - ylens), ylens)
+        # destination position shifted by the number of delimiters inserted so far
+        dst = np.arange(n_tokens, dtype=np.int64) + np.repeat(np.arange(1, len(rows) + 1), ylens)
+
+        concat_ids = np.full(n_tokens + len(rows) + 1, eos, dtype=np.int64)
+        concat_ids[dst] = self.token_id[src]
+        return concat_ids
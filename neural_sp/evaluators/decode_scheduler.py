@@ -0,0 +1,93 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Length-aware scheduling of utterances for decoding."""
+
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def make_length_sorted_batches(xlens, max_batch_size, max_n_frames_batch=0):
+    """Group utterances of similar lengths into mini-batches.
+
+    Utterances are sorted in the descending order of their lengths, and
+    consecutive ones are packed into a mini-batch as long as the number of
+    frames including padding does not exceed `max_n_frames_batch`.
+
+    Args:
+        xlens (list): length `B`, input lengths
+        max_batch_size (int): maximum number of utterances in a mini-batch
+        max_n_frames_batch (int): maximum number of padded frames in a mini-batch.
+            The size is only limited by `max_batch_size` if 0.
+            An utterance longer than this limit makes a mini-batch by itself.
+    Returns:
+        batches (list): list of mini-batches, each of which is a list of utterance indices
+
+    """
+    order = np.argsort(-np.asarray(xlens), kind='stable')
+    batches = []
+    for i in order:
+        if len(batches) > 0:
+            batch = batches[-1]
+            n_padded_frames = xlens[batch[0]] * (len(batch) + 1)
+            if len(batch) < max_batch_size and (max_n_frames_batch <= 0 or n_padded_frames <= max_n_frames_batch):
+                batch.append(int(i))
+                continue
+        batches.append([int(i)])
+    return batches
+
+
+def decode_length_sorted(model, xs, recog_params, idx2token=None, exclude_eos=False,
+                         refs_id=None, utt_ids=None, speakers=None, **kwargs):
+    """Decode utterances in length-homogeneous mini-batches.
+
+    Each mini-batch is encoded and decoded by a single `Speech2Text.decode`
+    call, and results are returned in the original order.
+
+    Args:
+        model (Speech2Text): ASR model
+        xs (list): length `B`, each of which contains arrays of size `[T, input_dim]`
+        recog_params (dict): hyper-parameters for decoding
+            recog_batch_size (int): maximum number of utterances in a mini-batch
+            recog_max_n_frames_batch (int): maximum number of padded frames in a mini-batch
+        idx2token (): converter from index to token
+        exclude_eos (bool): exclude <eos> from best_hyps_id
+        refs_id (list): gold token IDs
+        utt_ids (list):
+        speakers (list):
+        kwargs: other arguments for `Speech2Text.decode`
+    Returns:
+        best_hyps_id (list): length `B`, each of which contains arrays of size `[L]`
+        aws (list): length `B`, each of which contains arrays of size `[L, T, n_heads]`.
+            None if attention weights are not returned.
+
+    """
+    batches = make_length_sorted_batches([len(x) for x in xs],
+                                         max(recog_params['recog_batch_size'], 1),
+                                         recog_params['recog_max_n_frames_batch'])
+
+    best_hyps_id = [None] * len(xs)
+    aws = [None] * len(xs)
+    for batch in batches:
+        best_hyps_id_mb, aws_mb = model.decode(
+            [xs[i] for i in batch], dict(recog_params, recog_batch_size=len(batch)),
+            idx2token=idx2token,
+            exclude_eos=exclude_eos,
+            refs_id=[refs_id[i] for i in batch] if refs_id is not None else None,
+            utt_ids=[utt_ids[i] for i in batch] if utt_ids is not None else None,
+            speakers=[speakers[i] for i in batch] if speakers is not None else None,
+            **kwargs)
+        for j, i in enumerate(batch):
+            best_hyps_id[i] = best_hyps_id_mb[j]
+            if aws_mb is not None:
+                aws[i] = aws_mb[j]
+    logger.debug('Decoded %d utterances in %d mini-batches' % (len(xs), len(batches)))
+
+    if all(aw is None for aw in aws):
+        aws = None
+    return best_hyps_id, aws
@@ -9,6 +9,7 @@
 import logging
 from tqdm import tqdm
 
+from neural_sp.evaluators.decode_scheduler import decode_length_sorted
 from neural_sp.evaluators.edit_distance import compute_wer
 from neural_sp.utils import mkdir_join
 
@@ -62,6 +63,9 @@ def eval_wordpiece(models, dataset, recog_params, epoch,
     # calculate WER distribution based on input lengths
     wer_dist = {}
 
+    # NOTE: hypotheses are written in the original order of the dataset
+    # since utterances can be sorted by their lengths for efficient decoding
+    trn_lines = []  # (index, reference, hypothesis)
     with open(hyp_trn_save_path, 'w') as f_hyp, open(ref_trn_save_path, 'w') as f_ref:
         while True:
             batch, is_new_epoch = dataset.next(recog_params['recog_batch_size'])
@@ -70,8 +74,8 @@ def eval_wordpiece(models, dataset, recog_params, epoch,
                     batch['xs'], recog_params, dataset.idx2token[0],
                     exclude_eos=True)
             else:
-                best_hyps_id, _ = models[0].decode(
-                    batch['xs'], recog_params,
+                best_hyps_id, _ = decode_length_sorted(
+                    models[0], batch['xs'], recog_params,
                     idx2token=dataset.idx2token[0] if progressbar else None,
                     exclude_eos=True,
                     refs_id=batch['ys'],
@@ -91,8 +95,9 @@ def eval_wordpiece(models, dataset, recog_params, epoch,
                     utt_id = str(batch['utt_ids'][b]) + '_0000000_0000001'
                 else:
                     utt_id = str(batch['utt_ids'][b])
-                f_ref.write(ref + ' (' + speaker + '-' + utt_id + ')\n')
-                f_hyp.write(hyp + ' (' + speaker + '-' + utt_id + ')\n')
+                trn_lines.append((batch['utt_indices'][b],
+                                  ref + ' (' + speaker + '-' + utt_id + ')\n',
+                                  hyp + ' (' + speaker + '-' + utt_id + ')\n'))
                 logger.debug('utt-id: %s' % utt_id)
                 logger.debug('Ref: %s' % ref)
                 logger.debug('Hyp: %s' % hyp)
@@ -141,6 +146,10 @@ def eval_wordpiece(models, dataset, recog_params, epoch,
             if is_new_epoch:
                 break
 
+        for _, ref_line, hyp_line in sorted(trn_lines, key=lambda x: x[0]):
+            f_ref.write(ref_line)
+            f_hyp.write(hyp_line)
+
     if progressbar:
         pbar.close()
 
@@ -10,6 +10,7 @@ import logging
 from tqdm import tqdm
 from nltk.translate.bleu_score import corpus_bleu, sentence_bleu
 
+from neural_sp.evaluators.decode_scheduler import decode_length_sorted
 from neural_sp.utils import mkdir_join
 
 logger = logging.getLogger(__name__)
@@ -59,6 +60,9 @@ def eval_wordpiece_bleu(models, dataset, recog_params, epoch,
 
     list_of_references = []
     hypotheses = []
+    # NOTE: hypotheses are written in the original order of the dataset
+    # since utterances can be sorted by their lengths for efficient decoding
+    trn_lines = []  # (index, reference, hypothesis)
     with open(hyp_trn_save_path, 'w') as f_hyp, open(ref_trn_save_path, 'w') as f_ref:
         while True:
             batch, is_new_epoch = dataset.next(recog_params['recog_batch_size'])
@@ -67,8 +71,8 @@ def eval_wordpiece_bleu(models, dataset, recog_params, epoch,
                     batch['xs'], recog_params, dataset.idx2token[0],
                     exclude_eos=True)
             else:
-                best_hyps_id, _ = models[0].decode(
-                    batch['xs'], recog_params,
+                best_hyps_id, _ = decode_length_sorted(
+                    models[0], batch['xs'], recog_params,
                     idx2token=dataset.idx2token[0] if progressbar else None,
                     exclude_eos=True,
                     refs_id=batch['ys'],
@@ -88,8 +92,9 @@ def eval_wordpiece_bleu(models, dataset, recog_params, epoch,
                     utt_id = str(batch['utt_ids'][b]) + '_0000000_0000001'
                 else:
                     utt_id = str(batch['utt_ids'][b])
-                f_ref.write(ref + '\n')
-                f_hyp.write(hyp + '\n')
+                trn_lines.append((batch['utt_indices'][b],
+                                  ref + '\n',
+                                  hyp + '\n'))
                 logger.debug('utt-id: %s' % utt_id)
                 logger.debug('Ref: %s' % ref)
                 logger.debug('Hyp: %s' % hyp)
@@ -117,6 +122,10 @@ def eval_wordpiece_bleu(models, dataset, recog_params, epoch,
             if is_new_epoch:
                 break
 
+        for _, ref_line, hyp_line in sorted(trn_lines, key=lambda x: x[0]):
+            f_ref.write(ref_line)
+            f_hyp.write(hyp_line)
+
     if progressbar:
         pbar.close()
 
@@ -13,6 +13,7 @@ import torch
 from neural_sp.models.base import ModelBase
 from neural_sp.models.criterion import cross_entropy_lsm
 from neural_sp.models.torch_utils import compute_accuracy
+from neural_sp.models.torch_utils import is_attention_captured
 from neural_sp.models.torch_utils import np2tensor
 from neural_sp.models.torch_utils import pad_list
 
@@ -90,7 +91,7 @@ class LMBase(ModelBase):
                 torch.cat(self.cache_keys, dim=1), out.transpose(2, 1)).squeeze(2), dim=1)
 
             # For visualization
-            if len(self.cache_ids) == n_caches:
+            if len(self.cache_ids) == n_caches and is_attention_captured():
                 self.cache_attn += [cache_attn.cpu().numpy()]
                 self.cache_attn = self.cache_attn[-n_caches:]
 
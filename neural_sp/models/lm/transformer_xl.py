@@ -20,6 +20,7 @@ from neural_sp.models.lm.lm_base import LMBase
 from neural_sp.models.modules.initialization import init_like_transformer_xl
 from neural_sp.models.modules.positional_embedding import XLPositionalEmbedding
 from neural_sp.models.modules.transformer import TransformerDecoderBlock
+from neural_sp.models.torch_utils import is_attention_captured
 from neural_sp.models.torch_utils import tensor2np
 from neural_sp.utils import mkdir_join
 
@@ -210,8 +211,7 @@ class TransformerXL(LMBase):
 
         # Create the self-attention mask
         causal_mask = ys.new_ones(ylen, ylen + mlen).byte()
-        causal_mask = torch.tril(causal_mask, diagonal=0 + mlen, out=causal_mask).unsqueeze(0)
-        causal_mask = causal_mask.repeat([bs, 1, 1])  # `[B, L, L+mlen]`
+        causal_mask = torch.tril(causal_mask, diagonal=0 + mlen, out=causal_mask).unsqueeze(0)  # `[1, L, L+mlen]`
 
         out = self.dropout_emb(self.embed(ys.long()) * self.scale)
         # NOTE: TransformerXL does not use positional encoding in the token embedding
@@ -234,7 +234,7 @@ class TransformerXL(LMBase):
             elif lth < self.n_layers - 1:
                 hidden_states.append(out)
                 # NOTE: outputs from the last layer is not used for memory
-            if not self.training and layer.yy_aws is not None:
+            if not self.training and is_attention_captured() and layer.yy_aws is not None:
                 setattr(self, 'yy_aws_layer%d' % lth, tensor2np(layer.yy_aws))
         out = self.norm_out(out)
         if self.adaptive_softmax is None:
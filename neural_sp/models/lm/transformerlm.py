@@ -17,6 +17,7 @@ import torch.nn as nn
 from neural_sp.models.lm.lm_base import LMBase
 from neural_sp.models.modules.positional_embedding import PositionalEncoding
 from neural_sp.models.modules.transformer import TransformerDecoderBlock
+from neural_sp.models.torch_utils import is_attention_captured
 from neural_sp.models.torch_utils import tensor2np
 from neural_sp.utils import mkdir_join
 
@@ -201,8 +202,7 @@ class TransformerLM(LMBase):
         if incremental and cache[0] is not None:
             ylen = cache[0].size(1) + 1
         causal_mask = ys.new_ones(ylen, ylen).byte()
-        causal_mask = torch.tril(causal_mask, diagonal=0, out=causal_mask).unsqueeze(0)
-        causal_mask = causal_mask.repeat([bs, 1, 1])
+        causal_mask = torch.tril(causal_mask, diagonal=0, out=causal_mask).unsqueeze(0)  # `[1, L, L]`
 
         out = self.pos_enc(self.embed(ys.long()))
 
@@ -216,7 +216,7 @@ class TransformerLM(LMBase):
             elif lth < self.n_layers - 1:
                 hidden_states.append(out)
                 # NOTE: outputs from the last layer is not used for memory
-            if not self.training and layer.yy_aws is not None:
+            if not self.training and is_attention_captured() and layer.yy_aws is not None:
                 setattr(self, 'yy_aws_layer%d' % lth, tensor2np(layer.yy_aws))
         out = self.norm_out(out)
         if self.adaptive_softmax is None:
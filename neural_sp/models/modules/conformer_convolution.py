@@ -7,6 +7,7 @@
 """Convolution block for Conformer encoder."""
 
 import logging
+import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
@@ -87,3 +88,41 @@ class ConformerConvBlock(nn.Module):
 
         xs = xs.transpose(2, 1).contiguous()  # `[B, T, C]`
         return xs
+
+    def forward_chunk(self, xs, cache, n_center):
+        """Streaming forward pass over a chunk with the cached left context.
+
+        Inputs of the depthwise convolution for the last `kernel_size // 2`
+        frames in the center region are carried over to the next chunk, so
+        that the left context is not re-encoded.
+
+        Args:
+            xs (FloatTensor): `[B, T, d_model]`
+            cache (FloatTensor): `[B, d_model, kernel_size // 2]`
+            n_center (int): number of frames in the center region
+        Returns:
+            xs (FloatTensor): `[B, T, d_model]`
+            cache (FloatTensor): `[B, d_model, kernel_size // 2]`
+
+        """
+        B, T, d_model = xs.size()
+        assert d_model == self.d_model
+        pad = self.depthwise_conv.padding[0]
+
+        xs = xs.transpose(2, 1).contiguous()  # `[B, C, T]`
+        xs = self.pointwise_conv1(xs)  # `[B, 2 * C, T]`
+        xs = F.glu(xs, dim=1)  # `[B, C, T]`
+        if cache is None:
+            cache = xs.new_zeros(B, d_model, pad)
+        xs = torch.cat([cache, xs], dim=2)  # `[B, C, pad + T]`
+        cache = xs[:, :, n_center:n_center + pad]
+        xs = F.pad(xs, (0, pad))  # pad only the right side
+        xs = F.conv1d(xs, self.depthwise_conv.weight, self.depthwise_conv.bias,
+                      groups=self.depthwise_conv.groups)  # `[B, C, T]`
+
+        xs = self.batch_norm(xs)
+        xs = self.activation(xs)
+        xs = self.pointwise_conv2(xs)  # `[B, C, T]`
+
+        xs = xs.transpose(2, 1).contiguous()  # `[B, T, C]`
+        return xs, cache
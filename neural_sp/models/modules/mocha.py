@@ -125,9 +125,9 @@ class MonotonicEnergy(nn.Module):
             self.key = key.transpose(2, 1).contiguous()  # `[B, H_ma, klen, d_k]`
             self.mask = mask
             if mask is not None:
-                self.mask = self.mask.unsqueeze(1).repeat([1, self.n_heads, 1, 1])  # `[B, H_ma, qlen, klen]`
-                assert self.mask.size() == (bs, self.n_heads, qlen, klen), \
-                    (self.mask.size(), (bs, self.n_heads, qlen, klen))
+                self.mask = self.mask.unsqueeze(1)  # `[B, 1, qlen, klen]`, broadcast over heads
+                assert self.mask.size(0) in [1, bs] and self.mask.size(3) == klen, \
+                    (self.mask.size(), (bs, 1, qlen, klen))
 
         query = self.w_query(query).view(bs, -1, self.n_heads, self.d_k)
         query = query.transpose(2, 1).contiguous()  # `[B, H_ma, qlen, d_k]`
@@ -232,9 +232,9 @@ class ChunkEnergy(nn.Module):
             self.key = key.transpose(2, 1).contiguous()  # `[B, H_ca, klen, d_k]`
             self.mask = mask
             if mask is not None:
-                self.mask = self.mask.unsqueeze(1).repeat([1, self.n_heads, 1, 1])  # `[B, H_ca, qlen, klen]`
-                assert self.mask.size() == (bs, self.n_heads, qlen, klen), \
-                    (self.mask.size(), (bs, self.n_heads, qlen, klen))
+                self.mask = self.mask.unsqueeze(1)  # `[B, 1, qlen, klen]`, broadcast over heads
+                assert self.mask.size(0) in [1, bs] and self.mask.size(3) == klen, \
+                    (self.mask.size(), (bs, 1, qlen, klen))
 
         query = self.w_query(query).view(bs, -1, self.n_heads, self.d_k)
         query = query.transpose(2, 1).contiguous()  # `[B, H_ca, qlen, d_k]`
@@ -17,6 +17,9 @@ import random
 import torch
 import torch.nn as nn
 
+from neural_sp.models.torch_utils import get_attention_backend
+from neural_sp.models.torch_utils import scaled_dot_product_attention
+
 random.seed(1)
 
 logger = logging.getLogger(__name__)
@@ -93,20 +96,43 @@ class MultiheadAttentionMechanism(nn.Module):
         self.value = None
         self.mask = None
 
+    def head_weights(self):
+        """Sample heads to be masked out (HeadDrop).
+
+        Returns:
+            head_weights (FloatTensor): `[H]`, normalized by the number of effective heads
+
+        """
+        n_effective_heads = self.n_heads
+        head_weights = self.w_out.weight.new_ones(self.n_heads)
+        for h in range(self.n_heads):
+            if random.random() < self.dropout_head:
+                head_weights[h] = 0
+                n_effective_heads -= 1
+        # Normalization
+        if n_effective_heads > 0:
+            head_weights = head_weights * (self.n_heads / n_effective_heads)
+        return head_weights
+
     def forward(self, key, value, query, mask, aw_prev=None,
-                cache=False, mode='', trigger_point=None, eps_wait=-1):
+                cache=False, mode='', trigger_point=None, eps_wait=-1,
+                need_weights=True):
         """Forward pass.
 
         Args:
             key (FloatTensor): `[B, klen, kdim]`
             value (FloatTensor): `[B, klen, vdim]`
             query (FloatTensor): `[B, qlen, qdim]`
-            mask (ByteTensor): `[B, qlen, klen]`
+            mask (ByteTensor or FloatTensor): `[B, qlen, klen]` or any shape broadcastable to it
+                (e.g., `[B, 1, klen]` for padding and `[1, qlen, klen]` for causality).
+                A float mask is added to the attention energies as a bias.
             aw_prev: dummy interface
             cache (bool): cache key, value, and mask
             mode: dummy interface for MoChA
             trigger_point: dummy interface for MoChA
             eps_wait: dummy interface for MMA
+            need_weights (bool): return attention weights. Otherwise, the fused kernel
+                is used if available and None is returned instead.
         Returns:
             cv (FloatTensor): `[B, qlen, vdim]`
             aw (FloatTensor): `[B, H, qlen, klen]`
@@ -122,12 +148,25 @@ class MultiheadAttentionMechanism(nn.Module):
             self.value = self.w_value(value).view(bs, -1, self.n_heads, self.d_k)  # `[B, klen, H, d_k]`
             self.mask = mask
             if self.mask is not None:
-                self.mask = self.mask.unsqueeze(3).repeat([1, 1, 1, self.n_heads])
-                assert self.mask.size() == (bs, qlen, klen, self.n_heads), \
-                    (self.mask.size(), (bs, qlen, klen, self.n_heads))
+                assert self.mask.size(0) in [1, bs] and self.mask.size(1) in [1, qlen] and self.mask.size(2) in [1, klen], \
+                    (self.mask.size(), (bs, qlen, klen))
+                self.mask = self.mask.unsqueeze(3)  # broadcast over heads
 
         query = self.w_query(query).view(bs, -1, self.n_heads, self.d_k)  # `[B, qlen, H, d_k]`
 
+        if not need_weights and self.atype == 'scaled_dot' and get_attention_backend() == 'sdpa':
+            mask = self.mask.squeeze(3).unsqueeze(1) if self.mask is not None else None  # `[B, 1, qlen, klen]`
+            cv = scaled_dot_product_attention(query.transpose(2, 1), self.key.transpose(2, 1),
+                                              self.value.transpose(2, 1), mask,
+                                              self.dropout_attn.p if self.training else 0.)
+            cv = cv.transpose(2, 1)  # `[B, qlen, H, d_k]`
+            # mask out each head independently (HeadDrop)
+            if self.dropout_head > 0 and self.training:
+                cv = cv * self.head_weights().view(1, 1, self.n_heads, 1)
+            cv = cv.contiguous().view(bs, -1, self.n_heads * self.d_k)  # `[B, qlen, H * d_k]`
+            cv = self.w_out(cv)
+            return cv, None, None, None
+
         if self.atype == 'scaled_dot':
             e = torch.einsum("bihd,bjhd->bijh", (query, self.key)) / self.scale  # `[B, qlen, klen, H]`
         elif self.atype == 'add':
@@ -138,24 +177,18 @@ class MultiheadAttentionMechanism(nn.Module):
 
         # Compute attention weights
         if self.mask is not None:
-            NEG_INF = float(np.finfo(torch.tensor(0, dtype=e.dtype).numpy().dtype).min)
-            e = e.masked_fill_(self.mask == 0, NEG_INF)  # `[B, qlen, klen, H]`
+            if self.mask.is_floating_point():
+                e = e + self.mask  # `[B, qlen, klen, H]`
+            else:
+                NEG_INF = float(np.finfo(torch.tensor(0, dtype=e.dtype).numpy().dtype).min)
+                e = e.masked_fill_(self.mask == 0, NEG_INF)  # `[B, qlen, klen, H]`
         aw = torch.softmax(e, dim=2)
         aw = self.dropout_attn(aw)
-        aw_masked = aw.clone()
 
         # mask out each head independently (HeadDrop)
+        aw_masked = aw
         if self.dropout_head > 0 and self.training:
-            n_effective_heads = self.n_heads
-            head_mask = aw.new_ones(aw.size()).byte()  # `[B, qlen, klen, H]`
-            for h in range(self.n_heads):
-                if random.random() < self.dropout_head:
-                    head_mask[:, :, :, h] = 0
-                    n_effective_heads -= 1
-            aw_masked = aw_masked.masked_fill_(head_mask == 0, 0)
-            # Normalization
-            if n_effective_heads > 0:
-                aw_masked = aw_masked * (self.n_heads / n_effective_heads)
+            aw_masked = aw * self.head_weights().view(1, 1, 1, self.n_heads)
 
         cv = torch.einsum("bijh,bjhd->bihd", (aw_masked, self.value))  # `[B, qlen, H, d_k]`
         cv = cv.contiguous().view(bs, -1, self.n_heads * self.d_k)  # `[B, qlen, H * d_k]`
@@ -163,3 +196,38 @@ class MultiheadAttentionMechanism(nn.Module):
         aw = aw.permute(0, 3, 1, 2)  # `[B, H, qlen, klen]`
 
         return cv, aw, None, None
+
+    def forward_step(self, query, kv_cache, step):
+        """Incremental forward pass of self-attention for a single query.
+
+        Key and value of the current query are written to the preallocated
+        caches in place, so that no memory is allocated as the sequence grows.
+
+        Args:
+            query (FloatTensor): `[B, 1, qdim]`
+            kv_cache (tuple): preallocated key and value caches, each of size `[B, L_max, adim]`
+            step (int): position of the current query
+        Returns:
+            cv (FloatTensor): `[B, 1, vdim]`
+            aw (FloatTensor): `[B, H, 1, step + 1]`
+
+        """
+        assert self.atype == 'scaled_dot'
+        bs = query.size(0)
+        key_cache, value_cache = kv_cache
+        key_cache[:, step] = self.w_key(query[:, 0])
+        value_cache[:, step] = self.w_value(query[:, 0])
+        key = key_cache[:, :step + 1].view(bs, -1, self.n_heads, self.d_k)  # `[B, klen, H, d_k]`
+        value = value_cache[:, :step + 1].view(bs, -1, self.n_heads, self.d_k)  # `[B, klen, H, d_k]`
+
+        query = self.w_query(query).view(bs, -1, self.n_heads, self.d_k)  # `[B, 1, H, d_k]`
+        e = torch.einsum("bihd,bjhd->bijh", (query, key)) / self.scale  # `[B, 1, klen, H]`
+        aw = torch.softmax(e, dim=2)
+        aw = self.dropout_attn(aw)
+
+        cv = torch.einsum("bijh,bjhd->bihd", (aw, value))  # `[B, 1, H, d_k]`
+        cv = cv.contiguous().view(bs, -1, self.n_heads * self.d_k)  # `[B, 1, H * d_k]`
+        cv = self.w_out(cv)
+        aw = aw.permute(0, 3, 1, 2)  # `[B, H, 1, klen]`
+
+        return cv, aw
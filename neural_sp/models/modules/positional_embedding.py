@@ -85,11 +85,13 @@ class PositionalEncoding(nn.Module):
                 for n, p in layer.named_parameters():
                     init_with_xavier_uniform(n, p)
 
-    def forward(self, xs, scale=True):
+    def forward(self, xs, scale=True, offset=0):
         """Forward computation.
 
         Args:
             xs (FloatTensor): `[B, T, d_model]`
+            scale (bool): multiply the embedding by sqrt(d_model)
+            offset (int): position of the first frame (for incremental decoding)
         Returns:
             xs (FloatTensor): `[B, T, d_model]`
 
@@ -101,10 +103,10 @@ class PositionalEncoding(nn.Module):
         if self.pe_type == 'none':
             return xs
         elif self.pe_type == 'add':
-            xs = xs + self.pe[:, :xs.size(1)]
+            xs = xs + self.pe[:, offset:offset + xs.size(1)]
             xs = self.dropout(xs)
         elif self.pe_type == 'concat':
-            xs = torch.cat([xs, self.pe[:, :xs.size(1)]], dim=-1)
+            xs = torch.cat([xs, self.pe[:, offset:offset + xs.size(1)]], dim=-1)
             xs = self.dropout(xs)
         elif '1dconv' in self.pe_type:
             xs = self.pe(xs)
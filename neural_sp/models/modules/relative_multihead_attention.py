@@ -12,6 +12,9 @@ import numpy as np
 import torch
 import torch.nn as nn
 
+from neural_sp.models.torch_utils import get_attention_backend
+from neural_sp.models.torch_utils import scaled_dot_product_attention
+
 
 logger = logging.getLogger(__name__)
 
@@ -88,17 +91,21 @@ class RelativeMultiheadAttentionMechanism(nn.Module):
                       .view_as(xs))
         return xs_shifted.view(qlen, klen, bs, n_heads).permute(2, 0, 1, 3)
 
-    def forward(self, key, query, memory, pos_embs, mask, u=None, v=None):
+    def forward(self, key, query, memory, pos_embs, mask, u=None, v=None,
+                need_weights=True):
         """Forward computation.
 
         Args:
             key (FloatTensor): `[B, klen, kdim]`
             query (FloatTensor): `[B, qlen, qdim]`
             memory (FloatTensor): `[B, mlen, d_model]`
-            mask (ByteTensor): `[B, qlen, klen+mlen]`
+            mask (ByteTensor or FloatTensor): `[B, qlen, klen+mlen]` or any shape broadcastable to it.
+                A float mask is added to the attention energies as a bias.
             pos_embs (LongTensor): `[qlen, 1, d_model]`
             u (nn.Parameter): `[H, d_k]`
             v (nn.Parameter): `[H, d_k]`
+            need_weights (bool): return attention weights. Otherwise, the fused kernel
+                is used if available and None is returned instead.
         Returns:
             cv (FloatTensor): `[B, qlen, vdim]`
             aw (FloatTensor): `[B, H, qlen, klen+mlen]`
@@ -113,20 +120,14 @@ class RelativeMultiheadAttentionMechanism(nn.Module):
         value = self.w_value(key).view(bs, -1, self.n_heads, self.d_k)  # `[B, klen+mlen, H, d_k]`
         key = self.w_key(key).view(bs, -1, self.n_heads, self.d_k)  # `[B, klen+mlen, H, d_k]`
         if mask is not None:
-            mask = mask.unsqueeze(3).repeat([1, 1, 1, self.n_heads])
-            assert mask.size() == (bs, qlen, mlen + klen, self.n_heads), \
-                (mask.size(), (bs, qlen, klen + mlen, self.n_heads))
+            assert mask.size(0) in [1, bs] and mask.size(1) in [1, qlen] and mask.size(2) in [1, mlen + klen], \
+                (mask.size(), (bs, qlen, klen + mlen))
+            mask = mask.unsqueeze(3)  # broadcast over heads
 
         query = self.w_query(query).view(bs, -1, self.n_heads, self.d_k)  # `[B, qlen, H, d_k]`
         pos_embs = self.w_position(pos_embs)
         pos_embs = pos_embs.view(-1, self.n_heads, self.d_k)  # `[qlen, H, d_k]`
 
-        # content-based attention term: (a) + (c)
-        if u is not None:
-            AC = torch.einsum("bihd,bjhd->bijh", ((query + u[None, None]), key))  # `[B, qlen, klen+mlen, H]`
-        else:
-            AC = torch.einsum("bihd,bjhd->bijh", (query, key))  # `[B, qlen, klen+mlen, H]`
-
         # position-based attention term: (b) + (d)
         if v is not None:
             BD = torch.einsum("bihd,jhd->bijh", ((query + v[None, None]), pos_embs))  # `[B, qlen, klen+mlen, H]`
@@ -136,13 +137,36 @@ class RelativeMultiheadAttentionMechanism(nn.Module):
         # Compute positional attention efficiently
         BD = self._rel_shift(BD)
 
+        if not need_weights and get_attention_backend() == 'sdpa':
+            # the position-based term is fed to the fused kernel as a bias
+            bias = (BD / self.scale).permute(0, 3, 1, 2)  # `[B, H, qlen, klen+mlen]`
+            if mask is not None:
+                mask = mask.squeeze(3).unsqueeze(1)  # `[B, 1, qlen, klen+mlen]`
+            if u is not None:
+                query = query + u[None, None]
+            cv = scaled_dot_product_attention(query.transpose(2, 1), key.transpose(2, 1),
+                                              value.transpose(2, 1), mask,
+                                              self.dropout.p if self.training else 0., bias=bias)
+            cv = cv.transpose(2, 1).contiguous().view(bs, -1, self.n_heads * self.d_k)  # `[B, qlen, H * d_k]`
+            cv = self.w_out(cv)
+            return cv, None
+
+        # content-based attention term: (a) + (c)
+        if u is not None:
+            AC = torch.einsum("bihd,bjhd->bijh", ((query + u[None, None]), key))  # `[B, qlen, klen+mlen, H]`
+        else:
+            AC = torch.einsum("bihd,bjhd->bijh", (query, key))  # `[B, qlen, klen+mlen, H]`
+
         # the attention is the sum of content-based and position-based attention
         e = (AC + BD) / self.scale  # `[B, qlen, klen+mlen, H]`
 
         # Compute attention weights
         if mask is not None:
-            NEG_INF = float(np.finfo(torch.tensor(0, dtype=e.dtype).numpy().dtype).min)
-            e = e.masked_fill_(mask == 0, NEG_INF)  # `[B, qlen, klen+mlen, H]`
+            if mask.is_floating_point():
+                e = e + mask  # `[B, qlen, klen+mlen, H]`
+            else:
+                NEG_INF = float(np.finfo(torch.tensor(0, dtype=e.dtype).numpy().dtype).min)
+                e = e.masked_fill_(mask == 0, NEG_INF)  # `[B, qlen, klen+mlen, H]`
         aw = torch.softmax(e, dim=2)
         aw = self.dropout(aw)  # `[B, qlen, klen+mlen, H]`
         cv = torch.einsum("bijh,bjhd->bihd", (aw, value))  # `[B, qlen, H, d_k]`
@@ -12,6 +12,9 @@ import numpy as np
 import torch
 import torch.nn as nn
 
+from neural_sp.models.torch_utils import get_attention_backend
+from neural_sp.models.torch_utils import scaled_dot_product_attention
+
 
 logger = logging.getLogger(__name__)
 
@@ -93,7 +96,7 @@ class SyncBidirMultiheadAttentionMechanism(nn.Module):
     def forward(self, key_fwd, value_fwd, query_fwd,
                 key_bwd, value_bwd, query_bwd,
                 tgt_mask, identity_mask,
-                mode='', cache=True, trigger_point=None):
+                mode='', cache=True, trigger_point=None, need_weights=True):
         """Forward computation.
 
         Args:
@@ -108,6 +111,8 @@ class SyncBidirMultiheadAttentionMechanism(nn.Module):
             mode: dummy interface for MoChA
             cache (bool): cache key, value, and tgt_mask
             trigger_point (IntTensor): dummy
+            need_weights (bool): return attention weights. Otherwise, the fused kernel
+                is used if available and None is returned instead.
         Returns:
             cv_fwd (FloatTensor): `[B, qlen, vdim]`
             cv_bwd (FloatTensor): `[B, qlen, vdim]`
@@ -118,7 +123,6 @@ class SyncBidirMultiheadAttentionMechanism(nn.Module):
 
         """
         bs, klen = key_fwd.size()[: 2]
-        qlen = query_fwd.size(1)
 
         if self.key_fwd is None or not cache:
             key_fwd = self.w_key(key_fwd).view(bs, -1, self.n_heads, self.d_k)
@@ -127,12 +131,13 @@ class SyncBidirMultiheadAttentionMechanism(nn.Module):
             self.value_fwd = value_fwd.transpose(2, 1).contiguous()  # `[B, H, klen, d_k]`
             self.tgt_mask = tgt_mask
             self.identity_mask = identity_mask
+            # NOTE: masks are broadcast over heads
             if tgt_mask is not None:
-                self.tgt_mask = tgt_mask.unsqueeze(1).repeat([1, self.n_heads, 1, 1])
-                assert self.tgt_mask.size() == (bs, self.n_heads, qlen, klen)
+                self.tgt_mask = tgt_mask.unsqueeze(1)  # `[B, 1, qlen, klen]`
+                assert self.tgt_mask.size(0) in [1, bs] and self.tgt_mask.size(3) == klen
             if identity_mask is not None:
-                self.identity_mask = identity_mask.unsqueeze(1).repeat([1, self.n_heads, 1, 1])
-                assert self.identity_mask.size() == (bs, self.n_heads, qlen, klen)
+                self.identity_mask = identity_mask.unsqueeze(1)  # `[B, 1, qlen, klen]`
+                assert self.identity_mask.size(0) in [1, bs] and self.identity_mask.size(3) == klen
         if self.key_bwd is None or not cache:
             key_bwd = self.w_key(key_bwd).view(bs, -1, self.n_heads, self.d_k)
             self.key_bwd = key_bwd.transpose(2, 1).contiguous()  # `[B, H, klen, d_k]`
@@ -144,6 +149,52 @@ class SyncBidirMultiheadAttentionMechanism(nn.Module):
         query_bwd = self.w_query(query_bwd).view(bs, -1, self.n_heads, self.d_k)
         query_bwd = query_bwd.transpose(2, 1).contiguous()  # `[B, H, qlen, d_k]`
 
+        if not need_weights and self.atype == 'scaled_dot' and get_attention_backend() == 'sdpa':
+            dropout = self.dropout.p if self.training else 0.
+            cv_fwd_h = scaled_dot_product_attention(query_fwd, self.key_fwd, self.value_fwd, self.tgt_mask, dropout)
+            cv_fwd_f = scaled_dot_product_attention(query_fwd, self.key_bwd, self.value_bwd, self.identity_mask, dropout)
+            cv_bwd_h = scaled_dot_product_attention(query_bwd, self.key_bwd, self.value_bwd, self.tgt_mask, dropout)
+            cv_bwd_f = scaled_dot_product_attention(query_bwd, self.key_fwd, self.value_fwd, self.identity_mask, dropout)
+            aw_fwd_h, aw_fwd_f, aw_bwd_h, aw_bwd_f = None, None, None, None
+        else:
+            (cv_fwd_h, cv_fwd_f, cv_bwd_h, cv_bwd_f,
+             aw_fwd_h, aw_fwd_f, aw_bwd_h, aw_bwd_f) = self._forward_einsum(query_fwd, query_bwd)
+
+        cv_fwd_h = cv_fwd_h.transpose(2, 1).contiguous().view(bs, -1, self.n_heads * self.d_k)
+        cv_fwd_h = self.w_out(cv_fwd_h)
+        cv_fwd_f = cv_fwd_f.transpose(2, 1).contiguous().view(bs, -1, self.n_heads * self.d_k)
+        cv_fwd_f = self.w_out(cv_fwd_f)
+        cv_bwd_h = cv_bwd_h.transpose(2, 1).contiguous().view(bs, -1, self.n_heads * self.d_k)
+        cv_bwd_h = self.w_out(cv_bwd_h)
+        cv_bwd_f = cv_bwd_f.transpose(2, 1).contiguous().view(bs, -1, self.n_heads * self.d_k)
+        cv_bwd_f = self.w_out(cv_bwd_f)
+
+        # merge history and future information
+        cv_fwd = cv_fwd_h + self.future_weight * torch.tanh(cv_fwd_f)
+        cv_bwd = cv_bwd_h + self.future_weight * torch.tanh(cv_bwd_f)
+
+        return cv_fwd, cv_bwd, aw_fwd_h, aw_fwd_f, aw_bwd_h, aw_bwd_f
+
+    def _forward_einsum(self, query_fwd, query_bwd):
+        """Reference computation with explicit attention weights.
+
+        Args:
+            query_fwd (FloatTensor): `[B, H, qlen, d_k]`
+            query_bwd (FloatTensor): `[B, H, qlen, d_k]`
+        Returns:
+            cv_fwd_h (FloatTensor): `[B, H, qlen, d_k]`
+            cv_fwd_f (FloatTensor): `[B, H, qlen, d_k]`
+            cv_bwd_h (FloatTensor): `[B, H, qlen, d_k]`
+            cv_bwd_f (FloatTensor): `[B, H, qlen, d_k]`
+            aw_fwd_h (FloatTensor): `[B, H, qlen, klen]`
+            aw_fwd_f (FloatTensor): `[B, H, qlen, klen]`
+            aw_bwd_h (FloatTensor): `[B, H, qlen, klen]`
+            aw_bwd_f (FloatTensor): `[B, H, qlen, klen]`
+
+        """
+        bs, _, qlen = query_fwd.size()[:3]
+        klen = self.key_fwd.size(2)
+
         if self.atype == 'scaled_dot':
             e_fwd_h = torch.matmul(query_fwd, self.key_fwd.transpose(3, 2)) / self.scale
             e_fwd_f = torch.matmul(query_fwd, self.key_bwd.transpose(3, 2)) / self.scale
@@ -182,17 +233,4 @@ class SyncBidirMultiheadAttentionMechanism(nn.Module):
         cv_bwd_h = torch.matmul(aw_bwd_h, self.value_bwd)  # `[B, H, qlen, d_k]`
         cv_bwd_f = torch.matmul(aw_bwd_f, self.value_fwd)  # `[B, H, qlen, d_k]`
 
-        cv_fwd_h = cv_fwd_h.transpose(2, 1).contiguous().view(bs, -1, self.n_heads * self.d_k)
-        cv_fwd_h = self.w_out(cv_fwd_h)
-        cv_fwd_f = cv_fwd_f.transpose(2, 1).contiguous().view(bs, -1, self.n_heads * self.d_k)
-        cv_fwd_f = self.w_out(cv_fwd_f)
-        cv_bwd_h = cv_bwd_h.transpose(2, 1).contiguous().view(bs, -1, self.n_heads * self.d_k)
-        cv_bwd_h = self.w_out(cv_bwd_h)
-        cv_bwd_f = cv_bwd_f.transpose(2, 1).contiguous().view(bs, -1, self.n_heads * self.d_k)
-        cv_bwd_f = self.w_out(cv_bwd_f)
-
-        # merge history and future information
-        cv_fwd = cv_fwd_h + self.future_weight * torch.tanh(cv_fwd_f)
-        cv_bwd = cv_bwd_h + self.future_weight * torch.tanh(cv_bwd_f)
-
-        return cv_fwd, cv_bwd, aw_fwd_h, aw_fwd_f, aw_bwd_h, aw_bwd_f
+        return cv_fwd_h, cv_fwd_f, cv_bwd_h, cv_bwd_f, aw_fwd_h, aw_fwd_f, aw_bwd_h, aw_bwd_f
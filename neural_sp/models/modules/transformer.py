@@ -15,6 +15,7 @@ from neural_sp.models.modules.mocha import MoChA
 from neural_sp.models.modules.multihead_attention import MultiheadAttentionMechanism as MHA
 from neural_sp.models.modules.positionwise_feed_forward import PositionwiseFeedForward as FFN
 from neural_sp.models.modules.relative_multihead_attention import RelativeMultiheadAttentionMechanism as RelMHA
+from neural_sp.models.torch_utils import is_attention_captured
 
 random.seed(1)
 
@@ -205,12 +206,13 @@ class TransformerDecoderBlock(nn.Module):
             ys_q = ys
 
         # self-attention
+        need_weights = not self.training and is_attention_captured()
         if self.memory_transformer:
             if cache is not None:
                 pos_embs = pos_embs[-ys_q.size(1):]
-            out, self._yy_aws = self.self_attn(ys, ys_q, memory, pos_embs, yy_mask, u, v)
+            out, self._yy_aws = self.self_attn(ys, ys_q, memory, pos_embs, yy_mask, u, v, need_weights=need_weights)
         else:
-            out, self._yy_aws = self.self_attn(ys, ys, ys_q, mask=yy_mask)[:2]  # k/v/q
+            out, self._yy_aws = self.self_attn(ys, ys, ys_q, mask=yy_mask, need_weights=need_weights)[:2]  # k/v/q
         out = self.dropout(out) + residual
 
         # attention over encoder stacks
@@ -248,6 +250,46 @@ class TransformerDecoderBlock(nn.Module):
 
         return out
 
+    def forward_step(self, ys, kv_cache, step, xs=None, xy_mask=None):
+        """Incremental forward pass for a single step with preallocated caches.
+
+        Projections of the encoder outputs are cached in the source-target
+        attention at the first step. Call `self.src_attn.reset()` before decoding.
+
+        Args:
+            ys (FloatTensor): `[B, 1, d_model]`
+            kv_cache (tuple): preallocated key and value caches of the self-attention,
+                each of size `[B, L_max, d_model]`
+            step (int): position of the current token
+            xs (FloatTensor): encoder outputs. `[B, T, d_model]`
+            xy_mask (ByteTensor): `[B, 1, T]`
+        Returns:
+            out (FloatTensor): `[B, 1, d_model]`
+
+        """
+        assert not self.memory_transformer and not self.lm_fusion
+        self.reset_visualization()
+
+        residual = ys
+        ys = self.norm1(ys)
+        out, self._yy_aws = self.self_attn.forward_step(ys, kv_cache, step)
+        out = self.dropout(out) + residual
+
+        # attention over encoder stacks
+        if self.src_tgt_attention:
+            residual = out
+            out = self.norm2(out)
+            out, self._xy_aws = self.src_attn(xs, xs, out, mask=xy_mask, cache=True)[:2]  # k/v/q
+            out = self.dropout(out) + residual
+
+        # position-wise feed-forward
+        residual = out
+        out = self.norm3(out)
+        out = self.feed_forward(out)
+        out = self.dropout(out) + residual
+
+        return out
+
 
 class SyncBidirTransformerDecoderBlock(nn.Module):
     """A single layer of the synchronous bidirectional Transformer decoder.
@@ -66,5 +66,26 @@ class BeamSearch(object):
         new_ctc_states = new_ctc_states[joint_ids_topk[0].cpu().numpy()]
         return new_ctc_states, total_scores_ctc, total_scores_topk
 
+    def ctc_score_batch(self, hyps, topk_ids, ctc_prefix_scorer, batch_ids=None):
+        """Compute CTC prefix scores of the top-K candidates of all hypotheses at once.
+
+        Args:
+            hyps (list): length `N`, each of which is a dict containing `hyp` and `ctc_state`
+            topk_ids (LongTensor): `[N, beam_width]`
+            ctc_prefix_scorer (CTCPrefixScoreTH):
+            batch_ids (list): index of the utterance of each hypothesis
+        Returns:
+            new_ctc_states (FloatTensor): `[N, beam_width, T, 2]`
+            total_scores_ctc (FloatTensor): `[N, beam_width]`
+
+        """
+        if ctc_prefix_scorer is None:
+            return None, topk_ids.new_zeros(topk_ids.size(), dtype=torch.float)
+
+        ctc_states = torch.stack([beam['ctc_state'] for beam in hyps], dim=0)
+        total_scores_ctc, new_ctc_states = ctc_prefix_scorer(
+            [beam['hyp'] for beam in hyps], topk_ids, ctc_states, batch_ids)
+        return new_ctc_states, total_scores_ctc
+
     def add_lm_score(self):
         raise NotImplementedError
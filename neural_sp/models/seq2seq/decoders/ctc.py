@@ -7,7 +7,6 @@
 """CTC decoder."""
 
 from collections import OrderedDict
-from itertools import groupby
 import logging
 import numpy as np
 import random
@@ -142,41 +141,21 @@ class CTC(DecoderBase):
             eouts (FloatTensor): `[B, T, enc_n_units]`
             elens (IntTensor): `[B]`
         Returns:
-            hyps (IntTensor): `[B, L]`
+            trigger_points (IntTensor): `[B, L + 1]`
 
         """
         bs, xmax, _ = eouts.size()
         log_probs = torch.log_softmax(self.output(eouts), dim=-1)
-        best_paths = log_probs.argmax(-1)  # `[B, L]`
+        best_paths = log_probs.argmax(-1)  # `[B, T]`
+        is_trigger = _greedy_emission_mask(best_paths, elens, self.blank)  # `[B, T]`
 
-        hyps = []
-        for b in range(bs):
-            indices = [best_paths[b, t].item() for t in range(elens[b])]
-
-            # Step 1. Collapse repeated labels
-            collapsed_indices = [x[0] for x in groupby(indices)]
-
-            # Step 2. Remove all blank labels
-            best_hyp = [x for x in filter(lambda x: x != self.blank, collapsed_indices)]
-            hyps.append(best_hyp)
-
-        ymax = max([len(h) for h in hyps])
-
-        # pick up trigger points
+        # NOTE: select the most left trigger points
+        ylens = is_trigger.sum(1)
+        ymax = ylens.max().item() if bs > 0 else 0  # the only host sync
         trigger_points = log_probs.new_zeros((bs, ymax + 1), dtype=torch.int32)  # +1 for <eos>
-        for b in range(bs):
-            n_triggers = 0
-            for t in range(elens[b]):
-                token_idx = best_paths[b, t]
-
-                if token_idx == self.blank:
-                    continue
-                if not (t == 0 or token_idx != best_paths[b, t - 1]):
-                    continue
-
-                # NOTE: select the most left trigger points
-                trigger_points[b, n_triggers] = t
-                n_triggers += 1
+        batch_ids, frames = is_trigger.nonzero(as_tuple=True)
+        token_ids = torch.cumsum(is_trigger, dim=1)[batch_ids, frames] - 1
+        trigger_points[batch_ids, token_ids] = frames.int()
 
         return trigger_points
 
@@ -187,24 +166,19 @@ class CTC(DecoderBase):
             eouts (FloatTensor): `[B, T, enc_n_units]`
             elens (np.ndarray): `[B]`
         Returns:
-            hyps (np.ndarray): Best path hypothesis. `[B, L]`
+            hyps (list): length `B`, each of which contains arrays of size `[L]`
 
         """
         log_probs = torch.log_softmax(self.output(eouts), dim=-1)
-        best_paths = log_probs.argmax(-1)  # `[B, L]`
-
-        hyps = []
-        for b in range(eouts.size(0)):
-            indices = [best_paths[b, t].item() for t in range(elens[b])]
-
-            # Step 1. Collapse repeated labels
-            collapsed_indices = [x[0] for x in groupby(indices)]
+        best_paths = log_probs.argmax(-1)  # `[B, T]`
+        is_emitted = _greedy_emission_mask(best_paths, elens, self.blank)  # `[B, T]`
 
-            # Step 2. Remove all blank labels
-            best_hyp = [x for x in filter(lambda x: x != self.blank, collapsed_indices)]
-            hyps.append(np.array(best_hyp))
+        # Transfer the best paths to the host at once
+        best_paths = tensor2np(best_paths)
+        is_emitted = tensor2np(is_emitted)
+        hyps = [best_paths[b][is_emitted[b]] for b in range(best_paths.shape[0])]
 
-        return np.array(hyps)
+        return hyps
 
     def beam_search(self, eouts, elens, params, idx2token,
                     lm=None, lm_second=None, lm_second_rev=None,
@@ -229,7 +203,7 @@ class CTC(DecoderBase):
             utt_ids (list): utterance id list
             speakers (list): speaker list
         Returns:
-            best_hyps (list): Best path hypothesis. `[B, L]`
+            best_hyps (list): length `B`, each of which contains arrays of size `[L]`
 
         """
         bs = eouts.size(0)
@@ -238,6 +212,7 @@ class CTC(DecoderBase):
         lp_weight = params['recog_length_penalty']
         lm_weight = params['recog_lm_weight']
         lm_weight_second = params['recog_lm_second_weight']
+        lm_weight_second_bwd = params['recog_lm_bwd_weight']
 
         if lm is not None:
             assert lm_weight > 0
@@ -245,110 +220,26 @@ class CTC(DecoderBase):
         if lm_second is not None:
             assert lm_weight_second > 0
             lm_second.eval()
+        if lm_second_rev is not None:
+            assert lm_weight_second_bwd > 0
+            lm_second_rev.eval()
+
+        beam_search = CTCPrefixBeamSearch(self.blank, self.eos, beam_width, lp_weight,
+                                          lm=lm, lm_weight=lm_weight)
 
-        best_hyps = []
         log_probs = torch.log_softmax(self.output(eouts), dim=-1)
-        for b in range(bs):
-            # Elements in the beam are (prefix, (p_b, p_no_blank))
-            # Initialize the beam with the empty sequence, a probability of
-            # 1 for ending in blank and zero for ending in non-blank (in log space).
-            beam = [{'hyp': [self.eos],  # <eos> is used for LM
-                     'p_b': LOG_1,
-                     'p_nb': LOG_0,
-                     'score_lm': LOG_1,
-                     'lmstate': None}]
+        beams = [beam_search(log_probs[b, :elens[b]]) for b in range(bs)]
 
-            for t in range(elens[b]):
-                new_beam = []
-
-                # Pick up the top-k scores
-                log_probs_topk, topk_ids = torch.topk(
-                    log_probs[b:b + 1, t], k=min(beam_width, self.vocab), dim=-1, largest=True, sorted=True)
-
-                for i_beam in range(len(beam)):
-                    hyp = beam[i_beam]['hyp'][:]
-                    p_b = beam[i_beam]['p_b']
-                    p_nb = beam[i_beam]['p_nb']
-                    score_lm = beam[i_beam]['score_lm']
-
-                    # case 1. hyp is not extended
-                    new_p_b = np.logaddexp(p_b + log_probs[b, t, self.blank].item(),
-                                           p_nb + log_probs[b, t, self.blank].item())
-                    if len(hyp) > 1:
-                        new_p_nb = p_nb + log_probs[b, t, hyp[-1]].item()
-                    else:
-                        new_p_nb = LOG_0
-                    score_ctc = np.logaddexp(new_p_b, new_p_nb)
-                    score_lp = len(hyp[1:]) * lp_weight
-                    new_beam.append({'hyp': hyp,
-                                     'score': score_ctc + score_lm + score_lp,
-                                     'p_b': new_p_b,
-                                     'p_nb': new_p_nb,
-                                     'score_ctc': score_ctc,
-                                     'score_lm': score_lm,
-                                     'score_lp': score_lp,
-                                     'lmstate': beam[i_beam]['lmstate']})
-
-                    # Update LM states for shallow fusion
-                    if lm is not None:
-                        _, lmstate, lm_log_probs = lm.predict(
-                            eouts.new_zeros(1, 1).fill_(hyp[-1]), beam[i_beam]['lmstate'])
-                    else:
-                        lmstate = None
-
-                    # case 2. hyp is extended
-                    new_p_b = LOG_0
-                    for c in tensor2np(topk_ids)[0]:
-                        p_t = log_probs[b, t, c].item()
-
-                        if c == self.blank:
-                            continue
-
-                        c_prev = hyp[-1] if len(hyp) > 1 else None
-                        if c == c_prev:
-                            new_p_nb = p_b + p_t
-                            # TODO(hirofumi): apply character LM here
-                        else:
-                            new_p_nb = np.logaddexp(p_b + p_t, p_nb + p_t)
-                            # TODO(hirofumi): apply character LM here
-                            if c == self.space:
-                                pass
-                                # TODO(hirofumi): apply word LM here
-
-                        score_ctc = np.logaddexp(new_p_b, new_p_nb)
-                        score_lp = (len(hyp[1:]) + 1) * lp_weight
-                        if lm_weight > 0 and lm is not None:
-                            local_score_lm = lm_log_probs[0, 0, c].item() * lm_weight
-                            score_lm += local_score_lm
-                        new_beam.append({'hyp': hyp + [c],
-                                         'score': score_ctc + score_lm + score_lp,
-                                         'p_b': new_p_b,
-                                         'p_nb': new_p_nb,
-                                         'score_ctc': score_ctc,
-                                         'score_lm': score_lm,
-                                         'score_lp': score_lp,
-                                         'lmstate': lmstate})
-
-                # Pruning
-                beam = sorted(new_beam, key=lambda x: x['score'], reverse=True)[:beam_width]
-
-            # Rescoing lattice
-            if lm_second is not None:
-                new_beam = []
-                for i_beam in range(len(beam)):
-                    ys = [np2tensor(np.fromiter(beam[i_beam]['hyp'], dtype=np.int64), self.device_id)]
-                    ys_pad = pad_list(ys, lm_second.pad)
-                    _, _, lm_log_probs = lm_second.predict(ys_pad, None)
-                    score_ctc = np.logaddexp(beam[i_beam]['p_b'], beam[i_beam]['p_nb'])
-                    score_lm = lm_log_probs.sum() * lm_weight_second
-                    score_lp = len(beam[i_beam]['hyp'][1:]) * lp_weight
-                    new_beam.append({'hyp': beam[i_beam]['hyp'],
-                                     'score': score_ctc + score_lm + score_lp,
-                                     'score_ctc': score_ctc,
-                                     'score_lp': score_lp,
-                                     'score_lm': score_lm})
-                beam = sorted(new_beam, key=lambda x: x['score'], reverse=True)
+        # Rescoing lattice of all utterances at once
+        if lm_second is not None:
+            self.lm_rescoring(sum(beams, []), lm_second, lm_weight_second, tag='second')
+        if lm_second_rev is not None:
+            self.lm_rescoring(sum(beams, []), lm_second_rev, lm_weight_second_bwd,
+                              reverse=True, tag='second_bwd')
 
+        best_hyps = []
+        for b in range(bs):
+            beam = sorted(beams[b], key=lambda x: x['score'], reverse=True)
             best_hyps.append(np.array(beam[0]['hyp'][1:]))
 
             if idx2token is not None:
@@ -362,15 +253,40 @@ class CTC(DecoderBase):
                     logger.info('Hyp: %s' % idx2token(beam[k]['hyp'][1:]))
                     logger.info('log prob (hyp): %.7f' % beam[k]['score'])
                     logger.info('log prob (hyp, ctc): %.7f' % (beam[k]['score_ctc']))
-                    logger.info('log prob (hyp, lp): %.7f' % (beam[k]['score_lp'] * lp_weight))
+                    logger.info('log prob (hyp, lp): %.7f' % beam[k]['score_lp'])
                     if lm is not None:
-                        logger.info('log prob (hyp, first-path lm): %.7f' % (beam[k]['score_lm'] * lm_weight))
+                        logger.info('log prob (hyp, first-path lm): %.7f' % beam[k]['score_lm'])
                     if lm_second is not None:
                         logger.info('log prob (hyp, second-path lm): %.7f' %
                                     (beam[k]['score_lm_second'] * lm_weight_second))
+                    if lm_second_rev is not None:
+                        logger.info('log prob (hyp, second-path lm, reverse): %.7f' %
+                                    (beam[k]['score_lm_second_bwd'] * lm_weight_second_bwd))
                     logger.info('-' * 50)
 
-        return np.array(best_hyps)
+        return best_hyps
+
+
+def _greedy_emission_mask(best_paths, elens, blank):
+    """Find frames emitting labels in the best paths.
+
+    Repeated labels are collapsed to their first frames, and <blank> and
+    padded frames are removed.
+
+    Args:
+        best_paths (LongTensor): `[B, T]`
+        elens (IntTensor or np.ndarray): `[B]`
+        blank (int): index of <blank>
+    Returns:
+        mask (BoolTensor): `[B, T]`
+
+    """
+    xmax = best_paths.size(1)
+    elens = torch.as_tensor(elens).to(best_paths.device)
+    is_new = torch.ones_like(best_paths, dtype=torch.bool)
+    is_new[:, 1:] = best_paths[:, 1:] != best_paths[:, :-1]
+    is_valid = torch.arange(xmax, device=best_paths.device).unsqueeze(0) < elens.unsqueeze(1)
+    return is_new & (best_paths != blank) & is_valid
 
 
 def _label_to_path(labels, blank):
@@ -479,7 +395,7 @@ class CTCForcedAligner(object):
         # zero padding
         device_id = torch.cuda.device_of(logits).idx
         mask = make_pad_mask(elens, device_id)
-        mask = mask.unsqueeze(2).repeat([1, 1, vocab])
+        mask = mask.unsqueeze(2)
         logits = logits.masked_fill_(mask == 0, self.log0)
         log_probs = torch.log_softmax(logits, dim=-1).transpose(0, 1)  # `[T, B, vocab]`
 
@@ -573,13 +489,14 @@ class CTCPrefixScore(object):
         https://github.com/espnet/espnet
     """
 
-    def __init__(self, log_probs, blank, eos, truncate=False):
+    def __init__(self, log_probs, blank, eos, margin=0):
         """
         Args:
             log_probs (np.ndarray):
             blank (int): index of <blank>
             eos (int): index of <eos>
-            truncate (bool): restart prefix search from the previous CTC spike
+            margin (int): number of frames around the previous CTC spike to compute
+                prefix scores. All frames are used if 0.
 
         """
         self.blank = blank
@@ -589,8 +506,7 @@ class CTCPrefixScore(object):
         self.log_probs = log_probs
         self.log0 = LOG_0
 
-        self.truncate = truncate
-        self.offset = 0
+        self.margin = margin
 
     def initial_state(self):
         """Obtain an initial CTC state
@@ -631,13 +547,10 @@ class CTCPrefixScore(object):
         ylen = len(hyp) - 1  # ignore sos
         # new CTC states are prepared as a frame x (n or b) x n_labels tensor
         # that corresponds to r_t^n(h) and r_t^b(h).
-        r = np.ndarray((self.xlen, 2, beam_width), dtype=np.float32)
+        r = np.full((self.xlen, 2, beam_width), self.log0, dtype=np.float32)
         xs = self.log_probs[:, cs]
         if ylen == 0:
             r[0, 0] = xs[0]
-            r[0, 1] = self.log0
-        else:
-            r[ylen - 1] = self.log0
 
         # Initialize CTC state for the new chunk
         if new_chunk and self.xlen_prev > 0:
@@ -658,17 +571,223 @@ class CTCPrefixScore(object):
         else:
             log_phi = r_sum  # `[T]`
 
+        # restrict frames to those around the spike of the last label
+        start = max(ylen, 1)
+        end = self.xlen
+        if self.margin > 0 and ylen > 0:
+            spike = int(np.argmax(r_prev[:, 0]))
+            start = max(start, spike - self.margin)
+            end = min(end, spike + self.margin)
+
         # compute forward probabilities log(r_t^n(h)), log(r_t^b(h)),
         # and log prefix probabilites log(psi)
-        start = max(ylen, 1)
         log_psi = r[start - 1, 0]
-        for t in range(start, self.xlen):
+        for t in range(start, end):
             # non-blank
             r[t, 0] = np.logaddexp(r[t - 1, 0], log_phi[t - 1]) + xs[t]
             # blank
             r[t, 1] = np.logaddexp(r[t - 1, 0], r[t - 1, 1]) + self.log_probs[t, self.blank]
             log_psi = np.logaddexp(log_psi, log_phi[t - 1] + xs[t])
 
+        # carry over forward probabilities after the window with <blank> only
+        if end < self.xlen:
+            r_sum_end = np.logaddexp(r[end - 1, 0], r[end - 1, 1])
+            r[end:, 1] = r_sum_end + np.cumsum(self.log_probs[end:, self.blank])[:, None]
+
+        # get P(...eos|X) that ends with the prefix itself
+        eos_pos = np.where(cs == self.eos)[0]
+        if len(eos_pos) > 0:
+            log_psi[eos_pos] = r_sum[-1]  # log(r_T^n(g) + r_T^b(g))
+
+        # return the log prefix probability and CTC states, where the label axis
+        # of the CTC states is moved to the first axis to slice it easily
+        return log_psi, np.rollaxis(r, 2)
+
+
+class CTCPrefixScoreStreaming(object):
+    """Compute CTC label sequence scores over a stream of chunks.
+
+    This is a streaming version of CTCPrefixScore for chunk-synchronous decoding.
+    CTC posteriors are appended to a preallocated buffer whose capacity is doubled
+    when it is full, and CTC states of all hypotheses are extended to the frames
+    of a new chunk at once by `extend_states`. Only the last `horizon` frames are
+    kept so that the cost per chunk does not grow with the length of the stream.
+
+    """
+
+    def __init__(self, blank, eos, margin=0, horizon=0, init_capacity=256):
+        """
+        Args:
+            blank (int): index of <blank>
+            eos (int): index of <eos>
+            margin (int): number of frames around the previous CTC spike to compute
+                prefix scores. All frames are used if 0.
+            horizon (int): number of the latest frames to keep. All frames are kept if 0.
+            init_capacity (int): initial number of frames to allocate
+
+        """
+        self.blank = blank
+        self.eos = eos
+        self.log0 = LOG_0
+        self.margin = margin
+        self.horizon = horizon
+        self.init_capacity = init_capacity
+
+        self.buffer = None  # `[capacity, vocab]`
+        self.start = 0
+        self.end = 0
+        self.offset = 0  # index of the first kept frame in the stream
+        self.xlen_prev = 0
+        self.xlen = 0  # number of frames in the stream
+        self.log_blank_dropped = LOG_1  # log probability of <blank> only in dropped frames
+
+    @property
+    def log_probs(self):
+        """CTC log posteriors of the kept frames without copy `[T, vocab]`."""
+        return self.buffer[self.start:self.end]
+
+    def register_new_chunk(self, log_probs_chunk):
+        """Append CTC log posteriors of a new chunk and drop frames out of the horizon.
+
+        Args:
+            log_probs_chunk (np.ndarray): `[T_chunk, vocab]`
+
+        """
+        n_frames = len(log_probs_chunk)
+        if self.buffer is None:
+            self.buffer = np.empty((max(self.init_capacity, n_frames), log_probs_chunk.shape[1]),
+                                   dtype=np.float32)
+        elif self.end + n_frames > len(self.buffer):
+            length = self.end - self.start
+            capacity = len(self.buffer)
+            while length + n_frames > capacity:
+                capacity *= 2
+            if capacity == len(self.buffer):
+                self.buffer[:length] = self.buffer[self.start:self.end].copy()
+            else:
+                buffer = np.empty((capacity, self.buffer.shape[1]), dtype=np.float32)
+                buffer[:length] = self.buffer[self.start:self.end]
+                self.buffer = buffer
+            self.start, self.end = 0, length
+        self.buffer[self.end:self.end + n_frames] = log_probs_chunk
+        self.end += n_frames
+        self.xlen_prev = self.xlen
+        self.xlen += n_frames
+
+        if self.horizon > 0 and self.end - self.start > self.horizon:
+            self.evict(self.end - self.start - self.horizon)
+
+    def evict(self, n_frames):
+        """Drop the oldest kept frames.
+
+        CTC states of hypotheses must be truncated to the last `end - start` frames
+        accordingly.
+
+        Args:
+            n_frames (int): number of frames to drop
+
+        """
+        n_frames = min(n_frames, self.end - self.start)
+        self.log_blank_dropped += self.buffer[self.start:self.start + n_frames, self.blank].sum()
+        self.start += n_frames
+        self.offset += n_frames
+
+    def initial_state(self):
+        """Obtain an initial CTC state over the kept frames.
+
+        Returns:
+            ctc_states (np.ndarray): `[T, 2]`
+
+        """
+        r = np.full((self.end - self.start, 2), self.log0, dtype=np.float32)
+        r[:, 1] = self.log_blank_dropped + np.cumsum(self.log_probs[:, self.blank])
+        return r
+
+    def extend_states(self, ctc_states):
+        """Extend CTC states of all hypotheses to the frames of the latest chunk.
+
+        States are carried over to the new frames with <blank> only, and frames
+        out of the horizon are dropped.
+
+        Args:
+            ctc_states (np.ndarray): `[N, T_prev, 2]`, CTC states before the latest chunk
+        Returns:
+            ctc_states (np.ndarray): `[N, T, 2]`
+
+        """
+        n_hyps, xlen_prev = ctc_states.shape[:2]
+        xlen = self.end - self.start
+        n_new = self.xlen - self.xlen_prev
+        assert self.offset >= self.xlen_prev - xlen_prev
+        n_kept = max(0, min(xlen_prev, self.xlen_prev - self.offset))
+
+        r = np.full((n_hyps, xlen, 2), self.log0, dtype=np.float32)
+        r[:, :n_kept] = ctc_states[:, xlen_prev - n_kept:]
+        # log(r_t^b(h)) for t in the new chunk
+        blank_cumsum = np.cumsum(self.buffer[self.end - n_new:self.end, self.blank])
+        r[:, xlen - min(n_new, xlen):, 1] = ctc_states[:, -1:, 1] + blank_cumsum[max(0, n_new - xlen):]
+        return r
+
+    def __call__(self, hyp, cs, r_prev, new_chunk=False):
+        """Compute CTC prefix scores for next labels.
+
+        Args:
+            hyp (list): prefix label sequence
+            cs (np.ndarray): array of next labels. A tensor of size `[beam_width]`
+            r_prev (np.ndarray): previous CTC state `[T, 2]`
+            new_chunk (bool): `r_prev` is a CTC state before the latest chunk
+        Returns:
+            ctc_scores (np.ndarray): `[beam_width]`
+            ctc_states (np.ndarray): `[beam_width, T, 2]`
+
+        """
+        if new_chunk:
+            r_prev = self.extend_states(r_prev[None])[0]
+        xlen = self.end - self.start
+        assert len(r_prev) == xlen
+        beam_width = len(cs)
+
+        # initialize CTC states
+        ylen = len(hyp) - 1  # ignore sos
+        r = np.full((xlen, 2, beam_width), self.log0, dtype=np.float32)
+        log_probs = self.log_probs
+        xs = log_probs[:, cs]
+        if ylen == 0 and self.offset == 0:
+            r[0, 0] = xs[0]
+
+        # prepare forward probabilities for the last label
+        r_sum = np.logaddexp(r_prev[:, 0], r_prev[:, 1])  # log(r_t^n(g) + r_t^b(g))
+        last = hyp[-1]
+        if ylen > 0 and last in cs:
+            log_phi = np.repeat(r_sum[:, None], beam_width, axis=1)
+            log_phi[:, cs == last] = r_prev[:, 1:2]
+        else:
+            log_phi = r_sum[:, None]  # `[T, 1]`
+
+        # restrict frames to those around the spike of the last label,
+        # where frame indices are relative to the first kept frame
+        start = max(ylen - self.offset, 1)
+        end = xlen
+        if self.margin > 0 and ylen > 0:
+            spike = int(np.argmax(r_prev[:, 0]))
+            start = max(start, spike - self.margin)
+            end = min(end, spike + self.margin)
+
+        # compute forward probabilities log(r_t^n(h)), log(r_t^b(h)),
+        # and log prefix probabilites log(psi)
+        log_psi = r[start - 1, 0] if start <= xlen else np.full(beam_width, self.log0, dtype=np.float32)
+        for t in range(start, end):
+            # non-blank
+            r[t, 0] = np.logaddexp(r[t - 1, 0], log_phi[t - 1]) + xs[t]
+            # blank
+            r[t, 1] = np.logaddexp(r[t - 1, 0], r[t - 1, 1]) + log_probs[t, self.blank]
+            log_psi = np.logaddexp(log_psi, log_phi[t - 1] + xs[t])
+
+        # carry over forward probabilities after the window with <blank> only
+        if 0 < end < xlen:
+            r_sum_end = np.logaddexp(r[end - 1, 0], r[end - 1, 1])
+            r[end:, 1] = r_sum_end + np.cumsum(log_probs[end:, self.blank])[:, None]
+
         # get P(...eos|X) that ends with the prefix itself
         eos_pos = np.where(cs == self.eos)[0]
         if len(eos_pos) > 0:
@@ -677,3 +796,304 @@ class CTCPrefixScore(object):
         # return the log prefix probability and CTC states, where the label axis
         # of the CTC states is moved to the first axis to slice it easily
         return log_psi, np.rollaxis(r, 2)
+
+
+class CTCPrefixScoreTH(object):
+    """Compute CTC label sequence scores in a batch.
+
+    This is a tensorized version of CTCPrefixScore. Scores of multiple labels
+    for all hypotheses in multiple utterances are computed at once, where
+    hypotheses can have prefixes of different lengths.
+
+    [Reference]:
+        https://github.com/espnet/espnet
+    """
+
+    def __init__(self, log_probs, xlens, blank, eos, backward=False, margin=0):
+        """
+        Args:
+            log_probs (FloatTensor): `[B, T, vocab]`
+            xlens (IntTensor or list): `[B]`
+            blank (int): index of <blank>
+            eos (int): index of <eos>
+            backward (bool): compute scores in the reverse order of inputs
+            margin (int): number of frames around the previous CTC spike to compute
+                prefix scores. All frames are used if 0.
+
+        """
+        self.blank = blank
+        self.eos = eos
+        self.log0 = LOG_0
+        self.margin = margin
+
+        bs, xmax, vocab = log_probs.size()
+        self.xmax = xmax
+        device = log_probs.device
+        xlens = torch.as_tensor(xlens, dtype=torch.int64)
+        log_probs = log_probs.float()
+        if backward:
+            log_probs = _flip_label_probability(log_probs.transpose(0, 1).cpu(), xlens).transpose(0, 1).to(device)
+        xlens = xlens.to(device)
+        self.xlens = xlens
+
+        # <blank> is emitted with probability one in padded frames so that
+        # the forward probabilities at the last frame are those at the end of each utterance
+        mask = torch.arange(xmax, device=device).unsqueeze(0) >= xlens.unsqueeze(1)  # `[B, T]`
+        # NOTE: <blank> as a next label is never emitted in padded frames either
+        self.log_probs = log_probs.masked_fill(mask.unsqueeze(2), self.log0)  # `[B, T, vocab]`
+        self.log_probs_blank = log_probs[:, :, blank].masked_fill(mask, LOG_1)  # `[B, T]`
+        self.log_probs_blank_cumsum = torch.cumsum(self.log_probs_blank, dim=1)  # `[B, T]`
+
+    def initial_state(self):
+        """Obtain initial CTC states of all utterances.
+
+        Returns:
+            ctc_states (FloatTensor): `[B, T, 2]`
+
+        """
+        # r_t^n(<sos>) and r_t^b(<sos>)
+        r_b = self.log_probs_blank_cumsum
+        return torch.stack([torch.full_like(r_b, self.log0), r_b], dim=2)
+
+    def __call__(self, hyps, cs, r_prev, batch_ids=None):
+        """Compute CTC prefix scores for next labels of all hypotheses.
+
+        Args:
+            hyps (list): length `N`, each of which contains a prefix label sequence
+            cs (LongTensor): next labels of each hypothesis `[N, beam_width]`
+            r_prev (FloatTensor): previous CTC states `[N, T, 2]`
+            batch_ids (LongTensor or list): index of the utterance of each hypothesis `[N]`
+        Returns:
+            ctc_scores (FloatTensor): `[N, beam_width]`
+            ctc_states (FloatTensor): `[N, beam_width, T, 2]`
+
+        """
+        device = cs.device
+        ylens = torch.tensor([len(hyp) - 1 for hyp in hyps], dtype=torch.int64, device=device)  # ignore sos
+        last = torch.tensor([hyp[-1] for hyp in hyps], dtype=torch.int64, device=device)
+        return self.score(last, ylens, cs, r_prev, batch_ids)
+
+    def score(self, last, ylens, cs, r_prev, batch_ids=None):
+        """Compute CTC prefix scores for next labels of all hypotheses.
+
+        Only the last label and the length of each prefix are needed, so that
+        prefixes do not have to be copied to the host.
+
+        Args:
+            last (LongTensor): last label of each prefix `[N]`
+            ylens (LongTensor): length of each prefix excluding <sos> `[N]`
+            cs (LongTensor): next labels of each hypothesis `[N, beam_width]`
+            r_prev (FloatTensor): previous CTC states `[N, T, 2]`
+            batch_ids (LongTensor or list): index of the utterance of each hypothesis `[N]`
+        Returns:
+            ctc_scores (FloatTensor): `[N, beam_width]`
+            ctc_states (FloatTensor): `[N, beam_width, T, 2]`
+
+        """
+        n_hyps, beam_width = cs.size()
+        device = cs.device
+        if batch_ids is None:
+            batch_ids = [0] * n_hyps
+        batch_ids = torch.as_tensor(batch_ids, dtype=torch.int64, device=device)
+        last = last.to(device)
+        ylens = ylens.to(device)
+
+        # NOTE: gather only the columns of next labels and <blank> without copying
+        # the whole vocabulary of each hypothesis
+        xs = self.log_probs[batch_ids.unsqueeze(1), :, cs].permute(2, 0, 1)  # `[T, N, beam_width]`
+        xs_blank = self.log_probs_blank[batch_ids].transpose(0, 1).unsqueeze(2)  # `[T, N, 1]`
+
+        # prepare forward probabilities for the last label
+        r_sum = torch.logsumexp(r_prev, dim=2)  # log(r_t^n(g) + r_t^b(g)), `[N, T]`
+        is_last = ((cs == last.unsqueeze(1)) & (ylens > 0).unsqueeze(1)).unsqueeze(1)  # `[N, 1, beam_width]`
+        log_phi = torch.where(is_last, r_prev[:, :, 1:2], r_sum.unsqueeze(2))  # `[N, T, beam_width]`
+        log_phi = log_phi.transpose(0, 1)  # `[T, N, beam_width]`
+
+        # restrict frames to those around the spike of the last label
+        start = ylens.clamp(min=1)
+        end = torch.full_like(start, self.xmax)
+        if self.margin > 0:
+            spike = r_prev[:, :, 0].argmax(1)
+            start = torch.where(ylens > 0, torch.max(start, spike - self.margin), start)
+            end = torch.where(ylens > 0, torch.clamp(spike + self.margin, max=self.xmax), end)
+        frames = torch.arange(self.xmax, device=device).unsqueeze(1)
+        is_active = ((frames >= start) & (frames < end)).unsqueeze(2)  # `[T, N, 1]`
+
+        # compute forward probabilities log(r_t^n(h)) and log(r_t^b(h)),
+        # where all hypotheses are updated over the union of the windows
+        r = xs.new_full((self.xmax, 2, n_hyps, beam_width), self.log0)
+        r[0, 0] = torch.where((ylens == 0).unsqueeze(1), xs[0], r[0, 0])
+        xs_nb = torch.stack([xs, xs_blank.expand_as(xs)], dim=1)  # `[T, 2, N, beam_width]`
+        for t in range(start.min().item(), end.max().item()):
+            # non-blank and blank
+            r_t = torch.logsumexp(torch.stack([r[t - 1, 0:1].expand(2, -1, -1),
+                                               torch.stack([log_phi[t - 1], r[t - 1, 1]], dim=0)], dim=0), dim=0)
+            r[t] = torch.where(is_active[t], r_t + xs_nb[t], r[t])
+
+        # carry over forward probabilities after the window with <blank> only
+        hyp_ids = torch.arange(n_hyps, device=device)
+        if self.margin > 0:
+            r_sum_end = torch.logsumexp(r[end - 1, :, hyp_ids], dim=1)  # `[N, beam_width]`
+            blank_cumsum = self.log_probs_blank_cumsum[batch_ids].transpose(0, 1)  # `[T, N]`
+            blank_cumsum = blank_cumsum - blank_cumsum[end - 1, hyp_ids]
+            r[:, 1] = torch.where(frames.unsqueeze(2) >= end.unsqueeze(1),
+                                  r_sum_end + blank_cumsum.unsqueeze(2), r[:, 1])
+
+        # log prefix probabilites log(psi) summed over frames in the window
+        log_psi_init = r[start - 1, 0, hyp_ids]  # `[N, beam_width]`
+        log_psi = (log_phi[:-1] + xs[1:]).masked_fill(~is_active[1:], self.log0)
+        log_psi = torch.logsumexp(torch.cat([log_psi_init.unsqueeze(0), log_psi], dim=0), dim=0)
+
+        # get P(...eos|X) that ends with the prefix itself
+        log_psi = torch.where(cs == self.eos, r_sum[:, -1:], log_psi)  # log(r_T^n(g) + r_T^b(g))
+
+        return log_psi, r.permute(2, 3, 0, 1)
+
+
+class CTCPrefixBeamSearch(object):
+    """CTC prefix beam search with LM shallow fusion.
+
+    Forward probabilities of all prefixes in the beam ending with <blank> (p_b)
+    and non-blank labels (p_nb) are kept as tensors, and all prefixes are
+    extended by the top-k labels at once at each frame. Extensions collapsing
+    to a prefix already in the beam are merged. The LM is queried once per
+    frame only for new prefixes that survive pruning.
+
+    """
+
+    def __init__(self, blank, eos, beam_width, lp_weight=0., lm=None, lm_weight=0.):
+        """
+        Args:
+            blank (int): index of <blank>
+            eos (int): index of <eos> (shared with <sos>)
+            beam_width (int): size of beam
+            lp_weight (float): length penalty
+            lm (RNNLM): LM for shallow fusion
+            lm_weight (float): weight of LM score
+
+        """
+        self.blank = blank
+        self.eos = eos
+        self.beam_width = beam_width
+        self.lp_weight = lp_weight
+        self.lm = lm
+        self.lm_weight = lm_weight
+
+    def _prefix_score(self, item):
+        """Total score of a merged prefix used for pruning.
+
+        Args:
+            item (tuple): prefix and `[log p_b, log p_nb, LM score, ...]`
+        Returns:
+            score (float)
+
+        """
+        prefix, (p_b, p_nb, score_lm) = item[0], item[1][:3]
+        return np.logaddexp(p_b, p_nb) + score_lm + (len(prefix) - 1) * self.lp_weight
+
+    def __call__(self, log_probs):
+        """Decode a single utterance.
+
+        Args:
+            log_probs (FloatTensor): `[T, vocab]`
+        Returns:
+            beam (list): hypotheses sorted by scores, each of which is a dict containing
+                hyp (list): label sequence starting with <eos>
+                score (float): total score
+                score_ctc (float): CTC score
+                score_lm (float): weighted LM score
+                score_lp (float): weighted length penalty
+                p_b (float): probability of the prefix ending with <blank>
+                p_nb (float): probability of the prefix ending with a non-blank label
+
+        """
+        xmax, vocab = log_probs.size()
+        device = log_probs.device
+
+        # label pruning for all frames at once
+        topk_ids = torch.topk(log_probs, k=min(self.beam_width, vocab), dim=-1,
+                              largest=True, sorted=True)[1].tolist()
+
+        hyps = [(self.eos,)]  # <eos> is used for LM
+        p_b = log_probs.new_full((1,), LOG_1)
+        p_nb = log_probs.new_full((1,), LOG_0)
+        scores_lm = log_probs.new_zeros(1)
+        last = torch.full((1,), -1, dtype=torch.int64, device=device)  # -1 for the empty prefix
+        lmstate, lm_log_probs = None, None
+        if self.lm is not None:
+            y = torch.full((1, 1), self.eos, dtype=torch.int64, device=device)
+            _, lmstate, lm_log_probs = self.lm.predict(y, None)
+            lm_log_probs = lm_log_probs[:, 0]  # `[N, vocab]`
+
+        for t in range(xmax):
+            n_hyps = len(hyps)
+            lp_t = log_probs[t]
+            p_sum = torch.logaddexp(p_b, p_nb)
+
+            # case 1. prefixes are not extended
+            stay_p_b = p_sum + lp_t[self.blank]
+            stay_p_nb = torch.where(last >= 0, p_nb + lp_t[last.clamp(min=0)], torch.full_like(p_nb, LOG_0))
+
+            # case 2. prefixes are extended by non-blank labels
+            cs = [c for c in topk_ids[t] if c != self.blank]
+            cs_t = torch.tensor(cs, dtype=torch.int64, device=device)
+            is_repeat = last.unsqueeze(1) == cs_t.unsqueeze(0)  # `[N, K]`
+            ext_p_nb = torch.where(is_repeat, p_b.unsqueeze(1), p_sum.unsqueeze(1)) + lp_t[cs_t].unsqueeze(0)
+            ext_scores_lm = scores_lm.unsqueeze(1).expand_as(ext_p_nb)
+            if self.lm is not None:
+                ext_scores_lm = ext_scores_lm + lm_log_probs[:, cs_t] * self.lm_weight
+
+            # transfer all statistics to the host at once
+            stats = torch.cat([stay_p_b.unsqueeze(1), stay_p_nb.unsqueeze(1), scores_lm.unsqueeze(1),
+                               ext_p_nb, ext_scores_lm], dim=1).tolist()
+
+            # merge prefixes collapsing to the same label sequence
+            # value: [p_b, p_nb, score_lm, index of the parent, extended label]
+            merged = {}
+            for i in range(n_hyps):
+                merged[hyps[i]] = [stats[i][0], stats[i][1], stats[i][2], i, None]
+            n_cs = len(cs)
+            for i in range(n_hyps):
+                for j, c in enumerate(cs):
+                    prefix = hyps[i] + (c,)
+                    if prefix in merged:
+                        merged[prefix][1] = np.logaddexp(merged[prefix][1], stats[i][3 + j])
+                    else:
+                        merged[prefix] = [LOG_0, stats[i][3 + j], stats[i][3 + n_cs + j], i, c]
+
+            # Pruning
+            beam = sorted(merged.items(), key=self._prefix_score, reverse=True)[:self.beam_width]
+            hyps = [prefix for prefix, _ in beam]
+            p_b, p_nb, scores_lm = log_probs.new_tensor([v[:3] for _, v in beam]).t()
+            last = torch.tensor([prefix[-1] if len(prefix) > 1 else -1 for prefix in hyps],
+                                dtype=torch.int64, device=device)
+
+            # Update LM states for shallow fusion
+            if self.lm is not None:
+                src = torch.tensor([v[3] for _, v in beam], dtype=torch.int64, device=device)
+                lmstate = {k: s[:, src] if s is not None else None for k, s in lmstate.items()}
+                lm_log_probs = lm_log_probs[src]
+                new_ids = [n for n, (_, v) in enumerate(beam) if v[4] is not None]
+                if len(new_ids) > 0:
+                    new_ids = torch.tensor(new_ids, dtype=torch.int64, device=device)
+                    y = torch.tensor([[v[4]] for _, v in beam if v[4] is not None],
+                                     dtype=torch.int64, device=device)
+                    _, lmstate_new, lm_log_probs_new = self.lm.predict(
+                        y, {k: s[:, new_ids] if s is not None else None for k, s in lmstate.items()})
+                    for k, s in lmstate.items():
+                        if s is not None:
+                            s[:, new_ids] = lmstate_new[k]
+                    lm_log_probs[new_ids] = lm_log_probs_new[:, 0]
+
+        beam = []
+        for prefix, p_b_i, p_nb_i, score_lm in zip(hyps, p_b.tolist(), p_nb.tolist(), scores_lm.tolist()):
+            score_ctc = np.logaddexp(p_b_i, p_nb_i)
+            score_lp = (len(prefix) - 1) * self.lp_weight
+            beam.append({'hyp': list(prefix),
+                         'score': score_ctc + score_lm + score_lp,
+                         'score_ctc': score_ctc,
+                         'score_lm': score_lm,
+                         'score_lp': score_lp,
+                         'p_b': p_b_i,
+                         'p_nb': p_nb_i})
+        return sorted(beam, key=lambda x: x['score'], reverse=True)
@@ -203,18 +203,40 @@ class DecoderBase(ModelBase):
         return probs, topk_ids
 
     def lm_rescoring(self, hyps, lm, lm_weight, reverse=False, tag=''):
+        """Rescore N-best hypotheses with an external LM.
+
+        All hypotheses (possibly from multiple utterances) are padded into a
+        single batch and scored by a single forward pass of the LM.
+
+        Args:
+            hyps (list): length `N`, each of which is a dict containing `hyp` and `score`.
+                `hyp` is a label sequence starting with <sos>.
+                Scores are updated in-place and stored in `score_lm_{tag}`.
+            lm (LMBase): second path LM
+            lm_weight (float): weight of LM score
+            reverse (bool): score label sequences in the reverse order with a backward LM
+            tag (str): suffix of the key to store LM scores
+
+        """
+        hyp_ids = [i for i in range(len(hyps)) if len(hyps[i]['hyp']) > 1]
         for i in range(len(hyps)):
-            ys = hyps[i]['hyp']  # include <sos>
-            if reverse:
-                ys = ys[::-1]
+            hyps[i]['score_lm_' + tag] = 0.
+        if len(hyp_ids) == 0:
+            return
 
-            ys = [np2tensor(np.fromiter(ys, dtype=np.int64), self.device_id)]
-            ys_in = pad_list([y[:-1] for y in ys], -1)  # `[1, L-1]`
-            ys_out = pad_list([y[1:] for y in ys], -1)  # `[1, L-1]`
+        ys = [hyps[i]['hyp'] for i in hyp_ids]  # include <sos>
+        if reverse:
+            ys = [y[::-1] for y in ys]
+        ys = [np2tensor(np.fromiter(y, dtype=np.int64), self.device_id) for y in ys]
+        ys_in = pad_list([y[:-1] for y in ys], lm.pad)  # `[N, L-1]`
+        ys_out = pad_list([y[1:] for y in ys], 0)  # `[N, L-1]`
+        ylens = ys_in.new_tensor([y.size(0) - 1 for y in ys])
 
-            lmout, lmstate, scores_lm = lm.predict(ys_in, None)
-            score_lm = sum([scores_lm[0, t, ys_out[0, t]] for t in range(ys_out.size(1))])
-            score_lm /= ys_out.size(1)
+        _, _, scores_lm = lm.predict(ys_in, None)
+        scores_lm = torch.gather(scores_lm, 2, ys_out.unsqueeze(2)).squeeze(2)  # `[N, L-1]`
+        mask = torch.arange(ys_out.size(1), device=ys_out.device).unsqueeze(0) < ylens.unsqueeze(1)
+        scores_lm = (scores_lm * mask).sum(1) / ylens
 
+        for i, score_lm in zip(hyp_ids, scores_lm.tolist()):
             hyps[i]['score'] += score_lm * lm_weight
             hyps[i]['score_lm_' + tag] = score_lm
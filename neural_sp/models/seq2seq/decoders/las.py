@@ -28,10 +28,12 @@ from neural_sp.models.modules.multihead_attention import MultiheadAttentionMecha
 from neural_sp.models.modules.attention import AttentionMechanism
 from neural_sp.models.seq2seq.decoders.beam_search import BeamSearch
 from neural_sp.models.seq2seq.decoders.ctc import CTC
-from neural_sp.models.seq2seq.decoders.ctc import CTCPrefixScore
+from neural_sp.models.seq2seq.decoders.ctc import CTCPrefixScoreStreaming
+from neural_sp.models.seq2seq.decoders.ctc import CTCPrefixScoreTH
 from neural_sp.models.seq2seq.decoders.decoder_base import DecoderBase
 from neural_sp.models.torch_utils import append_sos_eos
 from neural_sp.models.torch_utils import compute_accuracy
+from neural_sp.models.torch_utils import is_attention_captured
 from neural_sp.models.torch_utils import make_pad_mask
 from neural_sp.models.torch_utils import repeat
 from neural_sp.models.torch_utils import pad_list
@@ -556,13 +558,14 @@ class RNNDecoder(DecoderBase):
             self.data_dict['elens'] = tensor2np(elens)
             self.data_dict['ylens'] = tensor2np(ylens)
             self.data_dict['ys'] = tensor2np(ys_out)
-            self.aws_dict['xy_aws'] = tensor2np(aws)
-            if len(betas) > 0:
-                betas = torch.cat(betas, dim=2)  # `[B, H, L, T]`
-                self.aws_dict['xy_aws_beta'] = tensor2np(betas)
-            if len(p_chooses) > 0:
-                p_chooses = torch.cat(p_chooses, dim=2)  # `[B, H, L, T]`
-                self.aws_dict['xy_aws_p_choose'] = tensor2np(p_chooses)
+            if is_attention_captured():
+                self.aws_dict['xy_aws'] = tensor2np(aws)
+                if len(betas) > 0:
+                    betas = torch.cat(betas, dim=2)  # `[B, H, L, T]`
+                    self.aws_dict['xy_aws_beta'] = tensor2np(betas)
+                if len(p_chooses) > 0:
+                    p_chooses = torch.cat(p_chooses, dim=2)  # `[B, H, L, T]`
+                    self.aws_dict['xy_aws_p_choose'] = tensor2np(p_chooses)
 
         logits = self.output(torch.cat(logits, dim=1))
         return logits
@@ -661,13 +664,14 @@ class RNNDecoder(DecoderBase):
             self.data_dict['elens'] = tensor2np(elens)
             self.data_dict['ylens'] = tensor2np(ylens)
             self.data_dict['ys'] = tensor2np(ys_out)
-            self.aws_dict['xy_aws'] = tensor2np(aws)
-            if len(betas) > 0:
-                betas = torch.cat(betas, dim=2)  # `[B, H, L, T]`
-                self.aws_dict['xy_aws_beta'] = tensor2np(betas)
-            if len(p_chooses) > 0:
-                p_chooses = torch.cat(p_chooses, dim=2)  # `[B, H, L, T]`
-                self.aws_dict['xy_p_choose'] = tensor2np(p_chooses)
+            if is_attention_captured():
+                self.aws_dict['xy_aws'] = tensor2np(aws)
+                if len(betas) > 0:
+                    betas = torch.cat(betas, dim=2)  # `[B, H, L, T]`
+                    self.aws_dict['xy_aws_beta'] = tensor2np(betas)
+                if len(p_chooses) > 0:
+                    p_chooses = torch.cat(p_chooses, dim=2)  # `[B, H, L, T]`
+                    self.aws_dict['xy_p_choose'] = tensor2np(p_chooses)
 
         n_heads = aws.size(1)  # mono
 
@@ -676,7 +680,7 @@ class RNNDecoder(DecoderBase):
 
         # Attention padding
         if self.attn_type == 'mocha' or trigger_points is not None:
-            aws = aws.masked_fill_(tgt_mask.unsqueeze(1).repeat([1, n_heads, 1, 1]) == 0, 0)
+            aws = aws.masked_fill_(tgt_mask.unsqueeze(1) == 0, 0)
             # NOTE: attention padding is quite effective for quantity loss
 
         # Quantity loss
@@ -991,9 +995,21 @@ class RNNDecoder(DecoderBase):
         bs, xmax, _ = eouts.size()
         n_models = len(ensmbl_decs) + 1
 
+        # Decode all utterances at once if possible
+        lm_step = self.lm if self.lm is not None else lm
+        state_carry_over = params['recog_asr_state_carry_over'] or params['recog_lm_state_carry_over']
+        state_carry_over = state_carry_over and speakers is not None
+        batchable = self.attn_type not in ['mocha', 'gmm', 'triggered_attention']
+        batchable = batchable and (lm_step is None or isinstance(lm_step, RNNLM))
+        if bs > 1 and n_models == 1 and not self.replace_sos and not state_carry_over and batchable:
+            return self.batch_beam_search(eouts, elens, params, idx2token,
+                                          lm, lm_second, lm_second_bwd, ctc_log_probs,
+                                          nbest, exclude_eos, refs_id, utt_ids, speakers)
+
         beam_width = params['recog_beam_width']
         assert 1 <= nbest <= beam_width
         ctc_weight = params['recog_ctc_weight']
+        ctc_margin = params['recog_ctc_prefix_margin']
         max_len_ratio = params['recog_max_len_ratio']
         min_len_ratio = params['recog_min_len_ratio']
         lp_weight = params['recog_length_penalty']
@@ -1020,9 +1036,13 @@ class RNNDecoder(DecoderBase):
             lm_second_bwd.eval()
         trfm_lm = isinstance(lm, TransformerLM) or isinstance(lm, TransformerXL)
 
+        # For joint CTC-Attention decoding
+        ctc_prefix_scorer = None
         if ctc_log_probs is not None:
             assert ctc_weight > 0
-            ctc_log_probs = tensor2np(ctc_log_probs)
+            ctc_prefix_scorer = CTCPrefixScoreTH(ctc_log_probs, elens, self.blank, self.eos, self.bwd,
+                                                 margin=ctc_margin)
+            ctc_states_init = ctc_prefix_scorer.initial_state()
 
         nbest_hyps_idx, aws, scores = [], [], []
         eos_flags = []
@@ -1033,14 +1053,6 @@ class RNNDecoder(DecoderBase):
             lmstate = None
             ys = eouts.new_zeros(1, 1).fill_(self.eos).long()  # for TransformerLM/TransformerXL
 
-            # For joint CTC-Attention decoding
-            ctc_prefix_scorer = None
-            if ctc_log_probs is not None:
-                if self.bwd:
-                    ctc_prefix_scorer = CTCPrefixScore(ctc_log_probs[b][::-1], self.blank, self.eos)
-                else:
-                    ctc_prefix_scorer = CTCPrefixScore(ctc_log_probs[b], self.blank, self.eos)
-
             # Ensemble initialization
             ensmbl_dstate, ensmbl_cv = [], []
             if n_models > 1:
@@ -1088,7 +1100,7 @@ class RNNDecoder(DecoderBase):
                      'ensmbl_dstate': ensmbl_dstate,
                      'ensmbl_cv': ensmbl_cv,
                      'ensmbl_aws':[[None]] * (n_models - 1),
-                     'ctc_state': ctc_prefix_scorer.initial_state() if ctc_prefix_scorer is not None else None}]
+                     'ctc_state': ctc_states_init[b] if ctc_prefix_scorer is not None else None}]
             ymax = int(math.floor(elens[b] * max_len_ratio)) + 1
             for t in range(ymax):
                 # batchfy all hypotheses for batch decoding
@@ -1102,6 +1114,7 @@ class RNNDecoder(DecoderBase):
                 cv = torch.cat([beam['cv'] for beam in hyps], dim=0)
                 aw = torch.cat([beam['aws'][-1] for beam in hyps], dim=0) if t > 0 else None
                 hxs = torch.cat([beam['dstates']['dstate'][0] for beam in hyps], dim=1)
+                cxs = None
                 if self.rnn_type == 'lstm':
                     cxs = torch.cat([beam['dstates']['dstate'][1] for beam in hyps], dim=1)
                 dstates = {'dstate': (hxs, cxs)}
@@ -1166,15 +1179,23 @@ class RNNDecoder(DecoderBase):
                 # Ensemble
                 scores_att = torch.log(probs / n_models)
 
+                # Attention scores of all hypotheses
+                total_scores_att_all = scores_att.new_tensor(
+                    [beam['score_att'] for beam in hyps]).unsqueeze(1) + scores_att
+                total_scores_topk_all, topk_ids_all = torch.topk(
+                    total_scores_att_all * (1 - ctc_weight), k=beam_width, dim=1, largest=True, sorted=True)
+
+                # CTC scores of all hypotheses
+                new_ctc_states, total_scores_ctc_all = helper.ctc_score_batch(
+                    hyps, topk_ids_all, ctc_prefix_scorer, [b] * len(hyps))
+
                 new_hyps = []
                 for j, beam in enumerate(hyps):
-                    # Attention scores
-                    total_scores_att = beam['score_att'] + scores_att[j:j + 1]
-                    total_scores = total_scores_att * (1 - ctc_weight)
+                    total_scores_att = total_scores_att_all[j:j + 1]
+                    total_scores_topk = total_scores_topk_all[j:j + 1]
+                    topk_ids = topk_ids_all[j:j + 1]
 
                     # Add LM score <after> top-K selection
-                    total_scores_topk, topk_ids = torch.topk(
-                        total_scores, k=beam_width, dim=1, largest=True, sorted=True)
                     if lm is not None:
                         total_scores_lm = beam['score_lm'] + scores_lm[j, -1, topk_ids[0]]
                         total_scores_topk += total_scores_lm * lm_weight
@@ -1210,9 +1231,8 @@ class RNNDecoder(DecoderBase):
                         cp = 0.
 
                     # Add CTC score
-                    new_ctc_states, total_scores_ctc, total_scores_topk = helper.add_ctc_score(
-                        beam['hyp'], topk_ids, beam['ctc_state'],
-                        total_scores_topk, ctc_prefix_scorer)
+                    total_scores_ctc = total_scores_ctc_all[j]
+                    total_scores_topk += total_scores_ctc * ctc_weight
 
                     for k in range(beam_width):
                         idx = topk_ids[0, k].item()
@@ -1252,11 +1272,12 @@ class RNNDecoder(DecoderBase):
                              'score_ctc': total_scores_ctc[k].item(),
                              'score_lm': total_scores_lm[k].item(),
                              'dstates': {'dstate': (dstates['dstate'][0][:, j:j + 1],
-                                                    dstates['dstate'][1][:, j:j + 1])},
+                                                    dstates['dstate'][1][:, j:j + 1]
+                                                    if self.rnn_type == 'lstm' else None)},
                              'cv': cv[j:j + 1],
                              'aws': beam['aws'] + [aw[j:j + 1]],
                              'lmstate': new_lmstate,
-                             'ctc_state': new_ctc_states[k] if ctc_prefix_scorer is not None else None,
+                             'ctc_state': new_ctc_states[j, k] if ctc_prefix_scorer is not None else None,
                              'ensmbl_dstate': ensmbl_dstate,
                              'ensmbl_cv': ensmbl_cv,
                              'ensmbl_aws': ensmbl_aws})
@@ -1282,7 +1303,8 @@ class RNNDecoder(DecoderBase):
 
             # backward secodn path LM rescoring
             if lm_second_bwd is not None:
-                self.lm_rescoring(end_hyps, lm_second_bwd, lm_weight_second_bwd, tag='second_bwd')
+                self.lm_rescoring(end_hyps, lm_second_bwd, lm_weight_second_bwd,
+                                  reverse=True, tag='second_bwd')
 
             # Sort by score
             end_hyps = sorted(end_hyps, key=lambda x: x['score'], reverse=True)
@@ -1309,7 +1331,7 @@ class RNNDecoder(DecoderBase):
                                     (end_hyps[k]['score_lm_second'] * lm_weight_second))
                     if lm_second_bwd is not None:
                         logger.info('log prob (hyp, second-path lm, reverse): %.7f' %
-                                    (end_hyps[k]['score_lm_second_rev'] * lm_weight_second_bwd))
+                                    (end_hyps[k]['score_lm_second_bwd'] * lm_weight_second_bwd))
                     logger.info('-' * 50)
 
             # N-best list
@@ -1355,6 +1377,311 @@ class RNNDecoder(DecoderBase):
 
         return nbest_hyps_idx, aws, scores
 
+    def batch_beam_search(self, eouts, elens, params, idx2token=None,
+                          lm=None, lm_second=None, lm_second_bwd=None, ctc_log_probs=None,
+                          nbest=1, exclude_eos=False,
+                          refs_id=None, utt_ids=None, speakers=None):
+        """Beam search decoding of all utterances in a mini-batch at once.
+
+        Hypotheses of all utterances are held in tensors of size `[B * beam_width]`
+        and reordered with index_select at every step. Hypotheses ending with <eos>
+        are masked out instead of being removed from the tensors.
+
+        Args:
+            eouts (FloatTensor): `[B, T, enc_n_units]`
+            elens (IntTensor): `[B]`
+            params (dict): hyperparameters for decoding
+            idx2token (): converter from index to token
+            lm: firsh path LM (RNNLM only)
+            lm_second: second path LM
+            lm_second_bwd: secoding path backward LM
+            ctc_log_probs (FloatTensor):
+            nbest (int):
+            exclude_eos (bool): exclude <eos> from hypothesis
+            refs_id (list): reference list
+            utt_ids (list): utterance id list
+            speakers (list): speaker list
+        Returns:
+            nbest_hyps_idx (list): length `B`, each of which contains list of N hypotheses
+            aws (list): length `B`, each of which contains arrays of size `[H, L, T]`
+            scores (list):
+
+        """
+        bs = eouts.size(0)
+
+        beam_width = params['recog_beam_width']
+        assert 1 <= nbest <= beam_width
+        ctc_weight = params['recog_ctc_weight']
+        ctc_margin = params['recog_ctc_prefix_margin']
+        max_len_ratio = params['recog_max_len_ratio']
+        min_len_ratio = params['recog_min_len_ratio']
+        lp_weight = params['recog_length_penalty']
+        cp_weight = params['recog_coverage_penalty']
+        cp_threshold = params['recog_coverage_threshold']
+        length_norm = params['recog_length_norm']
+        lm_weight = params['recog_lm_weight']
+        lm_weight_second = params['recog_lm_second_weight']
+        lm_weight_second_bwd = params['recog_lm_bwd_weight']
+        gnmt_decoding = params['recog_gnmt_decoding']
+        eos_threshold = params['recog_eos_threshold']
+        softmax_smoothing = params['recog_softmax_smoothing']
+
+        if lm is not None:
+            assert lm_weight > 0
+            lm.eval()
+        if lm_second is not None:
+            assert lm_weight_second > 0
+            lm_second.eval()
+        if lm_second_bwd is not None:
+            assert lm_weight_second_bwd > 0
+            lm_second_bwd.eval()
+        lm_step = self.lm if self.lm is not None else lm
+
+        # Expand encoder outputs for all hypotheses
+        elens = torch.as_tensor(elens, dtype=torch.int64).cpu()
+        n_hyps = bs * beam_width
+        hyp2utt = torch.arange(bs).unsqueeze(1).repeat([1, beam_width]).view(-1)  # `[B * beam_width]`
+        eouts = eouts[:, :elens.max()]
+        eouts_hyp = eouts[hyp2utt.to(eouts.device)]  # `[B * beam_width, T, enc_n_units]`
+        src_mask = make_pad_mask(elens[hyp2utt].int(), self.device_id).unsqueeze(1)  # `[B * beam_width, 1, T]`
+        ymax = [int(math.floor(elens[b].item() * max_len_ratio)) + 1 for b in range(bs)]
+        min_ylens = (elens[hyp2utt].float() * min_len_ratio).to(eouts.device)
+        hyp2utt = hyp2utt.to(eouts.device)
+
+        # For joint CTC-Attention decoding
+        ctc_prefix_scorer = None
+        if ctc_log_probs is not None:
+            assert ctc_weight > 0
+            ctc_prefix_scorer = CTCPrefixScoreTH(ctc_log_probs, elens, self.blank, self.eos, self.bwd,
+                                                 margin=ctc_margin)
+            ctc_states = ctc_prefix_scorer.initial_state()[hyp2utt]  # `[B * beam_width, T, 2]`
+
+        # Initialization
+        self.score.reset()
+        dstates = self.zero_state(n_hyps)
+        cv = eouts.new_zeros(n_hyps, 1, self.enc_n_units)
+        aw, aws_hyp = None, None
+        lmstate = None
+        ys = eouts.new_zeros(n_hyps, 1).fill_(self.eos).long()  # prefixes including <sos>
+        score = eouts.new_zeros(n_hyps)
+        score_att = eouts.new_zeros(n_hyps)
+        score_lm = eouts.new_zeros(n_hyps)
+        score_ctc = eouts.new_zeros(n_hyps)
+        score_cp = eouts.new_zeros(n_hyps)
+        # only the first hypothesis of each utterance is alive at the beginning
+        alive = torch.zeros(n_hyps, dtype=torch.bool, device=eouts.device)
+        alive[::beam_width] = True
+
+        def get_hyp(i):
+            """Convert the i-th hypothesis in the batch to a dict."""
+            elen = elens[i // beam_width].item()
+            return {'hyp': ys[i].tolist(),
+                    'ys': ys[i:i + 1],
+                    'score': score[i].item(),
+                    'score_att': score_att[i].item(),
+                    'score_cp': score_cp[i].item(),
+                    'score_ctc': score_ctc[i].item(),
+                    'score_lm': score_lm[i].item(),
+                    'dstates': {'dstate': (dstates['dstate'][0][:, i:i + 1],
+                                           dstates['dstate'][1][:, i:i + 1] if self.rnn_type == 'lstm' else None)},
+                    'aws': [None] + list(aws_hyp[i:i + 1, :, :, :elen].split(1, dim=2)),
+                    'lmstate': {k: s[:, i:i + 1] if s is not None else None
+                                for k, s in lmstate.items()} if lmstate is not None else None}
+
+        end_hyps = [[] for _ in range(bs)]
+        hyps = [[] for _ in range(bs)]
+        is_finished = [False] * bs
+        for t in range(max(ymax)):
+            # Update LM states for LM fusion
+            y = ys[:, -1:]
+            lmout, scores_lm = None, None
+            if lm_step is not None:
+                lmout, lmstate, scores_lm = lm_step.predict(y, lmstate)
+
+            dstates, cv, aw, attn_v, _, _ = self.decode_step(
+                eouts_hyp, dstates, cv, self.dropout_emb(self.embed(y)), src_mask, aw,
+                lmout if self.lm is not None else None)
+            scores_att = torch.log(torch.softmax(self.output(attn_v).squeeze(1) * softmax_smoothing, dim=1))
+
+            # Attention scores
+            total_scores_att = score_att.unsqueeze(1) + scores_att  # `[B * beam_width, vocab]`
+            total_scores_topk, topk_ids = torch.topk(
+                total_scores_att * (1 - ctc_weight), k=beam_width, dim=1, largest=True, sorted=True)
+
+            # Add LM score <after> top-K selection
+            if lm is not None:
+                total_scores_lm = score_lm.unsqueeze(1) + torch.gather(scores_lm[:, -1], 1, topk_ids)
+                total_scores_topk += total_scores_lm * lm_weight
+            else:
+                total_scores_lm = total_scores_topk.new_zeros(topk_ids.size())
+
+            # Add length penalty
+            if lp_weight > 0:
+                if gnmt_decoding:
+                    lp = math.pow(6 + t, lp_weight) / math.pow(6, lp_weight)
+                    total_scores_topk /= lp
+                else:
+                    total_scores_topk += (t + 1) * lp_weight
+
+            # Add coverage penalty accumulated over steps
+            cp = score_cp
+            if cp_weight > 0:
+                aw_t = aw[:, 0, 0]  # `[B * beam_width, T]`
+                if gnmt_decoding:
+                    aw_t = torch.log(aw_t.sum(-1))
+                    cp = cp + torch.where(aw_t < 0, aw_t, torch.zeros_like(aw_t))
+                elif cp_threshold == 0:
+                    cp = cp + aw_t.sum(-1) / self.score.n_heads
+                else:
+                    cp = cp + torch.where(aw_t > cp_threshold, aw_t,
+                                          torch.zeros_like(aw_t)).sum(-1) / self.score.n_heads
+                total_scores_topk += cp.unsqueeze(1) * cp_weight
+
+            # Add CTC score
+            if ctc_prefix_scorer is not None:
+                total_scores_ctc, new_ctc_states = ctc_prefix_scorer.score(
+                    ys[:, -1], ys.new_full((n_hyps,), t), topk_ids, ctc_states, hyp2utt)
+                total_scores_topk += total_scores_ctc * ctc_weight
+            else:
+                total_scores_ctc = total_scores_topk.new_zeros(topk_ids.size())
+
+            if length_norm:
+                total_scores_topk /= t + 1
+
+            # Exclude short hypotheses and <eos> below the threshold
+            scores_att_no_eos = torch.cat([scores_att[:, :self.eos], scores_att[:, self.eos + 1:]], dim=1)
+            eos_ok = (t >= min_ylens) & (scores_att[:, self.eos] > eos_threshold * scores_att_no_eos.max(1)[0])
+            is_excluded = (topk_ids == self.eos) & ~eos_ok.unsqueeze(1)
+            # NOTE: keep <eos> if there are no other candidates in the utterance
+            no_cands = ((~is_excluded & alive.unsqueeze(1)).view(bs, -1).sum(1) == 0)[hyp2utt]
+            is_excluded &= ~no_cands.unsqueeze(1)
+            total_scores_topk = total_scores_topk.masked_fill(is_excluded | ~alive.unsqueeze(1), float('-inf'))
+
+            # Local pruning over candidates of all hypotheses in each utterance
+            score, cand_ids = torch.topk(total_scores_topk.view(bs, -1), k=beam_width, dim=1,
+                                         largest=True, sorted=True)
+            score = score.view(-1)
+            src = (hyp2utt * beam_width + cand_ids.view(-1) // beam_width)  # `[B * beam_width]`
+            k_ids = cand_ids.view(-1) % beam_width
+            idx = topk_ids[src, k_ids]
+
+            # Reorder hypotheses
+            ys = torch.cat([ys[src], idx.unsqueeze(1)], dim=1)
+            score_att = total_scores_att[src, idx]
+            score_lm = total_scores_lm[src, k_ids]
+            score_ctc = total_scores_ctc[src, k_ids]
+            score_cp = cp[src]
+            dstates = {'dstate': (dstates['dstate'][0][:, src],
+                                  dstates['dstate'][1][:, src] if self.rnn_type == 'lstm' else None)}
+            cv = cv[src]
+            aw = aw[src]
+            aws_hyp = aw if aws_hyp is None else torch.cat([aws_hyp[src], aw], dim=2)
+            if lmstate is not None:
+                lmstate = {k: s[:, src] if s is not None else None for k, s in lmstate.items()}
+            if ctc_prefix_scorer is not None:
+                ctc_states = new_ctc_states[src, k_ids]
+            is_valid = score > float('-inf')
+            is_end = is_valid & (idx == self.eos)
+            alive = is_valid & ~is_end
+
+            # Remove complete hypotheses
+            is_end = is_end.tolist()
+            for b in range(bs):
+                if is_finished[b]:
+                    continue
+                end_hyps[b] += [get_hyp(i) for i in range(b * beam_width, (b + 1) * beam_width) if is_end[i]]
+                if len(end_hyps[b]) >= beam_width:
+                    end_hyps[b] = end_hyps[b][:beam_width]
+                    is_finished[b] = True
+                elif t == ymax[b] - 1:
+                    hyps[b] = [get_hyp(i) for i in range(b * beam_width, (b + 1) * beam_width)
+                               if alive[i].item()]
+                    is_finished[b] = True
+                if is_finished[b]:
+                    alive[b * beam_width:(b + 1) * beam_width] = False
+            if all(is_finished):
+                break
+
+        nbest_hyps_idx, aws, scores = [], [], []
+        eos_flags = []
+        for b in range(bs):
+            # Global pruning
+            if len(end_hyps[b]) == 0:
+                end_hyps[b] = hyps[b][:]
+            elif len(end_hyps[b]) < nbest and nbest > 1:
+                end_hyps[b].extend(hyps[b][:nbest - len(end_hyps[b])])
+
+        # forward second path LM rescoring of all utterances at once
+        if lm_second is not None:
+            self.lm_rescoring(sum(end_hyps, []), lm_second, lm_weight_second, tag='second')
+
+        # backward secodn path LM rescoring
+        if lm_second_bwd is not None:
+            self.lm_rescoring(sum(end_hyps, []), lm_second_bwd, lm_weight_second_bwd,
+                              reverse=True, tag='second_bwd')
+
+        for b in range(bs):
+            # Sort by score
+            end_hyps[b] = sorted(end_hyps[b], key=lambda x: x['score'], reverse=True)
+
+            if idx2token is not None:
+                if utt_ids is not None:
+                    logger.info('Utt-id: %s' % utt_ids[b])
+                assert self.vocab == idx2token.vocab
+                logger.info('=' * 200)
+                for k in range(len(end_hyps[b])):
+                    if refs_id is not None:
+                        logger.info('Ref: %s' % idx2token(refs_id[b]))
+                    logger.info('Hyp: %s' % idx2token(
+                        end_hyps[b][k]['hyp'][1:][::-1] if self.bwd else end_hyps[b][k]['hyp'][1:]))
+                    logger.info('log prob (hyp): %.7f' % end_hyps[b][k]['score'])
+                    logger.info('log prob (hyp, att): %.7f' % (end_hyps[b][k]['score_att'] * (1 - ctc_weight)))
+                    logger.info('log prob (hyp, cp): %.7f' % (end_hyps[b][k]['score_cp'] * cp_weight))
+                    if ctc_prefix_scorer is not None:
+                        logger.info('log prob (hyp, ctc): %.7f' % (end_hyps[b][k]['score_ctc'] * ctc_weight))
+                    if lm is not None:
+                        logger.info('log prob (hyp, first-path lm): %.7f' % (end_hyps[b][k]['score_lm'] * lm_weight))
+                    if lm_second is not None:
+                        logger.info('log prob (hyp, second-path lm): %.7f' %
+                                    (end_hyps[b][k]['score_lm_second'] * lm_weight_second))
+                    if lm_second_bwd is not None:
+                        logger.info('log prob (hyp, second-path lm, reverse): %.7f' %
+                                    (end_hyps[b][k]['score_lm_second_bwd'] * lm_weight_second_bwd))
+                    logger.info('-' * 50)
+
+            # N-best list
+            if self.bwd:
+                # Reverse the order
+                nbest_hyps_idx += [[np.array(end_hyps[b][n]['hyp'][1:][::-1]) for n in range(nbest)]]
+                aws += [tensor2np(torch.cat(end_hyps[b][0]['aws'][1:][::-1], dim=2).squeeze(0))]
+            else:
+                nbest_hyps_idx += [[np.array(end_hyps[b][n]['hyp'][1:]) for n in range(nbest)]]
+                aws += [tensor2np(torch.cat(end_hyps[b][0]['aws'][1:], dim=2).squeeze(0))]
+            if length_norm:
+                scores += [[end_hyps[b][n]['score_att'] / len(end_hyps[b][n]['hyp'][1:]) for n in range(nbest)]]
+            else:
+                scores += [[end_hyps[b][n]['score_att'] for n in range(nbest)]]
+
+            # Check <eos>
+            eos_flags.append([(end_hyps[b][n]['hyp'][-1] == self.eos) for n in range(nbest)])
+
+        # Exclude <eos> (<sos> in case of the backward decoder)
+        if exclude_eos:
+            if self.bwd:
+                nbest_hyps_idx = [[nbest_hyps_idx[b][n][1:] if eos_flags[b][n]
+                                   else nbest_hyps_idx[b][n] for n in range(nbest)] for b in range(bs)]
+            else:
+                nbest_hyps_idx = [[nbest_hyps_idx[b][n][:-1] if eos_flags[b][n]
+                                   else nbest_hyps_idx[b][n] for n in range(nbest)] for b in range(bs)]
+
+        # Store ASR/LM state
+        if speakers is not None:
+            self.prev_spk = speakers[-1]
+        self.dstates_final = end_hyps[-1][0]['dstates']
+        self.lmstate_final = end_hyps[-1][0]['lmstate']
+
+        return nbest_hyps_idx, aws, scores
+
     def beam_search_chunk_sync(self, eouts_c, params, idx2token,
                                lm=None, ctc_log_probs=None,
                                hyps=False, state_carry_over=False, ignore_eos=False):
@@ -1364,6 +1691,8 @@ class RNNDecoder(DecoderBase):
         beam_width = params['recog_beam_width']
         # beam_width_second = params['recog_beam_width']
         ctc_weight = params['recog_ctc_weight']
+        ctc_margin = params['recog_ctc_prefix_margin']
+        ctc_horizon = params['recog_ctc_prefix_horizon']
         max_len_ratio = params['recog_max_len_ratio']
         lp_weight = params['recog_length_penalty']
         length_norm = params['recog_length_norm']
@@ -1381,17 +1710,17 @@ class RNNDecoder(DecoderBase):
         ctc_state = None
 
         # For joint CTC-Attention decoding
-        self.ctc_prefix_scorer = None
+        if hyps is None:
+            # first chunk
+            self.ctc_prefix_scorer = None
         if ctc_log_probs is not None:
             assert ctc_weight > 0
             ctc_log_probs = tensor2np(ctc_log_probs)
-            if hyps is None:
-                # first chunk
-                self.ctc_prefix_scorer = CTCPrefixScore(ctc_log_probs[0], self.blank, self.eos)
-            else:
-                self.ctc_prefix_scorer.register_new_chunk(ctc_log_probs[0])
+            if self.ctc_prefix_scorer is None:
+                self.ctc_prefix_scorer = CTCPrefixScoreStreaming(self.blank, self.eos, margin=ctc_margin,
+                                                                 horizon=ctc_horizon)
+            self.ctc_prefix_scorer.register_new_chunk(ctc_log_probs[0])
             ctc_state = self.ctc_prefix_scorer.initial_state()
-        # TODO: add truncated version
 
         if state_carry_over:
             dstates = self.dstates_final
@@ -1419,6 +1748,11 @@ class RNNDecoder(DecoderBase):
         else:
             for h in hyps:
                 h['no_boundary'] = False
+            if ctc_log_probs is not None:
+                # extend CTC states of all hypotheses to the new chunk at once
+                ctc_states = self.ctc_prefix_scorer.extend_states(np.stack([h['ctc_state'] for h in hyps]))
+                for h, ctc_state in zip(hyps, ctc_states):
+                    h['ctc_state'] = ctc_state
 
         ymax = int(math.floor(eouts_c.size(1) * max_len_ratio)) + 1
         for t in range(ymax):
@@ -1497,7 +1831,7 @@ class RNNDecoder(DecoderBase):
                 # Add CTC score
                 new_ctc_states, total_scores_ctc, total_scores_topk = helper.add_ctc_score(
                     beam['hyp'], topk_ids, beam['ctc_state'],
-                    total_scores_topk, self.ctc_prefix_scorer, new_chunk=(t == 0))
+                    total_scores_topk, self.ctc_prefix_scorer)
 
                 for k in range(beam_width):
                     idx = topk_ids[0, k].item()
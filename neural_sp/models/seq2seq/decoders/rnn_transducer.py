@@ -323,6 +323,51 @@ class RNNTransducer(DecoderBase):
 
         return ys_emb, new_dstate
 
+    def recurrency_cached(self, hyp_ids, dstates, cache_size):
+        """Update prediction network for label prefixes with a state cache.
+
+        Prefixes found in the cache are not recomputed, and the others are
+        computed by a single call of `self.recurrency`. The least recently used
+        prefixes are evicted once the cache exceeds `cache_size` entries.
+
+        Args:
+            hyp_ids (list): length `N`, each of which is a tuple of label prefix
+            dstates (list): length `N`, each of which is a dict of states before
+                consuming the last label of the prefix
+                hxs (FloatTensor): `[n_layers, 1, dec_n_units]`
+                cxs (FloatTensor): `[n_layers, 1, dec_n_units]`
+            cache_size (int): maximum number of cached prefixes
+        Returns:
+            douts (list): length `N`, each of which is FloatTensor `[1, 1, dec_n_units]`
+            new_dstates (list): length `N`, each of which is a dict
+                hxs (FloatTensor): `[n_layers, 1, dec_n_units]`
+                cxs (FloatTensor): `[n_layers, 1, dec_n_units]`
+
+        """
+        miss = OrderedDict()
+        for hyp_id, dstate in zip(hyp_ids, dstates):
+            if hyp_id in self.state_cache:
+                self.state_cache.move_to_end(hyp_id)
+            else:
+                miss[hyp_id] = dstate
+
+        if len(miss) > 0:
+            ys = next(self.parameters()).new_tensor([[hyp_id[-1]] for hyp_id in miss], dtype=torch.int64)
+            dstate = {'hxs': torch.cat([s['hxs'] for s in miss.values()], dim=1), 'cxs': None}
+            if self.rnn_type == 'lstm_transducer':
+                dstate['cxs'] = torch.cat([s['cxs'] for s in miss.values()], dim=1)
+            douts, new_dstate = self.recurrency(self.dropout_emb(self.embed(ys)), dstate)
+            for i, hyp_id in enumerate(miss):
+                self.state_cache[hyp_id] = {
+                    'dout': douts[i:i + 1],
+                    'dstate': {'hxs': new_dstate['hxs'][:, i:i + 1],
+                               'cxs': new_dstate['cxs'][:, i:i + 1] if new_dstate['cxs'] is not None else None}}
+
+        outputs = [self.state_cache[hyp_id] for hyp_id in hyp_ids]
+        while len(self.state_cache) > cache_size:
+            self.state_cache.popitem(last=False)
+        return [o['dout'] for o in outputs], [o['dstate'] for o in outputs]
+
     def zero_state(self, batch_size):
         """Initialize hidden states.
 
@@ -427,11 +472,13 @@ class RNNTransducer(DecoderBase):
 
         beam_width = params['recog_beam_width']
         ctc_weight = params['recog_ctc_weight']
+        ctc_margin = params['recog_ctc_prefix_margin']
         lm_weight = params['recog_lm_weight']
         lm_weight_second = params['recog_lm_second_weight']
         lm_weight_second_bwd = params['recog_lm_bwd_weight']
         # asr_state_carry_over = params['recog_asr_state_carry_over']
         lm_state_carry_over = params['recog_lm_state_carry_over']
+        cache_size = params['recog_rnnt_state_cache_size']
 
         if lm is not None:
             assert lm_weight > 0
@@ -447,19 +494,21 @@ class RNNTransducer(DecoderBase):
             assert ctc_weight > 0
             ctc_log_probs = tensor2np(ctc_log_probs)
 
+        # Prediction network states are cached by label prefixes over utterances
+        self.state_cache = OrderedDict()
+
         nbest_hyps_idx = []
         eos_flags = []
         for b in range(bs):
             # Initialization per utterance
-            y = eouts.new_zeros(bs, 1).fill_(self.eos).long()
-            y_emb = self.dropout_emb(self.embed(y))
-            dout, dstate = self.recurrency(y_emb, None)
+            douts, dstates = self.recurrency_cached([(self.eos,)], [self.zero_state(1)], cache_size)
             lmstate = None
 
             # For joint CTC-Attention decoding
             ctc_prefix_scorer = None
             if ctc_log_probs is not None:
-                ctc_prefix_scorer = CTCPrefixScore(ctc_log_probs[b], self.blank, self.eos)
+                ctc_prefix_scorer = CTCPrefixScore(ctc_log_probs[b, :elens[b]], self.blank, self.eos,
+                                                   margin=ctc_margin)
 
             if speakers is not None:
                 if speakers[b] == self.prev_spk:
@@ -476,8 +525,8 @@ class RNNTransducer(DecoderBase):
                      'score_rnnt': 0.,
                      'score_lm': 0.,
                      'score_ctc': 0.,
-                     'dout': dout,
-                     'dstate': dstate,
+                     'dout': douts[0],
+                     'dstate': dstates[0],
                      'lmstate': lmstate,
                      'ctc_state': ctc_prefix_scorer.initial_state() if ctc_prefix_scorer is not None else None}]
             for t in range(elens[b]):
@@ -487,35 +536,36 @@ class RNNTransducer(DecoderBase):
                 scores_rnnt = torch.log_softmax(outs.squeeze(2).squeeze(1), dim=-1)
 
                 # Update LM states for shallow fusion
-                y = eouts.new_zeros(len(hyps), 1).long()
-                for j, beam in enumerate(hyps):
-                    y[j, 0] = beam['hyp'][-1]
+                y = eouts.new_tensor([[beam['hyp'][-1]] for beam in hyps], dtype=torch.int64)
                 lmstate, scores_lm = None, None
                 if lm is not None:
-                    if hyps[0]['lmstate'] is not None:
-                        lm_hxs = torch.cat([beam['lmstate']['hxs'] for beam in hyps], dim=1)
-                        lm_cxs = torch.cat([beam['lmstate']['cxs'] for beam in hyps], dim=1)
-                        lmstate = {'hxs': lm_hxs, 'cxs': lm_cxs}
+                    lmstates = [beam['lmstate'] if beam['lmstate'] is not None else lm.zero_state(1)
+                                for beam in hyps]
+                    lmstate = {k: torch.cat([s[k] for s in lmstates], dim=1) if lmstates[0][k] is not None else None
+                               for k in ['hxs', 'cxs']}
                     lmout, lmstate, scores_lm = lm.predict(y, lmstate)
 
-                new_hyps = []
-                for j, beam in enumerate(hyps):
-                    dout = douts[j:j + 1]
-                    dstate = beam['dstate']
-                    lmstate = beam['lmstate']
+                # Scores of all hypotheses
+                total_scores_rnnt_all = scores_rnnt.new_tensor(
+                    [beam['score_rnnt'] for beam in hyps]).unsqueeze(1) + scores_rnnt
+                total_scores_topk_all, topk_ids_all = torch.topk(
+                    total_scores_rnnt_all * (1 - ctc_weight), k=beam_width, dim=-1, largest=True, sorted=True)
 
-                    # Attention scores
-                    total_scores_rnnt = beam['score_rnnt'] + scores_rnnt[j:j + 1]
-                    total_scores = total_scores_rnnt * (1 - ctc_weight)
+                # Add LM score <after> top-K selection
+                if lm is not None:
+                    total_scores_lm_all = scores_lm.new_tensor(
+                        [beam['score_lm'] for beam in hyps]).unsqueeze(1) + torch.gather(
+                        scores_lm[:, -1], 1, topk_ids_all)
+                    total_scores_topk_all += total_scores_lm_all * lm_weight
+                else:
+                    total_scores_lm_all = eouts.new_zeros(len(hyps), beam_width)
 
-                    # Add LM score <after> top-K selection
-                    total_scores_topk, topk_ids = torch.topk(
-                        total_scores, k=beam_width, dim=-1, largest=True, sorted=True)
-                    if lm is not None:
-                        total_scores_lm = beam['score_lm'] + scores_lm[j, -1, topk_ids[0]]
-                        total_scores_topk += total_scores_lm * lm_weight
-                    else:
-                        total_scores_lm = eouts.new_zeros(beam_width)
+                new_hyps = []
+                for j, beam in enumerate(hyps):
+                    total_scores_rnnt = total_scores_rnnt_all[j:j + 1]
+                    total_scores_topk = total_scores_topk_all[j:j + 1]
+                    total_scores_lm = total_scores_lm_all[j]
+                    topk_ids = topk_ids_all[j:j + 1]
 
                     # Add CTC score
                     new_ctc_states, total_scores_ctc, total_scores_topk = helper.add_ctc_score(
@@ -526,65 +576,50 @@ class RNNTransducer(DecoderBase):
                         idx = topk_ids[0, k].item()
 
                         if idx == self.blank:
-                            beam['score'] = total_scores_topk[0, k].item()
-                            beam['score_rnnt'] = total_scores_topk[0, k].item()
-                            new_hyps.append(beam.copy())
+                            new_hyps.append(dict(beam, score=total_scores_topk[0, k].item(),
+                                                 score_rnnt=total_scores_topk[0, k].item()))
                             continue
 
                         # skip blank-dominant frames
                         # if total_scores_topk[0, self.blank].item() > 0.7:
                         #     continue
 
-                        # Update prediction network only when predicting non-blank labels
-                        hyp_id = beam['hyp'] + [idx]
-                        hyp_str = ' '.join(list(map(str, hyp_id)))
-                        # if hyp_str in self.state_cache.keys():
-                        #     # from cache
-                        #     dout = self.state_cache[hyp_str]['dout']
-                        #     new_dstate = self.state_cache[hyp_str]['dstate']
-                        #     lmstate = self.state_cache[hyp_str]['lmstate']
-                        # else:
-                        y = eouts.new_zeros(1, 1).fill_(idx).long()
-                        y_emb = self.dropout_emb(self.embed(y))
-                        dout, new_dstate = self.recurrency(y_emb, dstate)
-
-                        # store in cache
-                        self.state_cache[hyp_str] = {
-                            'dout': dout,
-                            'dstate': new_dstate,
-                            'lmstate': {'hxs': lmstate['hxs'][:, j:j + 1],
-                                        'cxs': lmstate['cxs'][:, j:j + 1]} if lmstate is not None else None,
-                        }
-
-                        new_hyps.append({'hyp': hyp_id,
+                        # NOTE: the prediction network is updated after pruning
+                        new_hyps.append({'hyp': beam['hyp'] + [idx],
                                          'score': total_scores_topk[0, k].item(),
                                          'score_rnnt': total_scores_rnnt[0, idx].item(),
                                          'score_ctc': total_scores_ctc[k].item(),
                                          'score_lm': total_scores_lm[k].item(),
-                                         'dout': dout,
-                                         'dstate': new_dstate,
+                                         'dout': None,
+                                         'dstate': beam['dstate'],
                                          'lmstate': {'hxs': lmstate['hxs'][:, j:j + 1],
-                                                     'cxs': lmstate['cxs'][:, j:j + 1]} if lmstate is not None else None,
+                                                     'cxs': lmstate['cxs'][:, j:j + 1]
+                                                     if lmstate['cxs'] is not None else None}
+                                         if lmstate is not None else None,
                                          'ctc_state': new_ctc_states[k] if ctc_prefix_scorer is not None else None})
 
                 # Merge hypotheses having the same token sequences
                 new_hyps_merged = {}
                 for beam in new_hyps:
-                    hyp_str = ' '.join(list(map(str, beam['hyp'])))
-                    if hyp_str not in new_hyps_merged.keys():
-                        new_hyps_merged[hyp_str] = beam
-                    elif hyp_str in new_hyps_merged.keys():
-                        if beam['score'] > new_hyps_merged[hyp_str]['score']:
-                            new_hyps_merged[hyp_str] = beam
-                new_hyps = [v for v in new_hyps_merged.values()]
+                    hyp_id = tuple(beam['hyp'])
+                    if hyp_id not in new_hyps_merged or beam['score'] > new_hyps_merged[hyp_id]['score']:
+                        new_hyps_merged[hyp_id] = beam
+                new_hyps = list(new_hyps_merged.values())
 
                 # Local pruning
-                new_hyps_tmp = sorted(new_hyps, key=lambda x: x['score'], reverse=True)[:beam_width]
+                new_hyps = sorted(new_hyps, key=lambda x: x['score'], reverse=True)[:beam_width]
+
+                # Update the prediction network for all surviving non-blank expansions at once
+                expanded = [beam for beam in new_hyps if beam['dout'] is None]
+                if len(expanded) > 0:
+                    douts, dstates = self.recurrency_cached([tuple(beam['hyp']) for beam in expanded],
+                                                            [beam['dstate'] for beam in expanded],
+                                                            cache_size)
+                    for beam, dout, dstate in zip(expanded, douts, dstates):
+                        beam['dout'] = dout
+                        beam['dstate'] = dstate
 
                 # Remove complete hypotheses
-                new_hyps = []
-                for hyp in new_hyps_tmp:
-                    new_hyps += [hyp]
                 if len(end_hyps) >= beam_width:
                     end_hyps = end_hyps[:beam_width]
                     break
@@ -602,13 +637,11 @@ class RNNTransducer(DecoderBase):
 
             # backward secodn path LM rescoring
             if lm_second_bwd is not None:
-                self.lm_rescoring(end_hyps, lm_second_bwd, lm_weight_second_bwd, tag='second_rev')
+                self.lm_rescoring(end_hyps, lm_second_bwd, lm_weight_second_bwd,
+                                  reverse=True, tag='second_rev')
 
             end_hyps = sorted(end_hyps, key=lambda x: x['score'], reverse=True)
 
-            # Reset state cache
-            self.state_cache = OrderedDict()
-
             if idx2token is not None:
                 if utt_ids is not None:
                     logger.info('Utt-id: %s' % utt_ids[b])
@@ -23,10 +23,13 @@ from neural_sp.models.modules.positional_embedding import XLPositionalEmbedding
 from neural_sp.models.modules.transformer import TransformerDecoderBlock
 from neural_sp.models.seq2seq.decoders.beam_search import BeamSearch
 from neural_sp.models.seq2seq.decoders.ctc import CTC
-from neural_sp.models.seq2seq.decoders.ctc import CTCPrefixScore
+from neural_sp.models.seq2seq.decoders.ctc import CTCPrefixScoreStreaming
+from neural_sp.models.seq2seq.decoders.ctc import CTCPrefixScoreTH
 from neural_sp.models.seq2seq.decoders.decoder_base import DecoderBase
+from neural_sp.models.seq2seq.frontends.streaming import EncoderOutputBuffer
 from neural_sp.models.torch_utils import append_sos_eos
 from neural_sp.models.torch_utils import compute_accuracy
+from neural_sp.models.torch_utils import is_attention_captured
 from neural_sp.models.torch_utils import make_pad_mask
 from neural_sp.models.torch_utils import tensor2np
 
@@ -424,16 +427,15 @@ class TransformerDecoder(DecoderBase):
             self.data_dict['ys'] = tensor2np(ys_out)
 
         # Create target self-attention mask
-        xmax = eouts.size(1)
         bs, ymax = ys_in.size()[:2]
         mlen = 0
-        tgt_mask = (ys_out != self.pad).unsqueeze(1).repeat([1, ymax, 1])
+        tgt_mask = (ys_out != self.pad).unsqueeze(1)  # `[B, 1, L (key)]`
         causal_mask = tgt_mask.new_ones(ymax, ymax).byte()
         causal_mask = torch.tril(causal_mask, diagonal=0 + mlen, out=causal_mask).unsqueeze(0)
         tgt_mask = tgt_mask & causal_mask  # `[B, L (query), L (key)]`
 
         # Create source-target mask
-        src_mask = make_pad_mask(elens, self.device_id).unsqueeze(1).repeat([1, ymax, 1])  # `[B, L, T]`
+        src_mask = make_pad_mask(elens, self.device_id).unsqueeze(1)  # `[B, 1, T]`
 
         # external LM integration
         lmout = None
@@ -466,10 +468,10 @@ class TransformerDecoder(DecoderBase):
             xy_aws = layer.xy_aws
             if xy_aws is not None and 'mocha' in self.attn_type:
                 tgt_mask_v2 = (ys_out != self.pad).unsqueeze(1).unsqueeze(3)  # `[B, 1, L, 1]`
-                xy_aws = xy_aws.masked_fill_(tgt_mask_v2.repeat([1, xy_aws.size(1), 1, xmax]) == 0, 0)
+                xy_aws = xy_aws.masked_fill_(tgt_mask_v2 == 0, 0)
                 # NOTE: attention padding is quite effective for quantity loss
                 xy_aws_layers.append(xy_aws.clone())
-            if not self.training:
+            if not self.training and is_attention_captured():
                 if layer.yy_aws is not None:
                     self.aws_dict['yy_aws_layer%d' % lth] = tensor2np(layer.yy_aws)
                 if layer.xy_aws is not None:
@@ -633,9 +635,20 @@ class TransformerDecoder(DecoderBase):
         bs, xmax, _ = eouts.size()
         n_models = len(ensmbl_decs) + 1
 
+        # Decode all utterances at once with preallocated caches if possible
+        lm_state_carry_over = speakers is not None and params['recog_lm_state_carry_over']
+        batchable = not self.memory_transformer and 'mocha' not in self.attn_type
+        batchable = batchable and self.pe_type in ['add', 'none'] and self.lm is None
+        batchable = batchable and (lm is None or isinstance(lm, RNNLM))
+        if n_models == 1 and cache_states and not lm_state_carry_over and batchable:
+            return self.batch_beam_search(eouts, elens, params, idx2token,
+                                          lm, lm_second, lm_bwd, ctc_log_probs,
+                                          nbest, exclude_eos, refs_id, utt_ids, speakers)
+
         beam_width = params['recog_beam_width']
         assert 1 <= nbest <= beam_width
         ctc_weight = params['recog_ctc_weight']
+        ctc_margin = params['recog_ctc_prefix_margin']
         max_len_ratio = params['recog_max_len_ratio']
         min_len_ratio = params['recog_min_len_ratio']
         lp_weight = params['recog_length_penalty']
@@ -658,9 +671,13 @@ class TransformerDecoder(DecoderBase):
             assert lm_weight_bwd > 0
             lm_bwd.eval()
 
+        # For joint CTC-Attention decoding
+        ctc_prefix_scorer = None
         if ctc_log_probs is not None:
             assert ctc_weight > 0
-            ctc_log_probs = tensor2np(ctc_log_probs)
+            ctc_prefix_scorer = CTCPrefixScoreTH(ctc_log_probs, elens, self.blank, self.eos, self.bwd,
+                                                 margin=ctc_margin)
+            ctc_states_init = ctc_prefix_scorer.initial_state()
 
         nbest_hyps_idx, aws, scores = [], [], []
         eos_flags = []
@@ -669,14 +686,6 @@ class TransformerDecoder(DecoderBase):
             lmstate = None
             ys = eouts.new_zeros(1, 1).fill_(self.eos).long()
 
-            # For joint CTC-Attention decoding
-            ctc_prefix_scorer = None
-            if ctc_log_probs is not None:
-                if self.bwd:
-                    ctc_prefix_scorer = CTCPrefixScore(ctc_log_probs[b][::-1], self.blank, self.eos)
-                else:
-                    ctc_prefix_scorer = CTCPrefixScore(ctc_log_probs[b], self.blank, self.eos)
-
             if speakers is not None:
                 if speakers[b] == self.prev_spk:
                     if lm_state_carry_over and isinstance(lm, RNNLM):
@@ -697,7 +706,7 @@ class TransformerDecoder(DecoderBase):
                      'aws': [None],
                      'lmstate': lmstate,
                      'ensmbl_aws':[[None]] * (n_models - 1),
-                     'ctc_state': ctc_prefix_scorer.initial_state() if ctc_prefix_scorer is not None else None,
+                     'ctc_state': ctc_states_init[b] if ctc_prefix_scorer is not None else None,
                      'streamable': True,
                      'streaming_failed_point': 1000}]
             streamable_global = True
@@ -727,7 +736,7 @@ class TransformerDecoder(DecoderBase):
 
                 # for the main model
                 causal_mask = eouts.new_ones(t + 1, t + 1).byte()
-                causal_mask = torch.tril(causal_mask, out=causal_mask).unsqueeze(0).repeat([ys.size(0), 1, 1])
+                causal_mask = torch.tril(causal_mask, out=causal_mask).unsqueeze(0)
 
                 out = self.pos_enc(self.embed(ys))  # scaled
 
@@ -792,40 +801,51 @@ class TransformerDecoder(DecoderBase):
                 # Ensemble in log-scale
                 scores_attn = torch.log(probs) / n_models
 
-                new_hyps = []
-                for j, beam in enumerate(hyps):
-                    # Attention scores
-                    total_scores_attn = beam['score_attn'] + scores_attn[j:j + 1]
-                    total_scores = total_scores_attn * (1 - ctc_weight)
+                # Attention scores of all hypotheses
+                total_scores_attn_all = scores_attn.new_tensor(
+                    [beam['score_attn'] for beam in hyps]).unsqueeze(1) + scores_attn
+                total_scores_all = total_scores_attn_all * (1 - ctc_weight)
 
-                    # Add LM score <before> top-K selection
-                    if lm is not None:
-                        total_scores_lm = beam['score_lm'] + scores_lm[j:j + 1, -1]
-                        total_scores += total_scores_lm * lm_weight
-                    else:
-                        total_scores_lm = eouts.new_zeros(1, self.vocab)
+                # Add LM score <before> top-K selection
+                if lm is not None:
+                    total_scores_lm_all = scores_lm.new_tensor(
+                        [beam['score_lm'] for beam in hyps]).unsqueeze(1) + scores_lm[:, -1]
+                    total_scores_all += total_scores_lm_all * lm_weight
+                else:
+                    total_scores_lm_all = eouts.new_zeros(len(hyps), self.vocab)
 
-                    total_scores_topk, topk_ids = torch.topk(
-                        total_scores, k=beam_width, dim=1, largest=True, sorted=True)
+                total_scores_topk_all, topk_ids_all = torch.topk(
+                    total_scores_all, k=beam_width, dim=1, largest=True, sorted=True)
+
+                # CTC scores of all hypotheses
+                new_ctc_states, total_scores_ctc_all = helper.ctc_score_batch(
+                    hyps, topk_ids_all, ctc_prefix_scorer, [b] * len(hyps))
+
+                new_hyps = []
+                for j, beam in enumerate(hyps):
+                    total_scores_attn = total_scores_attn_all[j:j + 1]
+                    total_scores_lm = total_scores_lm_all[j:j + 1]
+                    total_scores_topk = total_scores_topk_all[j:j + 1]
+                    topk_ids = topk_ids_all[j:j + 1]
 
                     # Add length penalty
                     if lp_weight > 0:
                         total_scores_topk += (len(beam['hyp'][1:]) + 1) * lp_weight
 
                     # Add CTC score
-                    new_ctc_states, total_scores_ctc, total_scores_topk = helper.add_ctc_score(
-                        beam['hyp'], topk_ids, beam['ctc_state'],
-                        total_scores_topk, ctc_prefix_scorer)
+                    total_scores_ctc = total_scores_ctc_all[j]
+                    total_scores_topk += total_scores_ctc * ctc_weight
 
                     new_aws = beam['aws'] + [xy_aws_all_layers[j:j + 1, :, :, -1:]]
                     aws_j = torch.cat(new_aws[1:], dim=3)  # `[1, H, n_layers, L, T]`
                     streaming_failed_point = beam['streaming_failed_point']
 
+                    if length_norm:
+                        total_scores_topk /= len(beam['hyp'][1:]) + 1
+
                     # forward direction
                     for k in range(beam_width):
                         idx = topk_ids[0, k].item()
-                        length_norm_factor = len(beam['hyp'][1:]) + 1 if length_norm else 1
-                        total_scores_topk /= length_norm_factor
 
                         if idx == self.eos:
                             # Exclude short hypotheses
@@ -868,7 +888,7 @@ class TransformerDecoder(DecoderBase):
                              'aws': new_aws,
                              'lmstate': {'hxs': lmstate['hxs'][:, j:j + 1],
                                          'cxs': lmstate['cxs'][:, j:j + 1]} if lmstate is not None else None,
-                             'ctc_state': new_ctc_states[k] if ctc_prefix_scorer is not None else None,
+                             'ctc_state': new_ctc_states[j, k] if ctc_prefix_scorer is not None else None,
                              'ensmbl_cache': ensmbl_new_cache,
                              'streamable': streamable_global,
                              'streaming_failed_point': streaming_failed_point,
@@ -896,7 +916,7 @@ class TransformerDecoder(DecoderBase):
 
             # backward secodn path LM rescoring
             if lm_bwd is not None and lm_weight_bwd > 0:
-                self.lm_rescoring(end_hyps, lm_bwd, lm_weight_bwd, tag='second_bwd')
+                self.lm_rescoring(end_hyps, lm_bwd, lm_weight_bwd, reverse=True, tag='second_bwd')
 
             # Sort by score
             end_hyps = sorted(end_hyps, key=lambda x: x['score'], reverse=True)
@@ -974,3 +994,620 @@ class TransformerDecoder(DecoderBase):
             self.lmstate_final = end_hyps[0]['lmstate']
 
         return nbest_hyps_idx, aws, scores
+
+    def batch_beam_search(self, eouts, elens, params, idx2token=None,
+                          lm=None, lm_second=None, lm_bwd=None, ctc_log_probs=None,
+                          nbest=1, exclude_eos=False,
+                          refs_id=None, utt_ids=None, speakers=None):
+        """Beam search decoding of all utterances in a mini-batch with preallocated caches.
+
+        Hypotheses of all utterances are held in tensors of size `[B * beam_width]`.
+        Keys and values of the self-attention in each layer are written to caches of
+        size `[B * beam_width, L_max, d_model]` allocated once, and only their filled
+        part is reordered at each step. Only the last token is fed to the decoder
+        at each step. Projections of the encoder outputs in the source-target attention
+        are computed once at the first step.
+
+        Args:
+            eouts (FloatTensor): `[B, T, d_model]`
+            elens (IntTensor): `[B]`
+            params (dict): hyperparameters for decoding
+            idx2token (): converter from index to token
+            lm: firsh path LM (RNNLM only)
+            lm_second: second path LM
+            lm_bwd: secoding path backward LM
+            ctc_log_probs (FloatTensor):
+            nbest (int):
+            exclude_eos (bool): exclude <eos> from hypothesis
+            refs_id (list): reference list
+            utt_ids (list): utterance id list
+            speakers (list): speaker list
+        Returns:
+            nbest_hyps_idx (list): length `B`, each of which contains list of N hypotheses
+            aws (list): length `B`, each of which contains arrays of size `[H, L, T]`
+            scores (list):
+
+        """
+        bs = eouts.size(0)
+
+        beam_width = params['recog_beam_width']
+        assert 1 <= nbest <= beam_width
+        ctc_weight = params['recog_ctc_weight']
+        ctc_margin = params['recog_ctc_prefix_margin']
+        max_len_ratio = params['recog_max_len_ratio']
+        min_len_ratio = params['recog_min_len_ratio']
+        lp_weight = params['recog_length_penalty']
+        length_norm = params['recog_length_norm']
+        lm_weight = params['recog_lm_weight']
+        lm_weight_second = params['recog_lm_second_weight']
+        lm_weight_bwd = params['recog_lm_bwd_weight']
+        eos_threshold = params['recog_eos_threshold']
+        softmax_smoothing = params['recog_softmax_smoothing']
+
+        if lm is not None:
+            assert lm_weight > 0
+            lm.eval()
+        if lm_second is not None:
+            assert lm_weight_second > 0
+            lm_second.eval()
+        if lm_bwd is not None:
+            assert lm_weight_bwd > 0
+            lm_bwd.eval()
+
+        # Expand encoder outputs for all hypotheses
+        elens = torch.as_tensor(elens, dtype=torch.int64).cpu()
+        n_hyps = bs * beam_width
+        hyp2utt = torch.arange(bs).unsqueeze(1).repeat([1, beam_width]).view(-1)  # `[B * beam_width]`
+        eouts = eouts[:, :elens.max()]
+        eouts_hyp = eouts[hyp2utt.to(eouts.device)]  # `[B * beam_width, T, d_model]`
+        src_mask = make_pad_mask(elens[hyp2utt].int(), self.device_id).unsqueeze(1)  # `[B * beam_width, 1, T]`
+        ymax = [int(math.floor(elens[b].item() * max_len_ratio)) + 1 for b in range(bs)]
+        min_ylens = (elens[hyp2utt].float() * min_len_ratio).to(eouts.device)
+        hyp2utt = hyp2utt.to(eouts.device)
+
+        # For joint CTC-Attention decoding
+        ctc_prefix_scorer = None
+        if ctc_log_probs is not None:
+            assert ctc_weight > 0
+            ctc_prefix_scorer = CTCPrefixScoreTH(ctc_log_probs, elens, self.blank, self.eos, self.bwd,
+                                                 margin=ctc_margin)
+            ctc_states = ctc_prefix_scorer.initial_state()[hyp2utt]  # `[B * beam_width, T, 2]`
+
+        # Preallocate key/value caches of the self-attention in all layers
+        kv_caches = [(eouts.new_zeros(n_hyps, max(ymax), self.d_model),
+                      eouts.new_zeros(n_hyps, max(ymax), self.d_model)) for _ in range(self.n_layers)]
+        for layer in self.layers:
+            layer.src_attn.reset()
+
+        # Initialization
+        ys = eouts.new_zeros(n_hyps, max(ymax) + 1).fill_(self.eos).long()  # prefixes including <sos>
+        lmstate = None
+        score = eouts.new_zeros(n_hyps)
+        score_attn = eouts.new_zeros(n_hyps)
+        score_lm = eouts.new_zeros(n_hyps)
+        score_ctc = eouts.new_zeros(n_hyps)
+        # only the first hypothesis of each utterance is alive at the beginning
+        alive = torch.zeros(n_hyps, dtype=torch.bool, device=eouts.device)
+        alive[::beam_width] = True
+        # attention weights and back pointers at each step
+        xy_aws_history, src_history = [], []
+
+        def get_hyp(i, t):
+            """Convert the i-th hypothesis in the batch at the t-th step to a dict."""
+            elen = elens[i // beam_width].item()
+            aws_i = []
+            j = i
+            for s in range(t, -1, -1):
+                j = src_history[s][j]
+                aws_i.insert(0, xy_aws_history[s][j:j + 1, :, :, :, :elen])
+            return {'hyp': ys[i, :t + 2].tolist(),
+                    'ys': ys[i:i + 1, :t + 2],
+                    'score': score[i].item(),
+                    'score_attn': score_attn[i].item(),
+                    'score_ctc': score_ctc[i].item(),
+                    'score_lm': score_lm[i].item(),
+                    'aws': [None] + aws_i,
+                    'lmstate': {'hxs': lmstate['hxs'][:, i:i + 1],
+                                'cxs': lmstate['cxs'][:, i:i + 1]} if lmstate is not None else None,
+                    'streamable': True,
+                    'streaming_failed_point': 1000,
+                    'quantity_rate': 1.}
+
+        end_hyps = [[] for _ in range(bs)]
+        hyps = [[] for _ in range(bs)]
+        is_finished = [False] * bs
+        for t in range(max(ymax)):
+            y = ys[:, t:t + 1]
+
+            # Update LM states for shallow fusion
+            scores_lm = None
+            if lm is not None:
+                _, lmstate, scores_lm = lm.predict(y.clone(), lmstate)
+
+            # Feed only the last token with the caches
+            out = self.pos_enc(self.embed(y), offset=t)  # scaled
+            xy_aws_all_layers = []
+            for lth, layer in enumerate(self.layers):
+                out = layer.forward_step(out, kv_caches[lth], t, eouts_hyp, src_mask)
+                xy_aws_all_layers.append(layer.xy_aws)
+            logits = self.output(self.norm_out(out))
+            scores_attn = torch.log(torch.softmax(logits[:, -1] * softmax_smoothing, dim=1))
+            xy_aws_history.append(torch.stack(xy_aws_all_layers, dim=1))  # `[B * beam_width, n_layers, H, 1, T]`
+
+            # Attention scores
+            total_scores_attn = score_attn.unsqueeze(1) + scores_attn  # `[B * beam_width, vocab]`
+            total_scores = total_scores_attn * (1 - ctc_weight)
+
+            # Add LM score <before> top-K selection
+            if lm is not None:
+                total_scores_lm = score_lm.unsqueeze(1) + scores_lm[:, -1]
+                total_scores += total_scores_lm * lm_weight
+            else:
+                total_scores_lm = torch.zeros_like(total_scores_attn)
+
+            total_scores_topk, topk_ids = torch.topk(
+                total_scores, k=beam_width, dim=1, largest=True, sorted=True)
+
+            # Add length penalty
+            if lp_weight > 0:
+                total_scores_topk += (t + 1) * lp_weight
+
+            # Add CTC score
+            if ctc_prefix_scorer is not None:
+                total_scores_ctc, new_ctc_states = ctc_prefix_scorer.score(
+                    ys[:, t], ys.new_full((n_hyps,), t), topk_ids, ctc_states, hyp2utt)
+                total_scores_topk += total_scores_ctc * ctc_weight
+            else:
+                total_scores_ctc = torch.zeros_like(total_scores_topk)
+
+            if length_norm:
+                total_scores_topk /= t + 1
+
+            # Exclude short hypotheses and <eos> below the threshold
+            scores_attn_no_eos = torch.cat([scores_attn[:, :self.eos], scores_attn[:, self.eos + 1:]], dim=1)
+            eos_ok = (t >= min_ylens) & (scores_attn[:, self.eos] > eos_threshold * scores_attn_no_eos.max(1)[0])
+            is_excluded = (topk_ids == self.eos) & ~eos_ok.unsqueeze(1)
+            # NOTE: keep <eos> if there are no other candidates in the utterance
+            no_cands = ((~is_excluded & alive.unsqueeze(1)).view(bs, -1).sum(1) == 0)[hyp2utt]
+            is_excluded &= ~no_cands.unsqueeze(1)
+            total_scores_topk = total_scores_topk.masked_fill(is_excluded | ~alive.unsqueeze(1), float('-inf'))
+
+            # Local pruning over candidates of all hypotheses in each utterance
+            score, cand_ids = torch.topk(total_scores_topk.view(bs, -1), k=beam_width, dim=1,
+                                         largest=True, sorted=True)
+            score = score.view(-1)
+            src = (hyp2utt * beam_width + cand_ids.view(-1) // beam_width)  # `[B * beam_width]`
+            k_ids = cand_ids.view(-1) % beam_width
+            idx = topk_ids[src, k_ids]
+
+            # Reorder hypotheses and the filled part of caches (prefixes up to the t-th step)
+            ys[:, :t + 1] = ys[src, :t + 1]
+            ys[:, t + 1] = idx
+            for kv_cache in kv_caches:
+                for cache in kv_cache:
+                    cache[:, :t + 1] = cache[src, :t + 1]
+            score_attn = total_scores_attn[src, idx]
+            score_lm = total_scores_lm[src, idx]
+            score_ctc = total_scores_ctc[src, k_ids]
+            if lmstate is not None:
+                lmstate = {k: s[:, src] if s is not None else None for k, s in lmstate.items()}
+            if ctc_prefix_scorer is not None:
+                ctc_states = new_ctc_states[src, k_ids]
+            src_history.append(src.tolist())
+            is_valid = score > float('-inf')
+            is_end = is_valid & (idx == self.eos)
+            alive = is_valid & ~is_end
+
+            # Remove complete hypotheses
+            is_end = is_end.tolist()
+            for b in range(bs):
+                if is_finished[b]:
+                    continue
+                end_hyps[b] += [get_hyp(i, t) for i in range(b * beam_width, (b + 1) * beam_width) if is_end[i]]
+                if len(end_hyps[b]) >= beam_width:
+                    end_hyps[b] = end_hyps[b][:beam_width]
+                    is_finished[b] = True
+                elif t == ymax[b] - 1:
+                    hyps[b] = [get_hyp(i, t) for i in range(b * beam_width, (b + 1) * beam_width)
+                               if alive[i].item()]
+                    is_finished[b] = True
+                if is_finished[b]:
+                    alive[b * beam_width:(b + 1) * beam_width] = False
+            if all(is_finished):
+                break
+
+        # Free cached projections of the encoder outputs
+        for layer in self.layers:
+            layer.src_attn.reset()
+
+        nbest_hyps_idx, aws, scores = [], [], []
+        eos_flags = []
+        for b in range(bs):
+            # Global pruning
+            if len(end_hyps[b]) == 0:
+                end_hyps[b] = hyps[b][:]
+            elif len(end_hyps[b]) < nbest and nbest > 1:
+                end_hyps[b].extend(hyps[b][:nbest - len(end_hyps[b])])
+
+        # forward second path LM rescoring of all utterances at once
+        if lm_second is not None:
+            self.lm_rescoring(sum(end_hyps, []), lm_second, lm_weight_second, tag='second')
+
+        # backward secodn path LM rescoring
+        if lm_bwd is not None and lm_weight_bwd > 0:
+            self.lm_rescoring(sum(end_hyps, []), lm_bwd, lm_weight_bwd, reverse=True, tag='second_bwd')
+
+        for b in range(bs):
+            # Sort by score
+            end_hyps[b] = sorted(end_hyps[b], key=lambda x: x['score'], reverse=True)
+
+            for j in range(len(end_hyps[b][0]['aws'][1:])):
+                tmp = end_hyps[b][0]['aws'][j + 1]
+                end_hyps[b][0]['aws'][j + 1] = tmp.view(1, -1, tmp.size(-2), tmp.size(-1))
+
+            # metrics for streaming infernece
+            self.streamable = end_hyps[b][0]['streamable']
+            self.quantity_rate = end_hyps[b][0]['quantity_rate']
+            self.last_success_frame_ratio = None
+
+            if idx2token is not None:
+                if utt_ids is not None:
+                    logger.info('Utt-id: %s' % utt_ids[b])
+                assert self.vocab == idx2token.vocab
+                logger.info('=' * 200)
+                for k in range(len(end_hyps[b])):
+                    if refs_id is not None:
+                        logger.info('Ref: %s' % idx2token(refs_id[b]))
+                    logger.info('Hyp: %s' % idx2token(
+                        end_hyps[b][k]['hyp'][1:][::-1] if self.bwd else end_hyps[b][k]['hyp'][1:]))
+                    logger.info('num tokens (hyp): %d' % len(end_hyps[b][k]['hyp'][1:]))
+                    logger.info('log prob (hyp): %.7f' % end_hyps[b][k]['score'])
+                    logger.info('log prob (hyp, att): %.7f' % (end_hyps[b][k]['score_attn'] * (1 - ctc_weight)))
+                    if ctc_prefix_scorer is not None:
+                        logger.info('log prob (hyp, ctc): %.7f' % (end_hyps[b][k]['score_ctc'] * ctc_weight))
+                    if lm is not None:
+                        logger.info('log prob (hyp, first-path lm): %.7f' % (end_hyps[b][k]['score_lm'] * lm_weight))
+                    if lm_second is not None:
+                        logger.info('log prob (hyp, second-path lm): %.7f' %
+                                    (end_hyps[b][k]['score_lm_second'] * lm_weight_second))
+                    if lm_bwd is not None:
+                        logger.info('log prob (hyp, second-path lm-bwd): %.7f' %
+                                    (end_hyps[b][k]['score_lm_second_bwd'] * lm_weight_bwd))
+                    logger.info('-' * 50)
+
+            # N-best list
+            if self.bwd:
+                # Reverse the order
+                nbest_hyps_idx += [[np.array(end_hyps[b][n]['hyp'][1:][::-1]) for n in range(nbest)]]
+                aws += [tensor2np(torch.cat(end_hyps[b][0]['aws'][1:][::-1], dim=2).squeeze(0))]
+            else:
+                nbest_hyps_idx += [[np.array(end_hyps[b][n]['hyp'][1:]) for n in range(nbest)]]
+                aws += [tensor2np(torch.cat(end_hyps[b][0]['aws'][1:], dim=2).squeeze(0))]
+            scores += [[end_hyps[b][n]['score_attn'] for n in range(nbest)]]
+
+            # Check <eos>
+            eos_flags.append([(end_hyps[b][n]['hyp'][-1] == self.eos) for n in range(nbest)])
+
+        # Exclude <eos> (<sos> in case of the backward decoder)
+        if exclude_eos:
+            if self.bwd:
+                nbest_hyps_idx = [[nbest_hyps_idx[b][n][1:] if eos_flags[b][n]
+                                   else nbest_hyps_idx[b][n] for n in range(nbest)] for b in range(bs)]
+            else:
+                nbest_hyps_idx = [[nbest_hyps_idx[b][n][:-1] if eos_flags[b][n]
+                                   else nbest_hyps_idx[b][n] for n in range(nbest)] for b in range(bs)]
+
+        # Store ASR/LM state
+        self.lmstate_final = end_hyps[-1][0]['lmstate']
+
+        return nbest_hyps_idx, aws, scores
+
+    def beam_search_chunk_sync(self, eouts_c, params, idx2token=None,
+                               lm=None, ctc_log_probs=None,
+                               hyps=None, state_carry_over=False, ignore_eos=False):
+        """Chunk-synchronous beam search decoding with MMA.
+
+        Hypotheses are expanded as long as the monotonic attention finds token
+        boundaries in the encoder outputs received so far. A hypothesis without any
+        boundary waits for the next chunk together with its self-attention cache.
+
+        Args:
+            eouts_c (FloatTensor): encoder outputs of the current chunk `[1, T_chunk, d_model]`
+            params (dict): hyperparameters for decoding
+            idx2token (): converter from index to token
+            lm: firsh path LM
+            ctc_log_probs (FloatTensor): `[1, T_chunk, vocab]`
+            hyps (list): active hypotheses after the previous chunk.
+                A new segment is started if None.
+            state_carry_over (bool): carry over LM states from the previous segment
+            ignore_eos (bool): regard <eos> as no boundary
+        Returns:
+            end_hyps (list): hypotheses ended in the current chunk
+            hyps (list): active hypotheses
+            aws: None
+
+        """
+        assert eouts_c.size(0) == 1
+        assert 'mocha' in self.attn_type
+        assert not self.memory_transformer
+
+        beam_width = params['recog_beam_width']
+        ctc_weight = params['recog_ctc_weight']
+        ctc_margin = params['recog_ctc_prefix_margin']
+        ctc_horizon = params['recog_ctc_prefix_horizon']
+        max_len_ratio = params['recog_max_len_ratio']
+        lp_weight = params['recog_length_penalty']
+        length_norm = params['recog_length_norm']
+        lm_weight = params['recog_lm_weight']
+        eos_threshold = params['recog_eos_threshold']
+        softmax_smoothing = params['recog_softmax_smoothing']
+        eps_wait = params['recog_mma_delay_threshold']
+
+        if lm is not None:
+            assert lm_weight > 0
+            lm.eval()
+
+        if hyps is None:
+            # first chunk in the segment
+            self.eout_buffer = EncoderOutputBuffer()
+            self.ctc_prefix_scorer = None
+            self.n_frames = 0
+        self.eout_buffer.append(eouts_c)
+        eouts = self.eout_buffer.view()
+        xmax = eouts.size(1)
+
+        # For joint CTC-Attention decoding
+        if ctc_log_probs is not None:
+            assert ctc_weight > 0
+            ctc_log_probs = tensor2np(ctc_log_probs)
+            if self.ctc_prefix_scorer is None:
+                self.ctc_prefix_scorer = CTCPrefixScoreStreaming(self.blank, self.eos, margin=ctc_margin,
+                                                                 horizon=ctc_horizon)
+            self.ctc_prefix_scorer.register_new_chunk(ctc_log_probs[0])
+
+        if hyps is None:
+            lmstate = None
+            if state_carry_over and isinstance(lm, RNNLM):
+                lmstate = self.lmstate_final
+            hyps = [{'hyp': [self.eos],
+                     'cache': None,
+                     'score': 0.,
+                     'score_attn': 0.,
+                     'score_ctc': 0.,
+                     'score_lm': 0.,
+                     'aw_prev': None,
+                     'lmstate': lmstate,
+                     'ctc_state': self.ctc_prefix_scorer.initial_state() if self.ctc_prefix_scorer is not None else None,
+                     'no_boundary': False,
+                     'streamable': True,
+                     'streaming_failed_point': 1000}]
+        else:
+            for beam in hyps:
+                beam['no_boundary'] = False
+                # extend the previous attention weights to the new frames
+                if beam['aw_prev'] is not None:
+                    aw_prev = beam['aw_prev']
+                    beam['aw_prev'] = torch.cat(
+                        [aw_prev, aw_prev.new_zeros(aw_prev.size()[:-1] + (xmax - aw_prev.size(-1),))], dim=-1)
+            if ctc_log_probs is not None:
+                # extend CTC states of all hypotheses to the new chunk at once
+                ctc_states = self.ctc_prefix_scorer.extend_states(np.stack([beam['ctc_state'] for beam in hyps]))
+                for beam, ctc_state in zip(hyps, ctc_states):
+                    beam['ctc_state'] = ctc_state
+
+        helper = BeamSearch(beam_width, self.eos, ctc_weight, self.device_id)
+        lth_s = self.mocha_first_layer - 1
+
+        end_hyps = []
+        hyps_nobd = []
+        ymax = int(math.floor(eouts_c.size(1) * max_len_ratio)) + 1
+        for t in range(ymax):
+            # hypotheses with no decision boundary in this chunk wait for the next chunk
+            new_hyps = [beam for beam in hyps if beam['no_boundary']]
+            if len(new_hyps) == len(hyps):
+                break
+            hyps = [beam for beam in hyps if not beam['no_boundary']]
+
+            # batchfy hypotheses of the same length
+            for ylen in sorted(set([len(beam['hyp']) for beam in hyps])):
+                group = [beam for beam in hyps if len(beam['hyp']) == ylen]
+                n_hyps = len(group)
+                ys = eouts.new_tensor([beam['hyp'] for beam in group], dtype=torch.long)
+                cache = [None] * self.n_layers
+                xy_aws_prev = None
+                if ylen > 1:
+                    for lth in range(self.n_layers):
+                        cache[lth] = torch.cat([beam['cache'][lth] for beam in group], dim=0)
+                    xy_aws_prev = torch.cat([beam['aw_prev'] for beam in group], dim=0)  # `[B, n_layers, H_ma, 1, T]`
+
+                # Update LM states for shallow fusion
+                lmstate, scores_lm = None, None
+                if lm is not None:
+                    if group[0]['lmstate'] is not None:
+                        lm_hxs = torch.cat([beam['lmstate']['hxs'] for beam in group], dim=1)
+                        lm_cxs = torch.cat([beam['lmstate']['cxs'] for beam in group], dim=1)
+                        lmstate = {'hxs': lm_hxs, 'cxs': lm_cxs}
+                    y = ys[:, -1:].clone()  # NOTE: this is important
+                    _, lmstate, scores_lm = lm.predict(y, lmstate)
+
+                causal_mask = eouts.new_ones(ylen, ylen).byte()
+                causal_mask = torch.tril(causal_mask, out=causal_mask).unsqueeze(0)
+
+                out = self.pos_enc(self.embed(ys))  # scaled
+                eouts_rep = eouts.expand(n_hyps, -1, -1)
+                new_cache = [None] * self.n_layers
+                xy_aws_all_layers = []
+                for lth, layer in enumerate(self.layers):
+                    out = layer(out, causal_mask, eouts_rep, None,
+                                cache=cache[lth],
+                                xy_aws_prev=xy_aws_prev[:, lth - lth_s] if lth >= lth_s and ylen > 1 else None,
+                                eps_wait=eps_wait)
+                    new_cache[lth] = out
+                    if layer.xy_aws is not None:
+                        xy_aws_all_layers.append(layer.xy_aws)
+                logits = self.output(self.norm_out(out))
+                scores_attn = torch.log(torch.softmax(logits[:, -1] * softmax_smoothing, dim=1))
+                xy_aws_all_layers = torch.stack(xy_aws_all_layers, dim=1)  # `[B, n_layers, H_ma, 1, T]`
+
+                # token boundaries found in each head
+                is_boundary = xy_aws_all_layers.sum(-1).squeeze(-1) > 0  # `[B, n_layers, H_ma]`
+                no_boundary_all = (~is_boundary.view(n_hyps, -1).any(1)).tolist()
+                streamable_all = is_boundary.view(n_hyps, -1).all(1).tolist()
+
+                # Attention scores of all hypotheses
+                total_scores_attn_all = scores_attn.new_tensor(
+                    [beam['score_attn'] for beam in group]).unsqueeze(1) + scores_attn
+                total_scores_all = total_scores_attn_all * (1 - ctc_weight)
+
+                # Add LM score <before> top-K selection
+                if lm is not None:
+                    total_scores_lm_all = scores_lm.new_tensor(
+                        [beam['score_lm'] for beam in group]).unsqueeze(1) + scores_lm[:, -1]
+                    total_scores_all += total_scores_lm_all * lm_weight
+                else:
+                    total_scores_lm_all = eouts.new_zeros(n_hyps, self.vocab)
+
+                total_scores_topk_all, topk_ids_all = torch.topk(
+                    total_scores_all, k=beam_width, dim=1, largest=True, sorted=True)
+
+                for j, beam in enumerate(group):
+                    no_boundary = no_boundary_all[j]
+                    if no_boundary:
+                        # NOTE: the case where the first token in the current chunk is <eos>
+                        new_hyps.append(dict(beam, no_boundary=True))
+
+                    total_scores_topk = total_scores_topk_all[j:j + 1]
+                    topk_ids = topk_ids_all[j:j + 1]
+
+                    # Add length penalty
+                    if lp_weight > 0:
+                        total_scores_topk = total_scores_topk + (ylen * lp_weight)
+
+                    # Add CTC score
+                    new_ctc_states, total_scores_ctc, total_scores_topk = helper.add_ctc_score(
+                        beam['hyp'], topk_ids, beam['ctc_state'],
+                        total_scores_topk, self.ctc_prefix_scorer)
+
+                    if length_norm:
+                        total_scores_topk = total_scores_topk / ylen
+
+                    streaming_failed_point = beam['streaming_failed_point']
+                    if beam['streamable'] and not streamable_all[j]:
+                        streaming_failed_point = ylen - 1
+
+                    for k in range(beam_width):
+                        idx = topk_ids[0, k].item()
+                        if no_boundary and idx != self.eos:
+                            continue
+
+                        if idx == self.eos:
+                            if ignore_eos:
+                                # NOTE: for unidirectional encoder
+                                if not no_boundary:
+                                    new_hyps.append(dict(beam, no_boundary=True))
+                                continue
+
+                            # EOS threshold
+                            max_score_no_eos = scores_attn[j, :idx].max(0)[0].item()
+                            max_score_no_eos = max(max_score_no_eos, scores_attn[j, idx + 1:].max(0)[0].item())
+                            if scores_attn[j, idx].item() <= eos_threshold * max_score_no_eos:
+                                continue
+
+                        new_hyps.append(
+                            {'hyp': beam['hyp'] + [idx],
+                             'cache': [new_cache_l[j:j + 1] for new_cache_l in new_cache],
+                             'score': total_scores_topk[0, k].item(),
+                             'score_attn': total_scores_attn_all[j, idx].item(),
+                             'score_ctc': total_scores_ctc[k].item(),
+                             'score_lm': total_scores_lm_all[j, idx].item(),
+                             'aw_prev': xy_aws_all_layers[j:j + 1],
+                             'lmstate': {'hxs': lmstate['hxs'][:, j:j + 1],
+                                         'cxs': lmstate['cxs'][:, j:j + 1]} if lmstate is not None else None,
+                             'ctc_state': new_ctc_states[k] if self.ctc_prefix_scorer is not None else None,
+                             'no_boundary': no_boundary,
+                             'streamable': beam['streamable'] and streamable_all[j],
+                             'streaming_failed_point': streaming_failed_point})
+
+            # Local pruning
+            new_hyps_sorted = sorted(new_hyps, key=lambda x: x['score'], reverse=True)
+            hyps_nobd += [hyp for hyp in new_hyps_sorted[beam_width:] if hyp['no_boundary']]
+
+            # Remove complete hypotheses
+            new_hyps, end_hyps, is_finish = helper.remove_complete_hyp(new_hyps_sorted[:beam_width], end_hyps)
+            hyps = new_hyps[:]
+            if is_finish:
+                break
+
+        # Global pruning
+        hyps_nobd_sorted = sorted(hyps_nobd, key=lambda x: x['score'], reverse=True)
+        hyps = (hyps[:] + hyps_nobd_sorted)[:beam_width]
+
+        # Discard frames that are never attended by active hypotheses again
+        self._evict_frames(hyps, end_hyps)
+
+        # Sort by score
+        if len(end_hyps) > 0:
+            end_hyps = sorted(end_hyps, key=lambda x: x['score'], reverse=True)
+
+        if idx2token is not None:
+            merged_hyps = sorted(end_hyps + hyps, key=lambda x: x['score'], reverse=True)[:beam_width]
+            logger.info('=' * 200)
+            for k in range(len(merged_hyps)):
+                logger.info('Hyp: %s' % idx2token(merged_hyps[k]['hyp'][1:]))
+                logger.info('log prob (hyp): %.7f' % merged_hyps[k]['score'])
+                logger.info('log prob (hyp, att): %.7f' % (merged_hyps[k]['score_attn'] * (1 - ctc_weight)))
+                if self.ctc_prefix_scorer is not None:
+                    logger.info('log prob (hyp, ctc): %.7f' % (merged_hyps[k]['score_ctc'] * ctc_weight))
+                if lm is not None:
+                    logger.info('log prob (hyp, first-path lm): %.7f' % (merged_hyps[k]['score_lm'] * lm_weight))
+                logger.info('streamable: %s' % merged_hyps[k]['streamable'])
+                logger.info('-' * 50)
+
+        # Store LM state
+        if len(end_hyps) > 0:
+            self.lmstate_final = end_hyps[0]['lmstate']
+
+        self.n_frames += eouts_c.size(1)
+
+        return end_hyps, hyps, None
+
+    def _evict_frames(self, hyps, end_hyps):
+        """Discard encoder outputs before the leftmost token boundary over active hypotheses.
+
+        In hard monotonic attention, frames before the last boundary of each head
+        are never attended again except for the window of chunkwise attention and
+        the receptive field of the causal convolution for monotonic energy.
+        Attention weights and CTC states of hypotheses are truncated accordingly.
+
+        Args:
+            hyps (list): active hypotheses
+            end_hyps (list): hypotheses ended in the current chunk
+
+        """
+        mocha = self.layers[-1].src_attn
+        if mocha.milk or len(hyps) == 0 or any(beam['aw_prev'] is None for beam in hyps):
+            return
+        aws = torch.cat([beam['aw_prev'] for beam in hyps], dim=0)
+        aws = aws.view(-1, aws.size(-1))  # `[B * n_layers * H_ma, T]`
+        is_boundary = aws.sum(-1) > 0
+        if not is_boundary.any():
+            return
+        # NOTE: heads without any boundary never attend again
+        boundary_leftmost = aws[is_boundary].argmax(-1).min().item()
+        conv1d = mocha.monotonic_energy.conv1d
+        n_frames = boundary_leftmost - max(mocha.w - 1, 0 if conv1d is None else conv1d.padding)
+        if n_frames <= 0:
+            return
+
+        self.eout_buffer.evict(n_frames)
+        xlen = len(self.eout_buffer)
+        for beam in hyps + end_hyps:
+            if beam['aw_prev'] is not None:
+                beam['aw_prev'] = beam['aw_prev'][..., -xlen:]
+
+        if self.ctc_prefix_scorer is not None:
+            ctc_xlen = self.ctc_prefix_scorer.end - self.ctc_prefix_scorer.start
+            if ctc_xlen > xlen:
+                self.ctc_prefix_scorer.evict(ctc_xlen - xlen)
+                for beam in hyps + end_hyps:
+                    beam['ctc_state'] = beam['ctc_state'][-xlen:]
@@ -20,6 +20,7 @@ from neural_sp.models.modules.relative_multihead_attention import RelativeMultih
 from neural_sp.models.seq2seq.encoders.conv import ConvEncoder
 from neural_sp.models.seq2seq.encoders.encoder_base import EncoderBase
 from neural_sp.models.seq2seq.encoders.utils import chunkwise
+from neural_sp.models.torch_utils import is_attention_captured
 from neural_sp.models.torch_utils import make_pad_mask
 from neural_sp.models.torch_utils import tensor2np
 
@@ -185,6 +186,10 @@ class ConformerEncoder(EncoderBase):
 
         self.reset_parameters(param_init)
 
+        # for streaming inference
+        self.cache_left_context = False
+        self.reset_cache()
+
     @staticmethod
     def add_args(parser, args):
         """Add arguments."""
@@ -245,6 +250,10 @@ class ConformerEncoder(EncoderBase):
                 nn.init.xavier_uniform_(self.bridge_sub2.weight)
                 nn.init.constant_(self.bridge_sub2.bias, 0.)
 
+    def reset_cache(self):
+        self.cache = [None] * self.n_layers
+        logger.debug('Reset cache.')
+
     def forward(self, xs, xlens, task, use_cache=False, streaming=False):
         """Forward computation.
 
@@ -252,7 +261,7 @@ class ConformerEncoder(EncoderBase):
             xs (FloatTensor): `[B, T, input_dim]`
             xlens (list): `[B]`
             task (str): not supported now
-            use_cache (bool):
+            use_cache (bool): use the cached left context in the previous chunk
             streaming (bool): streaming encoding
         Returns:
             eouts (dict):
@@ -264,20 +273,32 @@ class ConformerEncoder(EncoderBase):
                  'ys_sub1': {'xs': None, 'xlens': None},
                  'ys_sub2': {'xs': None, 'xlens': None}}
 
+        if self.latency_controlled and streaming:
+            if not use_cache or not self.cache_left_context:
+                self.reset_cache()
+            eouts['ys']['xs'], eouts['ys']['xlens'] = self._forward_streaming(xs)
+            return eouts
+
         N_l = self.chunk_size_left
         N_c = self.chunk_size_current
         N_r = self.chunk_size_right
 
         bs, xmax, idim = xs.size()
 
-        if self.latency_controlled:
-            xs = chunkwise(xs, N_l, N_c, N_r)
-
-        if self.conv is None:
-            xs = self.embed(xs)
+        if self.latency_controlled and self.conv is None:
+            # NOTE: the frame-wise embedding is applied before chunking so that each
+            # frame is projected once and the chunked input frames are not kept for backward.
+            # Frames beyond the input are filled with the embedding of zeros (bias).
+            xs = chunkwise(self.embed(xs), N_l, N_c, N_r, pad_value=self.embed.bias)
         else:
-            # Path through CNN blocks
-            xs, xlens = self.conv(xs, xlens)
+            if self.latency_controlled:
+                xs = chunkwise(xs, N_l, N_c, N_r)
+
+            if self.conv is None:
+                xs = self.embed(xs)
+            else:
+                # Path through CNN blocks
+                xs, xlens = self.conv(xs, xlens)
 
         if not self.training:
             self.data_dict['elens'] = tensor2np(xlens)
@@ -297,7 +318,7 @@ class ConformerEncoder(EncoderBase):
             xx_mask = None  # NOTE: no mask
             for lth, layer in enumerate(self.layers):
                 xs = layer(xs, xx_mask, pos_embs=pos_embs)
-                if not self.training:
+                if not self.training and is_attention_captured():
                     n_heads = layer.xx_aws.size(1)
                     xx_aws = layer.xx_aws[:, :, _N_l:_N_l + _N_c, _N_l:_N_l + _N_c]
                     xx_aws = xx_aws.view(bs, n_chunks, n_heads, _N_c, _N_c)
@@ -319,14 +340,14 @@ class ConformerEncoder(EncoderBase):
             xs = xs * self.scale
 
             # Create the self-attention mask
-            xx_mask = make_pad_mask(xlens, self.device_id).unsqueeze(2).repeat([1, 1, xmax])
+            xx_mask = make_pad_mask(xlens, self.device_id).unsqueeze(2)  # `[B, T, 1]`
 
             pos_idxs = torch.arange(xmax - 1, -1, -1.0, dtype=torch.float)
             pos_embs = self.pos_emb(pos_idxs, self.device_id)
 
             for lth, layer in enumerate(self.layers):
                 xs = layer(xs, xx_mask, pos_embs=pos_embs)
-                if not self.training:
+                if not self.training and is_attention_captured():
                     self.aws_dict['xx_aws_layer%d' % lth] = tensor2np(layer.xx_aws)
 
                 # Pick up outputs in the sub task before the projection layer
@@ -363,6 +384,73 @@ class ConformerEncoder(EncoderBase):
             eouts['ys_sub2']['xs'], eouts['ys_sub2']['xlens'] = xs_sub2, xlens
         return eouts
 
+    def _forward_streaming(self, xs):
+        """Streaming encoding of a single chunk.
+
+        By default, the left context is fed with each chunk and re-encoded,
+        which is identical to chunkwise training.
+        If `cache_left_context` is True, self-attention inputs of the last `N_l`
+        frames and inputs of the depthwise convolution in the center regions are
+        cached per layer instead of re-encoding the left context, so that each
+        chunk computes only its own `N_c + N_r` frames.
+        NOTE: the cache is an approximation when n_layers > 1. The cached left
+        context at each layer is the output of the previous chunk, where it was
+        the center region, while it is re-encoded with its own left context
+        and without the right context in chunkwise training.
+
+        Args:
+            xs (FloatTensor): `[B, T, input_dim]`, where `T <= N_l + N_c + N_r`
+                (`T <= N_c + N_r` if the left context is cached)
+        Returns:
+            xs (FloatTensor): `[B, T_c, d_model]`, where `T_c <= N_c // subsampling_factor`
+            xlens (IntTensor): `[B]`
+
+        """
+        N_c = self.chunk_size_current
+        N_r = self.chunk_size_right
+        _N_l = max(0, self.chunk_size_left // self.subsampling_factor)
+        _N_c = N_c // self.subsampling_factor
+
+        N_l = 0 if self.cache_left_context else self.chunk_size_left
+
+        bs, xmax, idim = xs.size()
+        emax = min(_N_c, math.ceil((xmax - N_l) / self.subsampling_factor))
+
+        # Pad the last chunk as in chunkwise training
+        if xmax < N_l + N_c + N_r:
+            xs = torch.cat([xs, xs.new_zeros(bs, N_l + N_c + N_r - xmax, idim)], dim=1)
+        xlens = torch.IntTensor(bs).fill_(xs.size(1))
+
+        if self.conv is None:
+            xs = self.embed(xs)
+        else:
+            # Path through CNN blocks
+            xs, xlens = self.conv(xs, xlens)
+
+        mlen = self.cache[0][0].size(1) if self.cache[0] is not None else 0
+        xs = xs * self.scale
+        pos_idxs = torch.arange(mlen + xs.size(1) - 1, -1, -1.0, dtype=torch.float)
+        pos_embs = self.pos_emb(pos_idxs, self.device_id)
+
+        for lth, layer in enumerate(self.layers):
+            if self.cache_left_context:
+                xs, self.cache[lth] = layer.forward_chunk(xs, self.cache[lth], _N_c, _N_l,
+                                                          pos_embs=pos_embs)
+            else:
+                xs = layer(xs, None, pos_embs=pos_embs)
+
+        # Extract the center region
+        n_left = N_l // self.subsampling_factor  # left context in the input
+        xs = xs[:, n_left:n_left + emax]
+
+        xs = self.norm_out(xs)
+
+        # Bridge layer
+        if self.bridge is not None:
+            xs = self.bridge(xs)
+
+        return xs, torch.IntTensor(bs).fill_(emax)
+
 
 class ConformerEncoderBlock(nn.Module):
     """A single layer of the Conformer encoder.
@@ -463,7 +551,8 @@ class ConformerEncoderBlock(nn.Module):
         xs = self.norm3(xs)
         # relative positional encoding
         memory = None
-        xs, self._xx_aws = self.self_attn(xs, xs, memory, pos_embs, xx_mask, u, v)
+        xs, self._xx_aws = self.self_attn(xs, xs, memory, pos_embs, xx_mask, u, v,
+                                          need_weights=not self.training and is_attention_captured())
         xs = self.dropout(xs) + residual
 
         # second half FFN
@@ -473,3 +562,52 @@ class ConformerEncoderBlock(nn.Module):
         xs = self.fc_factor * self.dropout(xs) + residual  # Macaron FFN
 
         return xs
+
+    def forward_chunk(self, xs, cache, n_center, mem_len, pos_embs=None, u=None, v=None):
+        """Streaming forward pass over a chunk with the cached left context.
+
+        Args:
+            xs (FloatTensor): `[B, T, d_model]`
+            cache (tuple): self-attention inputs of the left context `[B, mlen, d_model]`
+                and cache of the convolution module `[B, d_model, kernel_size // 2]`
+            n_center (int): number of frames in the center region
+            mem_len (int): maximum number of frames for the left context
+            pos_embs (LongTensor): `[mlen + T, 1, d_model]`
+            u (FloatTensor): global parameter for relative positinal embedding
+            v (FloatTensor): global parameter for relative positinal embedding
+        Returns:
+            xs (FloatTensor): `[B, T, d_model]`
+            cache (tuple): updated cache for the next chunk
+
+        """
+        self.reset_visualization()
+        memory, conv_cache = cache if cache is not None else (None, None)
+
+        # first half FFN
+        residual = xs
+        xs = self.norm1(xs)
+        xs = self.feed_forward1(xs)
+        xs = self.fc_factor * self.dropout(xs) + residual  # Macaron FFN
+
+        # conv
+        residual = xs
+        xs = self.norm2(xs)
+        xs, conv_cache = self.conv.forward_chunk(xs, conv_cache, n_center)
+        xs = self.dropout(xs) + residual
+
+        # self-attention over the cached left context
+        residual = xs
+        xs = self.norm3(xs)
+        memory_next = xs[:, :n_center] if memory is None else torch.cat([memory, xs[:, :n_center]], dim=1)
+        memory_next = memory_next[:, max(0, memory_next.size(1) - mem_len):]
+        xs, self._xx_aws = self.self_attn(xs, xs, memory, pos_embs, None, u, v,
+                                          need_weights=not self.training and is_attention_captured())
+        xs = self.dropout(xs) + residual
+
+        # second half FFN
+        residual = xs
+        xs = self.norm4(xs)
+        xs = self.feed_forward2(xs)
+        xs = self.fc_factor * self.dropout(xs) + residual  # Macaron FFN
+
+        return xs, (memory_next, conv_cache)
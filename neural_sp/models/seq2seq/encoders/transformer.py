@@ -22,6 +22,7 @@ from neural_sp.models.modules.relative_multihead_attention import RelativeMultih
 from neural_sp.models.seq2seq.encoders.conv import ConvEncoder
 from neural_sp.models.seq2seq.encoders.encoder_base import EncoderBase
 from neural_sp.models.seq2seq.encoders.utils import chunkwise
+from neural_sp.models.torch_utils import is_attention_captured
 from neural_sp.models.torch_utils import make_pad_mask
 from neural_sp.models.torch_utils import tensor2np
 
@@ -198,6 +199,10 @@ class TransformerEncoder(EncoderBase):
 
         self.reset_parameters(param_init)
 
+        # for streaming inference
+        self.cache_left_context = False
+        self.reset_cache()
+
     @staticmethod
     def add_args(parser, args):
         """Add arguments."""
@@ -264,6 +269,10 @@ class TransformerEncoder(EncoderBase):
                 nn.init.xavier_uniform_(self.bridge_sub2.weight)
                 nn.init.constant_(self.bridge_sub2.bias, 0.)
 
+    def reset_cache(self):
+        self.cache = [None] * self.n_layers
+        logger.debug('Reset cache.')
+
     def init_memory(self):
         """Initialize memory."""
         if self.device_id >= 0:
@@ -309,7 +318,7 @@ class TransformerEncoder(EncoderBase):
             xs (FloatTensor): `[B, T, input_dim]`
             xlens (list): `[B]`
             task (str): not supported now
-            use_cache (bool):
+            use_cache (bool): use the cached left context in the previous chunk
             streaming (bool): streaming encoding
         Returns:
             eouts (dict):
@@ -321,20 +330,32 @@ class TransformerEncoder(EncoderBase):
                  'ys_sub1': {'xs': None, 'xlens': None},
                  'ys_sub2': {'xs': None, 'xlens': None}}
 
+        if self.latency_controlled and streaming:
+            if not use_cache or not self.cache_left_context:
+                self.reset_cache()
+            eouts['ys']['xs'], eouts['ys']['xlens'] = self._forward_streaming(xs)
+            return eouts
+
         N_l = self.chunk_size_left
         N_c = self.chunk_size_current
         N_r = self.chunk_size_right
 
         bs, xmax, idim = xs.size()
 
-        if self.latency_controlled:
-            xs = chunkwise(xs, N_l, N_c, N_r)
-
-        if self.conv is None:
-            xs = self.embed(xs)
+        if self.latency_controlled and self.conv is None:
+            # NOTE: the frame-wise embedding is applied before chunking so that each
+            # frame is projected once and the chunked input frames are not kept for backward.
+            # Frames beyond the input are filled with the embedding of zeros (bias).
+            xs = chunkwise(self.embed(xs), N_l, N_c, N_r, pad_value=self.embed.bias)
         else:
-            # Path through CNN blocks
-            xs, xlens = self.conv(xs, xlens)
+            if self.latency_controlled:
+                xs = chunkwise(xs, N_l, N_c, N_r)
+
+            if self.conv is None:
+                xs = self.embed(xs)
+            else:
+                # Path through CNN blocks
+                xs, xlens = self.conv(xs, xlens)
 
         if not self.training:
             self.data_dict['elens'] = tensor2np(xlens)
@@ -358,7 +379,7 @@ class TransformerEncoder(EncoderBase):
             xx_mask = None  # NOTE: no mask
             for lth, layer in enumerate(self.layers):
                 xs = layer(xs, xx_mask, pos_embs=pos_embs)
-                if not self.training:
+                if not self.training and is_attention_captured():
                     n_heads = layer.xx_aws.size(1)
                     xx_aws = layer.xx_aws[:, :, _N_l:_N_l + _N_c, _N_l:_N_l + _N_c]
                     xx_aws = xx_aws.view(bs, n_chunks, n_heads, _N_c, _N_c)
@@ -387,11 +408,11 @@ class TransformerEncoder(EncoderBase):
                 xs = self.pos_enc(xs, scale=True)
 
             # Create the self-attention mask
-            xx_mask = make_pad_mask(xlens, self.device_id).unsqueeze(1).repeat([1, xmax, 1])
+            xx_mask = make_pad_mask(xlens, self.device_id).unsqueeze(1)  # `[B, 1, T]`
 
             for lth, layer in enumerate(self.layers):
                 xs = layer(xs, xx_mask, pos_embs=pos_embs)
-                if not self.training:
+                if not self.training and is_attention_captured():
                     self.aws_dict['xx_aws_layer%d' % lth] = tensor2np(layer.xx_aws)
 
                 # Pick up outputs in the sub task before the projection layer
@@ -426,6 +447,78 @@ class TransformerEncoder(EncoderBase):
             eouts['ys_sub2']['xs'], eouts['ys_sub2']['xlens'] = xs_sub2, xlens
         return eouts
 
+    def _forward_streaming(self, xs):
+        """Streaming encoding of a single chunk.
+
+        By default, the left context is fed with each chunk and re-encoded,
+        which is identical to chunkwise training.
+        If `cache_left_context` is True, self-attention inputs of the last `N_l`
+        frames in the center regions are cached per layer and attended to as memory
+        instead of re-encoding the left context, so that each chunk computes only
+        its own `N_c + N_r` frames.
+        NOTE: the cache is an approximation when n_layers > 1. The cached left
+        context at each layer is the output of the previous chunk, where it was
+        the center region, while it is re-encoded with its own left context
+        and without the right context in chunkwise training.
+
+        Args:
+            xs (FloatTensor): `[B, T, input_dim]`, where `T <= N_l + N_c + N_r`
+                (`T <= N_c + N_r` if the left context is cached)
+        Returns:
+            xs (FloatTensor): `[B, T_c, d_model]`, where `T_c <= N_c // subsampling_factor`
+            xlens (IntTensor): `[B]`
+
+        """
+        N_c = self.chunk_size_current
+        N_r = self.chunk_size_right
+        _N_l = max(0, self.chunk_size_left // self.subsampling_factor)
+        _N_c = N_c // self.subsampling_factor
+
+        N_l = 0 if self.cache_left_context else self.chunk_size_left
+
+        bs, xmax, idim = xs.size()
+        emax = min(_N_c, math.ceil((xmax - N_l) / self.subsampling_factor))
+
+        # Pad the last chunk as in chunkwise training
+        if xmax < N_l + N_c + N_r:
+            xs = torch.cat([xs, xs.new_zeros(bs, N_l + N_c + N_r - xmax, idim)], dim=1)
+        xlens = torch.IntTensor(bs).fill_(xs.size(1))
+
+        if self.conv is None:
+            xs = self.embed(xs)
+        else:
+            # Path through CNN blocks
+            xs, xlens = self.conv(xs, xlens)
+
+        n_left = N_l // self.subsampling_factor  # left context in the input
+        mlen = self.cache[0].size(1) if self.cache[0] is not None else 0
+        pos_embs = None
+        if self.pe_type == 'relative':
+            xs = xs * self.scale
+            pos_idxs = torch.arange(mlen + xs.size(1) - 1, -1, -1.0, dtype=torch.float)
+            pos_embs = self.pos_emb(pos_idxs, self.device_id)
+        else:
+            # NOTE: the current chunk follows the left context in training
+            xs = self.pos_enc(xs, scale=True, offset=_N_l - n_left)
+
+        for lth, layer in enumerate(self.layers):
+            if self.cache_left_context:
+                xs, self.cache[lth] = layer.forward_chunk(xs, self.cache[lth], _N_c, _N_l,
+                                                          pos_embs=pos_embs)
+            else:
+                xs = layer(xs, None, pos_embs=pos_embs)
+
+        # Extract the center region
+        xs = xs[:, n_left:n_left + emax]
+
+        xs = self.norm_out(xs)
+
+        # Bridge layer
+        if self.bridge is not None:
+            xs = self.bridge(xs)
+
+        return xs, torch.IntTensor(bs).fill_(emax)
+
 
 class TransformerEncoderBlock(nn.Module):
     """A single layer of the Transformer encoder.
@@ -505,10 +598,11 @@ class TransformerEncoderBlock(nn.Module):
         # self-attention
         residual = xs
         xs = self.norm1(xs)
+        need_weights = not self.training and is_attention_captured()
         if self.relative_attention:
-            xs, self._xx_aws = self.self_attn(xs, xs, memory, pos_embs, xx_mask, u, v)  # k/q/m
+            xs, self._xx_aws = self.self_attn(xs, xs, memory, pos_embs, xx_mask, u, v, need_weights=need_weights)  # k/q/m
         else:
-            xs, self._xx_aws = self.self_attn(xs, xs, xs, mask=xx_mask)[:2]  # k/v/q
+            xs, self._xx_aws = self.self_attn(xs, xs, xs, mask=xx_mask, need_weights=need_weights)[:2]  # k/v/q
         xs = self.dropout(xs) + residual
 
         # position-wise feed-forward
@@ -518,3 +612,42 @@ class TransformerEncoderBlock(nn.Module):
         xs = self.dropout(xs) + residual
 
         return xs
+
+    def forward_chunk(self, xs, cache, n_center, mem_len, pos_embs=None, u=None, v=None):
+        """Streaming forward pass over a chunk with the cached left context.
+
+        Args:
+            xs (FloatTensor): `[B, T, d_model]`
+            cache (FloatTensor): self-attention inputs of the left context `[B, mlen, d_model]`
+            n_center (int): number of frames in the center region
+            mem_len (int): maximum number of frames for the left context
+            pos_embs (LongTensor): `[mlen + T, 1, d_model]`
+            u (FloatTensor): global parameter for relative positional embedding
+            v (FloatTensor): global parameter for relative positional embedding
+        Returns:
+            xs (FloatTensor): `[B, T, d_model]`
+            cache (FloatTensor): `[B, mlen', d_model]`
+
+        """
+        self.reset_visualization()
+
+        # self-attention over the cached left context
+        residual = xs
+        xs = self.norm1(xs)
+        memory = xs[:, :n_center] if cache is None else torch.cat([cache, xs[:, :n_center]], dim=1)
+        memory = memory[:, max(0, memory.size(1) - mem_len):]
+        need_weights = not self.training and is_attention_captured()
+        if self.relative_attention:
+            xs, self._xx_aws = self.self_attn(xs, xs, cache, pos_embs, None, u, v, need_weights=need_weights)  # k/q/m
+        else:
+            kv = xs if cache is None else torch.cat([cache, xs], dim=1)
+            xs, self._xx_aws = self.self_attn(kv, kv, xs, mask=None, need_weights=need_weights)[:2]  # k/v/q
+        xs = self.dropout(xs) + residual
+
+        # position-wise feed-forward
+        residual = xs
+        xs = self.norm2(xs)
+        xs = self.feed_forward(xs)
+        xs = self.dropout(xs) + residual
+
+        return xs, memory
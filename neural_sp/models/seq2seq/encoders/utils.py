@@ -13,7 +13,7 @@ import torch
 logger = logging.getLogger(__name__)
 
 
-def chunkwise(xs, N_l, N_c, N_r):
+def chunkwise(xs, N_l, N_c, N_r, pad_value=None):
     """Slice input frames chunk by chunk and regard each chunk (with left and
         right contexts) as a single utterance for efficient training of
         latency-controlled bidirectional encoder.
@@ -23,6 +23,8 @@ def chunkwise(xs, N_l, N_c, N_r):
         N_l (int): number of frames for left context
         N_c (int): number of frames for current context
         N_r (int): number of frames for right context
+        pad_value (FloatTensor): `[input_dim]`, frame filled beyond the input.
+            Zeros are filled if None.
     Returns:
         xs (FloatTensor): `[B * n_chunks, N_l + N_c + N_r, input_dim]`
             where n_chunks = ceil(T / N_c)
@@ -31,13 +33,15 @@ def chunkwise(xs, N_l, N_c, N_r):
     bs, xmax, idim = xs.size()
 
     n_chunks = math.ceil(xmax / N_c)
-    xs_tmp = xs.new_zeros(bs, n_chunks, N_l + N_c + N_r, idim)
-    xs_pad = torch.cat([xs.new_zeros(bs, N_l, idim),
+    # NOTE: frames beyond the input are filled so that every chunk has the same length
+    if pad_value is None:
+        pad_value = xs.new_zeros(idim)
+    xs_pad = torch.cat([pad_value.expand(bs, N_l, idim),
                         xs,
-                        xs.new_zeros(bs, N_r, idim)], dim=1)
-    for chunk_idx, t in enumerate(range(N_l, N_l + xmax, N_c)):
-        xs_chunk = xs_pad[:, t - N_l:t + (N_c + N_r)]
-        xs_tmp[:, chunk_idx, :xs_chunk.size(1), :] = xs_chunk
-    xs = xs_tmp.view(bs * n_chunks, N_l + N_c + N_r, idim)
+                        pad_value.expand(bs, n_chunks * N_c - xmax + N_r, idim)], dim=1)
+    # NOTE: this replaces the per-chunk Python loop only. Overlapping chunks are
+    # still materialized by reshape, which copies the contexts into every chunk
+    xs = xs_pad.unfold(1, N_l + N_c + N_r, N_c)  # `[B, n_chunks, input_dim, N_l + N_c + N_r]`
+    xs = xs.transpose(3, 2).reshape(bs * n_chunks, N_l + N_c + N_r, idim)
 
     return xs
@@ -7,6 +7,12 @@
 """Frame stacking."""
 
 import numpy as np
+import torch
+import torch.nn.functional as F
+
+
+def _n_stacked_frames(xlen, n_stacks, n_skips):
+    return xlen // n_skips if xlen % n_stacks == 0 else (xlen // n_skips) + 1
 
 
 def stack_frame(feat, n_stacks, n_skips, dtype=np.float32):
@@ -17,8 +23,12 @@ def stack_frame(feat, n_stacks, n_skips, dtype=np.float32):
            "Fast and accurate recurrent neural network acoustic models for speech recognition."
            arXiv preprint arXiv:1507.06947 (2015).
 
+    The t-th output frame is a concatenation of `n_stacks` input frames from
+    the (t * n_skips)-th frame, where frames after the end are filled with zeros.
+    All output frames are obtained at once as a strided view of the input.
+
     Args:
-        feat (list): `[T, input_dim]`
+        feat (np.ndarray): `[T, input_dim]`
         n_stacks (int): the number of frames to stack
         n_skips (int): the number of frames to skip
         dtype ():
@@ -33,39 +43,52 @@ def stack_frame(feat, n_stacks, n_skips, dtype=np.float32):
         raise ValueError('n_skips must be less than n_stacks.')
 
     T, input_dim = feat.shape
-    T_new = T // n_skips if T % n_stacks == 0 else (T // n_skips) + 1
-
-    stacked_feat = np.zeros((T_new, input_dim * n_stacks), dtype=dtype)
-    stack_count = 0
-    stack = []
-    for t, frame_t in enumerate(feat):
-        if t == len(feat) - 1:  # final frame
-            # Stack the final frame
-            stack.append(frame_t)
-
-            while stack_count != int(T_new):
-                # Concatenate stacked frames
-                for i in range(len(stack)):
-                    stacked_feat[stack_count][input_dim * i:input_dim * (i + 1)] = stack[i]
-                stack_count += 1
-
-                # Delete some frames to skip
-                for _ in range(n_skips):
-                    if len(stack) != 0:
-                        stack.pop(0)
-
-        elif len(stack) < n_stacks:  # first & middle frames
-            # Stack some frames until stack is filled
-            stack.append(frame_t)
-
-        if len(stack) == n_stacks:
-            # Concatenate stacked frames
-            for i in range(n_stacks):
-                stacked_feat[stack_count][input_dim * i:input_dim * (i + 1)] = stack[i]
-            stack_count += 1
-
-            # Delete some frames to skip
-            for _ in range(n_skips):
-                stack.pop(0)
-
-    return stacked_feat
+    T_new = _n_stacked_frames(T, n_stacks, n_skips)
+
+    feat_pad = np.zeros(((T_new - 1) * n_skips + n_stacks, input_dim), dtype=dtype)
+    n_frames = min(T, len(feat_pad))
+    feat_pad[:n_frames] = feat[:n_frames]
+    stacked_feat = np.lib.stride_tricks.as_strided(
+        feat_pad, shape=(T_new, input_dim * n_stacks),
+        strides=(feat_pad.strides[0] * n_skips, feat_pad.strides[1]), writeable=False)
+    return stacked_feat.copy()
+
+
+def stack_frame_batch(xs, xlens, n_stacks, n_skips):
+    """Stack & skip some frames of all utterances in a mini-batch at once.
+
+    This is a batched version of `stack_frame` for padded tensors, and
+    outputs are identical to those of `stack_frame` for each utterance.
+
+    Args:
+        xs (FloatTensor): `[B, T, input_dim]`
+        xlens (IntTensor or list): `[B]`
+        n_stacks (int): the number of frames to stack
+        n_skips (int): the number of frames to skip
+    Returns:
+        xs (FloatTensor): `[B, T_new, input_dim * n_stacks]`
+        xlens (IntTensor): `[B]`
+
+    """
+    if n_stacks == 1:
+        return xs, torch.IntTensor(list(xlens))
+
+    if n_stacks < n_skips:
+        raise ValueError('n_skips must be less than n_stacks.')
+
+    bs, xmax, input_dim = xs.size()
+    xlens = [int(xlen) for xlen in xlens]
+    xlens_new = [_n_stacked_frames(xlen, n_stacks, n_skips) for xlen in xlens]
+    xmax_new = max(xlens_new)
+
+    # frames after the end of each utterance are filled with zeros
+    frames = torch.arange(xmax, device=xs.device)
+    xs = xs.masked_fill((frames.unsqueeze(0) >= torch.tensor(xlens, device=xs.device).unsqueeze(1)).unsqueeze(2), 0)
+    n_frames = (xmax_new - 1) * n_skips + n_stacks
+    xs = F.pad(xs[:, :n_frames], (0, 0, 0, n_frames - min(xmax, n_frames)))
+
+    xs = xs.unfold(1, n_stacks, n_skips)  # `[B, T_new, input_dim, n_stacks]`
+    xs = xs.transpose(2, 3).contiguous().view(bs, xmax_new, input_dim * n_stacks)
+    frames = torch.arange(xmax_new, device=xs.device)
+    xs = xs.masked_fill((frames.unsqueeze(0) >= torch.tensor(xlens_new, device=xs.device).unsqueeze(1)).unsqueeze(2), 0)
+    return xs, torch.IntTensor(xlens_new)
@@ -7,6 +7,12 @@
 """Splice data."""
 
 import numpy as np
+import torch
+
+
+def _splice_indices(xmax, n_splices):
+    # the first frame is copied to the left side (padding left frames)
+    return np.maximum(np.arange(xmax)[:, None] + np.arange(n_splices)[None] - n_splices, 0)
 
 
 def splice(feat, n_splices=1, n_stacks=1, dtype=np.float32):
@@ -34,31 +40,56 @@ def splice(feat, n_splices=1, n_stacks=1, dtype=np.float32):
 
     max_xlen, input_dim = feat.shape
     freq = (input_dim // 3) // n_stacks
-    feat_splice = np.zeros((max_xlen, freq * (n_splices * n_stacks) * 3), dtype=dtype)
 
-    for i_time in range(max_xlen):
-        spliced_frames = np.zeros((n_splices * n_stacks, freq, 3))
-        for i_splice in range(0, n_splices, 1):
-            if i_time <= n_splices - 1 and i_splice < n_splices - i_time:
-                # copy the first frame to left side (padding left frames)
-                copy_frame = feat[0]
-            elif max_xlen - n_splices <= i_time and i_time + (i_splice - n_splices) > max_xlen - 1:
-                # copy the last frame to right side (padding right frames)
-                copy_frame = feat[-1]
-            else:
-                copy_frame = feat[i_time + (i_splice - n_splices)]
+    # `[T, n_splices, freq * 3 * n_stacks]` -> `[T, n_splices, n_stacks, freq, 3]`
+    frames = feat[_splice_indices(max_xlen, n_splices)]
+    frames = frames.reshape((max_xlen, n_splices, freq, 3, n_stacks)).transpose((0, 1, 4, 2, 3))
+
+    # NOTE: the first stacked frame is taken from each spliced frame,
+    # followed by the other stacked frames of the last spliced frame
+    feat_splice = np.zeros((max_xlen, n_splices * n_stacks, freq, 3), dtype=dtype)
+    feat_splice[:, :n_splices] = frames[:, :, 0]
+    feat_splice[:, n_splices:n_splices + n_stacks - 1] = frames[:, -1, 1:]
+
+    # `[T, n_splices * n_stacks, freq, 3] -> `[T, freq, n_splices * n_stacks, 3]`
+    feat_splice = feat_splice.transpose((0, 2, 1, 3))
 
-            # `[freq * 3 * n_stacks]` -> `[freq, 3, n_stacks]`
-            copy_frame = copy_frame.reshape((freq, 3, n_stacks))
+    return feat_splice.reshape((max_xlen, freq * (n_splices * n_stacks) * 3))
 
-            # `[freq, 3, n_stacks]` -> `[n_stacks, freq, 3]`
-            copy_frame = np.transpose(copy_frame, (2, 0, 1))
 
-            spliced_frames[i_splice: i_splice + n_stacks] = copy_frame
+def splice_batch(xs, xlens, n_splices=1, n_stacks=1):
+    """Splice input data of all utterances in a mini-batch at once.
+
+    This is a batched version of `splice` for padded tensors, and outputs
+    are identical to those of `splice` for each utterance.
+
+    Args:
+        xs (FloatTensor): `[B, T, input_dim (freq * 3 * n_stacks)]`
+        xlens (IntTensor or list): `[B]`
+        n_splices (int): frames to n_splices
+        n_stacks (int): the number of frames to stack
+    Returns:
+        xs (FloatTensor): `[B, T, freq * (n_splices * n_stacks) * 3]`
+
+    """
+    assert xs.size(-1) % 3 == 0
+
+    if n_splices == 1:
+        return xs
+
+    bs, xmax, input_dim = xs.size()
+    freq = (input_dim // 3) // n_stacks
 
-        # `[n_splices * n_stacks, freq, 3] -> `[freq, n_splices * n_stacks, 3]`
-        spliced_frames = np.transpose(spliced_frames, (1, 0, 2))
+    # `[B, T, n_splices, freq * 3 * n_stacks]` -> `[B, T, n_splices, n_stacks, freq, 3]`
+    indices = torch.from_numpy(_splice_indices(xmax, n_splices)).to(xs.device)
+    frames = xs[:, indices].view(bs, xmax, n_splices, freq, 3, n_stacks).permute(0, 1, 2, 5, 3, 4)
 
-        feat_splice[i_time] = spliced_frames.reshape((freq * (n_splices * n_stacks) * 3))
+    xs_splice = xs.new_zeros(bs, xmax, n_splices * n_stacks, freq, 3)
+    xs_splice[:, :, :n_splices] = frames[:, :, :, 0]
+    xs_splice[:, :, n_splices:n_splices + n_stacks - 1] = frames[:, :, -1, 1:]
 
-    return feat_splice
+    # `[B, T, n_splices * n_stacks, freq, 3] -> `[B, T, freq, n_splices * n_stacks, 3]`
+    xs_splice = xs_splice.transpose(2, 3).contiguous().view(bs, xmax, -1)
+    frames = torch.arange(xmax, device=xs.device)
+    xlens = torch.tensor([int(xlen) for xlen in xlens], device=xs.device)
+    return xs_splice.masked_fill((frames.unsqueeze(0) >= xlens.unsqueeze(1)).unsqueeze(2), 0)
@@ -6,21 +6,25 @@
 
 """Streaming encoding interface."""
 
+import copy
+import logging
+import numpy as np
 import torch
 
+logger = logging.getLogger(__name__)
+
 
 class Streaming(object):
-    """Streaming encoding interface."""
+    """Streaming encoding interface.
 
-    def __init__(self, x_whole, params, encoder, idx2token):
-        """
-        Args:
-            x_whole (FloatTensor): `[T, input_dim]`
+    Input features are pushed by `feed` as they arrive and sliced chunk by chunk.
+    Frames that are no longer needed for the following chunks are discarded.
 
-        """
+    """
+
+    def __init__(self, params, encoder, idx2token):
         super(Streaming, self).__init__()
 
-        self.x_whole = x_whole
         self.encoder = encoder
         if self.encoder.conv is not None:
             self.encoder.turn_off_ceil_mode(self.encoder)
@@ -29,12 +33,25 @@ class Streaming(object):
         # latency
         self.factor = encoder.subsampling_factor
         self.N_l = encoder.chunk_size_left
-        # self.N_c = getattr(encoder, 'chunk_size_current', -1)  # for Transformer
-        self.N_c = encoder.chunk_size_left  # for Transformer
+        self.N_c = getattr(encoder, 'chunk_size_current', -1)  # for Transformer/Conformer
+        self.is_chunkwise = self.N_c > 0
+        if not self.is_chunkwise:
+            self.N_c = encoder.chunk_size_left  # for LC-BLSTM
         self.N_r = encoder.chunk_size_right
         if self.N_c == 0 and self.N_r == 0:
             # self.N_c = params['lc_chunk_size_left']  # for unidirectional encoder
             self.N_c = 40
+        self.context = 0
+        # NOTE: each chunk of the Transformer/Conformer encoder is passed through
+        # CNN blocks without extra frames as in training
+        if getattr(self.encoder, 'conv', None) is not None and not self.is_chunkwise:
+            self.context = self.encoder.conv.n_frames_context
+        # NOTE: the left context of the Transformer/Conformer encoder is fed with each
+        # chunk and re-encoded unless it is cached in the encoder
+        self.cache_left_context = self.is_chunkwise and params['recog_cache_left_context']
+        if self.is_chunkwise:
+            self.encoder.cache_left_context = self.cache_left_context
+        self.left_context = self.N_l if self.is_chunkwise and not self.cache_left_context else 0
 
         # threshold for CTC-VAD
         self.blank = 0
@@ -42,25 +59,72 @@ class Streaming(object):
         self.BLANK_THRESHOLD = params['recog_ctc_vad_blank_threshold']
         self.SPIKE_THRESHOLD = params['recog_ctc_vad_spike_threshold']
         self.MAX_N_ACCUM_FRAMES = params['recog_ctc_vad_n_accum_frames']
+        self.MAX_SEGMENT_LEN = params['recog_max_segment_len']
 
         self.offset = 0  # global time offset in the session
         self.n_blanks = 0  # number of blank frames
         self.n_accum_frames = 0
         self.bd_offset = -1  # boudnary offset in each chunk (after subsampling)
 
-        # for test
-        self.eout_chunks = []
+        # input buffer
+        self.x_buffer = None  # `[T_buffer, input_dim]`
+        self.buffer_offset = 0  # global time index of the first frame in the buffer
+        self.n_frames = 0  # number of frames fed so far
+        self.is_final = False  # no more inputs will be fed
+        self.is_finished = False  # the last chunk has been extracted
+
+        # encoder outputs in the current segment
+        self.eout_buffer = EncoderOutputBuffer()
 
     def reset(self):
-        self.eout_chunks = []
+        self.eout_buffer.evict()
         self.n_blanks = 0
         self.n_accum_frames = 0
 
     def register(self):
         pass
 
+    def feed(self, x):
+        """Append input features to the buffer.
+
+        Args:
+            x (np.ndarray): `[T_chunk, input_dim]`
+
+        """
+        assert not self.is_final
+        if self.x_buffer is None:
+            self.x_buffer = x
+        else:
+            self.x_buffer = np.concatenate([self.x_buffer, x], axis=0)
+        self.n_frames += len(x)
+
+    def finalize(self):
+        """Mark the end of inputs so that the remaining frames are encoded."""
+        self.is_final = True
+
+    def has_next_chunk(self):
+        """Check if the next chunk can be extracted.
+
+        Before `finalize` is called, a chunk is extracted only when all of its
+        right context has arrived and it is guaranteed not to be the last chunk.
+
+        """
+        if self.is_finished or self.n_frames == 0:
+            return False
+        if self.is_final:
+            return True
+        j = self.offset
+        return self.n_frames > j + self.N_c and self.n_frames >= j + self.N_c + self.N_r + self.context
+
     def next_chunk(self):
-        self.offset += self.N_l
+        self.offset += self.N_c
+
+        # Discard frames before the left context of the next chunk
+        # NOTE: the next chunk never starts before the current one
+        start = max(0, self.offset - self.context - self.left_context)
+        if start > self.buffer_offset:
+            self.x_buffer = self.x_buffer[start - self.buffer_offset:]
+            self.buffer_offset = start
 
     def extract_feature(self):
         j = self.offset
@@ -68,15 +132,18 @@ class Streaming(object):
         r = self.N_r
 
         # Encode input features chunk by chunk
-        if getattr(self.encoder, 'conv', None) is not None:
-            context = self.encoder.conv.n_frames_context
-            x_chunk = self.x_whole[max(0, j - context):j + (c + r) + context]
-        else:
-            x_chunk = self.x_whole[j:j + (c + r)]
+        start = max(0, j - self.context - self.left_context)
+        end = j + (c + r) + self.context
+        x_chunk = self.x_buffer[start - self.buffer_offset:end - self.buffer_offset]
+        if j - start < self.left_context:
+            # NOTE: the left context is filled with zeros at the beginning as in chunkwise training
+            x_chunk = np.concatenate([np.zeros((self.left_context - (j - start), x_chunk.shape[1]),
+                                               dtype=x_chunk.dtype), x_chunk], axis=0)
 
-        is_last_chunk = (j + c - 1) >= len(self.x_whole) - 1
+        is_last_chunk = self.is_final and (j + c - 1) >= self.n_frames - 1
+        self.is_finished = is_last_chunk
         self.bd_offset = -1  # reset
-        self.n_accum_frames += x_chunk.shape[1]
+        self.n_accum_frames += len(x_chunk) - self.left_context
 
         return x_chunk, is_last_chunk
 
@@ -121,3 +188,286 @@ class Streaming(object):
                     is_reset = True
 
         return is_reset
+
+    def is_segment_full(self):
+        """Check if encoder outputs in the current segment reach the maximum length.
+
+        Returns:
+            is_full (bool): the segment should be committed without waiting for a boundary
+
+        """
+        return self.MAX_SEGMENT_LEN > 0 and len(self.eout_buffer) * self.factor >= self.MAX_SEGMENT_LEN
+
+
+class EncoderOutputBuffer(object):
+    """Growable store of encoder outputs in the current segment.
+
+    Chunks are copied into a preallocated tensor whose capacity is doubled when
+    it is full, so that appending is amortized O(1) and the decoder reads the
+    segment as a view without concatenation. Evicted frames are reclaimed by
+    moving the remaining frames to the head when the tail is full.
+
+    Args:
+        init_capacity (int): initial number of frames to allocate
+
+    """
+
+    def __init__(self, init_capacity=256):
+
+        self.init_capacity = init_capacity
+        self.buffer = None  # `[B, capacity, enc_n_units]`
+        self.start = 0
+        self.end = 0
+
+    def __len__(self):
+        return self.end - self.start
+
+    @property
+    def capacity(self):
+        return 0 if self.buffer is None else self.buffer.size(1)
+
+    def append(self, eout_chunk):
+        """Append encoder outputs.
+
+        Args:
+            eout_chunk (FloatTensor): `[B, T_chunk, enc_n_units]`
+
+        """
+        n_frames = eout_chunk.size(1)
+        if self.buffer is None:
+            bs, _, enc_n_units = eout_chunk.size()
+            self.buffer = eout_chunk.new_empty(bs, max(self.init_capacity, n_frames), enc_n_units)
+        elif self.end + n_frames > self.capacity:
+            length = len(self)
+            capacity = self.capacity
+            while length + n_frames > capacity:
+                capacity *= 2
+            if capacity == self.capacity:
+                self.buffer[:, :length] = self.buffer[:, self.start:self.end].clone()
+            else:
+                buffer = self.buffer.new_empty(self.buffer.size(0), capacity, self.buffer.size(2))
+                buffer[:, :length] = self.buffer[:, self.start:self.end]
+                self.buffer = buffer
+            self.start, self.end = 0, length
+        self.buffer[:, self.end:self.end + n_frames] = eout_chunk
+        self.end += n_frames
+
+    def view(self):
+        """Return encoder outputs in the current segment without copy.
+
+        Returns:
+            eouts (FloatTensor): `[B, T, enc_n_units]`
+
+        """
+        return self.buffer[:, self.start:self.end]
+
+    def evict(self, n_frames=None):
+        """Discard the oldest frames.
+
+        Args:
+            n_frames (int): number of frames to discard. All frames are discarded if None.
+
+        """
+        if n_frames is None or n_frames >= len(self):
+            self.start, self.end = 0, 0
+        else:
+            self.start += n_frames
+
+
+class StreamingSession(object):
+    """Incremental decoding session for live recognition.
+
+    Input features are pushed by `feed` as they arrive. The encoder cache,
+    CTC-VAD counters, and decoder/LM states are carried over between calls,
+    and finalized segments are committed to the output.
+
+    Args:
+        model (Speech2Text): ASR model
+        params (dict): hyper-parameters for decoding
+        idx2token (): converter from index to token
+        task (str): ys only now
+
+    """
+
+    def __init__(self, model, params, idx2token, task='ys'):
+
+        # check configurations
+        assert task == 'ys'
+        assert model.input_type == 'speech'
+        assert model.ctc_weight > 0
+        assert model.fwd_weight > 0
+
+        self.model = model
+        self.params = params
+        self.global_params = copy.deepcopy(params)
+        self.global_params['recog_max_len_ratio'] = 1.0
+        self.idx2token = idx2token
+        self.task = task
+        self.chunk_sync = params['recog_chunk_sync']
+
+        self.lm = getattr(model, 'lm_fwd', None)
+        self.lm_second = getattr(model, 'lm_second', None)
+
+        self.streaming = Streaming(params, model.enc, idx2token)
+        if hasattr(model.enc, 'reset_cache'):
+            model.enc.reset_cache()
+
+        self.hyps = None  # active hypotheses in chunk-synchronous decoding
+        self.best_hyp_id_prefix = []  # best partial hypothesis in the current segment
+        self.best_hyp_id_stream = []  # committed tokens
+        self.is_reset = True  # for the first chunk
+        self.n_chunks = 0  # number of encoded chunks
+        self.partial_cache = None  # (number of encoded chunks, partial hypothesis)
+
+    def feed(self, x_chunk):
+        """Push input features and decode all chunks ready to be encoded.
+
+        Args:
+            x_chunk (np.ndarray): `[T_chunk, input_dim]`
+
+        """
+        self.streaming.feed(x_chunk)
+        self._decode_ready_chunks()
+
+    def partial_result(self):
+        """Return the current best hypothesis without finalizing the session.
+
+        Returns:
+            best_hyp_id (np.ndarray): `[L]`
+
+        """
+        best_hyp_id = list(self.best_hyp_id_stream)
+        if self.chunk_sync:
+            best_hyp_id.extend(self.best_hyp_id_prefix)
+        elif len(self.streaming.eout_buffer) > 0:
+            # Decode the pending segment only when new chunks have been encoded
+            if self.partial_cache is None or self.partial_cache[0] != self.n_chunks:
+                with torch.no_grad():
+                    self.partial_cache = (self.n_chunks, self._decode_segment())
+            best_hyp_id.extend(self.partial_cache[1])
+        return self._to_array(best_hyp_id)
+
+    def finalize(self):
+        """Decode the remaining frames and close the session.
+
+        Returns:
+            best_hyp_id (np.ndarray): `[L]`
+
+        """
+        self.streaming.finalize()
+        self._decode_ready_chunks()
+
+        with torch.no_grad():
+            # Global decoding over the last chunk
+            if not self.chunk_sync and len(self.streaming.eout_buffer) > 0:
+                self.best_hyp_id_stream.extend(self._decode_segment())
+                self.streaming.reset()
+
+        # pick up the best hyp
+        if not self.is_reset and self.chunk_sync and len(self.best_hyp_id_prefix) > 0:
+            self.best_hyp_id_stream.extend(self.best_hyp_id_prefix)
+            self.best_hyp_id_prefix = []
+
+        return self._to_array(self.best_hyp_id_stream)
+
+    def _to_array(self, best_hyp_id):
+        if len(best_hyp_id) > 0:
+            return np.stack(best_hyp_id, axis=0)
+        return np.zeros(0, dtype=np.int64)
+
+    def _decode_ready_chunks(self):
+        self.model.eval()
+        with torch.no_grad():
+            while self.streaming.has_next_chunk():
+                self._decode_chunk()
+
+    def _decode_segment(self):
+        """Global decoding over the segmented region."""
+        eout = self.streaming.eout_buffer.view()
+        elens = torch.IntTensor([eout.size(1)])
+        nbest_hyps_id_offline, _, _ = self.model.dec_fwd.beam_search(
+            eout, elens, self.global_params, self.idx2token, self.lm, self.lm_second,
+            ctc_log_probs=None)
+        return list(nbest_hyps_id_offline[0][0])
+
+    def _decode_chunk(self):
+        model = self.model
+        streaming = self.streaming
+        params = self.params
+
+        # Encode input features chunk by chunk
+        x_chunk, is_last_chunk = streaming.extract_feature()
+        eout_chunk = model.encode([x_chunk], self.task,
+                                  use_cache=not self.is_reset,
+                                  streaming=True)[self.task]['xs']
+        self.n_chunks += 1
+        self.is_reset = False  # detect the first boundary in the same chunk
+
+        # CTC-based VAD
+        ctc_log_probs_chunk = None
+        if streaming.is_ctc_vad:
+            ctc_probs_chunk = model.dec_fwd.ctc_probs(eout_chunk)
+            if params['recog_ctc_weight'] > 0:
+                ctc_log_probs_chunk = torch.log(ctc_probs_chunk)
+            self.is_reset = streaming.ctc_vad(ctc_probs_chunk)
+
+        # Truncate the most right frames
+        if self.is_reset and not is_last_chunk:
+            eout_chunk = eout_chunk[:, :streaming.bd_offset + 1]
+
+        if self.chunk_sync:
+            # Chunk-synchronous attention decoding
+            end_hyps, self.hyps, _ = model.dec_fwd.beam_search_chunk_sync(
+                eout_chunk, params, self.idx2token, self.lm,
+                ctc_log_probs=ctc_log_probs_chunk, hyps=self.hyps,
+                state_carry_over=False,
+                ignore_eos=getattr(model.enc, 'rnn_type', None) in ['lstm', 'conv_lstm'])
+            merged_hyps = sorted(end_hyps + self.hyps, key=lambda x: x['score'], reverse=True)
+            best_hyp_id_prefix = list(merged_hyps[0]['hyp'][1:])
+            if len(best_hyp_id_prefix) > 0 and best_hyp_id_prefix[-1] == model.eos:
+                # reset beam if <eos> is generated from the best hypothesis
+                best_hyp_id_prefix = best_hyp_id_prefix[:-1]  # exclude <eos>
+                # Segmentation strategy 2:
+                # If <eos> is emitted from the decoder (not CTC),
+                # the current chunk is segmented.
+                if not self.is_reset:
+                    streaming.bd_offset = eout_chunk.size(1) - 1
+                    self.is_reset = True
+            self.best_hyp_id_prefix = best_hyp_id_prefix
+            logger.debug('Sync MoChA (T:%d, offset:%d, blank:%d frames): %s' %
+                         (streaming.offset + eout_chunk.size(1) * streaming.factor,
+                          model.dec_fwd.n_frames * streaming.factor,
+                          streaming.n_blanks * streaming.factor,
+                          self.idx2token(best_hyp_id_prefix)))
+        else:
+            # Encoder outputs are kept until the end of the current segment
+            streaming.eout_buffer.append(eout_chunk)
+            # Segmentation strategy 3:
+            # If any boundaries are not detected for a long time, the segment is
+            # committed at the current chunk while the encoder and CTC-VAD states
+            # are carried over, so that the buffer does not grow without bound.
+            if not self.is_reset and not is_last_chunk and streaming.is_segment_full():
+                self.best_hyp_id_stream.extend(self._decode_segment())
+                streaming.eout_buffer.evict(len(streaming.eout_buffer))
+
+        if self.is_reset:
+            # pick up the best hyp from ended and active hypotheses
+            if self.chunk_sync:
+                self.best_hyp_id_stream.extend(self.best_hyp_id_prefix)
+                self.best_hyp_id_prefix = []
+            else:
+                self.best_hyp_id_stream.extend(self._decode_segment())
+
+            # reset
+            streaming.reset()
+            self.hyps = None
+
+            # next chunk will start from the frame next to the boundary
+            if not is_last_chunk and 0 <= streaming.bd_offset * streaming.factor < streaming.N_c - 1:
+                x_chunk = x_chunk[streaming.left_context:]
+                n_back = x_chunk[(streaming.bd_offset + 1) * streaming.factor:streaming.N_c].shape[0]
+                streaming.offset -= n_back
+                if self.chunk_sync:
+                    model.dec_fwd.n_frames -= n_back // streaming.factor
+
+        streaming.next_chunk()
@@ -6,7 +6,6 @@
 
 """Speech to text sequence-to-sequence model."""
 
-import copy
 import logging
 import numpy as np
 import random
@@ -20,11 +19,11 @@ from neural_sp.models.seq2seq.decoders.build import build_decoder
 from neural_sp.models.seq2seq.decoders.fwd_bwd_attention import fwd_bwd_attention
 from neural_sp.models.seq2seq.decoders.rnn_transducer import RNNTransducer
 from neural_sp.models.seq2seq.encoders.build import build_encoder
-from neural_sp.models.seq2seq.frontends.frame_stacking import stack_frame
+from neural_sp.models.seq2seq.frontends.frame_stacking import stack_frame_batch
 from neural_sp.models.seq2seq.frontends.gaussian_noise import add_gaussian_noise
 from neural_sp.models.seq2seq.frontends.sequence_summary import SequenceSummaryNetwork
 from neural_sp.models.seq2seq.frontends.spec_augment import SpecAugment
-from neural_sp.models.seq2seq.frontends.splicing import splice
+from neural_sp.models.seq2seq.frontends.splicing import splice_batch
 from neural_sp.models.torch_utils import np2tensor
 from neural_sp.models.torch_utils import tensor2np
 from neural_sp.models.torch_utils import pad_list
@@ -357,16 +356,16 @@ class Speech2Text(ModelBase):
 
         """
         if self.input_type == 'speech':
+            xlens = torch.IntTensor([len(x) for x in xs])
+            xs = pad_list([np2tensor(x, self.device_id).float() for x in xs], 0.)
+
             # Frame stacking
             if self.n_stacks > 1:
-                xs = [stack_frame(x, self.n_stacks, self.n_skips) for x in xs]
+                xs, xlens = stack_frame_batch(xs, xlens, self.n_stacks, self.n_skips)
 
             # Splicing
             if self.n_splices > 1:
-                xs = [splice(x, self.n_splices, self.n_stacks) for x in xs]
-            xlens = torch.IntTensor([len(x) for x in xs])
-
-            xs = pad_list([np2tensor(x, self.device_id).float() for x in xs], 0.)
+                xs = splice_batch(xs, xlens, self.n_splices, self.n_stacks)
 
             # SpecAugment
             if self.specaug is not None and self.training:
@@ -432,149 +431,29 @@ class Speech2Text(ModelBase):
             self.dec_fwd._plot_ctc(self.save_path)
 
     def decode_streaming(self, xs, params, idx2token, exclude_eos=False, task='ys'):
-        from neural_sp.models.seq2seq.frontends.streaming import Streaming
+        """Decode an utterance chunk by chunk.
 
-        # check configurations
-        assert task == 'ys'
-        assert self.input_type == 'speech'
-        assert self.ctc_weight > 0
-        assert self.fwd_weight > 0
-        assert len(xs) == 1  # batch size
-        # assert params['recog_length_norm']
-        global_params = copy.deepcopy(params)
-        global_params['recog_max_len_ratio'] = 1.0
+        The whole utterance is fed to a `StreamingSession` at once. For live
+        recognition, call `feed` of the session as input features arrive instead.
 
-        streaming = Streaming(xs[0], params, self.enc, idx2token)
+        Args:
+            xs (list): length 1, each of which contains arrays of size `[T, input_dim]`
+            params (dict): hyper-parameters for decoding
+            idx2token (): converter from index to token
+            exclude_eos (bool): exclude <eos> from best_hyps_id
+            task (str): ys only now
+        Returns:
+            best_hyps_id (list): length 1, each of which contains arrays of size `[L]`
+            aws (list): length 1, None
 
-        hyps = None
-        best_hyp_id_stream = []
-        is_reset = True   # for the first chunk
+        """
+        from neural_sp.models.seq2seq.frontends.streaming import StreamingSession
 
-        self.eval()
-        with torch.no_grad():
-            lm = getattr(self, 'lm_fwd', None)
-            lm_second = getattr(self, 'lm_second', None)
-
-            while True:
-                # Encode input features chunk by chunk
-                x_chunk, is_last_chunk = streaming.extract_feature()
-                eout_chunk = self.encode([x_chunk], task,
-                                         use_cache=not is_reset,
-                                         streaming=True)[task]['xs']
-                is_reset = False  # detect the first boundary in the same chunk
-
-                # CTC-based VAD
-                ctc_log_probs_chunk = None
-                if streaming.is_ctc_vad:
-                    ctc_probs_chunk = self.dec_fwd.ctc_probs(eout_chunk)
-                    if params['recog_ctc_weight'] > 0:
-                        ctc_log_probs_chunk = torch.log(ctc_probs_chunk)
-                    is_reset = streaming.ctc_vad(ctc_probs_chunk)
-
-                # Truncate the most right frames
-                if is_reset and not is_last_chunk:
-                    eout_chunk = eout_chunk[:, :streaming.bd_offset + 1]
-                streaming.eout_chunks.append(eout_chunk)
-
-                # Chunk-synchronous attention decoding
-                if params['recog_chunk_sync']:
-                    end_hyps, hyps, aws_seg = self.dec_fwd.beam_search_chunk_sync(
-                        eout_chunk, params, idx2token, lm,
-                        ctc_log_probs=ctc_log_probs_chunk, hyps=hyps,
-                        state_carry_over=False,
-                        ignore_eos=self.enc.rnn_type in ['lstm', 'conv_lstm'])
-                    merged_hyps = sorted(end_hyps + hyps, key=lambda x: x['score'], reverse=True)
-                    best_hyp_id_prefix = np.array(merged_hyps[0]['hyp'][1:])
-                    if len(best_hyp_id_prefix) > 0 and best_hyp_id_prefix[-1] == self.eos:
-                        # reset beam if <eos> is generated from the best hypothesis
-                        best_hyp_id_prefix = best_hyp_id_prefix[:-1]  # exclude <eos>
-                        # Segmentation strategy 2:
-                        # If <eos> is emitted from the decoder (not CTC),
-                        # the current chunk is segmented.
-                        if not is_reset:
-                            streaming.bd_offset = eout_chunk.size(1) - 1
-                            is_reset = True
-                    print('\rSync MoChA (T:%d, offset:%d, blank:%d frames): %s' %
-                          (streaming.offset + eout_chunk.size(1) * streaming.factor,
-                           self.dec_fwd.n_frames * streaming.factor,
-                           streaming.n_blanks * streaming.factor, idx2token(best_hyp_id_prefix)), end='')
-                    # print('-' * 50)
-
-                if is_reset:
-                    # Global decoding over the segmented region
-                    if not params['recog_chunk_sync']:
-                        eout = torch.cat(streaming.eout_chunks, dim=1)
-                        elens = torch.IntTensor([eout.size(1)])
-                        ctc_log_probs = None
-                        if params['recog_ctc_weight'] > 0:
-                            ctc_log_probs = torch.log(self.dec_fwd.ctc_probs(eout))
-                        nbest_hyps_id_offline, _, _ = self.dec_fwd.beam_search(
-                            eout, elens, global_params, idx2token, lm, lm_second,
-                            ctc_log_probs=ctc_log_probs)
-                        # print('Offline MoChA (T:%d): %s' %
-                        #       (streaming.offset + eout_chunk.size(1) * streaming.factor,
-                        #        idx2token(nbest_hyps_id_offline[0][0])))
-                    eout = torch.cat(streaming.eout_chunks, dim=1)
-                    elens = torch.IntTensor([eout.size(1)])
-                    ctc_log_probs = None
-                    nbest_hyps_id_offline, _, _ = self.dec_fwd.beam_search(
-                        eout, elens, global_params, idx2token, lm, lm_second,
-                        ctc_log_probs=ctc_log_probs)
-                    # print('Offline MoChA (T:%d): %s' %
-                    #       (streaming.offset + eout_chunk.size(1) * streaming.factor,
-                    #        idx2token(nbest_hyps_id_offline[0][0])))
-
-                    # pick up the best hyp from ended and active hypotheses
-                    if not params['recog_chunk_sync']:
-                        if len(nbest_hyps_id_offline[0][0]) > 0:
-                            best_hyp_id_stream.extend(nbest_hyps_id_offline[0][0])
-                    else:
-                        if len(best_hyp_id_prefix) > 0:
-                            best_hyp_id_stream.extend(best_hyp_id_prefix)
-                        # print('Final Sync MoChA (T:%d, segment:%d frames): %s' %
-                        #       (streaming.offset + eout_chunk.size(1) * streaming.factor,
-                        #        self.dec_fwd.n_frames * streaming.factor,
-                        #        idx2token(best_hyp_id_prefix)))
-                        # print('-' * 50)
-                        # for test
-                        # eos_hyp = np.zeros(1, dtype=np.int32)
-                        # eos_hyp[0] = self.eos
-                        # best_hyp_id_stream.extend(eos_hyp)
-
-                    # reset
-                    streaming.reset()
-                    hyps = None
-
-                    # next chunk will start from the frame next to the boundary
-                    if not is_last_chunk and 0 <= streaming.bd_offset * streaming.factor < streaming.N_l - 1:
-                        streaming.offset -= x_chunk[(streaming.bd_offset + 1) * streaming.factor:streaming.N_l].shape[0]
-                        self.dec_fwd.n_frames -= x_chunk[
-                            (streaming.bd_offset + 1) * streaming.factor:streaming.N_l].shape[0] // streaming.factor
-                        # print('Back %d frames' % (x_chunk[(streaming.bd_offset + 1) * streaming.factor:streaming.N_l].shape[0]))
-
-                streaming.next_chunk()
-                if is_last_chunk:
-                    break
-
-            # Global decoding over the last chunk
-            if not params['recog_chunk_sync'] and len(streaming.eout_chunks) > 0:
-                eout = torch.cat(streaming.eout_chunks, dim=1)
-                elens = torch.IntTensor([eout.size(1)])
-                nbest_hyps_id_offline, _, _ = self.dec_fwd.beam_search(
-                    eout, elens, global_params, idx2token, lm, lm_second, None)
-                # print('MoChA: ' + idx2token(nbest_hyps_id_offline[0][0]))
-                # print('*' * 50)
-                if len(nbest_hyps_id_offline[0][0]) > 0:
-                    best_hyp_id_stream.extend(nbest_hyps_id_offline[0][0])
-
-            # pick up the best hyp
-            if not is_reset and params['recog_chunk_sync'] and len(best_hyp_id_prefix) > 0:
-                best_hyp_id_stream.extend(best_hyp_id_prefix)
-
-            if len(best_hyp_id_stream) > 0:
-                return [np.stack(best_hyp_id_stream, axis=0)], [None]
-            else:
-                return [[]], [None]
+        assert len(xs) == 1  # batch size
+        # assert params['recog_length_norm']
+        session = StreamingSession(self, params, idx2token, task)
+        session.feed(xs[0])
+        return [session.finalize()], [None]
 
     def streamable(self):
         return getattr(self.dec_fwd, 'streamable', False)
@@ -655,14 +534,13 @@ class Speech2Text(ModelBase):
                     params['recog_max_len_ratio'], idx2token,
                     exclude_eos, refs_id, utt_ids, speakers)
             else:
-                assert params['recog_batch_size'] == 1
-
                 ctc_log_probs = None
                 if params['recog_ctc_weight'] > 0:
                     ctc_log_probs = self.dec_fwd.ctc_log_probs(eout_dict[task]['xs'])
 
                 # forward-backward decoding
                 if params['recog_fwd_bwd_attention']:
+                    assert params['recog_batch_size'] == 1
                     lm_fwd = getattr(self, 'lm_fwd', None)
                     lm_bwd = getattr(self, 'lm_bwd', None)
 
@@ -6,15 +6,126 @@
 
 """Utility functions."""
 
+from contextlib import contextmanager
 import copy
 import numpy as np
 import torch
+import torch.nn.functional as F
+
+_ATTENTION_CAPTURE = False
+_ATTENTION_BACKEND = 'sdpa' if hasattr(F, 'scaled_dot_product_attention') else 'einsum'
 
 
 def repeat(module, n_layers):
     return torch.nn.ModuleList([copy.deepcopy(module) for _ in range(n_layers)])
 
 
+def is_attention_captured():
+    """Return whether attention weights are kept on the host for visualization."""
+    return _ATTENTION_CAPTURE
+
+
+def set_attention_capture(enabled):
+    """Turn on/off capturing attention weights for visualization.
+
+    Attention weights in all layers are copied to the host in every forward
+    pass in evaluation mode while this is on. This is off by default.
+
+    Args:
+        enabled (bool):
+
+    """
+    global _ATTENTION_CAPTURE
+    _ATTENTION_CAPTURE = enabled
+
+
+@contextmanager
+def capture_attention(enabled=True):
+    """Capture attention weights for visualization inside the context.
+
+    Args:
+        enabled (bool):
+
+    """
+    prev = is_attention_captured()
+    set_attention_capture(enabled)
+    try:
+        yield
+    finally:
+        set_attention_capture(prev)
+
+
+def get_attention_backend():
+    """Return the backend of scaled dot-product attention (einsum/sdpa)."""
+    return _ATTENTION_BACKEND
+
+
+def set_attention_backend(backend):
+    """Set the backend of scaled dot-product attention.
+
+    The fused kernel (sdpa) is used only when attention weights are not
+    requested. The einsum backend is the reference implementation.
+
+    Args:
+        backend (str): einsum/sdpa
+
+    """
+    global _ATTENTION_BACKEND
+    if backend not in ['einsum', 'sdpa']:
+        raise ValueError(backend)
+    if backend == 'sdpa' and not hasattr(F, 'scaled_dot_product_attention'):
+        raise ValueError('scaled_dot_product_attention is not supported in PyTorch %s.' % torch.__version__)
+    _ATTENTION_BACKEND = backend
+
+
+@contextmanager
+def attention_backend(backend):
+    """Switch the backend of scaled dot-product attention inside the context.
+
+    Args:
+        backend (str): einsum/sdpa
+
+    """
+    prev = get_attention_backend()
+    set_attention_backend(backend)
+    try:
+        yield
+    finally:
+        set_attention_backend(prev)
+
+
+def scaled_dot_product_attention(query, key, value, mask=None, dropout=0., bias=None):
+    """Fused scaled dot-product attention without materializing attention weights.
+
+    Args:
+        query (FloatTensor): `[B, H, qlen, d_k]`
+        key (FloatTensor): `[B, H, klen, d_k]`
+        value (FloatTensor): `[B, H, klen, d_k]`
+        mask (ByteTensor or FloatTensor): any shape broadcastable to `[B, H, qlen, klen]`.
+            Non-zero entries of a byte mask are attended, and a float mask is added to the energies.
+        dropout (float): dropout probability for attention weights
+        bias (FloatTensor): any shape broadcastable to `[B, H, qlen, klen]`, added to the energies
+    Returns:
+        cv (FloatTensor): `[B, H, qlen, d_k]`
+
+    """
+    is_byte_mask = mask is not None and not mask.is_floating_point()
+    if is_byte_mask:
+        # NOTE: a byte mask is folded into a finite bias as in the einsum path
+        # so that fully-masked rows result in uniform weights instead of NaN
+        NEG_INF = float(np.finfo(torch.tensor(0, dtype=query.dtype).numpy().dtype).min)
+        if bias is None:
+            bias = query.new_zeros(mask.size())
+        bias = bias.masked_fill(mask == 0, NEG_INF)
+    elif mask is not None:
+        bias = mask if bias is None else bias + mask
+    cv = F.scaled_dot_product_attention(query, key, value, attn_mask=bias, dropout_p=dropout)
+    if is_byte_mask:
+        # energies of fully-masked rows do not depend on query and key in the einsum path
+        cv = torch.where((mask != 0).any(-1, keepdim=True), cv, value.mean(-2, keepdim=True))
+    return cv
+
+
 def tensor2np(x):
     """Convert torch.Tensor to np.ndarray.
 
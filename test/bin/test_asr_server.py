@@ -0,0 +1,104 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for the ASR inference server."""
+
+import importlib
+import kaldiio
+import numpy as np
+import os
+import pytest
+import threading
+
+INPUT_DIM = 8
+N_REQUESTS = 10
+
+
+class DecodeFn(object):
+    """Decode function returning summaries of the inputs and recording batch sizes."""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def __call__(self, xs):
+        self.batch_sizes.append(len(xs))
+        return [{'text': 'len%d' % len(x), 'sum': float(x.sum())} for x in xs]
+
+
+def start_server(module, transport, batcher, tmp_path):
+    if transport == 'tcp':
+        server = module.ASRServer(('localhost', 0), batcher)
+        address = server.server_address[:2]
+    else:
+        address = os.path.join(str(tmp_path), 'asr.sock')
+        server = module.UnixASRServer(address, batcher)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, address
+
+
+@pytest.mark.parametrize("transport", ['tcp', 'unix'])
+@pytest.mark.parametrize("max_batch_size", [1, 4])
+def test_dynamic_batching(transport, max_batch_size, tmp_path):
+    module = importlib.import_module('neural_sp.bin.asr.server')
+    decode_fn = DecodeFn()
+    batcher = module.DynamicBatcher(decode_fn, max_batch_size=max_batch_size, max_wait=0.2)
+    server, address = start_server(module, transport, batcher, tmp_path)
+
+    rng = np.random.RandomState(0)
+    xs = [rng.randn(int(rng.randint(5, 50)), INPUT_DIM).astype(np.float32) for _ in range(N_REQUESTS)]
+    ark_path = os.path.join(str(tmp_path), 'feats.ark')
+    with kaldiio.WriteHelper('ark,scp:%s,%s' % (ark_path, os.path.join(str(tmp_path), 'feats.scp'))) as writer:
+        writer('utt0', xs[0])
+    with open(os.path.join(str(tmp_path), 'feats.scp')) as f:
+        ark = f.readline().strip().split(' ')[1]
+
+    # Send requests concurrently
+    results = [None] * N_REQUESTS
+
+    def send(i):
+        if i == 0:
+            results[i] = module.request_decode(address, ark=ark, utt_id='utt%d' % i)
+        else:
+            results[i] = module.request_decode(address, feat=xs[i], utt_id='utt%d' % i)
+
+    threads = [threading.Thread(target=send, args=(i,)) for i in range(N_REQUESTS)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+
+    try:
+        for i, result in enumerate(results):
+            assert result['utt_id'] == 'utt%d' % i
+            assert result['text'] == 'len%d' % len(xs[i])
+            assert np.allclose(result['sum'], xs[i].sum(), atol=1e-3)
+        assert sum(decode_fn.batch_sizes) == N_REQUESTS
+        assert max(decode_fn.batch_sizes) <= max_batch_size
+        if max_batch_size > 1:
+            assert len(decode_fn.batch_sizes) < N_REQUESTS
+
+        # Invalid requests
+        with pytest.raises(RuntimeError, match='400'):
+            module.request_decode(address)
+        with pytest.raises(RuntimeError, match='400'):
+            module.request_decode(address, feat=np.zeros(INPUT_DIM))
+    finally:
+        server.shutdown()
+        server.server_close()
+        batcher.close()
+    if transport == 'unix':
+        assert not os.path.exists(address)
+
+
+def test_decode_error():
+    module = importlib.import_module('neural_sp.bin.asr.server')
+
+    def decode_fn(xs):
+        raise ValueError('broken model')
+
+    batcher = module.DynamicBatcher(decode_fn, max_batch_size=2, max_wait=0.)
+    future = batcher.submit(np.zeros((3, INPUT_DIM)))
+    with pytest.raises(ValueError, match='broken model'):
+        future.result(timeout=10)
+    batcher.close()
@@ -0,0 +1,354 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for the ASR dataset."""
+
+import importlib
+import kaldiio
+import numpy as np
+import os
+import pandas as pd
+import pytest
+import random
+
+N_UTTS = 37
+INPUT_DIM = 8
+VOCAB = 20
+N_EPOCHS = 3
+
+
+def make_corpus(dir_path, n_sessions=3, sort_by_session=False):
+    rng = np.random.RandomState(0)
+    dict_path = os.path.join(dir_path, 'dict.txt')
+    with open(dict_path, 'w') as f:
+        f.write('<unk> 1\n<eos> 2\n<pad> 3\n')
+        for i in range(4, VOCAB):
+            f.write('w%d %d\n' % (i, i))
+
+    ark_path = os.path.join(dir_path, 'feats.ark')
+    tsv_path = os.path.join(dir_path, 'train.tsv')
+    with kaldiio.WriteHelper('ark,scp:%s,%s' % (ark_path, os.path.join(dir_path, 'feats.scp'))) as writer:
+        lines = ['utt_id\tspeaker\tfeat_path\txlen\txdim\ttext\ttoken_id\tylen\tydim']
+        for i in range(N_UTTS):
+            spk = i * n_sessions // N_UTTS if sort_by_session else i % n_sessions
+            utt_id = 'spk%d_%07d-%07d' % (spk, i * 100, i * 100 + 50)
+            xlen = int(rng.randint(40, 200))
+            ylen = int(rng.randint(1, 10))
+            writer(utt_id, rng.randn(xlen, INPUT_DIM).astype(np.float32))
+            token_id = [int(t) for t in rng.randint(4, VOCAB, ylen)]
+            text = ' '.join('w%d' % t for t in token_id)
+            lines.append('%s\tspk%d\t%s\t%d\t%d\t%s\t%s\t%d\t%d' % (
+                utt_id, spk, '', xlen, INPUT_DIM, text, ' '.join(map(str, token_id)), ylen, VOCAB))
+    # fill feature paths from the scp file
+    with open(os.path.join(dir_path, 'feats.scp')) as f:
+        feat_paths = [line.strip().split(' ')[1] for line in f]
+    with open(tsv_path, 'w') as f:
+        f.write(lines[0] + '\n')
+        for line, feat_path in zip(lines[1:], feat_paths):
+            cols = line.split('\t')
+            cols[2] = feat_path
+            f.write('\t'.join(cols) + '\n')
+    return tsv_path, dict_path
+
+
+def make_args(**kwargs):
+    args = dict(
+        unit='word',
+        batch_size=4,
+        min_n_frames=40,
+        max_n_frames=2000,
+        sort_by='input',
+        short2long=True,
+        shuffle_bucket=False,
+        dynamic_batching=False,
+    )
+    args.update(kwargs)
+    return args
+
+
+def iterate(dataset, n_epochs):
+    batches = []
+    while dataset.epoch < n_epochs:
+        batch, is_new_epoch = dataset.next()
+        batches.append((batch['utt_ids'], [len(x) for x in batch['xs']], batch['ys'], is_new_epoch))
+    return batches
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({}),
+        ({'shuffle_bucket': True}),
+        ({'dynamic_batching': True}),
+        ({'sort_stop_epoch': 2}),
+    ]
+)
+def test_prefetch(args, tmp_path):
+    tsv_path, dict_path = make_corpus(str(tmp_path))
+    args = make_args(**args)
+    module = importlib.import_module('neural_sp.datasets.asr')
+
+    random.seed(1)
+    np.random.seed(1)
+    dataset = module.Dataset(tsv_path=tsv_path, dict_path=dict_path, **args)
+    batches_ref = iterate(dataset, N_EPOCHS)
+
+    for n_workers in [1, 3]:
+        random.seed(1)
+        np.random.seed(1)
+        dataset = module.Dataset(tsv_path=tsv_path, dict_path=dict_path,
+                                 n_workers=n_workers, n_prefetch=3, **args)
+        epoch_detail_prev = 0
+        batches = []
+        while dataset.epoch < N_EPOCHS:
+            batch, is_new_epoch = dataset.next()
+            batches.append((batch['utt_ids'], [len(x) for x in batch['xs']], batch['ys'], is_new_epoch))
+            if not is_new_epoch:
+                assert dataset.epoch_detail > epoch_detail_prev
+                epoch_detail_prev = dataset.epoch_detail
+            else:
+                assert dataset.epoch_detail == 0
+                epoch_detail_prev = 0
+        assert batches == batches_ref
+
+        # reset in the middle of an epoch
+        dataset.reset()
+        batch, _ = dataset.next()
+        assert len(batch['utt_ids']) > 0
+        dataset.close()
+        assert dataset.executor is None
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({}),
+        ({'shuffle_bucket': True}),
+    ]
+)
+def test_prefetch_change_batch_size(args, tmp_path):
+    tsv_path, dict_path = make_corpus(str(tmp_path))
+    args = make_args(**args)
+    module = importlib.import_module('neural_sp.datasets.asr')
+
+    dataset = module.Dataset(tsv_path=tsv_path, dict_path=dict_path, **args)
+    utt_ids_ref = sorted(sum([utt_ids for utt_ids, _, _, _ in iterate(dataset, 1)], []))
+
+    dataset = module.Dataset(tsv_path=tsv_path, dict_path=dict_path,
+                             n_workers=2, n_prefetch=3, **args)
+    for epoch in range(N_EPOCHS):
+        utt_ids = []
+        is_new_epoch = False
+        step = 0
+        while not is_new_epoch:
+            batch_size = 1 if step % 3 == 2 else None
+            batch, is_new_epoch = dataset.next(batch_size=batch_size)
+            if batch_size == 1 and not args.get('shuffle_bucket', False):
+                assert len(batch['utt_ids']) == 1
+            utt_ids += batch['utt_ids']
+            step += 1
+        # every utterance is consumed exactly once per epoch
+        assert sorted(utt_ids) == utt_ids_ref
+    dataset.close()
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({}),
+        ({'shuffle_bucket': True}),
+        ({'n_workers': 2}),
+    ]
+)
+def test_token_store(args, tmp_path):
+    tsv_path, dict_path = make_corpus(str(tmp_path))
+    args = make_args(**args)
+    module = importlib.import_module('neural_sp.datasets.asr')
+
+    random.seed(1)
+    np.random.seed(1)
+    dataset = module.Dataset(tsv_path=tsv_path, dict_path=dict_path, **args)
+    batches_ref = iterate(dataset, N_EPOCHS)
+
+    for _ in range(2):  # build and reuse the store
+        random.seed(1)
+        np.random.seed(1)
+        dataset = module.Dataset(tsv_path=tsv_path, dict_path=dict_path,
+                                 token_store=True, **args)
+        assert 'token_id' not in dataset.df.columns
+        batches = iterate(dataset, N_EPOCHS)
+        assert batches == batches_ref
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({'ctc': True, 'subsample_factor': 8}),
+        ({'min_n_frames': 100, 'max_n_frames': 150}),
+        ({'sort_by': 'output', 'short2long': False}),
+        ({'sort_by': 'shuffle'}),
+        ({'is_test': True, 'first_n_utterances': 10}),
+        ({'is_test': True, 'first_n_utterances': 10, 'sort_by': 'output'}),
+    ]
+)
+def test_filtering(args, tmp_path):
+    tsv_path, dict_path = make_corpus(str(tmp_path))
+    args = make_args(**args)
+    module = importlib.import_module('neural_sp.datasets.asr')
+    dataset = module.Dataset(tsv_path=tsv_path, dict_path=dict_path, **args)
+
+    df = pd.read_csv(tsv_path, encoding='utf-8', delimiter='\t')
+    if args.get('is_test', False):
+        df = df[df['ylen'] > 0][:args['first_n_utterances']]
+    else:
+        df = df[[args['min_n_frames'] <= xlen <= args['max_n_frames'] and ylen > 0
+                 for xlen, ylen in zip(df['xlen'], df['ylen'])]]
+        if args.get('ctc', False):
+            df = df[[ylen <= xlen // args['subsample_factor']
+                     for xlen, ylen in zip(df['xlen'], df['ylen'])]]
+    assert sorted(dataset.df['utt_id']) == sorted(df['utt_id'])
+    # NOTE: test sets are sorted only by input length
+    if args['sort_by'] == 'input' or (args['sort_by'] == 'output' and not args.get('is_test', False)):
+        lens = dataset.df['xlen' if args['sort_by'] == 'input' else 'ylen'].values
+        assert (np.diff(lens) >= 0).all() if args['short2long'] else (np.diff(lens) <= 0).all()
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({'is_test': True}),
+        ({'is_test': True, 'short2long': False}),
+        ({'is_test': True, 'sort_by': 'utt_id'}),
+        ({'sort_by': 'shuffle'}),
+    ]
+)
+def test_utt_indices(args, tmp_path):
+    tsv_path, dict_path = make_corpus(str(tmp_path))
+    args = make_args(**args)
+    module = importlib.import_module('neural_sp.datasets.asr')
+    dataset = module.Dataset(tsv_path=tsv_path, dict_path=dict_path, **args)
+
+    utt_ids, utt_indices = [], []
+    while True:
+        batch, is_new_epoch = dataset.next()
+        utt_ids += batch['utt_ids']
+        utt_indices += batch['utt_indices']
+        if is_new_epoch:
+            break
+
+    # the original order is restored by the positions in the tsv file
+    df = pd.read_csv(tsv_path, encoding='utf-8', delimiter='\t')
+    df = df[df['utt_id'].isin(utt_ids)]
+    assert [utt_id for _, utt_id in sorted(zip(utt_indices, utt_ids))] == df['utt_id'].tolist()
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({'batch_size': 1}),
+        ({'batch_size': 2}),
+        ({'batch_size': 2, 'shuffle_bucket': True}),
+    ]
+)
+def test_discourse_aware(args, tmp_path):
+    tsv_path, dict_path = make_corpus(str(tmp_path), n_sessions=4, sort_by_session=True)
+    args = make_args(**args)
+    module = importlib.import_module('neural_sp.datasets.asr')
+    dataset = module.Dataset(tsv_path=tsv_path, dict_path=dict_path, corpus='swbd',
+                             discourse_aware=True, **args)
+    df = dataset.df
+
+    # Compare with the brute-force search
+    for i in df.index:
+        same_session = df[df['session'] == df['session'][i]]
+        prev_utt = same_session[same_session['onset'] < df['onset'][i]]['line_no'].tolist()
+        assert sorted(df['prev_utt'][i]) == sorted(prev_utt)
+        assert df['n_prev_utt'][i] == len(prev_utt)
+        assert df['n_utt_in_session'][i] == len(same_session)
+
+    # All utterances are consumed in the order of onset in each session
+    utt_ids = []
+    while True:
+        batch, is_new_epoch = dataset.next()
+        assert len(set(batch['sessions'])) == len(batch['sessions'])
+        utt_ids += batch['utt_ids']
+        if is_new_epoch:
+            break
+    assert sorted(utt_ids) == sorted(df['utt_id'])
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({}),
+        ({'shuffle_bucket': True, 'dynamic_batching': True}),
+        ({'token_store': True}),
+        ({'is_test': True}),
+    ]
+)
+def test_index_cache(args, tmp_path, monkeypatch):
+    tsv_path, dict_path = make_corpus(str(tmp_path))
+    args = make_args(**args)
+    module = importlib.import_module('neural_sp.datasets.asr')
+
+    random.seed(1)
+    dataset = module.Dataset(tsv_path=tsv_path, dict_path=dict_path, **args)
+    batches_ref = iterate(dataset, N_EPOCHS)
+
+    # The first run writes the cache
+    random.seed(1)
+    dataset = module.Dataset(tsv_path=tsv_path, dict_path=dict_path, index_cache=True, **args)
+    assert len(os.listdir(tsv_path + '.index_cache')) == 1
+    assert iterate(dataset, N_EPOCHS) == batches_ref
+
+    # The second run does not parse the tsv file
+    with monkeypatch.context() as m:
+        m.setattr(module.pd, 'read_csv', None)
+        m.setattr(module.kaldiio, 'load_mat', None)
+        random.seed(1)
+        dataset_cached = module.Dataset(tsv_path=tsv_path, dict_path=dict_path, index_cache=True, **args)
+    assert dataset_cached.input_dim == INPUT_DIM
+    assert iterate(dataset_cached, N_EPOCHS) == batches_ref
+
+    # Different filtering options use another cache
+    module.Dataset(tsv_path=tsv_path, dict_path=dict_path, index_cache=True,
+                   **make_args(**dict(args, min_n_frames=100)))
+    assert len(os.listdir(tsv_path + '.index_cache')) == 2
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({'max_n_frames_batch': 400}),
+        ({'max_n_frames_batch': 400, 'short2long': False}),
+        ({'max_n_padded_frames_batch': 500}),
+        ({'max_n_frames_batch': 400, 'max_n_padded_frames_batch': 500, 'batch_size': 3}),
+        ({'max_n_frames_batch': 400, 'shuffle_bucket': True}),
+        ({'max_n_frames_batch': 400, 'dynamic_batching': True}),
+        ({'max_n_frames_batch': 100}),  # smaller than some utterances
+    ]
+)
+def test_frame_budget(args, tmp_path):
+    tsv_path, dict_path = make_corpus(str(tmp_path))
+    args = make_args(**dict({'batch_size': 100}, **args))
+    module = importlib.import_module('neural_sp.datasets.asr')
+    dataset = module.Dataset(tsv_path=tsv_path, dict_path=dict_path,
+                             tsv_path_sub1=tsv_path, dict_path_sub1=dict_path, **args)
+
+    max_n_frames_batch = args['max_n_frames_batch'] if 'max_n_frames_batch' in args else 1e10
+    max_n_padded_frames_batch = args.get('max_n_padded_frames_batch', 1e10)
+    utt_ids = []
+    while True:
+        batch, is_new_epoch = dataset.next()
+        xlens = [len(x) for x in batch['xs']]
+        assert len(xlens) <= args['batch_size']
+        if len(xlens) > 1:
+            assert sum(xlens) <= max_n_frames_batch
+            assert max(xlens) * len(xlens) <= max_n_padded_frames_batch
+        assert batch['ys'] == batch['ys_sub1']
+        utt_ids += batch['utt_ids']
+        if is_new_epoch:
+            break
+    assert len(set(utt_ids)) == len(utt_ids)
+    if not args['shuffle_bucket']:
+        assert sorted(utt_ids) == sorted(dataset.df['utt_id'])
@@ -0,0 +1,66 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for the LM dataset."""
+
+import importlib
+import numpy as np
+import os
+import pytest
+
+N_UTTS = 53
+VOCAB = 20
+
+
+def make_corpus(dir_path):
+    rng = np.random.RandomState(0)
+    dict_path = os.path.join(dir_path, 'dict.txt')
+    with open(dict_path, 'w') as f:
+        f.write('<unk> 1\n<eos> 2\n<pad> 3\n')
+        for i in range(4, VOCAB):
+            f.write('w%d %d\n' % (i, i))
+
+    tsv_path = os.path.join(dir_path, 'train.tsv')
+    with open(tsv_path, 'w') as f:
+        f.write('utt_id\tspeaker\tfeat_path\txlen\txdim\ttext\ttoken_id\tylen\tydim\n')
+        for i in range(N_UTTS):
+            ylen = int(rng.randint(0, 10))
+            token_id = [int(t) for t in rng.randint(4, VOCAB, ylen)]
+            text = ' '.join('w%d' % t for t in token_id)
+            f.write('utt%03d\tspk\t\t%d\t%d\t%s\t%s\t%d\t%d\n' % (
+                i, ylen, VOCAB, text, ' '.join(map(str, token_id)), ylen, VOCAB))
+    return tsv_path, dict_path
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({}),
+        ({'backward': True}),
+        ({'shuffle': True}),
+        ({'batch_size': 1}),
+    ]
+)
+def test_token_store(args, tmp_path):
+    tsv_path, dict_path = make_corpus(str(tmp_path))
+    kwargs = dict(unit='word', batch_size=3, bptt=5)
+    kwargs.update(args)
+    module = importlib.import_module('neural_sp.datasets.lm')
+
+    np.random.seed(1)
+    dataset = module.Dataset(tsv_path=tsv_path, dict_path=dict_path, **kwargs)
+    concat_ids_ref = [dataset.concat_ids]
+    for _ in range(2):
+        dataset.reset()
+        concat_ids_ref.append(dataset.concat_ids)
+
+    np.random.seed(1)
+    dataset = module.Dataset(tsv_path=tsv_path, dict_path=dict_path, token_store=True, **kwargs)
+    concat_ids = [dataset.concat_ids]
+    for _ in range(2):
+        dataset.reset()
+        concat_ids.append(dataset.concat_ids)
+
+    for ids, ids_ref in zip(concat_ids, concat_ids_ref):
+        assert ids.dtype == ids_ref.dtype
+        assert np.array_equal(ids, ids_ref)
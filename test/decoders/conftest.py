@@ -0,0 +1,24 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Shared fixtures for decoder tests."""
+
+import argparse
+import importlib
+import pytest
+
+
+@pytest.fixture
+def make_lm():
+    """Factory of a small RNNLM for shallow fusion and rescoring."""
+    module = importlib.import_module('neural_sp.models.lm.rnnlm')
+
+    def _make_lm(vocab):
+        args = argparse.Namespace(
+            lm_type='lstm', n_units=32, n_projs=0, n_layers=1, residual=False, use_glu=False,
+            n_units_null_context=0, bottleneck_dim=32, emb_dim=16, vocab=vocab,
+            dropout_in=0.1, dropout_hidden=0.1, lsm_prob=0.0, param_init=0.1,
+            adaptive_softmax=False, tie_embedding=False)
+        return module.RNNLM(args)
+
+    return _make_lm
@@ -0,0 +1,131 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for CTC decoding."""
+
+import importlib
+import itertools
+import numpy as np
+import pytest
+import torch
+
+BLANK = 0
+EOS = 2
+VOCAB = 4
+ENC_N_UNITS = 16
+
+
+def brute_force_scores(log_probs, lm, lm_weight, lp_weight):
+    """Score all label sequences that can be emitted from `log_probs`."""
+    xmax = log_probs.size(0)
+    scores = {}
+    for ylen in range(xmax + 1):
+        for y in itertools.product(range(1, VOCAB), repeat=ylen):
+            score_ctc = -torch.nn.functional.ctc_loss(
+                log_probs.unsqueeze(1), torch.tensor([y], dtype=torch.int64),
+                [xmax], [ylen], blank=BLANK, reduction='sum').item()
+            if np.isinf(score_ctc):
+                continue
+            score_lm = 0.
+            if lm is not None and ylen > 0:
+                ys = torch.tensor([(EOS,) + y], dtype=torch.int64)
+                _, _, lm_log_probs = lm.predict(ys[:, :-1], None)
+                score_lm = lm_log_probs[0, torch.arange(ylen), ys[0, 1:]].sum().item() * lm_weight
+            scores[y] = (score_ctc, score_lm, score_ctc + score_lm + ylen * lp_weight)
+    return scores
+
+
+@pytest.mark.parametrize(
+    "lm_weight, lp_weight",
+    [
+        (0., 0.),
+        (0., 1.),
+        (0.5, 0.),
+        (0.5, 1.),
+    ]
+)
+def test_prefix_beam_search(lm_weight, lp_weight, make_lm):
+    torch.manual_seed(1)
+    xmax = 5
+    log_probs = torch.log_softmax(torch.randn(xmax, VOCAB, dtype=torch.float64) * 2, dim=-1)
+    lm = None
+    if lm_weight > 0:
+        lm = make_lm(VOCAB).double()
+        lm.eval()
+    scores_ref = brute_force_scores(log_probs, lm, lm_weight, lp_weight)
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.ctc')
+    with torch.no_grad():
+        # The beam is large enough to keep all prefixes, so that the search is exact
+        beam_search = module.CTCPrefixBeamSearch(BLANK, EOS, 1000, lp_weight, lm=lm, lm_weight=lm_weight)
+        beam = beam_search(log_probs)
+        beam = [hyp for hyp in beam if hyp['score_ctc'] > module.LOG_0 / 2]
+        assert sorted(tuple(hyp['hyp'][1:]) for hyp in beam) == sorted(scores_ref.keys())
+        for hyp in beam:
+            score_ctc, score_lm, score = scores_ref[tuple(hyp['hyp'][1:])]
+            assert np.allclose(hyp['score_ctc'], score_ctc)
+            assert np.allclose(hyp['score_lm'], score_lm)
+            assert np.allclose(hyp['score'], score)
+        assert beam[0]['hyp'][1:] == list(max(scores_ref, key=lambda y: scores_ref[y][2]))
+
+        # Prefix probabilities are lower bounds after pruning
+        beam_search = module.CTCPrefixBeamSearch(BLANK, EOS, 3, lp_weight, lm=lm, lm_weight=lm_weight)
+        beam = beam_search(log_probs)
+        assert len(beam) <= 3
+        assert [hyp['score'] for hyp in beam] == sorted([hyp['score'] for hyp in beam], reverse=True)
+        for hyp in beam:
+            score_ctc, score_lm, _ = scores_ref[tuple(hyp['hyp'][1:])]
+            assert hyp['score_ctc'] <= score_ctc + 1e-6
+            assert np.allclose(hyp['score_lm'], score_lm)
+
+
+@pytest.mark.parametrize("elens", [[20], [20, 20], [20, 13, 1, 7]])
+def test_greedy(elens):
+    torch.manual_seed(1)
+    batch_size = len(elens)
+    xmax = max(elens)
+    eouts = torch.randn(batch_size, xmax, ENC_N_UNITS)
+    elens = torch.IntTensor(elens)
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.ctc')
+    ctc = module.CTC(eos=EOS, blank=BLANK, enc_n_units=ENC_N_UNITS, vocab=VOCAB)
+    ctc.eval()
+    with torch.no_grad():
+        hyps = ctc.greedy(eouts, elens)
+        trigger_points = ctc.trigger_points(eouts, elens)
+        best_paths = ctc.output(eouts).argmax(-1)
+
+    # Compare with collapsing the best path of each utterance frame by frame
+    assert len(hyps) == batch_size
+    ymax = 0
+    for b in range(batch_size):
+        path = best_paths[b, :elens[b]].tolist()
+        hyp_ref = [c for c, _ in itertools.groupby(path) if c != BLANK]
+        triggers_ref = [t for t in range(elens[b])
+                        if path[t] != BLANK and (t == 0 or path[t] != path[t - 1])]
+        assert hyps[b].tolist() == hyp_ref
+        assert trigger_points[b, :len(triggers_ref)].tolist() == triggers_ref
+        assert (trigger_points[b, len(triggers_ref):] == 0).all()
+        ymax = max(ymax, len(hyp_ref))
+    assert trigger_points.size() == (batch_size, ymax + 1)
+
+
+@pytest.mark.parametrize("elens", [[20], [20, 13, 1, 7]])
+def test_beam_search(elens):
+    torch.manual_seed(1)
+    batch_size = len(elens)
+    xmax = max(elens)
+    eouts = torch.randn(batch_size, xmax, ENC_N_UNITS)
+    params = {'recog_beam_width': 4, 'recog_length_penalty': 0.,
+              'recog_lm_weight': 0., 'recog_lm_second_weight': 0., 'recog_lm_bwd_weight': 0.}
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.ctc')
+    ctc = module.CTC(eos=EOS, blank=BLANK, enc_n_units=ENC_N_UNITS, vocab=VOCAB)
+    ctc.eval()
+    with torch.no_grad():
+        hyps = ctc.beam_search(eouts, elens, params, idx2token=None)
+        # hypotheses of different lengths are returned as a list
+        assert len(hyps) == batch_size
+        for b in range(batch_size):
+            hyps_b = ctc.beam_search(eouts[b:b + 1, :elens[b]], elens[b:b + 1], params, idx2token=None)
+            assert hyps[b].tolist() == hyps_b[0].tolist()
@@ -0,0 +1,175 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for CTC prefix scoring."""
+
+import importlib
+import numpy as np
+import pytest
+import torch
+
+BLANK = 0
+EOS = 2
+VOCAB = 10
+
+
+def make_hyps():
+    return [[EOS], [EOS, 3], [EOS, 3, 4], [EOS, 5, 5], [EOS, 4, 0, 4]]
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({'backward': False}),
+        ({'backward': True}),
+    ]
+)
+def test_batch(args):
+    torch.manual_seed(1)
+    batch_size = 3
+    xmax = 30
+    xlens = [30, 22, 15]
+    log_probs = torch.log_softmax(torch.randn(batch_size, xmax, VOCAB) * 2, dim=-1)
+    cs = torch.LongTensor([[3, 4, 5, 2, 1]])
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.ctc')
+    scorer = module.CTCPrefixScoreTH(log_probs, xlens, BLANK, EOS, **args)
+    ctc_states_init = scorer.initial_state()
+    assert ctc_states_init.size() == (batch_size, xmax, 2)
+
+    hyps, batch_ids, ctc_states = [], [], []
+    scores_ref = []
+    for b in range(batch_size):
+        log_probs_b = log_probs[b, :xlens[b]].numpy()
+        if args['backward']:
+            log_probs_b = log_probs_b[::-1]
+        scorer_ref = module.CTCPrefixScore(log_probs_b, BLANK, EOS)
+
+        for hyp in make_hyps():
+            # Compute CTC states of the prefix label by label
+            r_ref = scorer_ref.initial_state()
+            r = ctc_states_init[b]
+            for i in range(1, len(hyp)):
+                _, r_ref = scorer_ref(hyp[:i], np.array(hyp[i:i + 1]), r_ref)
+                _, r = scorer([hyp[:i]], torch.LongTensor([hyp[i:i + 1]]), r.unsqueeze(0), [b])
+                r_ref, r = r_ref[0], r[0, 0]
+            scores_ref.append(scorer_ref(hyp, cs[0].numpy(), r_ref)[0])
+            hyps.append(hyp)
+            batch_ids.append(b)
+            ctc_states.append(r)
+
+    # All hypotheses in all utterances at once
+    scores, new_ctc_states = scorer(hyps, cs.repeat([len(hyps), 1]), torch.stack(ctc_states), batch_ids)
+    assert scores.size() == (len(hyps), cs.size(1))
+    assert new_ctc_states.size() == (len(hyps), cs.size(1), xmax, 2)
+    assert np.allclose(scores.numpy(), np.stack(scores_ref), atol=1e-3)
+
+
+@pytest.mark.parametrize("margin", [3, 10, 100])
+def test_window(margin):
+    torch.manual_seed(1)
+    xmax = 60
+    log_probs = torch.log_softmax(torch.randn(1, xmax, VOCAB) * 3, dim=-1)
+    cs = np.array([3, 4, 5, 2, 1, 6])
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.ctc')
+    scorer_full = module.CTCPrefixScore(log_probs[0].numpy(), BLANK, EOS)
+    scorer_np = module.CTCPrefixScore(log_probs[0].numpy(), BLANK, EOS, margin=margin)
+    scorer_th = module.CTCPrefixScoreTH(log_probs, [xmax], BLANK, EOS, margin=margin)
+
+    hyp = [EOS, 3, 4, 5, 3, 4]
+    r_full = scorer_full.initial_state()
+    r_np = scorer_np.initial_state()
+    r_th = scorer_th.initial_state()[0]
+    for i in range(1, len(hyp)):
+        scores_full, r_full = scorer_full(hyp[:i], cs, r_full)
+        scores_np, r_np = scorer_np(hyp[:i], cs, r_np)
+        scores_th, r_th = scorer_th([hyp[:i]], torch.from_numpy(cs).unsqueeze(0), r_th.unsqueeze(0))
+        assert np.allclose(scores_np, scores_th[0].numpy(), atol=1e-3)
+        # frames outside the window are ignored
+        assert (scores_np <= scores_full + 1e-3).all()
+        if margin >= xmax:
+            assert np.allclose(scores_np, scores_full, atol=1e-3)
+        k = list(cs).index(hyp[i])
+        r_full, r_np, r_th = r_full[k], r_np[k], r_th[0, k]
+
+
+def decode_chunks(scorer, log_probs, chunk_size, cs, n_steps=3, scorer_ref=None):
+    """Extend prefixes with fixed labels in each chunk and return scores of all steps."""
+    beam = [([EOS], None, None)]  # (hyp, ctc_state, ctc_state_ref)
+    scores = []
+    for t in range(0, len(log_probs), chunk_size):
+        scorer.register_new_chunk(log_probs[t:t + chunk_size])
+        if scorer_ref is not None and t > 0:
+            scorer_ref.register_new_chunk(log_probs[t:t + chunk_size])
+        if t == 0:
+            beam = [([EOS], scorer.initial_state(),
+                     scorer_ref.initial_state() if scorer_ref is not None else None)]
+        else:
+            # all hypotheses at once
+            ctc_states = scorer.extend_states(np.stack([r for _, r, _ in beam]))
+            assert ctc_states.shape == (len(beam), len(scorer.log_probs), 2)
+            beam = [(hyp, ctc_states[i], r_ref) for i, (hyp, _, r_ref) in enumerate(beam)]
+
+        for step in range(n_steps):
+            new_beam = []
+            for hyp, r, r_ref in beam:
+                scores_hyp, new_r = scorer(hyp, cs, r)
+                scores.append(scores_hyp)
+                if scorer_ref is not None:
+                    scores_ref, new_r_ref = scorer_ref(hyp, cs, r_ref, new_chunk=(step == 0 and t > 0))
+                    assert np.allclose(scores_hyp, scores_ref, atol=1e-3)
+                    assert np.allclose(new_r, new_r_ref, atol=1e-3)
+                for k in [step % 3, 4 + step % 2]:
+                    new_beam.append((hyp + [int(cs[k])], new_r[k],
+                                     new_r_ref[k] if scorer_ref is not None else None))
+            beam = new_beam[:4]
+    return scores
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({'chunk_size': 8, 'margin': 0}),
+        ({'chunk_size': 8, 'margin': 5}),
+        ({'chunk_size': 13, 'margin': 0}),
+        ({'chunk_size': 60, 'margin': 0}),
+    ]
+)
+def test_streaming(args):
+    torch.manual_seed(1)
+    xmax = 60
+    log_probs = torch.log_softmax(torch.randn(xmax, VOCAB) * 3, dim=-1).numpy()
+    cs = np.array([3, 4, 5, 2, 1, 6])
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.ctc')
+    scorer = module.CTCPrefixScoreStreaming(BLANK, EOS, margin=args['margin'], init_capacity=4)
+    scorer_ref = module.CTCPrefixScore(log_probs[:args['chunk_size']], BLANK, EOS, margin=args['margin'])
+    decode_chunks(scorer, log_probs, args['chunk_size'], cs, scorer_ref=scorer_ref)
+    assert len(scorer.log_probs) == xmax
+    assert np.array_equal(scorer.log_probs, log_probs)
+
+
+@pytest.mark.parametrize("horizon", [10, 24, 100])
+def test_horizon(horizon):
+    torch.manual_seed(1)
+    xmax = 90
+    chunk_size = 8
+    log_probs = torch.log_softmax(torch.randn(xmax, VOCAB) * 3, dim=-1).numpy()
+    cs = np.array([3, 4, 5, 2, 1, 6])
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.ctc')
+    scorer_full = module.CTCPrefixScoreStreaming(BLANK, EOS, init_capacity=chunk_size)
+    scorer = module.CTCPrefixScoreStreaming(BLANK, EOS, horizon=horizon, init_capacity=chunk_size)
+    scores_full = decode_chunks(scorer_full, log_probs, chunk_size, cs)
+    scores = decode_chunks(scorer, log_probs, chunk_size, cs)
+
+    # only the latest frames are kept
+    assert len(scorer.log_probs) == min(horizon, xmax)
+    assert np.array_equal(scorer.log_probs, log_probs[-horizon:])
+    assert len(scorer.buffer) <= 2 * (horizon + chunk_size)
+    if horizon >= xmax:
+        assert np.allclose(np.stack(scores), np.stack(scores_full), atol=1e-3)
+    else:
+        # frames out of the horizon are ignored
+        assert (np.stack(scores) <= np.stack(scores_full) + 1e-3).all()
@@ -4,6 +4,7 @@
 """Test for attention-based RNN decoder."""
 
 import importlib
+import logging
 import numpy as np
 import pytest
 import torch
@@ -136,3 +137,155 @@ def test_forward(args):
     assert loss.size(0) == 1
     assert loss.item() >= 0
     assert isinstance(observation, dict)
+
+
+def make_decode_params(**kwargs):
+    params = dict(
+        recog_batch_size=1,
+        recog_beam_width=1,
+        recog_ctc_weight=0.0,
+        recog_ctc_prefix_margin=0,
+        recog_ctc_prefix_horizon=0,
+        recog_lm_weight=0.0,
+        recog_lm_second_weight=0.0,
+        recog_lm_bwd_weight=0.0,
+        recog_max_len_ratio=1.0,
+        recog_min_len_ratio=0.0,
+        recog_length_penalty=0.0,
+        recog_coverage_penalty=0.0,
+        recog_coverage_threshold=0.0,
+        recog_length_norm=False,
+        recog_gnmt_decoding=False,
+        recog_eos_threshold=1.0,
+        recog_asr_state_carry_over=False,
+        recog_lm_state_carry_over=False,
+        recog_softmax_smoothing=1.0,
+    )
+    params.update(kwargs)
+    return params
+
+
+@pytest.mark.parametrize(
+    "args, params",
+    [
+        ({}, {'recog_beam_width': 1}),
+        ({}, {'recog_beam_width': 4}),
+        ({}, {'recog_beam_width': 4, 'recog_min_len_ratio': 0.1, 'recog_max_len_ratio': 0.5}),
+        ({'rnn_type': 'gru'}, {'recog_beam_width': 4}),
+        ({'attn_type': 'add', 'attn_n_heads': 4}, {'recog_beam_width': 4}),
+        ({}, {'recog_beam_width': 4, 'recog_length_penalty': 0.1}),
+        ({}, {'recog_beam_width': 4, 'recog_length_penalty': 0.1, 'recog_gnmt_decoding': True}),
+        ({}, {'recog_beam_width': 4, 'recog_coverage_penalty': 0.1}),
+        ({}, {'recog_beam_width': 4, 'recog_coverage_penalty': 0.1, 'recog_coverage_threshold': 0.1}),
+        ({}, {'recog_beam_width': 4, 'recog_length_norm': True}),
+        ({}, {'recog_beam_width': 4, 'recog_lm_weight': 0.3}),
+        ({}, {'recog_beam_width': 4, 'recog_ctc_weight': 0.3}),
+        ({}, {'recog_beam_width': 4, 'recog_ctc_weight': 0.3, 'recog_lm_weight': 0.3}),
+        ({'backward': True}, {'recog_beam_width': 4, 'recog_ctc_weight': 0.3}),
+        ({}, {'recog_beam_width': 4, 'recog_lm_second_weight': 0.3, 'recog_lm_bwd_weight': 0.3}),
+    ]
+)
+def test_batch_beam_search(args, params, make_lm):
+    args = make_args(**args)
+    params = make_decode_params(**params)
+    nbest = min(2, params['recog_beam_width'])
+
+    batch_size = 4
+    xmax = 40
+    device_id = -1
+    elens = [40, 33, 27, 18]
+    eouts = np.random.randn(batch_size, xmax, ENC_N_UNITS).astype(np.float32)
+    eouts = pad_list([np2tensor(x[:elen], device_id).double() for x, elen in zip(eouts, elens)], 0.)
+    elens = torch.IntTensor(elens)
+    ctc_log_probs = None
+    if params['recog_ctc_weight'] > 0:
+        ctc_log_probs = torch.log_softmax(torch.randn(batch_size, xmax, VOCAB).double(), dim=-1)
+    lm = make_lm(VOCAB).double().eval() if params['recog_lm_weight'] > 0 else None
+    lm_second = make_lm(VOCAB).double().eval() if params['recog_lm_second_weight'] > 0 else None
+    lm_second_bwd = make_lm(VOCAB).double().eval() if params['recog_lm_bwd_weight'] > 0 else None
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.las')
+    dec = module.RNNDecoder(**args)
+    dec.double().eval()  # avoid near-ties among hypotheses of the untrained model
+    with torch.no_grad():
+        hyps, aws, scores = dec.beam_search(eouts, elens, params, lm=lm,
+                                            lm_second=lm_second, lm_second_bwd=lm_second_bwd,
+                                            ctc_log_probs=ctc_log_probs,
+                                            nbest=nbest, exclude_eos=True)
+        assert len(hyps) == batch_size
+        # Compare with decoding one utterance at a time
+        for b in range(batch_size):
+            hyps_b, aws_b, scores_b = dec.beam_search(
+                eouts[b:b + 1, :elens[b]], elens[b:b + 1], params, lm=lm,
+                lm_second=lm_second, lm_second_bwd=lm_second_bwd,
+                ctc_log_probs=ctc_log_probs[b:b + 1, :elens[b]] if ctc_log_probs is not None else None,
+                nbest=nbest, exclude_eos=True)
+            assert len(hyps[b]) == nbest
+            for n in range(nbest):
+                assert hyps[b][n].tolist() == hyps_b[0][n].tolist()
+            assert np.allclose(scores[b], scores_b[0], atol=1e-4)
+            assert aws[b].shape == aws_b[0].shape
+            assert np.allclose(aws[b], aws_b[0], atol=1e-4)
+
+
+class Idx2Token(object):
+
+    def __init__(self, vocab):
+        self.vocab = vocab
+
+    def __call__(self, token_ids):
+        return ' '.join(map(str, token_ids))
+
+
+@pytest.mark.parametrize("batch_size", [1, 4])
+def test_beam_search_logging(batch_size, make_lm, caplog):
+    args = make_args()
+    params = make_decode_params(recog_beam_width=4, recog_ctc_weight=0.3, recog_lm_weight=0.3,
+                                recog_lm_second_weight=0.3, recog_lm_bwd_weight=0.3)
+
+    xmax = 40
+    device_id = -1
+    elens = [40, 33, 27, 18][:batch_size]
+    eouts = np.random.randn(batch_size, xmax, ENC_N_UNITS).astype(np.float32)
+    eouts = pad_list([np2tensor(x[:elen], device_id) for x, elen in zip(eouts, elens)], 0.)
+    elens = torch.IntTensor(elens)
+    ctc_log_probs = torch.log_softmax(torch.randn(batch_size, xmax, VOCAB), dim=-1)
+    lm = make_lm(VOCAB).eval()
+    lm_second = make_lm(VOCAB).eval()
+    lm_second_bwd = make_lm(VOCAB).eval()
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.las')
+    dec = module.RNNDecoder(**args)
+    dec.eval()
+    caplog.set_level(logging.INFO, logger=module.__name__)
+    with torch.no_grad():
+        hyps, _, _ = dec.beam_search(eouts, elens, params, idx2token=Idx2Token(VOCAB), lm=lm,
+                                     lm_second=lm_second, lm_second_bwd=lm_second_bwd,
+                                     ctc_log_probs=ctc_log_probs,
+                                     utt_ids=['utt%d' % b for b in range(batch_size)])
+    assert len(hyps) == batch_size
+    assert 'second-path lm, reverse' in caplog.text
+
+
+@pytest.mark.parametrize("reverse", [False, True])
+def test_lm_rescoring(reverse, make_lm):
+    args = make_args()
+    lm = make_lm(VOCAB).double().eval()
+    eos = args['special_symbols']['eos']
+    hyps_ids = [[eos], [eos, 5], [eos, 5, 6, 7], [eos, 4, 4, 4, 4, 4, eos], [eos, 9, eos]]
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.las')
+    dec = module.RNNDecoder(**args)
+    with torch.no_grad():
+        hyps = [{'hyp': hyp, 'score': 1.} for hyp in hyps_ids]
+        dec.lm_rescoring(hyps, lm, 0.5, reverse=reverse, tag='second')
+
+        # Compare with scoring one hypothesis at a time
+        for hyp, hyp_ids in zip(hyps, hyps_ids):
+            score_lm_ref = 0.
+            if len(hyp_ids) > 1:
+                ys = torch.LongTensor([hyp_ids[::-1] if reverse else hyp_ids])
+                _, _, lm_log_probs = lm.predict(ys[:, :-1], None)
+                score_lm_ref = lm_log_probs[0, torch.arange(ys.size(1) - 1), ys[0, 1:]].mean().item()
+            assert np.allclose(hyp['score_lm_second'], score_lm_ref)
+            assert np.allclose(hyp['score'], 1. + score_lm_ref * 0.5)
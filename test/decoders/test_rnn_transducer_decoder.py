@@ -75,3 +75,72 @@ def test_forward(args):
     assert loss.size(0) == 1
     assert loss.item() >= 0
     assert isinstance(observation, dict)
+
+
+def make_decode_params(**kwargs):
+    params = dict(
+        recog_batch_size=1,
+        recog_beam_width=1,
+        recog_ctc_weight=0.0,
+        recog_ctc_prefix_margin=0,
+        recog_lm_weight=0.0,
+        recog_lm_second_weight=0.0,
+        recog_lm_bwd_weight=0.0,
+        recog_lm_state_carry_over=False,
+        recog_rnnt_state_cache_size=1000,
+    )
+    params.update(kwargs)
+    return params
+
+
+@pytest.mark.parametrize(
+    "args, params",
+    [
+        ({}, {'recog_beam_width': 1}),
+        ({}, {'recog_beam_width': 4}),
+        ({'rnn_type': 'gru_transducer'}, {'recog_beam_width': 4}),
+        ({}, {'recog_beam_width': 4, 'recog_lm_weight': 0.3}),
+        ({}, {'recog_beam_width': 4, 'recog_ctc_weight': 0.3}),
+    ]
+)
+def test_beam_search(args, params, make_lm):
+    args = make_args(**args)
+    params = make_decode_params(**params)
+    nbest = params['recog_beam_width']
+
+    batch_size = 3
+    xmax = 40
+    device_id = -1
+    elens = [40, 33, 18]
+    eouts = np.random.randn(batch_size, xmax, ENC_N_UNITS).astype(np.float32)
+    eouts = pad_list([np2tensor(x[:elen], device_id).double() for x, elen in zip(eouts, elens)], 0.)
+    elens = torch.IntTensor(elens)
+    ctc_log_probs = None
+    if params['recog_ctc_weight'] > 0:
+        ctc_log_probs = torch.log_softmax(torch.randn(batch_size, xmax, VOCAB).double(), dim=-1)
+    lm = make_lm(VOCAB).double().eval() if params['recog_lm_weight'] > 0 else None
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.rnn_transducer')
+    dec = module.RNNTransducer(**args)
+    dec.double().eval()
+    with torch.no_grad():
+        hyps = dec.beam_search(eouts, elens, params, lm=lm, ctc_log_probs=ctc_log_probs, nbest=nbest)[0]
+        assert len(hyps) == batch_size
+        assert 0 < len(dec.state_cache) <= params['recog_rnnt_state_cache_size']
+
+        # The state cache does not change results
+        for cache_size in [0, 5]:
+            hyps_c = dec.beam_search(eouts, elens, make_decode_params(**dict(
+                params, recog_rnnt_state_cache_size=cache_size)),
+                lm=lm, ctc_log_probs=ctc_log_probs, nbest=nbest)[0]
+            assert len(dec.state_cache) <= cache_size
+            for b in range(batch_size):
+                assert [h.tolist() for h in hyps[b]] == [h.tolist() for h in hyps_c[b]]
+
+        # Compare with decoding one utterance at a time
+        for b in range(batch_size):
+            hyps_b = dec.beam_search(
+                eouts[b:b + 1, :elens[b]], elens[b:b + 1], params, lm=lm,
+                ctc_log_probs=ctc_log_probs[b:b + 1, :elens[b]] if ctc_log_probs is not None else None,
+                nbest=nbest)[0]
+            assert [h.tolist() for h in hyps[b]] == [h.tolist() for h in hyps_b[0]]
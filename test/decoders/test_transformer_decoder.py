@@ -136,3 +136,227 @@ def test_forward(args):
     assert loss.size(0) == 1
     assert loss.item() >= 0
     assert isinstance(observation, dict)
+
+
+def make_decode_params(**kwargs):
+    params = dict(
+        recog_batch_size=1,
+        recog_beam_width=1,
+        recog_ctc_weight=0.0,
+        recog_ctc_prefix_margin=0,
+        recog_ctc_prefix_horizon=0,
+        recog_lm_weight=0.0,
+        recog_lm_second_weight=0.0,
+        recog_lm_bwd_weight=0.0,
+        recog_max_len_ratio=1.0,
+        recog_min_len_ratio=0.0,
+        recog_length_penalty=0.0,
+        recog_length_norm=False,
+        recog_eos_threshold=1.0,
+        recog_lm_state_carry_over=False,
+        recog_softmax_smoothing=1.0,
+        recog_mma_delay_threshold=-1,
+    )
+    params.update(kwargs)
+    return params
+
+
+@pytest.mark.parametrize(
+    "args, params",
+    [
+        ({}, {'recog_beam_width': 1}),
+        ({}, {'recog_beam_width': 4}),
+        ({}, {'recog_beam_width': 4, 'recog_min_len_ratio': 0.1, 'recog_max_len_ratio': 0.5}),
+        ({'n_heads': 1, 'pe_type': 'none'}, {'recog_beam_width': 4}),
+        ({}, {'recog_beam_width': 4, 'recog_length_penalty': 0.1}),
+        ({}, {'recog_beam_width': 4, 'recog_length_norm': True}),
+        ({}, {'recog_beam_width': 4, 'recog_lm_weight': 0.3}),
+        ({}, {'recog_beam_width': 4, 'recog_ctc_weight': 0.3}),
+        ({}, {'recog_beam_width': 4, 'recog_ctc_weight': 0.3, 'recog_lm_weight': 0.3}),
+        ({'backward': True}, {'recog_beam_width': 4, 'recog_ctc_weight': 0.3}),
+        ({}, {'recog_beam_width': 4, 'recog_lm_second_weight': 0.3, 'recog_lm_bwd_weight': 0.3}),
+    ]
+)
+def test_batch_beam_search(args, params, make_lm):
+    args = make_args(**args)
+    params = make_decode_params(**params)
+    nbest = min(2, params['recog_beam_width'])
+
+    batch_size = 4
+    xmax = 40
+    device_id = -1
+    elens = [40, 33, 27, 18]
+    eouts = np.random.randn(batch_size, xmax, ENC_N_UNITS).astype(np.float32)
+    eouts = pad_list([np2tensor(x[:elen], device_id).double() for x, elen in zip(eouts, elens)], 0.)
+    elens = torch.IntTensor(elens)
+    ctc_log_probs = None
+    if params['recog_ctc_weight'] > 0:
+        ctc_log_probs = torch.log_softmax(torch.randn(batch_size, xmax, VOCAB).double(), dim=-1)
+    lm = make_lm(VOCAB).double().eval() if params['recog_lm_weight'] > 0 else None
+    lm_second = make_lm(VOCAB).double().eval() if params['recog_lm_second_weight'] > 0 else None
+    lm_bwd = make_lm(VOCAB).double().eval() if params['recog_lm_bwd_weight'] > 0 else None
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.transformer')
+    dec = module.TransformerDecoder(**args)
+    dec.double().eval()  # avoid near-ties among hypotheses of the untrained model
+    with torch.no_grad():
+        hyps, aws, scores = dec.beam_search(eouts, elens, params, lm=lm,
+                                            lm_second=lm_second, lm_bwd=lm_bwd,
+                                            ctc_log_probs=ctc_log_probs,
+                                            nbest=nbest, exclude_eos=True)
+        assert len(hyps) == batch_size
+        # Compare with decoding one utterance at a time without caches
+        for b in range(batch_size):
+            hyps_b, aws_b, scores_b = dec.beam_search(
+                eouts[b:b + 1, :elens[b]], elens[b:b + 1], params, lm=lm,
+                lm_second=lm_second, lm_bwd=lm_bwd,
+                ctc_log_probs=ctc_log_probs[b:b + 1, :elens[b]] if ctc_log_probs is not None else None,
+                nbest=nbest, exclude_eos=True, cache_states=False)
+            assert len(hyps[b]) == nbest
+            for n in range(nbest):
+                assert hyps[b][n].tolist() == hyps_b[0][n].tolist()
+            assert np.allclose(scores[b], scores_b[0], atol=1e-4)
+            assert aws[b].shape == aws_b[0].shape
+            assert np.allclose(aws[b], aws_b[0], atol=1e-4)
+
+
+@pytest.mark.parametrize("mocha_init_r", [0., -1.])
+@pytest.mark.parametrize("chunk_size", [4, 8])
+def test_beam_search_chunk_sync(mocha_init_r, chunk_size):
+    # A single monotonic head in the last layer so that boundaries found in the
+    # received frames are identical to those found in the whole utterance
+    args = make_args(attn_type='mocha', n_layers=2, mocha_first_layer=2,
+                     mocha_chunk_size=1, mocha_n_heads_mono=1, mocha_init_r=mocha_init_r)
+    params = make_decode_params(recog_beam_width=1)
+
+    xmax = 40
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.transformer')
+    for seed in range(4):
+        torch.manual_seed(seed)
+        dec = module.TransformerDecoder(**args)
+        dec.eval()
+        eouts = torch.randn(1, xmax, ENC_N_UNITS)
+        with torch.no_grad():
+            hyps_full, aws, _ = dec.beam_search(eouts, torch.IntTensor([xmax]), params)
+            hyp_full = hyps_full[0][0].tolist()
+
+            hyps, end_hyps = None, []
+            for t in range(0, xmax, chunk_size):
+                end_hyps, hyps, _ = dec.beam_search_chunk_sync(eouts[:, t:t + chunk_size], params, hyps=hyps)
+                assert len(end_hyps) + len(hyps) <= params['recog_beam_width']
+                for beam in hyps:
+                    # self-attention caches and attention weights are carried over
+                    if len(beam['hyp']) > 1:
+                        assert beam['cache'][0].size(1) == len(beam['hyp']) - 1
+                        assert beam['aw_prev'].size(-1) == len(dec.eout_buffer)
+                # frames before the leftmost boundary are discarded
+                assert len(dec.eout_buffer) <= t + eouts[:, t:t + chunk_size].size(1)
+                if len(end_hyps) > 0:
+                    break
+            assert dec.n_frames == min(t + chunk_size, xmax)
+        best_hyp = (end_hyps + hyps)[0]
+
+        hyp = best_hyp['hyp'][1:]
+        n_tokens = min(len(hyp), len(hyp_full))
+        assert hyp[:n_tokens] == hyp_full[:n_tokens]
+
+        # Hypotheses wait from the first step where no boundary is found in the whole utterance
+        for step in range(aws[0].shape[1]):
+            if aws[0][:, step].sum() == 0:
+                assert len(hyp) <= step + 1  # <eos> can be emitted without boundary
+                if best_hyp['no_boundary']:
+                    assert len(hyp) == step
+                break
+
+
+@pytest.mark.parametrize(
+    "args, params",
+    [
+        ({}, {'recog_beam_width': 4}),
+        ({'mocha_n_heads_mono': 4}, {'recog_beam_width': 4, 'recog_mma_delay_threshold': 4}),
+        ({}, {'recog_beam_width': 4, 'recog_length_penalty': 0.1, 'recog_length_norm': True}),
+        ({}, {'recog_beam_width': 4, 'recog_lm_weight': 0.3}),
+        ({}, {'recog_beam_width': 4, 'recog_ctc_weight': 0.3}),
+        ({}, {'recog_beam_width': 4, 'recog_ctc_weight': 0.3, 'recog_ctc_prefix_horizon': 12}),
+    ]
+)
+def test_beam_search_chunk_sync_state(args, params, make_lm):
+    args = make_args(attn_type='mocha', mocha_chunk_size=4, mocha_init_r=-1., **args)
+    params = make_decode_params(**params)
+
+    torch.manual_seed(1)
+    xmax = 40
+    chunk_size = 8
+    eouts = torch.randn(1, xmax, ENC_N_UNITS)
+    ctc_log_probs = None
+    if params['recog_ctc_weight'] > 0:
+        ctc_log_probs = torch.log_softmax(torch.randn(1, xmax, VOCAB), dim=-1)
+    lm = make_lm(VOCAB).eval() if params['recog_lm_weight'] > 0 else None
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.transformer')
+    dec = module.TransformerDecoder(**args)
+    dec.eval()
+    with torch.no_grad():
+        hyps = None
+        for t in range(0, xmax, chunk_size):
+            end_hyps, hyps, _ = dec.beam_search_chunk_sync(
+                eouts[:, t:t + chunk_size], params, lm=lm,
+                ctc_log_probs=ctc_log_probs[:, t:t + chunk_size] if ctc_log_probs is not None else None,
+                hyps=hyps)
+            assert len(hyps) <= params['recog_beam_width']
+            # partial hypotheses are emitted after every chunk
+            for beam in end_hyps + hyps:
+                if len(beam['hyp']) > 1:
+                    assert beam['aw_prev'].size(-1) == len(dec.eout_buffer)
+                    assert len(beam['cache']) == args['n_layers']
+                    assert beam['cache'][0].size(1) == len(beam['hyp']) - 1
+                if ctc_log_probs is not None:
+                    # CTC states are extended to the new chunk and truncated to the horizon
+                    # and the frames kept in the buffer
+                    n_frames = len(dec.eout_buffer)
+                    if params['recog_ctc_prefix_horizon'] > 0:
+                        n_frames = min(n_frames, params['recog_ctc_prefix_horizon'])
+                    assert beam['ctc_state'].shape[0] == n_frames
+            if len(hyps) == 0:
+                break
+
+
+@pytest.mark.parametrize("mocha_chunk_size", [1, 4])
+@pytest.mark.parametrize("params", [{}, {'recog_ctc_weight': 0.3}])
+def test_beam_search_chunk_sync_bounded(mocha_chunk_size, params):
+    args = make_args(attn_type='mocha', n_layers=2, mocha_first_layer=2,
+                     mocha_chunk_size=mocha_chunk_size, mocha_n_heads_mono=1, mocha_init_r=-1.)
+    params = make_decode_params(recog_beam_width=1, **params)
+
+    torch.manual_seed(2)
+    xmax = 800
+    chunk_size = 8
+    eouts = torch.randn(1, xmax, ENC_N_UNITS)
+    ctc_log_probs = None
+    if params['recog_ctc_weight'] > 0:
+        ctc_log_probs = torch.log_softmax(torch.randn(1, xmax, VOCAB), dim=-1)
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.transformer')
+    dec = module.TransformerDecoder(**args)
+    dec.eval()
+    dec.output.bias.data[dec.eos] = -1e4  # a long stream without any segment boundary
+    max_len = 0
+    with torch.no_grad():
+        hyps = None
+        for t in range(0, xmax, chunk_size):
+            end_hyps, hyps, _ = dec.beam_search_chunk_sync(
+                eouts[:, t:t + chunk_size], params,
+                ctc_log_probs=ctc_log_probs[:, t:t + chunk_size] if ctc_log_probs is not None else None,
+                hyps=hyps)
+            assert len(end_hyps) == 0
+            max_len = max(max_len, len(dec.eout_buffer))
+            for beam in hyps:
+                if len(beam['hyp']) > 1:
+                    aw_prev = beam['aw_prev']
+                    assert aw_prev.size(-1) == len(dec.eout_buffer)
+                    # frames before the window of the token boundary are discarded
+                    assert aw_prev.view(-1, aw_prev.size(-1)).argmax(-1).min() <= max(mocha_chunk_size - 1, 0)
+                if ctc_log_probs is not None:
+                    assert beam['ctc_state'].shape[0] == len(dec.eout_buffer)
+    assert dec.n_frames == xmax
+    assert max_len < xmax // 2
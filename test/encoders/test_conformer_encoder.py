@@ -4,6 +4,7 @@
 """Test for Conformer encoders."""
 
 import importlib
+import math
 import numpy as np
 import pytest
 import torch
@@ -99,3 +100,109 @@ def test_forward(args):
         if args['n_layers_sub2'] > 0:
             assert enc_out_dict['ys_sub2']['xs'].size(0) == batch_size, xs.size()
             assert enc_out_dict['ys_sub2']['xs'].size(1) == enc_out_dict['ys_sub2']['xlens'][0], xs.size()
+
+
+def encode_streaming(enc, xs, N_l, N_c, N_r):
+    eouts = []
+    for t in range(0, xs.size(1), N_c):
+        if enc.cache_left_context:
+            xs_chunk = xs[:, t:t + N_c + N_r]
+        else:
+            # the left context is fed with each chunk
+            xs_chunk = xs[:, max(0, t - N_l):t + N_c + N_r]
+            xs_chunk = torch.cat([xs.new_zeros(xs.size(0), max(0, N_l - t), xs.size(2)), xs_chunk], dim=1)
+        enc_out_dict = enc(xs_chunk, None, task='all',
+                           use_cache=t > 0, streaming=True)
+        assert enc_out_dict['ys']['xs'].size(1) == enc_out_dict['ys']['xlens'][0]
+        eouts.append(enc_out_dict['ys']['xs'])
+    return eouts
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({'enc_type': 'conv_conformer', 'chunk_size_left': 64, 'chunk_size_current': 64, 'chunk_size_right': 32}),
+        ({'enc_type': 'conv_conformer', 'chunk_size_left': 128, 'chunk_size_current': 64, 'chunk_size_right': 0,
+          'kernel_size': 7}),
+        ({'enc_type': 'conformer', 'chunk_size_left': 64, 'chunk_size_current': 64, 'chunk_size_right': 32,
+          'conv_channels': ''}),
+        # the first layer attends to the same left context as chunkwise encoding
+        ({'enc_type': 'conformer', 'chunk_size_left': 64, 'chunk_size_current': 64, 'chunk_size_right': 32,
+          'n_layers': 1, 'kernel_size': 1, 'conv_channels': ''}),
+        ({'enc_type': 'conformer', 'chunk_size_left': 128, 'chunk_size_current': 64, 'chunk_size_right': 32,
+          'n_layers': 1, 'kernel_size': 1, 'conv_channels': ''}),
+    ]
+)
+@pytest.mark.parametrize("cache_left_context", [False, True])
+def test_forward_streaming(args, cache_left_context):
+    args = make_args(**args)
+    N_l = args['chunk_size_left']
+    N_c = args['chunk_size_current']
+    N_r = args['chunk_size_right']
+
+    batch_size = 1
+    xmax = 300
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.conformer')
+    enc = module.ConformerEncoder(**args)
+    enc.eval()
+    enc.cache_left_context = cache_left_context
+    xs = torch.randn(batch_size, xmax, args['input_dim'])
+    xlens = torch.IntTensor([xmax] * batch_size)
+
+    with torch.no_grad():
+        eouts = enc(xs, xlens, task='all')['ys']['xs']
+        eouts_stream = encode_streaming(enc, xs, N_l, N_c, N_r)
+        assert torch.cat(eouts_stream, dim=1).size() == eouts.size()
+
+        # cache is reset without use_cache
+        eouts_stream_reset = encode_streaming(enc, xs, N_l, N_c, N_r)
+        assert torch.equal(eouts_stream[0], eouts_stream_reset[0])
+
+        if not cache_left_context:
+            # re-encoding the left context is identical to chunkwise encoding
+            assert torch.allclose(torch.cat(eouts_stream, dim=1), eouts, atol=1e-5)
+        elif args['n_layers'] == 1 and args['kernel_size'] == 1 and not args['conv_channels']:
+            # exclude chunks without the full left context and the last chunk
+            _N_c = N_c // enc.subsampling_factor
+            for chunk_idx in range(math.ceil(N_l / N_c), len(eouts_stream) - 1):
+                a = eouts[:, chunk_idx * _N_c:(chunk_idx + 1) * _N_c]
+                assert torch.allclose(a, eouts_stream[chunk_idx], atol=1e-5)
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({'enc_type': 'conformer', 'conv_channels': ''}),
+        ({'enc_type': 'conformer', 'conv_channels': '', 'chunk_size_left': 32, 'chunk_size_current': 32,
+          'chunk_size_right': 16}),
+    ]
+)
+def test_sdpa_equivalence(args):
+    args = make_args(**args)
+    for k in ['dropout_in', 'dropout', 'dropout_att', 'dropout_layer']:
+        args[k] = 0.
+
+    batch_size = 4
+    xmax = 80
+    torch.manual_seed(1)
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.conformer')
+    torch_utils = importlib.import_module('neural_sp.models.torch_utils')
+    enc = module.ConformerEncoder(**args)
+    enc.double().train()  # gradients of the untrained model are large
+    xlens = torch.IntTensor([80, 72, 52, 32])
+    xs = torch.randn(batch_size, xmax, args['input_dim']).double()
+    # NOTE: the sum of layer-normalized outputs does not depend on parameters
+    w = torch.randn(batch_size, xmax // enc.subsampling_factor, args['d_model']).double()
+
+    outs = []
+    for backend in ['einsum', 'sdpa']:
+        enc.zero_grad()
+        with torch_utils.attention_backend(backend):
+            eouts = enc(xs, xlens, task='all')['ys']['xs']
+        (eouts * w).sum().backward()
+        outs.append((eouts, [p.grad.clone() for p in enc.parameters() if p.grad is not None]))
+    (eouts_ref, grads_ref), (eouts, grads) = outs
+    assert torch.allclose(eouts, eouts_ref, atol=1e-8)
+    assert len(grads) == len(grads_ref)
+    for grad, grad_ref in zip(grads, grads_ref):
+        assert torch.allclose(grad, grad_ref, rtol=1e-8, atol=1e-8)
@@ -4,6 +4,7 @@
 """Test for Transformer encoder."""
 
 import importlib
+import math
 import numpy as np
 import pytest
 import torch
@@ -109,3 +110,107 @@ def test_forward(args):
         if args['n_layers_sub2'] > 0:
             assert enc_out_dict['ys_sub2']['xs'].size(0) == batch_size, xs.size()
             assert enc_out_dict['ys_sub2']['xs'].size(1) == enc_out_dict['ys_sub2']['xlens'][0], xs.size()
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({'enc_type': 'transformer', 'chunk_size_left': 64, 'chunk_size_current': 128, 'chunk_size_right': 64}),
+        ({'enc_type': 'transformer', 'chunk_size_left': 64, 'chunk_size_current': 128, 'chunk_size_right': 64,
+          'pe_type': 'relative'}),
+    ]
+)
+def test_attention_capture(args):
+    args = make_args(**args)
+
+    batch_size = 2
+    xmax = 300
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.transformer')
+    module_utils = importlib.import_module('neural_sp.models.torch_utils')
+    enc = module.TransformerEncoder(**args)
+    enc.eval()
+    xs = torch.randn(batch_size, xmax, args['input_dim'])
+    xlens = torch.IntTensor([xmax] * batch_size)
+
+    with torch.no_grad():
+        # off by default
+        assert not module_utils.is_attention_captured()
+        enc(xs, xlens, task='all')
+        assert len(enc.aws_dict) == 0
+
+        with module_utils.capture_attention():
+            enc(xs, xlens, task='all')
+        assert not module_utils.is_attention_captured()
+        assert len(enc.aws_dict) == args['n_layers']
+        for aw in enc.aws_dict.values():
+            assert isinstance(aw, np.ndarray)
+            assert aw.shape[:2] == (batch_size, args['n_heads'])
+
+
+def encode_streaming(enc, xs, N_l, N_c, N_r):
+    eouts = []
+    for t in range(0, xs.size(1), N_c):
+        if enc.cache_left_context:
+            xs_chunk = xs[:, t:t + N_c + N_r]
+        else:
+            # the left context is fed with each chunk
+            xs_chunk = xs[:, max(0, t - N_l):t + N_c + N_r]
+            xs_chunk = torch.cat([xs.new_zeros(xs.size(0), max(0, N_l - t), xs.size(2)), xs_chunk], dim=1)
+        enc_out_dict = enc(xs_chunk, None, task='all',
+                           use_cache=t > 0, streaming=True)
+        assert enc_out_dict['ys']['xs'].size(1) == enc_out_dict['ys']['xlens'][0]
+        eouts.append(enc_out_dict['ys']['xs'])
+    return eouts
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({'enc_type': 'transformer', 'chunk_size_left': 64, 'chunk_size_current': 64, 'chunk_size_right': 32}),
+        ({'enc_type': 'transformer', 'chunk_size_left': 64, 'chunk_size_current': 64, 'chunk_size_right': 32,
+          'pe_type': 'add'}),
+        ({'enc_type': 'transformer', 'chunk_size_left': 64, 'chunk_size_current': 64, 'chunk_size_right': 32,
+          'pe_type': 'relative'}),
+        ({'enc_type': 'transformer', 'chunk_size_left': 128, 'chunk_size_current': 64, 'chunk_size_right': 0,
+          'pe_type': 'relative'}),
+        # the first layer attends to the same left context as chunkwise encoding
+        ({'enc_type': 'transformer', 'chunk_size_left': 64, 'chunk_size_current': 64, 'chunk_size_right': 32,
+          'n_layers': 1, 'conv_channels': ''}),
+        ({'enc_type': 'transformer', 'chunk_size_left': 128, 'chunk_size_current': 64, 'chunk_size_right': 32,
+          'pe_type': 'relative', 'n_layers': 1, 'conv_channels': ''}),
+    ]
+)
+@pytest.mark.parametrize("cache_left_context", [False, True])
+def test_forward_streaming(args, cache_left_context):
+    args = make_args(**args)
+    N_l = args['chunk_size_left']
+    N_c = args['chunk_size_current']
+    N_r = args['chunk_size_right']
+
+    batch_size = 1
+    xmax = 300
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.transformer')
+    enc = module.TransformerEncoder(**args)
+    enc.eval()
+    enc.cache_left_context = cache_left_context
+    xs = torch.randn(batch_size, xmax, args['input_dim'])
+    xlens = torch.IntTensor([xmax] * batch_size)
+
+    with torch.no_grad():
+        eouts = enc(xs, xlens, task='all')['ys']['xs']
+        eouts_stream = encode_streaming(enc, xs, N_l, N_c, N_r)
+        assert torch.cat(eouts_stream, dim=1).size() == eouts.size()
+
+        # cache is reset without use_cache
+        eouts_stream_reset = encode_streaming(enc, xs, N_l, N_c, N_r)
+        assert torch.equal(eouts_stream[0], eouts_stream_reset[0])
+
+        if not cache_left_context:
+            # re-encoding the left context is identical to chunkwise encoding
+            assert torch.allclose(torch.cat(eouts_stream, dim=1), eouts, atol=1e-5)
+        elif args['n_layers'] == 1 and not args['conv_channels']:
+            # exclude chunks without the full left context and the last chunk
+            _N_c = N_c // enc.subsampling_factor
+            for chunk_idx in range(math.ceil(N_l / N_c), len(eouts_stream) - 1):
+                a = eouts[:, chunk_idx * _N_c:(chunk_idx + 1) * _N_c]
+                assert torch.allclose(a, eouts_stream[chunk_idx], atol=1e-5)
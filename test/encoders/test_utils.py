@@ -4,6 +4,7 @@
 """Test for encoder utility functions."""
 
 import importlib
+import math
 import numpy as np
 import pytest
 import torch
@@ -12,6 +13,20 @@ from neural_sp.models.torch_utils import np2tensor
 from neural_sp.models.torch_utils import pad_list
 
 
+def chunkwise_loop(xs, N_l, N_c, N_r):
+    """Reference implementation copying chunks one by one."""
+    bs, xmax, idim = xs.size()
+    n_chunks = math.ceil(xmax / N_c)
+    xs_tmp = xs.new_zeros(bs, n_chunks, N_l + N_c + N_r, idim)
+    xs_pad = torch.cat([xs.new_zeros(bs, N_l, idim),
+                        xs,
+                        xs.new_zeros(bs, N_r, idim)], dim=1)
+    for chunk_idx, t in enumerate(range(N_l, N_l + xmax, N_c)):
+        xs_chunk = xs_pad[:, t - N_l:t + (N_c + N_r)]
+        xs_tmp[:, chunk_idx, :xs_chunk.size(1), :] = xs_chunk
+    return xs_tmp.view(bs * n_chunks, N_l + N_c + N_r, idim)
+
+
 @pytest.mark.parametrize(
     "N_l, N_c, N_r",
     [
@@ -41,3 +56,61 @@ def test_chunkwise(N_l, N_c, N_r):
 
         assert xs_chunk.size() == xs.size()
         assert torch.equal(xs_chunk, xs)
+
+
+@pytest.mark.parametrize(
+    "N_l, N_c, N_r",
+    [
+        (96, 64, 32),
+        (64, 128, 64),
+        (0, 40, 0),
+        (40, 40, 0),
+        (0, 16, 48),
+    ]
+)
+def test_chunkwise_equivalence(N_l, N_c, N_r):
+    batch_size = 3
+    input_dim = 8
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.utils')
+
+    for xmax in [1, 39, 40, 41, 300]:
+        xs = torch.randn(batch_size, xmax, input_dim, requires_grad=True)
+        xs_chunk = module.chunkwise(xs, N_l, N_c, N_r)
+        xs_chunk_ref = chunkwise_loop(xs, N_l, N_c, N_r)
+        assert xs_chunk.size() == xs_chunk_ref.size()
+        assert torch.equal(xs_chunk, xs_chunk_ref)
+
+        # gradients are accumulated over overlapping chunks
+        w = torch.randn_like(xs_chunk)
+        grad, = torch.autograd.grad((xs_chunk * w).sum(), xs)
+        grad_ref, = torch.autograd.grad((xs_chunk_ref * w).sum(), xs)
+        assert torch.allclose(grad, grad_ref, atol=1e-5)
+
+
+@pytest.mark.parametrize(
+    "N_l, N_c, N_r",
+    [
+        (96, 64, 32),
+        (0, 40, 0),
+        (40, 40, 20),
+    ]
+)
+def test_chunkwise_before_embedding(N_l, N_c, N_r):
+    batch_size = 3
+    input_dim = 8
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.utils')
+    embed = torch.nn.Linear(input_dim, 16)
+
+    for xmax in [1, 41, 300]:
+        xs = torch.randn(batch_size, xmax, input_dim)
+        # embedding before chunking with frames beyond the input filled with the embedding of zeros
+        xs_chunk = module.chunkwise(embed(xs), N_l, N_c, N_r, pad_value=embed.bias)
+        xs_chunk_ref = embed(module.chunkwise(xs, N_l, N_c, N_r))
+        assert xs_chunk.size() == xs_chunk_ref.size()
+        assert torch.allclose(xs_chunk, xs_chunk_ref, atol=1e-6)
+
+        w = torch.randn_like(xs_chunk)
+        grads = torch.autograd.grad((xs_chunk * w).sum(), embed.parameters())
+        grads_ref = torch.autograd.grad((xs_chunk_ref * w).sum(), embed.parameters())
+        for g, g_ref in zip(grads, grads_ref):
+            assert torch.allclose(g, g_ref, atol=1e-4)
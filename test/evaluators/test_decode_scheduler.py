@@ -0,0 +1,79 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for the length-aware decoding scheduler."""
+
+import importlib
+import numpy as np
+import pytest
+
+INPUT_DIM = 4
+
+
+class ToyModel(object):
+    """Model returning the length of each utterance as the hypothesis."""
+
+    def __init__(self):
+        self.batches = []
+
+    def decode(self, xs, params, idx2token=None, exclude_eos=False,
+               refs_id=None, utt_ids=None, speakers=None, task='ys', ensemble_models=[]):
+        assert params['recog_batch_size'] == len(xs)
+        self.batches.append([len(x) for x in xs])
+        best_hyps_id = [np.array([len(x), ref[0]]) for x, ref in zip(xs, refs_id)]
+        aws = [np.zeros((2, len(x), 1)) for x in xs]
+        assert utt_ids == ['utt%d' % ref[0] for ref in refs_id]
+        return best_hyps_id, aws
+
+
+@pytest.mark.parametrize(
+    "max_batch_size, max_n_frames_batch",
+    [
+        (1, 0),
+        (4, 0),
+        (100, 0),
+        (100, 400),
+        (3, 400),
+        (100, 50),  # smaller than some utterances
+    ]
+)
+def test_length_sorted_batches(max_batch_size, max_n_frames_batch):
+    rng = np.random.RandomState(0)
+    xlens = [int(xlen) for xlen in rng.randint(10, 200, 37)]
+
+    module = importlib.import_module('neural_sp.evaluators.decode_scheduler')
+    batches = module.make_length_sorted_batches(xlens, max_batch_size, max_n_frames_batch)
+    assert sorted(sum(batches, [])) == list(range(len(xlens)))
+
+    # Lengths are in the descending order
+    xlens_sorted = [xlens[i] for batch in batches for i in batch]
+    assert xlens_sorted == sorted(xlens, reverse=True)
+    for batch in batches:
+        assert len(batch) <= max_batch_size
+        if max_n_frames_batch > 0 and len(batch) > 1:
+            assert max(xlens[i] for i in batch) * len(batch) <= max_n_frames_batch
+
+
+@pytest.mark.parametrize("max_n_frames_batch", [0, 300])
+def test_decode_length_sorted(max_n_frames_batch):
+    rng = np.random.RandomState(0)
+    n_utts = 20
+    xs = [rng.randn(int(rng.randint(10, 100)), INPUT_DIM) for _ in range(n_utts)]
+    refs_id = [[i] for i in range(n_utts)]
+    utt_ids = ['utt%d' % i for i in range(n_utts)]
+    params = {'recog_batch_size': 8, 'recog_max_n_frames_batch': max_n_frames_batch}
+
+    module = importlib.import_module('neural_sp.evaluators.decode_scheduler')
+    model = ToyModel()
+    best_hyps_id, aws = module.decode_length_sorted(model, xs, params, refs_id=refs_id, utt_ids=utt_ids)
+
+    # Results are in the original order
+    for i in range(n_utts):
+        assert best_hyps_id[i].tolist() == [len(xs[i]), i]
+        assert aws[i].shape == (2, len(xs[i]), 1)
+    assert sum(len(batch) for batch in model.batches) == n_utts
+    for batch in model.batches:
+        assert len(batch) <= 8
+        assert batch == sorted(batch, reverse=True)
+        if max_n_frames_batch > 0 and len(batch) > 1:
+            assert batch[0] * len(batch) <= max_n_frames_batch
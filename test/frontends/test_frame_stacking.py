@@ -0,0 +1,95 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for frame stacking."""
+
+import importlib
+import numpy as np
+import pytest
+import time
+import torch
+
+INPUT_DIM = 8
+
+
+def stack_frame_ref(feat, n_stacks, n_skips):
+    """Reference implementation stacking frames one by one."""
+    T, input_dim = feat.shape
+    T_new = T // n_skips if T % n_stacks == 0 else (T // n_skips) + 1
+
+    stacked_feat = np.zeros((T_new, input_dim * n_stacks), dtype=np.float32)
+    stack_count = 0
+    stack = []
+    for t, frame_t in enumerate(feat):
+        if t == len(feat) - 1:
+            stack.append(frame_t)
+            while stack_count != int(T_new):
+                for i in range(len(stack)):
+                    stacked_feat[stack_count][input_dim * i:input_dim * (i + 1)] = stack[i]
+                stack_count += 1
+                for _ in range(n_skips):
+                    if len(stack) != 0:
+                        stack.pop(0)
+        elif len(stack) < n_stacks:
+            stack.append(frame_t)
+
+        if len(stack) == n_stacks:
+            for i in range(n_stacks):
+                stacked_feat[stack_count][input_dim * i:input_dim * (i + 1)] = stack[i]
+            stack_count += 1
+            for _ in range(n_skips):
+                stack.pop(0)
+
+    return stacked_feat
+
+
+@pytest.mark.parametrize(
+    "n_stacks, n_skips",
+    [
+        (2, 1),
+        (2, 2),
+        (3, 1),
+        (3, 2),
+        (3, 3),
+        (4, 3),
+    ]
+)
+def test_equivalence(n_stacks, n_skips):
+    module = importlib.import_module('neural_sp.models.seq2seq.frontends.frame_stacking')
+    rng = np.random.RandomState(1)
+    xlens = list(range(1, 30)) + [101, 256]
+    xs = [rng.randn(xlen, INPUT_DIM).astype(np.float32) for xlen in xlens]
+
+    ys_ref = [stack_frame_ref(x, n_stacks, n_skips) for x in xs]
+    for x, y_ref in zip(xs, ys_ref):
+        y = module.stack_frame(x, n_stacks, n_skips)
+        assert y.shape == y_ref.shape
+        assert np.array_equal(y, y_ref)
+
+    # all utterances in a mini-batch at once
+    xs_pad = torch.zeros(len(xs), max(xlens), INPUT_DIM)
+    for b, x in enumerate(xs):
+        xs_pad[b, :len(x)] = torch.from_numpy(x)
+    ys, ylens = module.stack_frame_batch(xs_pad, torch.IntTensor(xlens), n_stacks, n_skips)
+    assert ylens.tolist() == [len(y_ref) for y_ref in ys_ref]
+    assert ys.size() == (len(xs), max(ylens), INPUT_DIM * n_stacks)
+    for b, y_ref in enumerate(ys_ref):
+        assert np.array_equal(ys[b, :ylens[b]].numpy(), y_ref)
+        assert (ys[b, ylens[b]:] == 0).all()
+
+
+def test_throughput():
+    module = importlib.import_module('neural_sp.models.seq2seq.frontends.frame_stacking')
+    rng = np.random.RandomState(1)
+    xs = [rng.randn(3000, 80).astype(np.float32) for _ in range(4)]
+
+    start = time.time()
+    for x in xs:
+        stack_frame_ref(x, 3, 3)
+    elapsed_ref = time.time() - start
+
+    start = time.time()
+    for x in xs:
+        module.stack_frame(x, 3, 3)
+    elapsed = time.time() - start
+    assert elapsed < elapsed_ref
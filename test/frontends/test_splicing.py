@@ -0,0 +1,87 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for splicing."""
+
+import importlib
+import numpy as np
+import pytest
+import time
+import torch
+
+FREQ = 4
+
+
+def splice_ref(feat, n_splices, n_stacks):
+    """Reference implementation splicing frames one by one."""
+    max_xlen, input_dim = feat.shape
+    freq = (input_dim // 3) // n_stacks
+    feat_splice = np.zeros((max_xlen, freq * (n_splices * n_stacks) * 3), dtype=np.float32)
+
+    for i_time in range(max_xlen):
+        spliced_frames = np.zeros((n_splices * n_stacks, freq, 3))
+        for i_splice in range(0, n_splices, 1):
+            if i_time <= n_splices - 1 and i_splice < n_splices - i_time:
+                copy_frame = feat[0]
+            elif max_xlen - n_splices <= i_time and i_time + (i_splice - n_splices) > max_xlen - 1:
+                copy_frame = feat[-1]
+            else:
+                copy_frame = feat[i_time + (i_splice - n_splices)]
+            copy_frame = copy_frame.reshape((freq, 3, n_stacks))
+            copy_frame = np.transpose(copy_frame, (2, 0, 1))
+            spliced_frames[i_splice: i_splice + n_stacks] = copy_frame
+        spliced_frames = np.transpose(spliced_frames, (1, 0, 2))
+        feat_splice[i_time] = spliced_frames.reshape((freq * (n_splices * n_stacks) * 3))
+
+    return feat_splice
+
+
+@pytest.mark.parametrize(
+    "n_splices, n_stacks",
+    [
+        (2, 1),
+        (3, 1),
+        (5, 1),
+        (3, 2),
+        (5, 3),
+    ]
+)
+def test_equivalence(n_splices, n_stacks):
+    module = importlib.import_module('neural_sp.models.seq2seq.frontends.splicing')
+    rng = np.random.RandomState(1)
+    input_dim = FREQ * 3 * n_stacks
+    xlens = list(range(1, 20)) + [101]
+    xs = [rng.randn(xlen, input_dim).astype(np.float32) for xlen in xlens]
+
+    ys_ref = [splice_ref(x, n_splices, n_stacks) for x in xs]
+    for x, y_ref in zip(xs, ys_ref):
+        y = module.splice(x, n_splices, n_stacks)
+        assert y.shape == y_ref.shape
+        assert np.array_equal(y, y_ref)
+
+    # all utterances in a mini-batch at once
+    xs_pad = torch.zeros(len(xs), max(xlens), input_dim)
+    for b, x in enumerate(xs):
+        xs_pad[b, :len(x)] = torch.from_numpy(x)
+    ys = module.splice_batch(xs_pad, torch.IntTensor(xlens), n_splices, n_stacks)
+    assert ys.size() == (len(xs), max(xlens), FREQ * n_splices * n_stacks * 3)
+    for b, y_ref in enumerate(ys_ref):
+        assert np.array_equal(ys[b, :xlens[b]].numpy(), y_ref)
+        assert (ys[b, xlens[b]:] == 0).all()
+
+
+def test_throughput():
+    module = importlib.import_module('neural_sp.models.seq2seq.frontends.splicing')
+    rng = np.random.RandomState(1)
+    xs = [rng.randn(1000, 80 * 3).astype(np.float32) for _ in range(4)]
+
+    start = time.time()
+    for x in xs:
+        splice_ref(x, 5, 1)
+    elapsed_ref = time.time() - start
+
+    start = time.time()
+    for x in xs:
+        module.splice(x, 5, 1)
+    elapsed = time.time() - start
+    assert elapsed < elapsed_ref
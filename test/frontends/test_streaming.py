@@ -0,0 +1,290 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for incremental feature slicing in streaming encoding."""
+
+import importlib
+import numpy as np
+import pytest
+import torch
+
+INPUT_DIM = 8
+
+
+def make_args_rnn(**kwargs):
+    args = dict(
+        input_dim=INPUT_DIM,
+        rnn_type='blstm',
+        n_units=16,
+        n_projs=0,
+        last_proj_dim=0,
+        n_layers=2,
+        n_layers_sub1=0,
+        n_layers_sub2=0,
+        dropout_in=0.1,
+        dropout=0.1,
+        subsample="1_1",
+        subsample_type='drop',
+        n_stacks=1,
+        n_splices=1,
+        conv_in_channel=1,
+        conv_channels="4",
+        conv_kernel_sizes="(3,3)",
+        conv_strides="(1,1)",
+        conv_poolings="(2,2)",
+        conv_batch_norm=False,
+        conv_layer_norm=False,
+        conv_bottleneck_dim=0,
+        bidir_sum_fwd_bwd=False,
+        task_specific_layer=False,
+        param_init=0.1,
+        chunk_size_left=8,
+        chunk_size_right=4,
+    )
+    args.update(kwargs)
+    return args
+
+
+def make_args_transformer(**kwargs):
+    args = dict(
+        input_dim=INPUT_DIM,
+        enc_type='conv_transformer',
+        n_heads=2,
+        n_layers=2,
+        n_layers_sub1=0,
+        n_layers_sub2=0,
+        d_model=16,
+        d_ff=32,
+        ffn_bottleneck_dim=0,
+        last_proj_dim=0,
+        pe_type='relative',
+        layer_norm_eps=1e-12,
+        ffn_activation='relu',
+        dropout_in=0.1,
+        dropout=0.1,
+        dropout_att=0.1,
+        dropout_layer=0.1,
+        n_stacks=1,
+        n_splices=1,
+        conv_in_channel=1,
+        conv_channels="4",
+        conv_kernel_sizes="(3,3)",
+        conv_strides="(1,1)",
+        conv_poolings="(2,2)",
+        conv_batch_norm=False,
+        conv_layer_norm=False,
+        conv_bottleneck_dim=0,
+        conv_param_init=0.1,
+        task_specific_layer=False,
+        param_init='xavier_uniform',
+        chunk_size_left=8,
+        chunk_size_current=8,
+        chunk_size_right=4,
+    )
+    args.update(kwargs)
+    return args
+
+
+def make_params(**kwargs):
+    params = dict(
+        recog_ctc_vad=False,
+        recog_ctc_vad_blank_threshold=40,
+        recog_ctc_vad_spike_threshold=0.1,
+        recog_ctc_vad_n_accum_frames=4000,
+        recog_cache_left_context=False,
+        recog_max_segment_len=6000,
+    )
+    params.update(kwargs)
+    return params
+
+
+def encode_chunks(enc, streaming, eouts):
+    while streaming.has_next_chunk():
+        n_accum_frames = streaming.n_accum_frames
+        x_chunk, _ = streaming.extract_feature()
+        # count input frames for CTC-VAD except the re-encoded left context
+        assert streaming.n_accum_frames == n_accum_frames + len(x_chunk) - streaming.left_context
+        xs = torch.from_numpy(x_chunk).unsqueeze(0)
+        eouts.append(enc(xs, [len(x_chunk)], task='all', use_cache=len(eouts) > 0,
+                         streaming=True)['ys']['xs'])
+        streaming.next_chunk()
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({'rnn_type': 'blstm'}),
+        ({'rnn_type': 'blstm', 'chunk_size_left': 16, 'chunk_size_right': 0}),
+        ({'rnn_type': 'conv_blstm'}),
+    ]
+)
+def test_feed(args):
+    args = make_args_rnn(**args)
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.rnn')
+    enc = module.RNNEncoder(**args)
+    enc.eval()
+
+    module = importlib.import_module('neural_sp.models.seq2seq.frontends.streaming')
+    rng = np.random.RandomState(1)
+    with torch.no_grad():
+        for xmax in [17, 40, 63]:
+            x = rng.randn(xmax, INPUT_DIM).astype(np.float32)
+
+            # all inputs at once
+            enc.reset_cache()
+            streaming = module.Streaming(make_params(), enc, None)
+            streaming.feed(x)
+            streaming.finalize()
+            eouts = []
+            encode_chunks(enc, streaming, eouts)
+
+            # inputs arrive in small pieces
+            enc.reset_cache()
+            streaming = module.Streaming(make_params(), enc, None)
+            max_buffer = streaming.N_c + streaming.N_r + streaming.context * 2
+            eouts_stream = []
+            t = 0
+            while t < xmax:
+                n = rng.randint(1, 6)
+                streaming.feed(x[t:t + n])
+                t += n
+                encode_chunks(enc, streaming, eouts_stream)
+                # frames already encoded are discarded
+                assert len(streaming.x_buffer) < max_buffer + n
+            streaming.finalize()
+            encode_chunks(enc, streaming, eouts_stream)
+            assert streaming.is_finished
+
+            assert len(eouts) == len(eouts_stream)
+            assert torch.equal(torch.cat(eouts, dim=1), torch.cat(eouts_stream, dim=1))
+
+
+@pytest.mark.parametrize(
+    "enc_type, args",
+    [
+        ('transformer', {}),
+        ('transformer', {'chunk_size_left': 16, 'chunk_size_right': 0}),
+        ('conformer', {'enc_type': 'conv_conformer', 'kernel_size': 3}),
+    ]
+)
+@pytest.mark.parametrize("cache_left_context", [False, True])
+def test_feed_left_context(enc_type, args, cache_left_context):
+    args = make_args_transformer(**args)
+    params = make_params(recog_cache_left_context=cache_left_context)
+    if enc_type == 'transformer':
+        module = importlib.import_module('neural_sp.models.seq2seq.encoders.transformer')
+        enc = module.TransformerEncoder(**args)
+    else:
+        module = importlib.import_module('neural_sp.models.seq2seq.encoders.conformer')
+        enc = module.ConformerEncoder(**args)
+    enc.eval()
+
+    module = importlib.import_module('neural_sp.models.seq2seq.frontends.streaming')
+    rng = np.random.RandomState(1)
+    with torch.no_grad():
+        for xmax in [17, 40, 63]:
+            x = rng.randn(xmax, INPUT_DIM).astype(np.float32)
+            eouts_offline = enc(torch.from_numpy(x).unsqueeze(0), [xmax], task='all')['ys']['xs']
+
+            # all inputs at once
+            streaming = module.Streaming(params, enc, None)
+            # chunks are hopped by the current chunk size without extra frames for CNN blocks
+            assert streaming.N_c == args['chunk_size_current']
+            assert streaming.context == 0
+            assert enc.cache_left_context == cache_left_context
+            streaming.feed(x)
+            streaming.finalize()
+            eouts = []
+            encode_chunks(enc, streaming, eouts)
+            assert torch.cat(eouts, dim=1).size() == eouts_offline.size()
+            if not cache_left_context:
+                # re-encoding the left context is identical to chunkwise encoding
+                assert torch.allclose(torch.cat(eouts, dim=1), eouts_offline, atol=1e-5)
+
+            # inputs arrive in small pieces
+            streaming = module.Streaming(params, enc, None)
+            eouts_stream = []
+            t = 0
+            while t < xmax:
+                n = rng.randint(1, 6)
+                streaming.feed(x[t:t + n])
+                t += n
+                encode_chunks(enc, streaming, eouts_stream)
+            streaming.finalize()
+            encode_chunks(enc, streaming, eouts_stream)
+
+            assert len(eouts) == len(eouts_stream)
+            assert torch.equal(torch.cat(eouts, dim=1), torch.cat(eouts_stream, dim=1))
+
+
+@pytest.mark.parametrize("init_capacity", [1, 8, 256])
+def test_eout_buffer(init_capacity):
+    torch.manual_seed(1)
+    module = importlib.import_module('neural_sp.models.seq2seq.frontends.streaming')
+    eout_buffer = module.EncoderOutputBuffer(init_capacity)
+    rng = np.random.RandomState(1)
+
+    eouts_ref = torch.zeros(1, 0, 4)
+    n_reallocs = 0
+    max_len = 0
+    for _ in range(200):
+        eout_chunk = torch.randn(1, rng.randint(1, 10), 4)
+        capacity = eout_buffer.capacity
+        eout_buffer.append(eout_chunk)
+        n_reallocs += int(eout_buffer.capacity != capacity)
+        eouts_ref = torch.cat([eouts_ref, eout_chunk], dim=1)
+        max_len = max(max_len, len(eout_buffer))
+        if rng.rand() < 0.1:
+            n_evicted = rng.randint(0, len(eout_buffer) + 1)
+            eout_buffer.evict(n_evicted)
+            eouts_ref = eouts_ref[:, n_evicted:]
+
+        eouts = eout_buffer.view()
+        assert len(eout_buffer) == eouts_ref.size(1)
+        assert torch.equal(eouts, eouts_ref)
+        # no copy
+        if len(eout_buffer) > 0:
+            assert eouts.data_ptr() >= eout_buffer.buffer.data_ptr()
+        # evicted frames are reused
+        assert eout_buffer.capacity <= max(init_capacity, 2 * max_len)
+
+    # capacity grows geometrically
+    assert n_reallocs <= np.log2(eout_buffer.capacity) + 1
+
+    eout_buffer.evict()
+    assert len(eout_buffer) == 0
+
+
+@pytest.mark.parametrize("max_segment_len", [0, 64])
+def test_segment_full(max_segment_len):
+    args = make_args_rnn()
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.rnn')
+    enc = module.RNNEncoder(**args)
+    enc.eval()
+
+    module = importlib.import_module('neural_sp.models.seq2seq.frontends.streaming')
+    streaming = module.Streaming(make_params(recog_max_segment_len=max_segment_len), enc, None)
+    rng = np.random.RandomState(1)
+    xmax = 400
+    streaming.feed(rng.randn(xmax, INPUT_DIM).astype(np.float32))
+    streaming.finalize()
+    n_commits = 0
+    with torch.no_grad():
+        while streaming.has_next_chunk():
+            x_chunk, is_last_chunk = streaming.extract_feature()
+            xs = torch.from_numpy(x_chunk).unsqueeze(0)
+            eout_chunk = enc(xs, [len(x_chunk)], task='all', use_cache=streaming.offset > 0,
+                             streaming=True)['ys']['xs']
+            streaming.eout_buffer.append(eout_chunk)
+            # commit the segment without any boundary as in StreamingSession
+            if not is_last_chunk and streaming.is_segment_full():
+                streaming.eout_buffer.evict(len(streaming.eout_buffer))
+                n_commits += 1
+            if max_segment_len > 0:
+                assert len(streaming.eout_buffer) * streaming.factor < max_segment_len + streaming.N_c
+            streaming.next_chunk()
+
+    if max_segment_len > 0:
+        assert n_commits > 0
+    else:
+        assert n_commits == 0
@@ -78,3 +78,24 @@ def test_forward(args):
     # assert loss.size(0) == 1, loss
     assert loss.item() >= 0
     assert isinstance(observation, dict)
+
+
+def test_attention_capture():
+    args = make_args()
+
+    ylens = [4, 5, 3, 7]
+    ys = [np.random.randint(0, VOCAB, ylen).astype(np.int64) for ylen in ylens]
+
+    module = importlib.import_module('neural_sp.models.lm.transformerlm')
+    module_utils = importlib.import_module('neural_sp.models.torch_utils')
+    lm = module.TransformerLM(args)
+
+    # off by default
+    lm(ys, state=None, is_eval=True)
+    assert not any(hasattr(lm, 'yy_aws_layer%d' % lth) for lth in range(args.n_layers))
+
+    with module_utils.capture_attention():
+        lm(ys, state=None, is_eval=True)
+    assert not module_utils.is_attention_captured()
+    for lth in range(args.n_layers):
+        assert getattr(lm, 'yy_aws_layer%d' % lth).shape[:2] == (len(ys), args.transformer_n_heads)
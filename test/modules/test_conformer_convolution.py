@@ -41,3 +41,34 @@ def test_forward(args):
         xs = conv(xs)
 
         assert xs.size() == (batch_size, xmax, args['d_model'])
+
+
+@pytest.mark.parametrize(
+    "kernel_size, N_c, N_r",
+    [
+        (3, 8, 1),
+        (7, 8, 3),
+        (17, 4, 8),
+        (31, 16, 15),
+    ]
+)
+def test_forward_chunk(kernel_size, N_c, N_r):
+    args = make_args(kernel_size=kernel_size)
+
+    batch_size = 2
+    xmax = 50
+    module = importlib.import_module('neural_sp.models.modules.conformer_convolution')
+    conv = module.ConformerConvBlock(**args)
+    conv.eval()
+
+    xs = torch.randn(batch_size, xmax, args['d_model'])
+    with torch.no_grad():
+        ys = conv(xs)
+
+        # chunk by chunk with the cached left context
+        cache = None
+        for t in range(0, xmax - N_c - N_r + 1, N_c):
+            ys_chunk, cache = conv.forward_chunk(xs[:, t:t + N_c + N_r], cache, N_c)
+            assert cache.size() == (batch_size, args['d_model'], kernel_size // 2)
+            # outputs in the center region are identical when the right context covers the kernel
+            assert torch.allclose(ys_chunk[:, :N_c], ys[:, t:t + N_c], atol=1e-5)
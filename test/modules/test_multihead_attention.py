@@ -4,6 +4,7 @@
 """Test for multihead atteniton."""
 
 import importlib
+import random
 import pytest
 import torch
 
@@ -57,3 +58,88 @@ def test_forward(args):
         cv, aws, _, _ = out
         assert cv.size() == (batch_size, 1, value.size(2))
         assert aws.size() == (batch_size, args['n_heads'], 1, klen)
+
+
+@pytest.mark.parametrize(
+    "args", [
+        ({'n_heads': 1}),
+        ({'n_heads': 4}),
+        ({'n_heads': 4, 'atype': 'add'}),
+    ]
+)
+def test_compact_mask(args):
+    args = make_args(**args)
+
+    batch_size = 4
+    klen = 12
+    qlen = 12
+    torch.manual_seed(1)
+    key = torch.randn(batch_size, klen, args['kdim'])
+    query = torch.randn(batch_size, qlen, args['qdim'])
+    klens = torch.IntTensor([12, 9, 5, 1])
+
+    pad_mask = (torch.arange(klen).unsqueeze(0) < klens.unsqueeze(1)).unsqueeze(1)  # `[B, 1, klen]`
+    causal_mask = torch.tril(torch.ones(qlen, klen).byte()).unsqueeze(0)  # `[1, qlen, klen]`
+
+    module = importlib.import_module('neural_sp.models.modules.multihead_attention')
+    attention = module.MultiheadAttentionMechanism(**args)
+    attention.eval()
+    with torch.no_grad():
+        for mask in [pad_mask, causal_mask, pad_mask & causal_mask]:
+            # reference: masks repeated to `[B, qlen, klen]`
+            dense_mask = mask.repeat([batch_size // mask.size(0), qlen // mask.size(1), 1])
+            cv_ref, aw_ref, _, _ = attention(key, key, query, mask=dense_mask)
+
+            cv, aw, _, _ = attention(key, key, query, mask=mask)
+            assert torch.allclose(cv, cv_ref, atol=1e-6)
+            assert torch.allclose(aw, aw_ref, atol=1e-6)
+
+            # additive bias
+            bias = torch.zeros(mask.size()).masked_fill_(mask == 0, float('-inf'))
+            cv, aw, _, _ = attention(key, key, query, mask=bias)
+            assert torch.allclose(cv, cv_ref, atol=1e-6)
+            assert torch.allclose(aw, aw_ref, atol=1e-6)
+
+
+@pytest.mark.parametrize(
+    "args", [
+        ({'n_heads': 1}),
+        ({'n_heads': 4}),
+        ({'n_heads': 4, 'dropout_head': 0.5}),
+    ]
+)
+def test_sdpa_equivalence(args):
+    args = make_args(**args)
+    args['dropout'] = 0.
+
+    batch_size = 4
+    klen = 12
+    qlen = 12
+    torch.manual_seed(1)
+    key = torch.randn(batch_size, klen, args['kdim'])
+    query = torch.randn(batch_size, qlen, args['qdim'])
+    klens = torch.IntTensor([12, 9, 5, 1])
+
+    pad_mask = (torch.arange(klen).unsqueeze(0) < klens.unsqueeze(1)).unsqueeze(1)  # `[B, 1, klen]`
+    causal_mask = torch.tril(torch.ones(qlen, klen).byte()).unsqueeze(0)  # `[1, qlen, klen]`
+    bias = torch.zeros(causal_mask.size()).masked_fill_(causal_mask == 0, float('-inf'))
+
+    module = importlib.import_module('neural_sp.models.modules.multihead_attention')
+    torch_utils = importlib.import_module('neural_sp.models.torch_utils')
+    attention = module.MultiheadAttentionMechanism(**args)
+    attention.train()  # for HeadDrop
+    # NOTE: fully-masked rows by a mask over queries result in uniform weights
+    query_mask = pad_mask.transpose(2, 1)  # `[B, qlen, 1]`
+    for mask in [None, pad_mask, causal_mask, pad_mask & causal_mask, query_mask, bias]:
+        outs = []
+        for backend in ['einsum', 'sdpa']:
+            attention.zero_grad()
+            random.seed(1)
+            with torch_utils.attention_backend(backend):
+                cv, aw, _, _ = attention(key, key, query, mask=mask, need_weights=False)
+            assert (aw is None) == (backend == 'sdpa')
+            cv.sum().backward()
+            outs.append((cv, attention.w_query.weight.grad.clone()))
+        (cv_ref, grad_ref), (cv, grad) = outs
+        assert torch.allclose(cv, cv_ref, atol=1e-5)
+        assert torch.allclose(grad, grad_ref, atol=1e-5)
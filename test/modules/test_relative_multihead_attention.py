@@ -73,3 +73,88 @@ def test_forward(args, learnable):
         cv, aws = out
         assert cv.size() == (batch_size, 1, memory.size(2))
         assert aws.size() == (batch_size, args['n_heads'], 1, klen + mlen)
+
+
+def test_compact_mask():
+    args = make_args()
+
+    batch_size = 4
+    device_id = -1
+    klen = 10
+    mlen = 6
+    qlen = 10
+    torch.manual_seed(1)
+    key = torch.randn(batch_size, klen, args['kdim'])
+    memory = torch.randn(batch_size, mlen, args['kdim'])
+    query = torch.randn(batch_size, qlen, args['qdim'])
+
+    causal_mask = torch.ones(qlen, klen + mlen).byte()
+    causal_mask = torch.tril(causal_mask, diagonal=0 + mlen, out=causal_mask).unsqueeze(0)  # `[1, qlen, klen+mlen]`
+    bias = torch.zeros(causal_mask.size()).masked_fill_(causal_mask == 0, float('-inf'))
+
+    module_embedding = importlib.import_module('neural_sp.models.modules.positional_embedding')
+    pos_emb = module_embedding.XLPositionalEmbedding(args['kdim'], args['dropout'])
+    pos_idxs = torch.arange(klen + mlen - 1, -1, -1.0, dtype=torch.float)
+    pos_embs = pos_emb(pos_idxs, device_id)
+
+    module_mha = importlib.import_module('neural_sp.models.modules.relative_multihead_attention')
+    attention = module_mha.RelativeMultiheadAttentionMechanism(**args)
+    attention.eval()
+    with torch.no_grad():
+        cv_ref, aw_ref = attention(key, query, memory, mask=causal_mask.repeat([batch_size, 1, 1]),
+                                   pos_embs=pos_embs)
+        for mask in [causal_mask, bias]:
+            cv, aw = attention(key, query, memory, mask=mask, pos_embs=pos_embs)
+            assert torch.allclose(cv, cv_ref, atol=1e-6)
+            assert torch.allclose(aw, aw_ref, atol=1e-6)
+
+
+@pytest.mark.parametrize("learnable", [False, True])
+def test_sdpa_equivalence(learnable):
+    args = make_args(dropout=0.)
+
+    batch_size = 4
+    device_id = -1
+    klen = 10
+    mlen = 6
+    qlen = 10
+    torch.manual_seed(1)
+    key = torch.randn(batch_size, klen, args['kdim'])
+    memory = torch.randn(batch_size, mlen, args['kdim'])
+    query = torch.randn(batch_size, qlen, args['qdim'])
+
+    causal_mask = torch.ones(qlen, klen + mlen).byte()
+    causal_mask = torch.tril(causal_mask, diagonal=0 + mlen, out=causal_mask).unsqueeze(0)  # `[1, qlen, klen+mlen]`
+    bias = torch.zeros(causal_mask.size()).masked_fill_(causal_mask == 0, float('-inf'))
+    # NOTE: fully-masked rows by a mask over queries result in uniform weights
+    qlens = torch.IntTensor([10, 7, 4, 1])
+    query_mask = (torch.arange(qlen).unsqueeze(0) < qlens.unsqueeze(1)).unsqueeze(2)  # `[B, qlen, 1]`
+
+    module_embedding = importlib.import_module('neural_sp.models.modules.positional_embedding')
+    pos_emb = module_embedding.XLPositionalEmbedding(args['kdim'], args['dropout'])
+    pos_idxs = torch.arange(klen + mlen - 1, -1, -1.0, dtype=torch.float)
+    pos_embs = pos_emb(pos_idxs, device_id)
+
+    if learnable:
+        u = torch.nn.Parameter(torch.randn(args['n_heads'], args['adim'] // args['n_heads']))
+        v = torch.nn.Parameter(torch.randn(args['n_heads'], args['adim'] // args['n_heads']))
+    else:
+        u, v = None, None
+
+    module_mha = importlib.import_module('neural_sp.models.modules.relative_multihead_attention')
+    torch_utils = importlib.import_module('neural_sp.models.torch_utils')
+    attention = module_mha.RelativeMultiheadAttentionMechanism(**args)
+    attention.train()
+    for mask in [None, causal_mask, query_mask, bias]:
+        outs = []
+        for backend in ['einsum', 'sdpa']:
+            attention.zero_grad()
+            with torch_utils.attention_backend(backend):
+                cv, aw = attention(key, query, memory, mask=mask, pos_embs=pos_embs, u=u, v=v,
+                                   need_weights=False)
+            assert (aw is None) == (backend == 'sdpa')
+            cv.sum().backward()
+            outs.append((cv, attention.w_position.weight.grad.clone()))
+        (cv_ref, grad_ref), (cv, grad) = outs
+        assert torch.allclose(cv, cv_ref, atol=1e-5)
+        assert torch.allclose(grad, grad_ref, atol=1e-5)
@@ -0,0 +1,87 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for synchronous bidirectional multihead atteniton."""
+
+import importlib
+import pytest
+import torch
+
+
+def make_args(**kwargs):
+    args = dict(
+        kdim=32,
+        qdim=32,
+        adim=16,
+        n_heads=4,
+        dropout=0.1,
+        atype='scaled_dot',
+        bias=True,
+        param_init='xavier_uniform',
+        future_weight=0.1,
+    )
+    args.update(kwargs)
+    return args
+
+
+def make_masks(batch_size, qlen):
+    tgt_mask = torch.tril(torch.ones(qlen, qlen).byte()).unsqueeze(0)  # `[1, qlen, qlen]`
+    tgt_mask = tgt_mask.repeat([batch_size, 1, 1])
+    identity_mask = torch.eye(qlen).byte().unsqueeze(0).repeat([batch_size, 1, 1])
+    return tgt_mask, identity_mask
+
+
+@pytest.mark.parametrize(
+    "args", [
+        ({'n_heads': 1}),
+        ({'n_heads': 4}),
+        ({'n_heads': 4, 'atype': 'add'}),
+        ({'bias': False}),
+    ]
+)
+def test_forward(args):
+    args = make_args(**args)
+
+    batch_size = 4
+    qlen = 6
+    ys = torch.randn(batch_size, qlen, args['kdim'])
+    ys_bwd = torch.randn(batch_size, qlen, args['kdim'])
+    tgt_mask, identity_mask = make_masks(batch_size, qlen)
+
+    module = importlib.import_module('neural_sp.models.modules.sync_bidir_multihead_attention')
+    attention = module.SyncBidirMultiheadAttentionMechanism(**args)
+    attention.train()
+    out = attention(ys, ys, ys, ys_bwd, ys_bwd, ys_bwd, tgt_mask, identity_mask, cache=False)
+    assert len(out) == 6
+    cv_fwd, cv_bwd = out[:2]
+    assert cv_fwd.size() == (batch_size, qlen, args['kdim'])
+    assert cv_bwd.size() == (batch_size, qlen, args['kdim'])
+    for aw in out[2:]:
+        assert aw.size() == (batch_size, args['n_heads'], qlen, qlen)
+
+
+@pytest.mark.parametrize("n_heads", [1, 4])
+def test_sdpa_equivalence(n_heads):
+    args = make_args(n_heads=n_heads, dropout=0.)
+
+    batch_size = 4
+    qlen = 6
+    torch.manual_seed(1)
+    ys = torch.randn(batch_size, qlen, args['kdim'])
+    ys_bwd = torch.randn(batch_size, qlen, args['kdim'])
+    tgt_mask, identity_mask = make_masks(batch_size, qlen)
+
+    module = importlib.import_module('neural_sp.models.modules.sync_bidir_multihead_attention')
+    torch_utils = importlib.import_module('neural_sp.models.torch_utils')
+    attention = module.SyncBidirMultiheadAttentionMechanism(**args)
+    attention.eval()
+    with torch.no_grad():
+        outs = []
+        for backend in ['einsum', 'sdpa']:
+            with torch_utils.attention_backend(backend):
+                out = attention(ys, ys, ys, ys_bwd, ys_bwd, ys_bwd, tgt_mask, identity_mask,
+                                cache=False, need_weights=False)
+            assert all((aw is None) == (backend == 'sdpa') for aw in out[2:])
+            outs.append(out[:2])
+        for cv, cv_ref in zip(outs[1], outs[0]):
+            assert torch.allclose(cv, cv_ref, atol=1e-5)
@@ -4,6 +4,10 @@ modules="neural_sp test utils setup.py"
 pip install pycodestyle
 pycodestyle -r ${modules} --show-source --show-pep8 --ignore="E501"
 
+# dataset
+pytest ./test/datasets/test_asr_dataset.py || exit 1;
+pytest ./test/datasets/test_lm_dataset.py || exit 1;
+
 # encoder
 pytest ./test/encoders/test_conv_encoder.py || exit 1;
 pytest ./test/encoders/test_rnn_encoder.py || exit 1;
@@ -12,11 +16,21 @@ pytest ./test/encoders/test_transformer_encoder.py || exit 1;
 pytest ./test/encoders/test_conformer_encoder.py || exit 1;
 pytest ./test/encoders/test_utils.py || exit 1;
 
+# frontend
+pytest ./test/frontends/test_frame_stacking.py || exit 1;
+pytest ./test/frontends/test_splicing.py || exit 1;
+pytest ./test/frontends/test_streaming.py || exit 1;
+
 # decoder
+pytest ./test/decoders/test_ctc_decoder.py || exit 1;
+pytest ./test/decoders/test_ctc_prefix_score.py || exit 1;
 pytest ./test/decoders/test_las_decoder.py || exit 1;
 pytest ./test/decoders/test_transformer_decoder.py || exit 1;
 pytest ./test/decoders/test_rnn_transducer_decoder.py || exit 1;
 
+# evaluators
+pytest ./test/evaluators/test_decode_scheduler.py || exit 1;
+
 # LM
 pytest ./test/lm/test_rnnlm.py || exit 1;
 pytest ./test/lm/test_transformerlm.py || exit 1;
@@ -30,3 +44,7 @@ pytest ./test/modules/test_multihead_attention.py || exit 1;
 pytest ./test/modules/test_mocha.py || exit 1;
 pytest ./test/modules/test_pointwise_feed_forward.py || exit 1;
 pytest ./test/modules/test_relative_multihead_attention.py || exit 1;
+pytest ./test/modules/test_sync_bidir_multihead_attention.py || exit 1;
+
+# bin
+pytest ./test/bin/test_asr_server.py || exit 1;